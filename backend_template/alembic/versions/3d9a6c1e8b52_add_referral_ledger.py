@@ -0,0 +1,134 @@
+"""add_referral_ledger
+
+Revision ID: 3d9a6c1e8b52
+Revises: f2b7c9e4a1d8
+Create Date: 2026-10-18 23:41:07.264918
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3d9a6c1e8b52'
+down_revision: Union[str, None] = 'f2b7c9e4a1d8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Per-user history totals of each book: earned, held (open payout requests), paid out
+OPENING_TOTALS = {
+    'referral': """
+        SELECT user_id, SUM(earned) AS earned, SUM(held) AS held, SUM(paid_out) AS paid_out
+        FROM (
+            SELECT user_id, commission_amount AS earned, 0 AS held, 0 AS paid_out
+            FROM referral_earnings
+            UNION ALL
+            SELECT user_id, 0,
+                   CASE WHEN status = 'requested' THEN gross_amount ELSE 0 END,
+                   CASE WHEN status IN ('approved', 'completed') THEN gross_amount ELSE 0 END
+            FROM referral_payouts
+        ) history
+        GROUP BY user_id
+    """,
+    'affiliate': """
+        SELECT user_id, SUM(earned) AS earned, SUM(held) AS held, SUM(paid_out) AS paid_out
+        FROM (
+            SELECT affiliate_user_id AS user_id, commission_amount AS earned, 0 AS held, 0 AS paid_out
+            FROM commissions
+            WHERE status IN ('APPROVED', 'PAID')
+            UNION ALL
+            SELECT affiliate_user_id, 0,
+                   CASE WHEN status IN ('PENDING', 'PROCESSING') THEN amount ELSE 0 END,
+                   CASE WHEN status = 'COMPLETED' THEN amount ELSE 0 END
+            FROM payouts
+        ) history
+        GROUP BY user_id
+    """,
+}
+
+
+def upgrade() -> None:
+    # Append-only double-entry ledger (see app/services/referral_ledger.py)
+    op.create_table(
+        'referral_ledger_entries',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('transaction_key', sa.String(length=120), nullable=False),
+        sa.Column('leg', sa.Integer(), nullable=False),
+        sa.Column('entry_type', sa.String(length=30), nullable=False),
+        sa.Column('book', sa.String(length=20), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('account', sa.String(length=20), nullable=False),
+        sa.Column('amount', sa.Numeric(precision=12, scale=2), nullable=False),
+        sa.Column('reference_type', sa.String(length=30), nullable=True),
+        sa.Column('reference_id', sa.Integer(), nullable=True),
+        sa.Column('description', sa.String(length=255), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users_profiles.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('transaction_key', 'leg', name='uq_ledger_transaction_leg'),
+    )
+    op.create_index('idx_ledger_user_book_id', 'referral_ledger_entries', ['user_id', 'book', 'id'], unique=False)
+
+    op.create_table(
+        'referral_ledger_balances',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('book', sa.String(length=20), nullable=False),
+        sa.Column('available', sa.Numeric(precision=12, scale=2), nullable=False, server_default='0'),
+        sa.Column('held', sa.Numeric(precision=12, scale=2), nullable=False, server_default='0'),
+        sa.Column('total_earned', sa.Numeric(precision=12, scale=2), nullable=False, server_default='0'),
+        sa.Column('total_paid_out', sa.Numeric(precision=12, scale=2), nullable=False, server_default='0'),
+        sa.Column('last_entry_id', sa.Integer(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users_profiles.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('user_id', 'book'),
+    )
+
+    # Backfill: one opening transaction per user and book from the existing rows
+    # (available = earned - held - paid out; the legs balance against "commissions")
+    for book, totals in OPENING_TOTALS.items():
+        op.execute(f"""
+            INSERT INTO referral_ledger_entries
+                (transaction_key, leg, entry_type, book, user_id, account, amount, description)
+            WITH totals AS ({totals})
+            SELECT 'opening:{book}:' || user_id, leg, 'opening_balance', '{book}', user_id, account, amount,
+                   'Opening balance'
+            FROM (
+                SELECT user_id, 1 AS leg, 'available' AS account, earned - held - paid_out AS amount FROM totals
+                UNION ALL SELECT user_id, 2, 'held', held FROM totals
+                UNION ALL SELECT user_id, 3, 'paid_out', paid_out FROM totals
+                UNION ALL SELECT user_id, 4, 'commissions', -earned FROM totals
+            ) legs
+            WHERE amount <> 0
+        """)
+
+    op.execute("""
+        INSERT INTO referral_ledger_balances
+            (user_id, book, available, held, total_earned, total_paid_out, last_entry_id)
+        SELECT user_id, book,
+               SUM(CASE WHEN account = 'available' THEN amount ELSE 0 END),
+               SUM(CASE WHEN account = 'held' THEN amount ELSE 0 END),
+               -SUM(CASE WHEN account = 'commissions' THEN amount ELSE 0 END),
+               SUM(CASE WHEN account = 'paid_out' THEN amount ELSE 0 END),
+               MAX(id)
+        FROM referral_ledger_entries
+        GROUP BY user_id, book
+    """)
+
+    # The profile balance columns become a copy of the referral snapshot
+    op.execute("""
+        UPDATE users_profiles u
+        SET available_balance = b.available,
+            total_earnings = b.total_earned,
+            total_withdrawn = b.total_paid_out
+        FROM referral_ledger_balances b
+        WHERE b.user_id = u.id AND b.book = 'referral'
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('referral_ledger_balances')
+    op.drop_index('idx_ledger_user_book_id', table_name='referral_ledger_entries')
+    op.drop_table('referral_ledger_entries')
@@ -0,0 +1,58 @@
+"""add_referral_closure_table
+
+Revision ID: 5b7e1c2d9a40
+Revises: 80efb2eb76fb
+Create Date: 2026-10-18 10:12:41.513204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b7e1c2d9a40'
+down_revision: Union[str, None] = '80efb2eb76fb'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Ancestor/descendant closure of users_profiles.referred_by
+    op.create_table(
+        'referral_closure',
+        sa.Column('ancestor_id', sa.Integer(), nullable=False),
+        sa.Column('descendant_id', sa.Integer(), nullable=False),
+        sa.Column('depth', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.ForeignKeyConstraint(['ancestor_id'], ['users_profiles.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['descendant_id'], ['users_profiles.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('ancestor_id', 'descendant_id'),
+    )
+    op.create_index('idx_referral_closure_ancestor_depth', 'referral_closure', ['ancestor_id', 'depth'])
+    op.create_index('idx_referral_closure_descendant_depth', 'referral_closure', ['descendant_id', 'depth'])
+
+    # Backfill from the existing referred_by chains
+    op.execute("""
+        INSERT INTO referral_closure (ancestor_id, descendant_id, depth)
+        WITH RECURSIVE chain(ancestor_id, descendant_id, depth) AS (
+            SELECT referred_by, id, 1
+            FROM users_profiles
+            WHERE referred_by IS NOT NULL
+            UNION ALL
+            SELECT u.referred_by, c.descendant_id, c.depth + 1
+            FROM chain c
+            JOIN users_profiles u ON u.id = c.ancestor_id
+            WHERE u.referred_by IS NOT NULL AND c.depth < 64
+        )
+        SELECT ancestor_id, descendant_id, MIN(depth)
+        FROM chain
+        GROUP BY ancestor_id, descendant_id
+    """)
+
+
+def downgrade() -> None:
+    op.drop_index('idx_referral_closure_descendant_depth', table_name='referral_closure')
+    op.drop_index('idx_referral_closure_ancestor_depth', table_name='referral_closure')
+    op.drop_table('referral_closure')
@@ -0,0 +1,52 @@
+"""add_attachment_blobs
+
+Revision ID: 7a3f9d2e6b14
+Revises: e41d7b90c2a5
+Create Date: 2026-10-18 18:04:51.220917
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7a3f9d2e6b14'
+down_revision: Union[str, None] = 'e41d7b90c2a5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Content-addressed, reference-counted encrypted blobs shared by identical attachments
+    # (see app/services/attachment_blob_store.py). Existing attachments keep their own file (blob_id NULL).
+    op.create_table(
+        'attachment_blobs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('content_hash', sa.String(length=64), nullable=False),
+        sa.Column('storage_path', sa.String(length=500), nullable=False),
+        sa.Column('encryption_key_id', sa.String(length=100), nullable=False),
+        sa.Column('size', sa.BigInteger(), nullable=False),
+        sa.Column('ref_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('content_hash'),
+    )
+    op.create_index(op.f('ix_attachment_blobs_id'), 'attachment_blobs', ['id'], unique=False)
+
+    op.add_column('ticket_attachments', sa.Column('blob_id', sa.Integer(), nullable=True))
+    op.create_foreign_key(
+        'ticket_attachments_blob_id_fkey', 'ticket_attachments', 'attachment_blobs',
+        ['blob_id'], ['id'], ondelete='SET NULL'
+    )
+    op.create_index(op.f('ix_ticket_attachments_blob_id'), 'ticket_attachments', ['blob_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_ticket_attachments_blob_id'), table_name='ticket_attachments')
+    op.drop_constraint('ticket_attachments_blob_id_fkey', 'ticket_attachments', type_='foreignkey')
+    op.drop_column('ticket_attachments', 'blob_id')
+    op.drop_index(op.f('ix_attachment_blobs_id'), table_name='attachment_blobs')
+    op.drop_table('attachment_blobs')
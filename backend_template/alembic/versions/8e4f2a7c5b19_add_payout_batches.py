@@ -0,0 +1,60 @@
+"""add_payout_batches
+
+Revision ID: 8e4f2a7c5b19
+Revises: 3d9a6c1e8b52
+Create Date: 2026-10-19 00:52:18.447301
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8e4f2a7c5b19'
+down_revision: Union[str, None] = '3d9a6c1e8b52'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Monthly payout runs (see app/services/payout_batches.py)
+    op.create_table(
+        'payout_batches',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('book', sa.String(length=20), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False, server_default='running'),
+        sa.Column('payouts_claimed', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('payouts_settled', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('total_amount', sa.Numeric(precision=14, scale=2), nullable=False, server_default='0'),
+        sa.Column('last_payout_id', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('file_key', sa.String(length=255), nullable=True),
+        sa.Column('file_rows', sa.Integer(), nullable=True),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('created_by', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.Column('completed_at', sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(['created_by'], ['users_profiles.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('idx_payout_batches_book_status', 'payout_batches', ['book', 'status'], unique=False)
+
+    # Payouts remember the run that claimed them
+    for table in ('referral_payouts', 'payouts'):
+        op.add_column(table, sa.Column('batch_id', sa.Integer(), nullable=True))
+        op.create_foreign_key(f'fk_{table}_batch_id', table, 'payout_batches', ['batch_id'], ['id'])
+        op.create_index(f'ix_{table}_batch_id', table, ['batch_id'], unique=False)
+
+    # A payout marks the user's pending earnings paid with one UPDATE
+    op.create_index('idx_referral_earnings_user_status', 'referral_earnings', ['user_id', 'status'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('idx_referral_earnings_user_status', table_name='referral_earnings')
+    for table in ('payouts', 'referral_payouts'):
+        op.drop_index(f'ix_{table}_batch_id', table_name=table)
+        op.drop_constraint(f'fk_{table}_batch_id', table, type_='foreignkey')
+        op.drop_column(table, 'batch_id')
+    op.drop_index('idx_payout_batches_book_status', table_name='payout_batches')
+    op.drop_table('payout_batches')
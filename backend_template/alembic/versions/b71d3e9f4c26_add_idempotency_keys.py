@@ -0,0 +1,44 @@
+"""add_idempotency_keys
+
+Revision ID: b71d3e9f4c26
+Revises: 8e4f2a7c5b19
+Create Date: 2026-10-19 01:37:44.918026
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b71d3e9f4c26'
+down_revision: Union[str, None] = '8e4f2a7c5b19'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Idempotency-Key records for order / payment creation (see app/services/idempotency.py)
+    op.create_table(
+        'idempotency_keys',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('key', sa.String(length=255), nullable=False),
+        sa.Column('request_fingerprint', sa.String(length=64), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False, server_default='in_progress'),
+        sa.Column('response_status', sa.Integer(), nullable=True),
+        sa.Column('response_body', sa.JSON(), nullable=True),
+        sa.Column('locked_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.Column('completed_at', sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users_profiles.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id', 'key', name='uq_idempotency_user_key'),
+    )
+    op.create_index('idx_idempotency_keys_locked_at', 'idempotency_keys', ['locked_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('idx_idempotency_keys_locked_at', table_name='idempotency_keys')
+    op.drop_table('idempotency_keys')
@@ -0,0 +1,33 @@
+"""add_attachment_blob_previews
+
+Revision ID: c58e1f4a9d27
+Revises: 7a3f9d2e6b14
+Create Date: 2026-10-18 20:41:07.513386
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c58e1f4a9d27'
+down_revision: Union[str, None] = '7a3f9d2e6b14'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Encrypted thumbnails / PDF first-page previews, generated in the background
+    # (see app/services/attachment_previews.py)
+    op.add_column(
+        'attachment_blobs',
+        sa.Column('preview_status', sa.String(length=20), nullable=False, server_default='pending')
+    )
+    op.add_column('attachment_blobs', sa.Column('preview_key', sa.String(length=500), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('attachment_blobs', 'preview_key')
+    op.drop_column('attachment_blobs', 'preview_status')
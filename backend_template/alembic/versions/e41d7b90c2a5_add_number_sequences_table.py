@@ -0,0 +1,35 @@
+"""add_number_sequences_table
+
+Revision ID: e41d7b90c2a5
+Revises: 9c4e2a7f1b63
+Create Date: 2026-10-18 15:22:07.913374
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e41d7b90c2a5'
+down_revision: Union[str, None] = '9c4e2a7f1b63'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Block-allocated counters for order / invoice / ticket numbers (see app/services/number_allocator.py).
+    # Rows are created lazily and seeded from the highest number already issued in the series.
+    op.create_table(
+        'number_sequences',
+        sa.Column('name', sa.String(length=100), nullable=False),
+        sa.Column('next_value', sa.BigInteger(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint('name'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('number_sequences')
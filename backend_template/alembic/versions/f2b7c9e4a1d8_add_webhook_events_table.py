@@ -0,0 +1,49 @@
+"""add_webhook_events_table
+
+Revision ID: f2b7c9e4a1d8
+Revises: c58e1f4a9d27
+Create Date: 2026-10-18 22:16:35.804112
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2b7c9e4a1d8'
+down_revision: Union[str, None] = 'c58e1f4a9d27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Durable webhook inbox (see app/services/webhook_inbox.py)
+    op.create_table(
+        'webhook_events',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('provider', sa.String(length=20), nullable=False, server_default='razorpay'),
+        sa.Column('event_id', sa.String(length=100), nullable=False),
+        sa.Column('event_type', sa.String(length=50), nullable=False),
+        sa.Column('order_key', sa.String(length=100), nullable=True),
+        sa.Column('payload', sa.JSON(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False, server_default='received'),
+        sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('run_after', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('locked_by', sa.String(length=100), nullable=True),
+        sa.Column('locked_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('received_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.Column('processed_at', sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('event_id'),
+    )
+    op.create_index('idx_webhook_events_status_run_after', 'webhook_events', ['status', 'run_after'], unique=False)
+    op.create_index('idx_webhook_events_order_key_id', 'webhook_events', ['order_key', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('idx_webhook_events_order_key_id', table_name='webhook_events')
+    op.drop_index('idx_webhook_events_status_run_after', table_name='webhook_events')
+    op.drop_table('webhook_events')
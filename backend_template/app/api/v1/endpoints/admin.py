@@ -1,7 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func, and_, or_
-from datetime import datetime, timedelta
 from typing import Dict, Any, List
 
 from app.core.database import get_db
@@ -10,9 +9,9 @@ from app.models.users import UserProfile
 from app.models.server import Server
 from app.models.order import Order
 from app.models.support import SupportTicket
-from app.models.affiliate import Referral
 from app.models.roles import Department, Role, Permission, UserDepartment, user_roles
 from app.models.plan import HostingPlan
+from app.services.stats_service import StatsService
 from pydantic import BaseModel
 from typing import Optional
 
@@ -104,68 +103,7 @@ async def get_admin_stats(
     current_user: UserProfile = Depends(require_admin)
 ):
     """Get admin dashboard statistics"""
-    
-    # Get total users count
-    users_stmt = select(func.count(UserProfile.id))
-    users_result = await db.execute(users_stmt)
-    total_users = users_result.scalar() or 0
-    
-    # Get users created this month
-    current_month_start = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    users_this_month_stmt = select(func.count(UserProfile.id)).where(
-        UserProfile.created_at >= current_month_start
-    )
-    users_this_month_result = await db.execute(users_this_month_stmt)
-    users_this_month = users_this_month_result.scalar() or 0
-    
-    # Get active servers count
-    servers_stmt = select(func.count(Server.id)).where(Server.server_status == 'active')
-    servers_result = await db.execute(servers_stmt)
-    active_servers = servers_result.scalar() or 0
-    
-    # Get total servers count
-    total_servers_stmt = select(func.count(Server.id))
-    total_servers_result = await db.execute(total_servers_stmt)
-    total_servers = total_servers_result.scalar() or 0
-    
-    # Get total orders count
-    orders_stmt = select(func.count(Order.id))
-    orders_result = await db.execute(orders_stmt)
-    total_orders = orders_result.scalar() or 0
-    
-    # Get monthly revenue (sum of completed orders this month)
-    monthly_revenue_stmt = select(func.sum(Order.total_amount)).where(
-        and_(
-            Order.created_at >= current_month_start,
-            Order.order_status == 'completed'
-        )
-    )
-    monthly_revenue_result = await db.execute(monthly_revenue_stmt)
-    monthly_revenue = float(monthly_revenue_result.scalar() or 0)
-    
-    # Get open support tickets
-    open_tickets_stmt = select(func.count(SupportTicket.id)).where(
-        SupportTicket.status.in_(['open', 'in_progress'])
-    )
-    open_tickets_result = await db.execute(open_tickets_stmt)
-    open_tickets = open_tickets_result.scalar() or 0
-    
-    # Get referral program status
-    referrals_stmt = select(func.count(Referral.id)).where(Referral.status == 'active')
-    referrals_result = await db.execute(referrals_stmt)
-    active_referrals = referrals_result.scalar() or 0
-    
-    return {
-        "total_users": total_users,
-        "users_this_month": users_this_month,
-        "active_servers": active_servers,
-        "total_servers": total_servers,
-        "total_orders": total_orders,
-        "monthly_revenue": monthly_revenue,
-        "open_tickets": open_tickets,
-        "active_referrals": active_referrals,
-        "referral_status": "Active" if active_referrals > 0 else "Inactive"
-    }
+    return await StatsService().get_admin_stats(db)
 
 
 @router.get("/users")
@@ -12,7 +12,7 @@ from app.services.affiliate_service import AffiliateService
 from app.schemas.affiliate import (
     AffiliateSubscriptionCreate, AffiliateSubscriptionResponse,
     AffiliateStatsResponse, PayoutRequest, PayoutResponse,
-    PayoutActionRequest, CommissionDetail, TeamMember,
+    PayoutActionRequest, CommissionDetail, TeamMember, TeamMemberPage,
     AffiliateDashboard, CommissionRuleResponse
 )
 from app.models.users import UserProfile
@@ -211,6 +211,25 @@ async def get_team_members(
     return await affiliate_service.get_team_members(db, current_user.id, level)
 
 
+@router.get("/team/members/page", response_model=TeamMemberPage)
+async def get_team_members_page(
+    level: Optional[int] = Query(None, ge=1, le=3, description="Filter by level (1, 2, or 3)"),
+    sort_by: str = Query("joined", description="Sort by: joined, purchases, or commission"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    limit: int = Query(50, ge=1, le=200),
+    db: AsyncSession = Depends(get_db),
+    current_user: UserProfile = Depends(get_current_user)
+):
+    """Get team members one page at a time (cursor paginated)"""
+    try:
+        items, next_cursor = await affiliate_service.get_team_page(
+            db, current_user.id, level=level, sort_by=sort_by, cursor=cursor, limit=limit
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return TeamMemberPage(items=items, next_cursor=next_cursor)
+
+
 @router.get("/team/hierarchy")
 async def get_team_hierarchy(
     db: AsyncSession = Depends(get_db),
@@ -1,13 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Body
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Body, Header
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from pydantic import BaseModel
-import io
 
 from app.core.database import get_db
 from app.core.security import get_current_user
 from app.services.file_service import SecureFileService
+from app.services.attachment_previews import attachment_previews
+from app.services.job_queue import notify_job_workers
 from app.models.users import UserProfile
 from app.models.ticket_attachment import TicketAttachment
 from sqlalchemy import select
@@ -50,6 +51,11 @@ async def upload_attachment(
             message_id=message_id
         )
         
+        # Thumbnail / first-page preview is rendered in the background
+        if await attachment_previews.enqueue(db, attachment):
+            await db.commit()
+            notify_job_workers()
+        
         return {
             "id": attachment.id,
             "filename": attachment.original_filename,
@@ -113,33 +119,84 @@ async def list_attachments(
 @router.get("/attachments/{attachment_id}/download")
 async def download_attachment(
     attachment_id: int,
+    range_header: Optional[str] = Header(None, alias="Range"),
     db: AsyncSession = Depends(get_db),
     current_user: UserProfile = Depends(get_current_user)
 ):
     """
-    Download and decrypt an attachment
+    Download and decrypt an attachment (supports single `Range: bytes=` requests)
     
     Security features:
     - Access control verification
-    - Decryption
-    - Integrity check
+    - Streaming decryption (constant memory per download)
+    - Per-chunk authentication (integrity)
     - Download tracking
     """
     file_service = SecureFileService()
     
     try:
-        file_data, filename, mime_type = await file_service.download_file(
+        download = await file_service.download_file(
+            db=db,
+            attachment_id=attachment_id,
+            user=current_user,
+            range_header=range_header
+        )
+        
+        headers = {
+            "Content-Disposition": f'attachment; filename="{download.filename}"',
+            "Content-Length": str(download.end - download.start + 1),
+            "Accept-Ranges": "bytes",
+        }
+        if download.partial:
+            headers["Content-Range"] = f"bytes {download.start}-{download.end}/{download.size}"
+        
+        return StreamingResponse(
+            download.chunks,
+            status_code=status.HTTP_206_PARTIAL_CONTENT if download.partial else status.HTTP_200_OK,
+            media_type=download.mime_type,
+            headers=headers
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"File download failed: {str(e)}"
+        )
+
+
+@router.get("/attachments/{attachment_id}/preview")
+async def preview_attachment(
+    attachment_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user: UserProfile = Depends(get_current_user)
+):
+    """
+    Small JPEG preview of an image or PDF attachment (a few KB instead of the whole file)
+    
+    - 200: the preview image
+    - 202: still being generated, retry shortly
+    - 404: no preview for this file type, or it could not be rendered
+    """
+    try:
+        preview = await attachment_previews.download(
             db=db,
             attachment_id=attachment_id,
             user=current_user
         )
+        if preview is None:
+            return JSONResponse(
+                status_code=status.HTTP_202_ACCEPTED,
+                content={"status": "pending", "message": "Preview is being generated"},
+                headers={"Retry-After": "2"}
+            )
         
         return StreamingResponse(
-            io.BytesIO(file_data),
-            media_type=mime_type,
+            preview.chunks,
+            media_type=preview.mime_type,
             headers={
-                "Content-Disposition": f'attachment; filename="{filename}"',
-                "Content-Length": str(len(file_data))
+                "Content-Disposition": f'inline; filename="{preview.filename}"',
+                "Content-Length": str(preview.size),
             }
         )
     except HTTPException:
@@ -147,7 +204,7 @@ async def download_attachment(
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"File download failed: {str(e)}"
+            detail=f"Preview failed: {str(e)}"
         )
 
 
@@ -10,6 +10,7 @@ from app.services.server_service import ServerService
 from app.services.order_service import OrderService
 from app.services.support_service import SupportService
 from app.services.invoice_service import InvoiceService
+from app.services.dashboard_service import DashboardAssembler
 from app.schemas.dashboard import DashboardResponse, CustomerDashboard, AdminDashboard
 from app.schemas.users import User
 
@@ -20,7 +21,6 @@ router = APIRouter()
 
 @router.get("/overview", response_model=CustomerDashboard)
 async def get_customer_dashboard(
-    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
     """
@@ -31,24 +31,19 @@ async def get_customer_dashboard(
         server_service = ServerService()
         invoice_service = InvoiceService()
         support_service = SupportService()
+        user_id = current_user.id
 
-        # ✅ Await all async service methods
-        active_servers = await server_service.get_user_active_servers_count(db, current_user.id)
-        monthly_cost = await invoice_service.get_user_monthly_cost(db, current_user.id)
-        open_tickets = await support_service.get_user_open_tickets_count(db, current_user.id)
-        bandwidth_used = await server_service.get_user_bandwidth_used(db, current_user.id)
-
-        recent_servers = await server_service.get_user_recent_servers(db, current_user.id, limit=3)
-        recent_invoices = await invoice_service.get_user_recent_invoices(db, current_user.id, limit=2)
-
-        return CustomerDashboard(
-            active_servers=active_servers,
-            monthly_cost=monthly_cost,
-            open_tickets=open_tickets,
-            bandwidth_used=bandwidth_used,
-            recent_servers=recent_servers,
-            recent_invoices=recent_invoices
-        )
+        # ✅ Independent sections run concurrently, each on its own session
+        sections, failed = await DashboardAssembler().assemble({
+            "active_servers": lambda db: server_service.get_user_active_servers_count(db, user_id),
+            "monthly_cost": lambda db: invoice_service.get_user_monthly_cost(db, user_id),
+            "open_tickets": lambda db: support_service.get_user_open_tickets_count(db, user_id),
+            "bandwidth_used": lambda db: server_service.get_user_bandwidth_used(db, user_id),
+            "recent_servers": lambda db: server_service.get_user_recent_servers(db, user_id, limit=3),
+            "recent_invoices": lambda db: invoice_service.get_user_recent_invoices(db, user_id, limit=2),
+        })
+
+        return CustomerDashboard(**sections, failed_sections=failed)
 
     except Exception as e:
         import traceback
@@ -60,7 +55,6 @@ async def get_customer_dashboard(
 
 @router.get("/admin", response_model=AdminDashboard)
 async def get_admin_dashboard(
-    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_admin_user),
 ):
     """
@@ -78,25 +72,19 @@ async def get_admin_dashboard(
         invoice_service = InvoiceService()
         referral_service = ReferralService()
 
-        # Await all async service methods
-        user_stats = await user_service.get_user_stats(db)
-        server_stats = await server_service.get_server_stats(db)
-        order_stats = await order_service.get_order_stats(db)
-        invoice_stats = await invoice_service.get_invoice_stats(db)
-        support_stats = await support_service.get_support_stats(db)
-        referral_stats = await referral_service.get_admin_referral_stats(db)
-        recent_activity = await user_service.get_recent_activity(db, limit=10)
-
-        # Return combined dashboard response
-        return AdminDashboard(
-            user_stats=user_stats,
-            server_stats=server_stats,
-            order_stats=order_stats,
-            invoice_stats=invoice_stats,
-            support_stats=support_stats,
-            referral_stats=referral_stats,
-            recent_activity=recent_activity
-        )
+        # Independent sections run concurrently, each on its own session
+        sections, failed = await DashboardAssembler().assemble({
+            "user_stats": user_service.get_user_stats,
+            "server_stats": server_service.get_server_stats,
+            "order_stats": order_service.get_order_stats,
+            "invoice_stats": invoice_service.get_invoice_stats,
+            "support_stats": support_service.get_support_stats,
+            "referral_stats": referral_service.get_admin_referral_stats,
+            "recent_activity": lambda db: user_service.get_recent_activity(db, limit=10),
+        })
+
+        # Return combined dashboard response (partial if some sections failed)
+        return AdminDashboard(**sections, failed_sections=failed)
 
     except Exception as e:
         raise HTTPException(
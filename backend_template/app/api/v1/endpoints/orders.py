@@ -1084,13 +1084,14 @@
 
 
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Header, Request, status
 from typing import List, Optional
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.database import get_db
 from app.core.security import get_current_user, get_current_admin_user
 from app.services.order_service import OrderService
+from app.services.idempotency import IDEMPOTENCY_HEADER, idempotency_store
 from app.schemas.order import (
     Order,
     OrderCreate,
@@ -1210,30 +1211,38 @@ async def get_order(
 @router.post("/", response_model=OrderWithInvoiceResponse)
 async def create_order(
     order_data: OrderCreate,
+    request: Request,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER),
 ):
     """
     Create a new order and auto-generate its invoice
+    (a retry with the same Idempotency-Key gets the first response back)
     """
-    try:
-        service = OrderService()
-        result = await service.create_order(db, current_user.id, order_data)
+    async def create():
+        try:
+            service = OrderService()
+            result = await service.create_order(db, current_user.id, order_data)
 
-        if not result:
+            if not result:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Order creation failed"
+                )
+
+            return result
+        except HTTPException:
+            raise
+        except Exception as e:
             raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Order creation failed"
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Error creating order: {str(e)}"
             )
 
-        return result
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error creating order: {str(e)}"
-        )
+    return await idempotency_store.run(
+        request, idempotency_key, current_user.id, order_data, create, OrderWithInvoiceResponse, db=db
+    )
 
 
 # ---------------------- UPDATE ORDER ----------------------
@@ -2,16 +2,24 @@ from fastapi import APIRouter, Depends, HTTPException, Request, Header
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional, Dict, Any
 from decimal import Decimal
-from datetime import datetime
+import hashlib
+import json
 
 from app.core.database import get_db
 from app.core.security import get_current_user
 from app.services.payment_service import PaymentService
-from app.services.commission_service import CommissionService
+from app.services.job_queue import notify_job_workers
+from app.services.idempotency import IDEMPOTENCY_HEADER, idempotency_store
+from app.services.webhook_inbox import WebhookInbox, notify_webhook_consumers, razorpay_order_key
+from app.services.payment_fulfillment import (
+    enqueue_fulfillment, server_hostname,
+    DISTRIBUTE_COMMISSION, PROVISION_SERVER, PROVISION_INVOICE_SERVER,
+    ACTIVATE_AFFILIATE, ACTIVATE_SUBSCRIPTION
+)
 from app.services.order_service import OrderService
 from app.services.plan_service import PlanService
 from app.schemas.users import User
-from app.models.payment import PaymentType, PaymentStatus
+from app.models.payment import PaymentType
 from app.core.config import settings
 from pydantic import BaseModel
 
@@ -59,8 +67,26 @@ class VerifyPaymentRequest(BaseModel):
 @router.post("/create-order")
 async def create_payment_order(
     payment_request: CreatePaymentRequest,
+    request: Request,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER)
+):
+    """
+    Create Razorpay payment order for subscription (499 plan) or server purchase.
+    A retry with the same Idempotency-Key gets the first response back instead
+    of a second transaction and gateway order.
+    """
+    return await idempotency_store.run(
+        request, idempotency_key, current_user.id, payment_request,
+        lambda: _create_payment_order(payment_request, db, current_user), db=db
+    )
+
+
+async def _create_payment_order(
+    payment_request: CreatePaymentRequest,
+    db: AsyncSession,
+    current_user: User
 ):
     """
     Create Razorpay payment order for subscription (499 plan) or server purchase
@@ -219,16 +245,17 @@ async def verify_payment(
     This endpoint:
     1. Verifies Razorpay payment signature
     2. Updates PaymentTransaction to PAID status
-    3. Creates Order in database
-    4. Distributes commission (if user activated via referral)
-    5. Updates user subscription status (for subscription payments)
+    3. Creates Order in database (or marks the paid invoice / order)
+    4. Enqueues fulfillment jobs - commission distribution, server provisioning,
+       affiliate / subscription activation (see payment_fulfillment.py)
+    Steps 2-4 are committed as one transaction: a crash part-way leaves the
+    payment unpaid, never PAID without its jobs.
     """
     import time
     start_time = time.time()
     print(f"🔄 Payment verification started at {start_time}")
     
     payment_service = PaymentService()
-    commission_service = CommissionService()
     order_service = OrderService()
 
     try:
@@ -238,16 +265,23 @@ async def verify_payment(
             db=db,
             razorpay_order_id=payment_data.razorpay_order_id,
             razorpay_payment_id=payment_data.razorpay_payment_id,
-            razorpay_signature=payment_data.razorpay_signature
+            razorpay_signature=payment_data.razorpay_signature,
+            commit=False
         )
         print(f"⏱️  Payment verification took {time.time() - t1:.2f}s")
 
+        job_payload = {
+            "payment_transaction_id": payment_transaction.id,
+            "user_id": current_user.id,
+        }
+
         # Check if this is an invoice payment
         payment_for = payment_transaction.payment_metadata.get('payment_for')
         
         if payment_for == 'invoice':
             # For invoice payment, update the invoice status
             invoice_id = payment_transaction.payment_metadata.get('invoice_id')
+            queued_jobs = []
             
             if invoice_id:
                 from sqlalchemy import select
@@ -269,10 +303,9 @@ async def verify_payment(
                     invoice_obj.payment_method = 'razorpay'
                     invoice_obj.payment_reference = payment_data.razorpay_payment_id
                     
-                    # If invoice has an associated order, create the server
+                    # If invoice has an associated order, complete it and queue its server
                     if invoice_obj.order_id:
                         from app.models.order import Order as OrderModel
-                        from app.services.server_service import ServerService
                         
                         order_result = await db.execute(
                             select(OrderModel).where(OrderModel.id == invoice_obj.order_id)
@@ -287,55 +320,13 @@ async def verify_payment(
                             order_obj.razorpay_payment_id = payment_data.razorpay_payment_id
                             order_obj.paid_at = payment_transaction.paid_at
                             
-                            # Create server
-                            server_service = ServerService()
-                            try:
-                                # Get plan details to create server
-                                from app.services.plan_service import PlanService
-                                from app.schemas.server import ServerCreate
-                                
-                                plan_service = PlanService()
-                                plan = await plan_service.get_plan_by_id(db, order_obj.plan_id)
-                                
-                                if plan:
-                                    # Extract addons and services from order metadata
-                                    order_addons = order_obj.order_metadata.get('addons', []) if order_obj.order_metadata else []
-                                    order_services = order_obj.order_metadata.get('services', []) if order_obj.order_metadata else []
-                                    billing_cycle = order_obj.billing_cycle or "monthly"
-                                    
-                                    server_data = ServerCreate(
-                                        plan_id=plan.id,
-                                        server_name=f"{plan.name} Server",
-                                        hostname=f"server-{current_user.id}-{order_obj.id}",
-                                        server_type=plan.plan_type,
-                                        operating_system="Ubuntu 22.04 LTS",
-                                        vcpu=plan.vcpu,
-                                        ram_gb=plan.ram,
-                                        storage_gb=plan.storage,
-                                        bandwidth_gb=plan.bandwidth,
-                                        monthly_cost=float(plan.monthly_price),
-                                        billing_cycle=billing_cycle,
-                                        addons=order_addons,
-                                        services=order_services
-                                    )
-                                    
-                                    server = await server_service.create_user_server(
-                                        db=db,
-                                        user_id=current_user.id,
-                                        server_data=server_data
-                                    )
-                                    
-                                    # Update order with server_id
-                                    if isinstance(server, dict):
-                                        order_obj.server_id = server.get('id')
-                                    else:
-                                        order_obj.server_id = server.id
-                                        
-                            except Exception as e:
-                                print(f"Warning: Server creation failed: {str(e)}")
-                                # Don't fail the payment if server creation fails
-                    
-                    await db.commit()
+                            queued_jobs = await enqueue_fulfillment(
+                                db, [PROVISION_INVOICE_SERVER], {**job_payload, "order_id": order_obj.id}
+                            )
+            
+            # Payment, invoice and job become visible together
+            await db.commit()
+            notify_job_workers()
             
             return {
                 "success": True,
@@ -346,7 +337,8 @@ async def verify_payment(
                     "amount": float(payment_transaction.total_amount),
                     "status": "paid",
                     "invoice_id": invoice_id
-                }
+                },
+                "fulfillment": {"status": "queued" if queued_jobs else "none", "jobs": queued_jobs}
             }
         
         # Check payment type and handle accordingly
@@ -356,46 +348,14 @@ async def verify_payment(
         
         # Handle subscription payment (₹499 premium)
         if payment_transaction.payment_type == PaymentType.SUBSCRIPTION:
-            t2 = time.time()
-            # Create affiliate subscription instead of order
-            from app.services.affiliate_service import AffiliateService
-            affiliate_service = AffiliateService()
-            
-            # Create affiliate subscription with payment details
-            from app.schemas.affiliate import AffiliateSubscriptionCreate
-            subscription_data = AffiliateSubscriptionCreate(
-                subscription_type='premium',
-                payment_method='razorpay',
-                payment_id=payment_data.razorpay_payment_id,
-                transaction_id=str(payment_transaction.id),
-                amount_paid=float(payment_transaction.total_amount)
-            )
-            
-            affiliate_sub = await affiliate_service.create_affiliate_subscription(
-                db=db,
-                user_id=current_user.id,
-                subscription_data=subscription_data
-            )
-            print(f"⏱️  Affiliate subscription creation took {time.time() - t2:.2f}s")
-            print(f"✅ Affiliate subscription created: {affiliate_sub.id}")
-            
-            # Update user profile subscription status
-            from sqlalchemy import select
-            from app.models.users import UserProfile
-            result = await db.execute(
-                select(UserProfile).where(UserProfile.id == current_user.id)
-            )
-            user = result.scalars().first()
-            if user:
-                user.subscription_status = 'active'
-                user.subscription_start = datetime.utcnow()
-                await db.commit()
+            # Affiliate subscription + user subscription status are set by the job
+            queued_jobs = await enqueue_fulfillment(db, [ACTIVATE_SUBSCRIPTION], job_payload)
             
             # Set order data for response (subscription doesn't create order)
             order_data = {
                 'id': None,
-                'order_number': f'SUB-{affiliate_sub.id}',
-                'order_status': 'active',
+                'order_number': f'SUB-{payment_transaction.id}',
+                'order_status': 'processing',
                 'is_subscription': True
             }
             
@@ -413,7 +373,7 @@ async def verify_payment(
                 payment_status='paid'
             )
 
-            order = await order_service.create_order(db, current_user.id, order_create)
+            order = await order_service.create_order(db, current_user.id, order_create, commit=False)
             print(f"⏱️  Order creation took {time.time() - t2:.2f}s")
 
             # Extract order details from the returned dictionary
@@ -425,7 +385,8 @@ async def verify_payment(
             await payment_service.link_payment_to_order(
                 db=db,
                 payment_transaction_id=payment_transaction.id,
-                order_id=order_id
+                order_id=order_id,
+                commit=False
             )
             print(f"⏱️  Payment linking took {time.time() - t3:.2f}s")
 
@@ -462,80 +423,22 @@ async def verify_payment(
                     invoice_obj.paid_at = payment_transaction.paid_at
                     invoice_obj.payment_method = 'razorpay'
                     invoice_obj.payment_reference = payment_data.razorpay_payment_id
-                
-                await db.commit()
 
-        # Distribute commission if applicable (skip for subscription payments)
-        commission_earnings = []
-        if payment_transaction.requires_commission() and payment_transaction.payment_type != PaymentType.SUBSCRIPTION:
-            t4 = time.time()
-            commission_earnings = await commission_service.distribute_commission(
-                db=db,
-                payment_transaction_id=payment_transaction.id
+            # Side effects run on the job workers, not in this request
+            job_types = []
+            if payment_transaction.requires_commission():
+                job_types.append(DISTRIBUTE_COMMISSION)
+            if payment_transaction.payment_type == PaymentType.SERVER:
+                if plan_id:
+                    job_types.append(PROVISION_SERVER)
+                job_types.append(ACTIVATE_AFFILIATE)
+            queued_jobs = await enqueue_fulfillment(
+                db, job_types, {**job_payload, "order_id": order_id, "plan_id": plan_id}
             )
-            print(f"⏱️  Commission distribution took {time.time() - t4:.2f}s")
-
-        # 🆕 Auto-create server if this is a server purchase
-        server_created = None
-        if payment_transaction.payment_type == PaymentType.SERVER and plan_id:
-            try:
-                t5 = time.time()
-                from app.services.server_service import ServerService
-                from app.schemas.server import ServerCreate
-                from sqlalchemy import select
-                from app.models.plan import HostingPlan
-
-                server_service = ServerService()
-
-                # Get plan details
-                result = await db.execute(select(HostingPlan).filter(HostingPlan.id == plan_id))
-                plan = result.scalar_one_or_none()
-
-                if plan:
-                    # Extract server config from payment metadata
-                    server_metadata = payment_transaction.payment_metadata or {}
-
-                    server_data = ServerCreate(
-                        server_name=server_metadata.get('server_name', f'{plan.name} Server'),
-                        hostname=server_metadata.get('hostname', f'server-{current_user.id}-{order_id}.bidua.com'),
-                        server_type='VPS',
-                        operating_system=server_metadata.get('os', 'Ubuntu 22.04 LTS'),
-                        vcpu=plan.cpu_cores,
-                        ram_gb=plan.ram_gb,
-                        storage_gb=plan.storage_gb,
-                        bandwidth_gb=plan.bandwidth_gb or 1000,
-                        plan_id=plan.id,
-                        monthly_cost=plan.base_price
-                    )
-
-                    server_created = await server_service.create_user_server(db, current_user.id, server_data)
-                    print(f"✅ Server {server_created.id} created for user {current_user.id}")
-                    print(f"⏱️  Server creation took {time.time() - t5:.2f}s")
-            except Exception as e:
-                print(f"❌ Server creation failed: {str(e)}")
-                print(f"⏱️  Failed server creation took {time.time() - t5:.2f}s")
-                # Don't fail payment verification, but log the error
-                import traceback
-                traceback.print_exc()
-
-        # 🆕 Auto-activate affiliate subscription after server purchase
-        affiliate_activated = False
-        if payment_transaction.payment_type == PaymentType.SERVER:
-            try:
-                t6 = time.time()
-                from app.services.affiliate_service import AffiliateService
-                affiliate_service = AffiliateService()
-
-                # Activate affiliate subscription (free with server purchase)
-                affiliate_sub = await affiliate_service.check_and_activate_from_server_purchase(db, current_user.id)
-                affiliate_activated = affiliate_sub is not None
-                if affiliate_activated:
-                    print(f"✅ Affiliate subscription activated for user {current_user.id}")
-                print(f"⏱️  Affiliate activation took {time.time() - t6:.2f}s")
-            except Exception as e:
-                print(f"❌ Affiliate activation failed: {str(e)}")
-                import traceback
-                traceback.print_exc()
+
+        # Payment, order and jobs become visible together
+        await db.commit()
+        notify_job_workers()
 
         print(f"✅ Total payment verification took {time.time() - start_time:.2f}s")
 
@@ -550,7 +453,8 @@ async def verify_payment(
                 "status": payment_transaction.payment_status.value,
                 "payment_type": payment_transaction.payment_type.value,
                 "payment_method": payment_transaction.payment_method
-            }
+            },
+            "fulfillment": {"status": "queued" if queued_jobs else "none", "jobs": queued_jobs}
         }
         
         # Add order info if available
@@ -566,27 +470,31 @@ async def verify_payment(
         if payment_transaction.payment_type != PaymentType.SUBSCRIPTION:
             response["commission"] = {
                 "distributed": payment_transaction.commission_distributed,
-                "earnings_count": len(commission_earnings),
-                "total_distributed": sum(float(e.commission_amount) for e in commission_earnings)
+                "queued": DISTRIBUTE_COMMISSION in queued_jobs,
+                "earnings_count": 0,
+                "total_distributed": 0.0
             }
         
         # Add server info for server payments
         if payment_transaction.payment_type == PaymentType.SERVER:
             response["server"] = {
-                "created": server_created is not None,
-                "server_id": server_created.id if server_created else None,
-                "hostname": server_created.hostname if server_created else None
+                "created": False,
+                "queued": PROVISION_SERVER in queued_jobs,
+                "server_id": None,
+                "hostname": server_hostname(current_user.id, order_id, payment_transaction.payment_metadata) if plan_id else None
             }
             response["affiliate"] = {
-                "activated": affiliate_activated
+                "activated": False,
+                "queued": True
             }
         
         # Add affiliate info for subscription payments
         if payment_transaction.payment_type == PaymentType.SUBSCRIPTION:
             response["affiliate"] = {
-                "activated": True,
+                "activated": False,
+                "queued": True,
                 "subscription_type": "premium",
-                "message": "🎉 Your affiliate account is now active! Start referring and earning today!"
+                "message": "🎉 Your affiliate account is being activated! Start referring and earning in a moment!"
             }
         
         return response
@@ -607,81 +515,59 @@ async def verify_payment(
 async def razorpay_webhook(
     request: Request,
     db: AsyncSession = Depends(get_db),
-    x_razorpay_signature: Optional[str] = Header(None)
+    x_razorpay_signature: Optional[str] = Header(None),
+    x_razorpay_event_id: Optional[str] = Header(None)
 ):
     """
-    Handle Razorpay webhooks for payment events
+    Receive Razorpay webhooks for payment events
     
     This is called by Razorpay for events like:
     - payment.authorized
     - payment.captured
     - payment.failed
     - order.paid
+    
+    The event is verified, stored in the webhook inbox and acknowledged in one
+    round-trip; webhook consumers process it (in order per Razorpay order) right
+    after. Redeliveries of an event already stored are acknowledged and ignored.
     """
-    payment_service = PaymentService()
-    commission_service = CommissionService()
-
+    # The signature covers the raw body, so verify before parsing
+    body = await request.body()
+    
+    from app.services.razorpay_service import RazorpayService
+    razorpay_service = RazorpayService()
+    
+    is_valid = await razorpay_service.process_webhook(
+        body=body,
+        signature=x_razorpay_signature
+    )
+    
+    if not is_valid:
+        raise HTTPException(status_code=400, detail="Invalid webhook signature")
+    
     try:
-        # Get webhook payload
-        payload = await request.json()
-        
-        # Verify webhook signature
-        from app.services.razorpay_service import RazorpayService
-        razorpay_service = RazorpayService()
-        
-        is_valid = await razorpay_service.process_webhook(
+        payload = json.loads(body)
+        event = payload['event']
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Malformed webhook payload")
+    
+    try:
+        stored = await WebhookInbox().append(
+            db,
+            event_id=x_razorpay_event_id or hashlib.sha256(body).hexdigest(),
+            event_type=event,
             payload=payload,
-            signature=x_razorpay_signature
+            order_key=razorpay_order_key(payload)
         )
-
-        if not is_valid:
-            raise HTTPException(status_code=400, detail="Invalid webhook signature")
-
-        # Process webhook event
-        event = payload.get('event')
-        
-        if event == 'payment.captured':
-            # Payment was successful
-            payment_entity = payload.get('payload', {}).get('payment', {}).get('entity', {})
-            order_id = payment_entity.get('order_id')
-            payment_id = payment_entity.get('id')
-
-            # Find and update payment transaction
-            payment_transaction = await payment_service.get_payment_by_razorpay_order_id(
-                db=db,
-                razorpay_order_id=order_id
-            )
-
-            if payment_transaction and payment_transaction.payment_status == PaymentStatus.INITIATED:
-                payment_transaction.razorpay_payment_id = payment_id
-                payment_transaction.payment_status = PaymentStatus.PAID
-                payment_transaction.paid_at = datetime.utcnow()
-                await db.commit()
-
-                # Trigger commission distribution if needed
-                if payment_transaction.requires_commission():
-                    await commission_service.distribute_commission(
-                        db=db,
-                        payment_transaction_id=payment_transaction.id
-                    )
-
-        elif event == 'payment.failed':
-            # Payment failed
-            payment_entity = payload.get('payload', {}).get('payment', {}).get('entity', {})
-            order_id = payment_entity.get('order_id')
-            error_description = payment_entity.get('error_description', 'Payment failed')
-
-            await payment_service.mark_payment_failed(
-                db=db,
-                razorpay_order_id=order_id,
-                reason=error_description
-            )
-
-        return {"status": "success", "event": event}
-
     except Exception as e:
-        print(f"❌ Webhook processing error: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
+        # Not acknowledged: Razorpay redelivers
+        print(f"❌ Webhook inbox error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Webhook could not be stored")
+    
+    if stored:
+        notify_webhook_consumers()
+    
+    return {"status": "accepted" if stored else "duplicate", "event": event}
 
 
 # --------------------------------------------------------
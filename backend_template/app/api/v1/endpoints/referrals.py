@@ -360,16 +360,20 @@
 
 
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import List
+from typing import List, Optional
 
 from app.core.database import get_db
 from app.core.security import get_current_user, get_current_admin_user
+from app.services.referral_ledger import BOOKS, REFERRAL_BOOK, referral_ledger
 from app.services.referral_service import ReferralService
+from app.services.payout_batches import payout_batches
 from app.schemas.referrals import (
     ReferralPayout, ReferralPayoutCreate, ReferralPayoutAction,
-    ReferralEarning, ReferralStats
+    ReferralEarning, ReferralStats, LedgerBalance, LedgerStatementPage,
+    PayoutBatch, PayoutBatchCreate
 )
 from app.schemas.users import User
 
@@ -400,6 +404,38 @@ async def get_referral_earnings(
     return await referral_service.get_user_earnings(db, current_user.id)
 
 
+@router.get("/balance", response_model=LedgerBalance)
+async def get_ledger_balance(
+    book: str = Query(REFERRAL_BOOK, description="referral or affiliate"),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Get user's balance from the ledger snapshot"""
+    if book not in BOOKS:
+        raise HTTPException(status_code=400, detail=f"Unknown book: {book}")
+    return await referral_ledger.get_balance(db, current_user.id, book)
+
+
+@router.get("/statement", response_model=LedgerStatementPage)
+async def get_ledger_statement(
+    book: str = Query(REFERRAL_BOOK, description="referral or affiliate"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    limit: int = Query(50, ge=1, le=200),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Get user's ledger entries one page at a time (cursor paginated, newest first)"""
+    if book not in BOOKS:
+        raise HTTPException(status_code=400, detail=f"Unknown book: {book}")
+    try:
+        items, next_cursor = await referral_ledger.get_statement(
+            db, current_user.id, book, cursor=cursor, limit=limit
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return LedgerStatementPage(items=items, next_cursor=next_cursor)
+
+
 @router.get("/payouts", response_model=List[ReferralPayout])
 async def get_referral_payouts(
     db: AsyncSession = Depends(get_db),
@@ -417,16 +453,14 @@ async def request_payout(
     current_user: User = Depends(get_current_user),
     referral_service: ReferralService = Depends()
 ):
-    """Request referral payout"""
-    stats = await referral_service.get_user_referral_stats(db, current_user.id)
-
-    if stats.available_balance < payout_data.gross_amount:
-        raise HTTPException(status_code=400, detail="Insufficient balance for payout")
-
+    """Request referral payout (the amount is held on the ledger until approved or rejected)"""
     if payout_data.gross_amount < 500:
         raise HTTPException(status_code=400, detail="Minimum payout amount is ₹500")
 
-    return await referral_service.request_payout(db, current_user.id, payout_data)
+    try:
+        return await referral_service.request_payout(db, current_user.id, payout_data)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 @router.get("/referrals/list")
@@ -501,6 +535,54 @@ async def complete_payout(
     return {"message": "Payout marked as completed"}
 
 
+@router.post("/admin/payout-batches", response_model=PayoutBatch, status_code=202)
+async def create_payout_batch(
+    data: PayoutBatchCreate,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """
+    Admin: Start a payout run - every approved payout of the book is settled
+    in the background and a bank-upload file is generated
+    """
+    try:
+        return await payout_batches.create(db, data.book, created_by=current_user.id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/admin/payout-batches", response_model=List[PayoutBatch])
+async def list_payout_batches(
+    book: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Admin: Recent payout runs"""
+    return await payout_batches.list_batches(db, book)
+
+
+@router.get("/admin/payout-batches/{batch_id}/file")
+async def download_payout_batch_file(
+    batch_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Admin: Download a completed run's bank-upload file (CSV)"""
+    try:
+        batch, size = await payout_batches.open_bank_file(db, batch_id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return StreamingResponse(
+        payout_batches.bank_file_chunks(batch.file_key, size),
+        media_type="text/csv",
+        headers={
+            "Content-Disposition": f'attachment; filename="{batch.file_key}"',
+            "Content-Length": str(size),
+            "Cache-Control": "no-store",
+        }
+    )
+
+
 @router.get("/admin/stats")
 async def get_admin_referral_stats(
     db: AsyncSession = Depends(get_db),
@@ -1,8 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Header, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-from typing import List
+from typing import Any, Dict, List, Optional
+import json
+from app.core.config import settings
 from app.core.database import get_db
+from app.core.http_cache import body_etag, etag_matches
 from app.models.plan import HostingPlan
 from app.schemas.pricing import (
     HostingPlanResponse,
@@ -13,8 +16,10 @@ from app.schemas.pricing import (
     PricingQuoteResponse,
 )
 from decimal import Decimal
-from app.models.addon import Addon
-from sqlalchemy import select
+from app.services.pricing_catalog import pricing_catalog
+from app.services.pricing_engine import (
+    BILLING_TERMS, GST_PERCENT, LineItem, billing_terms, monthly_from_annual, price_cart,
+)
 
 router = APIRouter(prefix="/pricing", tags=["Pricing"])
 
@@ -85,19 +90,19 @@ async def get_plan_types():
         }
     ]
 
+# Display names; months and discounts come from the pricing engine's BILLING_TERMS
+_CYCLE_NAMES = {"semiannually": "Semi-Annually"}
+BILLING_CYCLES = [
+    {"id": cycle, "name": _CYCLE_NAMES.get(cycle, label), "discount": int(discount), "months": months}
+    for cycle, (months, label, discount) in BILLING_TERMS.items()
+]
+
 @router.get("/billing-cycles", response_model=List[BillingCycleResponse])
 async def get_billing_cycles():
     """
     Get all available billing cycles with discounts
     """
-    return [
-        {"id": "monthly", "name": "Monthly", "discount": 5, "months": 1},
-        {"id": "quarterly", "name": "Quarterly", "discount": 10, "months": 3},
-        {"id": "semiannually", "name": "Semi-Annually", "discount": 15, "months": 6},
-        {"id": "annually", "name": "Annually", "discount": 20, "months": 12},
-        {"id": "biennially", "name": "Biennially", "discount": 25, "months": 24},
-        {"id": "triennially", "name": "Triennially", "discount": 35, "months": 36}
-    ]
+    return BILLING_CYCLES
 
 @router.get("/filters", response_model=PricingFiltersResponse)
 async def get_pricing_filters():
@@ -110,125 +115,117 @@ async def get_pricing_filters():
     }
 
 
+# ==================== Quote pricing rules ====================
+# Shared by /quote and /matrix so the browser and the server price identically.
+
+# Quote field -> (addon slug, fallback monthly price per unit)
+UNIT_ADDONS = {
+    'additional_ipv4': ('additional-ipv4', Decimal('200')),
+    'extra_storage_gb': ('extra-storage', Decimal('2')),      # ₹2/GB
+    'extra_bandwidth_tb': ('extra-bandwidth', Decimal('100')),  # ₹100/TB
+}
+
+# Quote field -> selected option -> (addon slug, fallback monthly price)
+OPTION_ADDONS = {
+    'plesk_addon': {
+        'admin': ('plesk-admin', Decimal('950')),
+        'pro': ('plesk-pro', Decimal('1750')),
+        'host': ('plesk-host', Decimal('2650')),
+    },
+    'support_package': {
+        'basic': ('support-basic', Decimal('2500')),
+        'premium': ('support-premium', Decimal('7500')),
+    },
+    'managed_service': {
+        'basic': ('managed-basic', Decimal('2000')),
+        'premium': ('managed-premium', Decimal('5000')),
+    },
+    'ddos_protection': {
+        'advanced': ('ddos-advanced', Decimal('1000')),
+        'enterprise': ('ddos-enterprise', Decimal('3000')),
+    },
+}
+
+# Backup storage tiers (monthly)
+BACKUP_STORAGE_MONTHLY = {
+    '100gb': Decimal('750'),
+    '200gb': Decimal('1500'),
+    '300gb': Decimal('2250'),
+    '500gb': Decimal('3750'),
+    '1000gb': Decimal('7500'),
+}
+
+# SSL certificates are annual; quotes convert to monthly
+SSL_ANNUAL = {
+    'essential': Decimal('2700'),
+    'essential-wildcard': Decimal('13945.61'),
+    'comodo': Decimal('2500'),
+    'comodo-wildcard': Decimal('13005.86'),
+    'rapid': Decimal('3000'),
+    'rapid-wildcard': Decimal('16452.72'),
+}
+
+TAX_PERCENT = GST_PERCENT
+
+
+def _addon_price_table(catalog) -> Dict[str, Any]:
+    """Monthly price of every configurator option for one catalog snapshot"""
+    def price(slug: str, fallback: Decimal) -> Decimal:
+        addon = catalog.active_addon(slug)
+        return addon.price if addon else fallback
+
+    table: Dict[str, Any] = {field: price(slug, fallback) for field, (slug, fallback) in UNIT_ADDONS.items()}
+    for field, options in OPTION_ADDONS.items():
+        table[field] = {option: price(slug, fallback) for option, (slug, fallback) in options.items()}
+    table['backup_storage'] = dict(BACKUP_STORAGE_MONTHLY)
+    table['ssl_certificate'] = {name: monthly_from_annual(annual) for name, annual in SSL_ANNUAL.items()}
+    return table
+
+
 @router.post("/quote", response_model=PricingQuoteResponse)
-async def get_pricing_quote(
-    payload: PricingQuoteRequest,
-    db: AsyncSession = Depends(get_db)
-):
+async def get_pricing_quote(payload: PricingQuoteRequest):
     """
     Calculate a pricing quote for a given plan, billing cycle and selected add-ons.
 
     This endpoint is designed to be used by the checkout page so the summary is
-    computed on the backend instead of only on the UI.
+    computed on the backend instead of only on the UI. Prices come from the
+    in-memory pricing catalog, so a quote issues no database queries.
+    For live slider updates prefer GET /pricing/matrix and price in the browser.
     """
+    catalog = await pricing_catalog.get()
+
     # 1) Fetch plan
-    plan_result = await db.execute(select(HostingPlan).where(HostingPlan.id == payload.plan_id))
-    plan = plan_result.scalar_one_or_none()
+    plan = catalog.plans.get(payload.plan_id)
     if not plan:
         raise HTTPException(status_code=404, detail="Plan not found")
 
-    # 2) Helper to get addon price by slug with a fallback
-    async def addon_price(slug: str, fallback: Decimal) -> Decimal:
-        try:
-            res = await db.execute(select(Addon).where(Addon.slug == slug, Addon.is_active == True))
-            addon = res.scalar_one_or_none()
-            if addon and addon.price is not None:
-                return Decimal(str(addon.price))
-        except Exception:
-            pass
-        return Decimal(str(fallback))
+    # 2) Configurator option prices for this catalog version
+    prices = _addon_price_table(catalog)
 
     qty = max(1, payload.quantity or 1)
 
-    # 3) Base monthly and addons monthly
-    base_monthly = Decimal(str(plan.monthly_price))
+    # 3) Cycle months and discount
+    months, label, discount_percent = billing_terms(payload.billing_cycle) or (1, 'Monthly', Decimal('0'))
 
-    addons_monthly = Decimal('0')
-    # IPv4
-    if payload.additional_ipv4 and payload.additional_ipv4 > 0:
-        price_per_ip = await addon_price('additional-ipv4', Decimal('200'))
-        addons_monthly += price_per_ip * Decimal(str(payload.additional_ipv4))
-
-    # Extra storage (₹2/GB)
-    if payload.extra_storage_gb and payload.extra_storage_gb > 0:
-        price_per_gb = await addon_price('extra-storage', Decimal('2'))
-        addons_monthly += price_per_gb * Decimal(str(payload.extra_storage_gb))
-
-    # Extra bandwidth (₹100/TB)
-    if payload.extra_bandwidth_tb and payload.extra_bandwidth_tb > 0:
-        price_per_tb = await addon_price('extra-bandwidth', Decimal('100'))
-        addons_monthly += price_per_tb * Decimal(str(payload.extra_bandwidth_tb))
-
-    # Plesk license
-    if payload.plesk_addon == 'admin':
-        addons_monthly += await addon_price('plesk-admin', Decimal('950'))
-    elif payload.plesk_addon == 'pro':
-        addons_monthly += await addon_price('plesk-pro', Decimal('1750'))
-    elif payload.plesk_addon == 'host':
-        addons_monthly += await addon_price('plesk-host', Decimal('2650'))
-
-    # Backup storage tiers
-    backup_map = {
-        '100gb': Decimal('750'),
-        '200gb': Decimal('1500'),
-        '300gb': Decimal('2250'),
-        '500gb': Decimal('3750'),
-        '1000gb': Decimal('7500'),
-    }
-    if payload.backup_storage in backup_map:
-        addons_monthly += backup_map[payload.backup_storage]
-
-    # SSL certificates are annual; convert to monthly
-    ssl_annual_map = {
-        'essential': Decimal('2700'),
-        'essential-wildcard': Decimal('13945.61'),
-        'comodo': Decimal('2500'),
-        'comodo-wildcard': Decimal('13005.86'),
-        'rapid': Decimal('3000'),
-        'rapid-wildcard': Decimal('16452.72'),
-    }
-    if payload.ssl_certificate in ssl_annual_map:
-        addons_monthly += (ssl_annual_map[payload.ssl_certificate] / Decimal('12')).quantize(Decimal('1'))
-
-    # Support packages
-    if payload.support_package == 'basic':
-        addons_monthly += await addon_price('support-basic', Decimal('2500'))
-    elif payload.support_package == 'premium':
-        addons_monthly += await addon_price('support-premium', Decimal('7500'))
-
-    # Managed services
-    if payload.managed_service == 'basic':
-        addons_monthly += await addon_price('managed-basic', Decimal('2000'))
-    elif payload.managed_service == 'premium':
-        addons_monthly += await addon_price('managed-premium', Decimal('5000'))
-
-    # DDoS protection
-    if payload.ddos_protection == 'advanced':
-        addons_monthly += await addon_price('ddos-advanced', Decimal('1000'))
-    elif payload.ddos_protection == 'enterprise':
-        addons_monthly += await addon_price('ddos-enterprise', Decimal('3000'))
-
-    # 4) Cycle months and discount
-    cycle_map = {
-        'monthly': (1, 'Monthly', Decimal('5')),
-        'quarterly': (3, 'Quarterly', Decimal('10')),
-        'semiannually': (6, 'Semiannually', Decimal('15')),
-        'annually': (12, 'Annually', Decimal('20')),
-        'biennially': (24, 'Biennially', Decimal('25')),
-        'triennially': (36, 'Triennially', Decimal('35')),
-    }
-    months, label, discount_percent = cycle_map.get(payload.billing_cycle, (1, 'Monthly', Decimal('0')))
+    # 4) One line per server component; the engine prices the cart
+    base_monthly = plan.monthly_price
+    lines = [LineItem('plan', plan.name, base_monthly, Decimal(qty), months, ref_id=plan.id)]
 
-    # 5) Subtotals and totals
-    per_server_monthly = base_monthly + addons_monthly
-    subtotal_before_discount = per_server_monthly * Decimal(str(months)) * Decimal(str(qty))
+    addons_monthly = Decimal('0')
+    for field in UNIT_ADDONS:
+        units = getattr(payload, field)
+        if units and units > 0:
+            lines.append(LineItem('addon', field, prices[field], Decimal(units) * qty, months))
+            addons_monthly += prices[field] * Decimal(units)
 
-    discount_amount = (subtotal_before_discount * discount_percent / Decimal('100')).quantize(Decimal('1.00')) if discount_percent > 0 else Decimal('0.00')
-    subtotal_after_discount = subtotal_before_discount - discount_amount
+    for field in ('plesk_addon', 'backup_storage', 'ssl_certificate', 'support_package', 'managed_service', 'ddos_protection'):
+        selected = getattr(payload, field)
+        if selected in prices[field]:
+            lines.append(LineItem('addon', f"{field}:{selected}", prices[field][selected], Decimal(qty), months))
+            addons_monthly += prices[field][selected]
 
-    tax_percent = Decimal('18.00')
-    tax_amount = (subtotal_after_discount * tax_percent / Decimal('100')).quantize(Decimal('1.00'))
-    total = subtotal_after_discount + tax_amount
+    # 5) Subtotals and totals
+    totals = price_cart(lines, discount_percent).quote_totals()
 
     return {
         'success': True,
@@ -237,13 +234,93 @@ async def get_pricing_quote(
             'cycle_months': months,
             'base_monthly': base_monthly,
             'addons_monthly': addons_monthly,
-            'subtotal_before_discount': subtotal_before_discount,
             'discount_percent': discount_percent,
-            'discount_amount': discount_amount,
-            'subtotal_after_discount': subtotal_after_discount,
-            'tax_percent': tax_percent,
-            'tax_amount': tax_amount,
-            'total': total,
+            'tax_percent': TAX_PERCENT,
             'currency': 'INR',
+            **totals,
         }
     }
+
+
+# ==================== Pricing matrix ====================
+
+_matrix_cache: Dict[str, Any] = {"version": None, "etag": None, "body": None}
+
+
+def _build_matrix(catalog) -> bytes:
+    """Every active plan x billing cycle, plus per-unit addon deltas, as one JSON document"""
+    cycles = []
+    for cycle in BILLING_CYCLES:
+        months, label, discount_percent = BILLING_TERMS[cycle['id']]
+        cycles.append({'id': cycle['id'], 'name': cycle['name'], 'label': label,
+                       'months': months, 'discount_percent': discount_percent})
+
+    plans = []
+    for plan in sorted(catalog.plans.values(), key=lambda p: (p.monthly_price, p.id)):
+        if not plan.is_active:
+            continue
+        plans.append({
+            'id': plan.id,
+            'name': plan.name,
+            'plan_type': plan.plan_type,
+            'cpu_cores': plan.cpu_cores,
+            'ram_gb': plan.ram_gb,
+            'storage_gb': plan.storage_gb,
+            'bandwidth_gb': plan.bandwidth_gb,
+            'base_monthly': plan.monthly_price,
+            # Totals for one server with no add-ons
+            'cycles': {
+                cycle['id']: price_cart(
+                    [LineItem('plan', plan.name, plan.monthly_price, Decimal('1'), cycle['months'], ref_id=plan.id)],
+                    cycle['discount_percent'],
+                ).quote_totals()
+                for cycle in cycles
+            },
+        })
+
+    document = {
+        'catalog_version': catalog.version,
+        'currency': 'INR',
+        'tax_percent': TAX_PERCENT,
+        # Same arithmetic as POST /pricing/quote
+        'formula': {
+            'per_server_monthly': 'base_monthly + sum(unit_addons[f] * units) + sum(option_addons[f][choice])',
+            'subtotal_before_discount': 'per_server_monthly * months * quantity',
+            'discount_amount': 'round_half_up(subtotal_before_discount * discount_percent / 100, 2)',
+            'tax_amount': 'round_half_up((subtotal_before_discount - discount_amount) * tax_percent / 100, 2)',
+            'total': 'subtotal_before_discount - discount_amount + tax_amount',
+        },
+        'billing_cycles': cycles,
+        'plans': plans,
+        'addons': _addon_price_table(catalog),
+    }
+    return json.dumps(document, default=str, separators=(',', ':')).encode()
+
+
+@router.get("/matrix")
+async def get_pricing_matrix(if_none_match: Optional[str] = Header(None)):
+    """
+    Complete price list for the checkout configurator, rebuilt once per catalog version.
+
+    The browser prices any plan / cycle / add-on combination locally from this
+    document and revalidates it with If-None-Match (304 while unchanged).
+    Orders are still priced and validated server-side.
+    """
+    catalog = await pricing_catalog.get()
+    if _matrix_cache["version"] != catalog.version or _matrix_cache["body"] is None:
+        body = _build_matrix(catalog)
+        _matrix_cache.update(
+            version=catalog.version,
+            etag=body_etag(body),
+            body=body,
+        )
+
+    etag = _matrix_cache["etag"]
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={settings.PRICING_MATRIX_MAX_AGE_SECONDS}",
+    }
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    return Response(content=_matrix_cache["body"], media_type="application/json", headers=headers)
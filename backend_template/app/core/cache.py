@@ -0,0 +1,135 @@
+"""
+Small in-process TTL cache with tag-based invalidation.
+Per worker process only - entries are never shared between API nodes.
+"""
+import time
+from itertools import chain
+from threading import Lock
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, Optional, Set, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+
+class TTLCache:
+    """Key/value cache whose entries expire after `ttl_seconds` or when one of their tags is invalidated"""
+
+    def __init__(self, ttl_seconds: float, maxsize: int = 256):
+        self.ttl_seconds = ttl_seconds
+        self.maxsize = maxsize
+        self._entries: Dict[Hashable, Tuple[float, Any, frozenset]] = {}
+        self._lock = Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value, _ = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            return value
+
+    def set(self, key: Hashable, value: Any, tags: Iterable[str] = ()) -> None:
+        with self._lock:
+            if len(self._entries) >= self.maxsize and key not in self._entries:
+                # Drop the entry closest to expiry to make room
+                oldest = min(self._entries, key=lambda k: self._entries[k][0])
+                del self._entries[oldest]
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value, frozenset(tags))
+
+    def invalidate(self, tags: Set[str]) -> None:
+        """Drop every entry tagged with any of `tags`"""
+        if not tags:
+            return
+        with self._lock:
+            stale = [k for k, (_, _, entry_tags) in self._entries.items() if entry_tags & tags]
+            for key in stale:
+                del self._entries[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    async def get_or_load(
+        self,
+        key: Hashable,
+        loader: Callable[[], Awaitable[Any]],
+        tags: Iterable[str] = ()
+    ) -> Any:
+        """Return the cached value for `key`, awaiting `loader()` on a miss"""
+        value = self.get(key)
+        if value is None:
+            value = await loader()
+            self.set(key, value, tags)
+        return value
+
+
+def invalidate_on_commit(
+    tables: Iterable[str],
+    callback: Callable[[Optional[Set[Hashable]]], None],
+    rows: Optional[Callable[[Any], Iterable[Hashable]]] = None,
+    bulk_rows: Optional[Callable[[Any], Optional[Iterable[Hashable]]]] = None,
+    before_commit: Optional[Callable[[Session], None]] = None,
+) -> None:
+    """
+    Call `callback(touched)` after every commit that wrote to one of `tables`,
+    through ORM flushes or ORM-enabled insert()/update()/delete() statements.
+    A rolled-back transaction calls nothing.
+
+    `touched` is the set of table names written, unless `rows(obj)` (flushed
+    objects) or `bulk_rows(orm_execute_state)` (statements) name finer tags.
+    `bulk_rows` returning None means the rows are unknown, and the callback
+    gets None: drop everything. `before_commit(session)` runs inside the
+    transaction, just before a commit that writes to the tables.
+    """
+    tables = frozenset(tables)
+    touched_key = object()  # this registration's entry in session.info
+
+    def _tags(obj) -> Iterable[Hashable]:
+        return rows(obj) if rows else (obj.__tablename__,)
+
+    def _touch(session, tags) -> None:
+        if touched_key in session.info and session.info[touched_key] is None:
+            return
+        if tags is None:
+            session.info[touched_key] = None
+        else:
+            session.info.setdefault(touched_key, set()).update(tags)
+
+    def _flushed(session, objects) -> None:
+        for obj in objects:
+            if getattr(obj, "__tablename__", None) in tables:
+                _touch(session, _tags(obj))
+
+    @event.listens_for(Session, "after_flush")
+    def _collect_flushed(session, flush_context):
+        _flushed(session, chain(session.new, session.dirty, session.deleted))
+
+    @event.listens_for(Session, "do_orm_execute")
+    def _collect_bulk_writes(orm_execute_state):
+        if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+            table = getattr(orm_execute_state.statement, "table", None)
+            if table is not None and table.name in tables:
+                tags = bulk_rows(orm_execute_state) if bulk_rows else (table.name,)
+                _touch(orm_execute_state.session, tags)
+
+    if before_commit is not None:
+        @event.listens_for(Session, "before_commit")
+        def _before_commit(session):
+            # Objects still pending are flushed by this commit, after this hook
+            _flushed(session, chain(session.new, session.dirty, session.deleted))
+            if touched_key in session.info:
+                before_commit(session)
+
+    @event.listens_for(Session, "after_commit")
+    def _invalidate(session):
+        if touched_key in session.info:
+            touched = session.info.pop(touched_key)
+            if touched is None or touched:
+                callback(touched)
+
+    @event.listens_for(Session, "after_rollback")
+    def _discard(session):
+        session.info.pop(touched_key, None)
@@ -17,6 +17,8 @@ class Settings(BaseSettings):
     SECRET_KEY: str
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    AUTH_USER_CACHE_TTL_SECONDS: int = 60  # per worker; local writes invalidate immediately
+    AUTH_USER_CACHE_MAXSIZE: int = 4096
 
     # 🔹 CORS - Allow all origins for Replit environment
     BACKEND_CORS_ORIGINS: List[str] = ["*"]
@@ -39,10 +41,92 @@ class Settings(BaseSettings):
     # 🔹 Admin
     DEFAULT_ADMIN_EMAIL: str = "admin@bidua.com"
 
+    # 🔹 Caching (per worker process)
+    STATS_CACHE_TTL_SECONDS: int = 30
+    COMMISSION_RATE_CACHE_TTL_SECONDS: int = 300  # local rate edits invalidate immediately; other workers within this
+
+    # 🔹 Dashboards - each section runs on its own pooled session
+    DASHBOARD_SECTION_TIMEOUT_SECONDS: float = 5.0
+
     # 🔹 Razorpay settings
     APP_NAME: str = "Razorpay Payment Gateway"
     RAZORPAY_KEY_ID: str
     RAZORPAY_KEY_SECRET: str
+    RAZORPAY_API_BASE_URL: str = "https://api.razorpay.com/v1"  # point at scripts/razorpay_stub_gateway.py for offline load tests
+    RAZORPAY_TIMEOUT_SECONDS: float = 10.0
+    RAZORPAY_MAX_RETRIES: int = 2
+    RAZORPAY_POOL_SIZE: int = 20
+    RAZORPAY_WEBHOOK_SECRET: Optional[str] = None  # secret set on the Razorpay dashboard webhook; falls back to RAZORPAY_KEY_SECRET
+
+    # 🔹 Background jobs - post-payment side effects (app/services/job_queue.py)
+    JOB_WORKERS_ENABLED: bool = True
+    JOB_WORKER_CONCURRENCY: int = 4
+    JOB_POLL_INTERVAL_SECONDS: float = 1.0
+    JOB_MAX_ATTEMPTS: int = 5
+    JOB_RETRY_BASE_SECONDS: int = 10  # doubles on every failed attempt
+    JOB_LOCK_TIMEOUT_SECONDS: int = 300  # a running job older than this is taken over by another worker
+
+    # 🔹 Webhook inbox - events stored and acknowledged at once, processed by consumers (app/services/webhook_inbox.py)
+    WEBHOOK_CONSUMERS_ENABLED: bool = True
+    WEBHOOK_CONSUMER_CONCURRENCY: int = 4
+    WEBHOOK_MAX_ATTEMPTS: int = 8
+    WEBHOOK_RETRY_BASE_SECONDS: int = 5  # doubles on every failed attempt
+
+    # 🔹 Order / invoice / ticket numbers - reserved per process in blocks (unused numbers are skipped on restart)
+    NUMBER_BLOCK_SIZE: int = 20
+
+    # 🔹 Pricing catalog - in-memory plans/addons/services, reloaded when the catalog version moves
+    PRICING_CATALOG_CHECK_SECONDS: float = 5.0  # how stale another process's admin edit can be here
+    PRICING_MATRIX_MAX_AGE_SECONDS: int = 60  # browser revalidates /pricing/matrix with If-None-Match after this
+
+    # 🔹 HTTP caching - public catalog GETs (app/core/http_cache.py); everything else is no-store
+    CATALOG_CACHE_MAX_AGE_SECONDS: int = 60  # plans / addons, revalidated against the catalog version
+    REFERENCE_CACHE_MAX_AGE_SECONDS: int = 3600  # countries, plan types, billing cycles, attachment limits
+
+    # 🔹 Attachment encryption - per-file data keys wrapped by one master key (app/services/attachment_keys.py)
+    ATTACHMENT_MASTER_KEY: Optional[str] = None  # base64, 32 bytes; derived from SECRET_KEY when unset
+    ATTACHMENT_KEY_CACHE_SIZE: int = 1024  # unwrapped data keys kept per worker
+    CRYPTO_WORKERS: int = 4  # bounded thread pool for encryption / KDF work
+
+    # 🔹 Attachment storage - "local" disk or "s3" (any S3-compatible store, e.g. MinIO) (app/services/attachment_storage.py)
+    ATTACHMENT_STORAGE_BACKEND: str = "local"  # use "s3" when running more than one API node
+    ATTACHMENT_LOCAL_DIR: str = "app/static/uploads/tickets"
+    ATTACHMENT_S3_BUCKET: Optional[str] = None
+    ATTACHMENT_S3_ENDPOINT_URL: Optional[str] = None  # e.g. http://localhost:9000 for MinIO; None for AWS
+    ATTACHMENT_S3_REGION: str = "us-east-1"
+    ATTACHMENT_S3_ACCESS_KEY_ID: Optional[str] = None  # None: boto3's default credential chain
+    ATTACHMENT_S3_SECRET_ACCESS_KEY: Optional[str] = None
+    ATTACHMENT_S3_PREFIX: str = "attachments/"
+    ATTACHMENT_S3_PART_SIZE: int = 8 * 1024 * 1024  # multipart upload part size (S3 minimum is 5 MiB)
+    ATTACHMENT_S3_READ_AHEAD: int = 1024 * 1024  # bytes fetched per ranged GET while downloading
+    STORAGE_WORKERS: int = 8  # bounded thread pool for blocking storage I/O
+
+    # 🔹 Malware scanning - every upload is scanned in full while it streams in (app/services/malware_scanner.py)
+    MALWARE_SIGNATURES_FILE: Optional[str] = None  # JSON [{"name", "hex", "max_offset"}] added to the built-in signatures
+    CLAMAV_HOST: Optional[str] = None  # also scan with a local clamd, e.g. "127.0.0.1"
+    CLAMAV_PORT: int = 3310
+    CLAMAV_SOCKET: Optional[str] = None  # unix socket instead of host/port, e.g. /run/clamav/clamd.ctl
+    CLAMAV_TIMEOUT_SECONDS: float = 30.0
+
+    # 🔹 Attachment previews - thumbnails / PDF first pages rendered in the background (app/services/attachment_previews.py)
+    PREVIEW_WORKERS: int = 2  # worker processes
+    PREVIEW_MAX_SIZE: int = 320  # px, longest side
+    PREVIEW_MAX_PIXELS: int = 40_000_000  # larger images are not decoded
+    PREVIEW_JPEG_QUALITY: int = 80
+
+    # 🔹 Attachment blobs - identical uploads share one encrypted file (app/services/attachment_blob_store.py)
+    ATTACHMENT_BLOB_GC_GRACE_SECONDS: int = 3600  # unreferenced blobs are kept this long before scripts/gc_attachment_blobs.py deletes them
+
+    # 🔹 Payout batches - monthly payout runs settled in chunks (app/services/payout_batches.py)
+    PAYOUT_BATCH_CHUNK_SIZE: int = 500  # payouts settled (and committed) per chunk; a crashed run resumes after the last chunk
+    PAYOUT_FILES_LOCAL_DIR: str = "payout_files"  # bank-upload files (account numbers: never under app/static); "s3" backend uses the prefix below
+    PAYOUT_FILES_S3_PREFIX: str = "payout-files/"
+
+    # 🔹 Idempotency keys - retried POST /orders and /payments/create-order replay the first response (app/services/idempotency.py)
+    IDEMPOTENCY_KEY_TTL_HOURS: int = 24  # a key can be reused for a new request after this; scripts/purge_idempotency_keys.py deletes older rows
+    IDEMPOTENCY_WAIT_SECONDS: float = 15.0  # a duplicate waits this long for the in-flight original, then gets 409
+    IDEMPOTENCY_LOCK_TIMEOUT_SECONDS: int = 120  # an in-flight key older than this (crashed worker) is taken over by the next retry
+    IDEMPOTENCY_POLL_SECONDS: float = 0.25  # how often a waiting duplicate checks a key owned by another process
 
     class Config:
         env_file = ".env"
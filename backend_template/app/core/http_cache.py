@@ -0,0 +1,132 @@
+"""
+HTTP cache policy per route.
+
+Public catalog GETs (plans, addons, pricing lists, countries, attachment limits)
+are served with `Cache-Control: public, max-age=...` and a strong ETag (hash of
+the body), so browsers, the marketing site and the CDN revalidate instead of
+re-downloading. Every other response - authenticated, financial, mutations,
+errors - keeps `no-store`, unless the endpoint already set its own Cache-Control
+(e.g. /pricing/matrix).
+
+Routes backed by the pricing catalog also remember the ETag of each URL per
+catalog version: a matching If-None-Match gets its 304 before the endpoint runs,
+with no database query and no serialization. Reference data defined in code uses
+a constant version; the remembered ETags are per process, so a deploy starts clean.
+"""
+import hashlib
+import re
+from collections import OrderedDict
+from typing import Awaitable, Callable, Hashable, List, NamedTuple, Optional, Pattern, Tuple
+
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request
+from starlette.responses import Response
+
+from app.core.config import settings
+from app.services.pricing_catalog import pricing_catalog
+
+
+Version = Callable[[], Awaitable[Hashable]]
+
+
+async def catalog_version() -> Hashable:
+    return (await pricing_catalog.get()).version
+
+
+async def code_version() -> Hashable:
+    return settings.VERSION
+
+
+class CachePolicy(NamedTuple):
+    pattern: Pattern
+    max_age: int
+    version: Optional[Version] = None  # None: ETag from the body only, endpoint always runs
+
+
+def _route(path: str) -> Pattern:
+    return re.compile(f"^{re.escape(settings.API_V1_STR)}{path}$")
+
+
+PUBLIC_ROUTES: List[CachePolicy] = [
+    CachePolicy(_route(r"/pricing/plans(/\d+)?"), settings.CATALOG_CACHE_MAX_AGE_SECONDS, catalog_version),
+    CachePolicy(_route(r"/plans/(\d+)?"), settings.CATALOG_CACHE_MAX_AGE_SECONDS, catalog_version),
+    CachePolicy(_route(r"/addons/([\w-]+)?"), settings.CATALOG_CACHE_MAX_AGE_SECONDS, catalog_version),
+    CachePolicy(_route(r"/pricing/(plan-types|billing-cycles|filters)"), settings.REFERENCE_CACHE_MAX_AGE_SECONDS, code_version),
+    CachePolicy(_route(r"/attachments/attachments/allowed-types"), settings.REFERENCE_CACHE_MAX_AGE_SECONDS, code_version),
+    CachePolicy(_route(r"/countries(/.*)?"), settings.REFERENCE_CACHE_MAX_AGE_SECONDS),
+]
+
+NO_STORE_HEADERS = {
+    "Cache-Control": "no-cache, no-store, must-revalidate",
+    "Pragma": "no-cache",
+    "Expires": "0",
+}
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match comparison (weak, as RFC 9110 requires for GET)"""
+    if not if_none_match:
+        return False
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag in candidates or "*" in candidates
+
+
+def body_etag(body: bytes) -> str:
+    return f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+
+def policy_for(request: Request) -> Optional[CachePolicy]:
+    if request.method != "GET":
+        return None
+    path = request.url.path
+    return next((policy for policy in PUBLIC_ROUTES if policy.pattern.match(path)), None)
+
+
+class HttpCacheMiddleware(BaseHTTPMiddleware):
+    def __init__(self, app, max_entries: int = 2048):
+        super().__init__(app)
+        self.max_entries = max_entries
+        self._etags: "OrderedDict[str, Tuple[Hashable, str]]" = OrderedDict()  # url -> (version, etag)
+
+    async def dispatch(self, request: Request, call_next):
+        policy = policy_for(request)
+        if policy is None:
+            return self._no_store(await call_next(request))
+
+        cache_control = f"public, max-age={policy.max_age}"
+        if_none_match = request.headers.get("if-none-match")
+        key = f"{request.url.path}?{request.url.query}"
+        version = await policy.version() if policy.version else None
+
+        if version is not None and if_none_match:
+            known = self._etags.get(key)
+            if known and known[0] == version and etag_matches(if_none_match, known[1]):
+                return Response(status_code=304, headers={"ETag": known[1], "Cache-Control": cache_control})
+
+        response = await call_next(request)
+        if response.status_code != 200 or "cache-control" in response.headers:
+            return self._no_store(response)
+
+        body = b"".join([chunk async for chunk in response.body_iterator])
+        etag = body_etag(body)
+        if version is not None:
+            self._remember(key, version, etag)
+
+        headers = dict(response.headers)
+        headers.pop("content-length", None)
+        headers.update({"ETag": etag, "Cache-Control": cache_control})
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
+        return Response(content=body, status_code=200, headers=headers)
+
+    def _remember(self, key: str, version: Hashable, etag: str) -> None:
+        self._etags[key] = (version, etag)
+        self._etags.move_to_end(key)
+        while len(self._etags) > self.max_entries:
+            self._etags.popitem(last=False)
+
+    @staticmethod
+    def _no_store(response: Response) -> Response:
+        if "cache-control" not in response.headers:
+            response.headers.update(NO_STORE_HEADERS)
+        return response
@@ -136,11 +136,13 @@
 
 from datetime import datetime, timedelta
 from typing import Any, Union, Optional
+import logging
 from jose import JWTError, jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.cache import TTLCache, invalidate_on_commit
 from app.core.config import settings
 from app.core.database import get_db
 from app.models.users import UserProfile
@@ -149,6 +151,15 @@ from app.utils.security_utils import get_password_hash, verify_password
 
 security = HTTPBearer()
 
+logger = logging.getLogger(__name__)
+
+# Authenticated principals by user id (per worker process). Entries are detached,
+# fully loaded UserProfile snapshots; any committed write to a user drops its entry.
+auth_user_cache = TTLCache(
+    ttl_seconds=settings.AUTH_USER_CACHE_TTL_SECONDS,
+    maxsize=settings.AUTH_USER_CACHE_MAXSIZE
+)
+
 
 def create_access_token(subject: Union[str, Any], expires_delta: timedelta = None) -> str:
     expire = datetime.utcnow() + (
@@ -173,39 +184,38 @@ async def get_current_user(
 ) -> UserProfile:
     from app.services.user_service import UserService  # moved inside to prevent circular import
 
-    print(f"=== GET_CURRENT_USER ===")
-    print(f"Token object: {token}")
-    print(f"Token type: {type(token)}")
-    if hasattr(token, 'credentials'):
-        print(f"Token credentials: {token.credentials[:50] if token.credentials else 'None'}...")
-    
     payload = verify_token(token.credentials)
-    print(f"Payload: {payload}")
-    
     if not payload or "sub" not in payload:
-        print("ERROR: Invalid payload or missing 'sub'")
+        logger.info("auth.rejected reason=invalid_token")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid authentication credentials",
         )
 
-    user_service = UserService()
-    user = await user_service.get_user_by_id(db, int(payload["sub"]))
+    user_id = int(payload["sub"])
+    user = auth_user_cache.get(user_id)
+    cache_hit = user is not None
+    if not cache_hit:
+        user = await UserService().get_user_by_id(db, user_id)
+        if user:
+            # Detach so the snapshot can be shared across requests and sessions
+            db.expunge(user)
+            auth_user_cache.set(user_id, user, tags=[_user_tag(user_id)])
+
     if not user:
-        print(f"ERROR: User not found for id {payload['sub']}")
+        logger.info("auth.rejected reason=user_not_found user_id=%s", user_id)
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
 
     if user.account_status != "active":
-        print(f"ERROR: User account not active: {user.account_status}")
+        logger.info("auth.rejected reason=inactive user_id=%s account_status=%s", user_id, user.account_status)
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Account is suspended or inactive",
         )
 
-    print(f"SUCCESS: User authenticated: {user.email}")
+    logger.debug("auth.ok user_id=%s role=%s cache_hit=%s", user_id, user.role, cache_hit)
     return user
 
-
 async def get_current_active_user(
     current_user: UserProfile = Depends(get_current_user)
 ) -> UserProfile:
@@ -227,3 +237,39 @@ async def get_current_admin_user(
         )
     return current_user
 
+
+# ==================== Auth cache invalidation ====================
+
+def _user_tag(user_id: int) -> str:
+    return f"user:{user_id}"
+
+
+def invalidate_cached_user(user_id: int) -> None:
+    """Drop a user's cached principal (e.g. after a role, status or password change)"""
+    auth_user_cache.invalidate({_user_tag(user_id)})
+
+
+def _bulk_user_tags(orm_execute_state):
+    """
+    Bulk update()/delete() on users can't name the rows - drop every cached principal,
+    unless the statement lists them with execution_options(user_ids=[...])
+    """
+    if orm_execute_state.is_insert:
+        return ()  # new users have nothing cached
+    user_ids = orm_execute_state.execution_options.get("user_ids")
+    return None if user_ids is None else {_user_tag(user_id) for user_id in user_ids}
+
+
+def _invalidate_users(tags):
+    if tags is None:
+        auth_user_cache.clear()
+    else:
+        auth_user_cache.invalidate(tags)
+
+
+invalidate_on_commit(
+    {UserProfile.__tablename__},
+    _invalidate_users,
+    rows=lambda user: (_user_tag(user.id),),
+    bulk_rows=_bulk_user_tags,
+)
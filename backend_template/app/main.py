@@ -1,8 +1,7 @@
-from fastapi import FastAPI, Request, Response
+from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from fastapi.staticfiles import StaticFiles
-from starlette.middleware.base import BaseHTTPMiddleware
 import uvicorn
 from fastapi.responses import FileResponse
 from sqlalchemy.engine import URL
@@ -11,6 +10,14 @@ from scalar_fastapi import get_scalar_api_reference
 from app.core.config import settings
 from app.api.v1.api import api_router
 from app.core.database import engine, Base
+from app.core.http_cache import HttpCacheMiddleware
+from app.services.razorpay_gateway import close_razorpay_gateway
+from app.services.job_queue import start_job_workers, stop_job_workers
+from app.services.webhook_inbox import start_webhook_consumers, stop_webhook_consumers
+from app.services.attachment_keys import attachment_keyring
+from app.services.attachment_storage import attachment_storage
+from app.services import payment_fulfillment, razorpay_webhooks, payout_batches  # noqa: F401  (register job / webhook handlers)
+from app.services.attachment_previews import attachment_previews  # also registers the preview job handler
 
 
 app = FastAPI(
@@ -99,6 +106,9 @@ app = FastAPI(
 )
 
 # Middleware
+# Cache policy per route: public + ETag for catalog GETs, no-store for everything else.
+# Added first so it sits inside CORS and its 304s still carry CORS headers.
+app.add_middleware(HttpCacheMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=settings.BACKEND_CORS_ORIGINS,
@@ -112,17 +122,6 @@ app.add_middleware(
     allowed_hosts=settings.ALLOWED_HOSTS
 )
 
-# Add no-cache headers middleware
-class NoCacheMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        response = await call_next(request)
-        response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
-        response.headers["Pragma"] = "no-cache"
-        response.headers["Expires"] = "0"
-        return response
-
-app.add_middleware(NoCacheMiddleware)
-
 # API router
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
@@ -158,6 +157,19 @@ async def on_startup():
     print(f"✅ Connected to database: {safe_url}")
     await init_models()
     print("📦 Tables initialized (if not already present).")
+    await start_job_workers()
+    await start_webhook_consumers()
+    await attachment_keyring.master_key()
+    print("🔐 Attachment master key ready.")
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await stop_webhook_consumers()
+    await stop_job_workers()
+    close_razorpay_gateway()
+    attachment_keyring.shutdown()
+    attachment_storage.shutdown()
+    attachment_previews.shutdown()
 
 # Root and health check endpoints
 @app.get("/", tags=["Introduction"])
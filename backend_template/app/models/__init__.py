@@ -10,12 +10,20 @@ from app.models.settings import UserSettings
 from app.models.support import SupportTicket
 from app.models.ticket_message import TicketMessage
 from app.models.ticket_attachment import TicketAttachment
+from app.models.attachment_blob import AttachmentBlob
 from app.models.countries import Country
 from app.models.payment import PaymentTransaction, ReferralCommissionRate, PaymentType, ActivationType, PaymentStatus
 from app.models.addon import Addon, AddonCategory, BillingType
 from app.models.service import Service, ServiceCategory
 from app.models.order_addon import OrderAddon
 from app.models.order_service import OrderService
+from app.models.referral_closure import ReferralClosure
+from app.models.referral_ledger import LedgerEntry, LedgerBalance
+from app.models.background_job import BackgroundJob
+from app.models.number_sequence import NumberSequence
+from app.models.webhook_event import WebhookEvent
+from app.models.payout_batch import PayoutBatch
+from app.models.idempotency_key import IdempotencyKey
 
 __all__ = [
     "UserProfile",
@@ -44,4 +52,13 @@ __all__ = [
     "ServiceCategory",
     "OrderAddon",
     "OrderService",
+    "ReferralClosure",
+    "LedgerEntry",
+    "LedgerBalance",
+    "BackgroundJob",
+    "NumberSequence",
+    "WebhookEvent",
+    "PayoutBatch",
+    "IdempotencyKey",
+    "AttachmentBlob",
 ]
@@ -238,6 +238,7 @@ class Payout(Base):
     # Transaction details
     transaction_id = Column(String(100), nullable=True)
     transaction_reference = Column(String(200), nullable=True)
+    batch_id = Column(Integer, ForeignKey('payout_batches.id'), nullable=True, index=True)  # payout run that paid it
     
     # Notes and remarks
     notes = Column(Text, nullable=True)
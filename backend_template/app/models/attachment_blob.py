@@ -0,0 +1,34 @@
+"""
+AttachmentBlob - One encrypted file on disk, shared by every identical attachment
+"""
+from sqlalchemy import Column, Integer, String, BigInteger, DateTime
+from sqlalchemy.sql import func
+from app.core.database import Base
+
+
+class AttachmentBlob(Base):
+    """
+    Content-addressed: content_hash is the SHA-256 of the plaintext, so uploading
+    the same log or screenshot again reuses this blob instead of writing a copy.
+    ref_count is the number of live (not soft-deleted) TicketAttachments using it;
+    blobs at zero are reclaimed by AttachmentBlobStore.collect_garbage().
+    The file name on disk is random, so it does not reveal the content hash.
+    """
+    __tablename__ = "attachment_blobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    content_hash = Column(String(64), unique=True, nullable=False)
+    storage_path = Column(String(500), nullable=False)
+    encryption_key_id = Column(String(100), nullable=False)  # wrapped data key, see attachment_keys.py
+    size = Column(BigInteger, nullable=False)  # plaintext bytes
+    ref_count = Column(Integer, nullable=False, default=0)
+
+    # Thumbnail / first-page preview, encrypted with this blob's data key (attachment_previews.py)
+    preview_status = Column(String(20), nullable=False, default='pending')  # pending, ready, unsupported, failed
+    preview_key = Column(String(500), nullable=True)  # storage key of the encrypted preview image
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<AttachmentBlob(id={self.id}, refs={self.ref_count}, size={self.size})>"
@@ -0,0 +1,41 @@
+"""
+BackgroundJob - Durable queue of side effects processed by JobWorker
+"""
+from sqlalchemy import Column, String, Integer, DateTime, JSON, Text, Index
+from sqlalchemy.sql import func
+from app.core.database import Base
+
+
+class BackgroundJob(Base):
+    """
+    One unit of deferred work (e.g. provisioning a server after payment).
+    status: queued -> running -> succeeded, or back to queued for a retry,
+    or dead once max_attempts is exhausted (dead letter, needs a human).
+    """
+    __tablename__ = "background_jobs"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    job_type = Column(String(100), nullable=False)
+    idempotency_key = Column(String(255), nullable=False, unique=True)  # enqueueing the same key twice is a no-op
+    payload = Column(JSON, nullable=False, default=dict)
+
+    status = Column(String(20), nullable=False, default='queued')  # queued, running, succeeded, dead
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=5)
+    run_after = Column(DateTime(timezone=True), nullable=False)
+
+    locked_by = Column(String(100), nullable=True)
+    locked_at = Column(DateTime(timezone=True), nullable=True)
+    last_error = Column(Text, nullable=True)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    completed_at = Column(DateTime(timezone=True), nullable=True)
+
+    # 🔹 Workers poll for due jobs by (status, run_after)
+    __table_args__ = (
+        Index('idx_background_jobs_status_run_after', 'status', 'run_after'),
+    )
+
+    def __repr__(self):
+        return f"<BackgroundJob(id={self.id}, type={self.job_type}, status={self.status}, attempts={self.attempts})>"
@@ -13,6 +13,14 @@ from app.models.order import Order
 from app.models.invoice import Invoice
 from app.models.billing import PaymentMethod, BillingSettings
 from app.models.referrals import  ReferralEarning, ReferralPayout
+from app.models.referral_closure import ReferralClosure
+from app.models.referral_ledger import LedgerEntry, LedgerBalance
+from app.models.background_job import BackgroundJob
+from app.models.number_sequence import NumberSequence
+from app.models.webhook_event import WebhookEvent
+from app.models.payout_batch import PayoutBatch
+from app.models.idempotency_key import IdempotencyKey
+from app.models.attachment_blob import AttachmentBlob
 from app.models.support import SupportTicket
 from app.models.settings import UserSettings
 from app.models.countries import Country
@@ -31,7 +39,7 @@ __all__ = [
     "Invoice",
     "PaymentMethod",
     "BillingSettings",
-    "ReferralEarning", "ReferralPayout",
+    "ReferralEarning", "ReferralPayout", "ReferralClosure", "LedgerEntry", "LedgerBalance", "BackgroundJob", "NumberSequence", "AttachmentBlob", "WebhookEvent", "PayoutBatch", "IdempotencyKey",
     "SupportTicket",
     "UserSettings",
     "Country",
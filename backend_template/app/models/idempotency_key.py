@@ -0,0 +1,41 @@
+"""
+IdempotencyKey - Stored outcome of a request sent with an Idempotency-Key header
+"""
+from sqlalchemy import Column, String, Integer, DateTime, JSON, ForeignKey, Index, UniqueConstraint
+from sqlalchemy.sql import func
+from app.core.database import Base
+
+
+class IdempotencyKey(Base):
+    """
+    One client-supplied key per user. The first request inserts the row
+    (in_progress) and runs; duplicates wait for it and replay the stored
+    response. request_fingerprint is a hash of method, path and body, so a key
+    reused for a different request is refused.
+    status: in_progress -> committed (set in the request's own transaction)
+    -> completed. A request refused before committing deletes its row so the
+    retry runs again; a committed key is never run again.
+    """
+    __tablename__ = "idempotency_keys"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey('users_profiles.id', ondelete='CASCADE'), nullable=False)
+    key = Column(String(255), nullable=False)
+    request_fingerprint = Column(String(64), nullable=False)  # sha256 hex
+
+    status = Column(String(20), nullable=False, default='in_progress')  # in_progress, committed, completed
+    response_status = Column(Integer, nullable=True)
+    response_body = Column(JSON, nullable=True)
+    locked_at = Column(DateTime(timezone=True), nullable=False)  # when the owning request started
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    completed_at = Column(DateTime(timezone=True), nullable=True)
+
+    # 🔹 Keys are scoped per user; expired rows are purged by age
+    __table_args__ = (
+        UniqueConstraint('user_id', 'key', name='uq_idempotency_user_key'),
+        Index('idx_idempotency_keys_locked_at', 'locked_at'),
+    )
+
+    def __repr__(self):
+        return f"<IdempotencyKey(id={self.id}, user={self.user_id}, key={self.key}, status={self.status})>"
@@ -0,0 +1,25 @@
+"""
+NumberSequence - Counter rows behind order / invoice / ticket numbers
+"""
+from sqlalchemy import Column, String, BigInteger, DateTime
+from sqlalchemy.sql import func
+from app.core.database import Base
+
+
+class NumberSequence(Base):
+    """
+    One counter per numbering series, e.g. "order:2026" or "ticket:2026".
+    next_value is the first number not yet handed to any process; NumberAllocator
+    bumps it by a whole block at a time and serves the block from memory.
+    The "catalog:pricing" row is the pricing catalog version (see pricing_catalog.py).
+    """
+    __tablename__ = "number_sequences"
+
+    name = Column(String(100), primary_key=True)
+    next_value = Column(BigInteger, nullable=False, default=1)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<NumberSequence(name={self.name}, next_value={self.next_value})>"
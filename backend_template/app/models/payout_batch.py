@@ -0,0 +1,42 @@
+"""
+PayoutBatch - One payout run of a book (referral or affiliate)
+"""
+from sqlalchemy import Column, String, Integer, DateTime, Numeric, ForeignKey, Text, Index
+from sqlalchemy.sql import func
+from app.core.database import Base
+
+
+class PayoutBatch(Base):
+    """
+    A payout run. Creating the batch claims every approved payout of its book
+    (payout.batch_id); the run then settles them in id-ordered chunks, one
+    commit per chunk, and finally streams the bank-upload file to storage.
+    status: running -> completed, or failed (the run is resumed from
+    last_payout_id by running it again).
+    """
+    __tablename__ = "payout_batches"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    book = Column(String(20), nullable=False)  # referral (ReferralPayout) or affiliate (Payout)
+    status = Column(String(20), nullable=False, default='running')  # running, completed, failed
+
+    payouts_claimed = Column(Integer, nullable=False, default=0)
+    payouts_settled = Column(Integer, nullable=False, default=0)
+    total_amount = Column(Numeric(14, 2), nullable=False, default=0)  # paid to banks (net of TDS for referral payouts)
+    last_payout_id = Column(Integer, nullable=False, default=0)  # checkpoint: every claimed payout up to here is settled
+
+    file_key = Column(String(255), nullable=True)  # bank-upload file in payout file storage
+    file_rows = Column(Integer, nullable=True)
+    last_error = Column(Text, nullable=True)
+
+    created_by = Column(Integer, ForeignKey('users_profiles.id'), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    completed_at = Column(DateTime(timezone=True), nullable=True)
+
+    # 🔹 "Is a run of this book still open?"
+    __table_args__ = (
+        Index('idx_payout_batches_book_status', 'book', 'status'),
+    )
+
+    def __repr__(self):
+        return f"<PayoutBatch(id={self.id}, book={self.book}, status={self.status}, settled={self.payouts_settled}/{self.payouts_claimed})>"
@@ -0,0 +1,30 @@
+"""
+ReferralClosure - Materialized ancestor/descendant closure of the referred_by tree
+"""
+from sqlalchemy import Column, Integer, DateTime, ForeignKey, Index
+from sqlalchemy.sql import func
+from app.core.database import Base
+
+
+class ReferralClosure(Base):
+    """
+    One row per (upline, downline) pair in the referral tree.
+    depth=1 is the direct referrer, depth=2 the referrer's referrer, and so on.
+    Kept in sync with UserProfile.referred_by by ReferralTreeService.
+    """
+    __tablename__ = "referral_closure"
+
+    ancestor_id = Column(Integer, ForeignKey('users_profiles.id', ondelete='CASCADE'), primary_key=True)
+    descendant_id = Column(Integer, ForeignKey('users_profiles.id', ondelete='CASCADE'), primary_key=True)
+    depth = Column(Integer, nullable=False)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    # 🔹 Downline lookups filter by ancestor, upline lookups by descendant
+    __table_args__ = (
+        Index('idx_referral_closure_ancestor_depth', 'ancestor_id', 'depth'),
+        Index('idx_referral_closure_descendant_depth', 'descendant_id', 'depth'),
+    )
+
+    def __repr__(self):
+        return f"<ReferralClosure(ancestor_id={self.ancestor_id}, descendant_id={self.descendant_id}, depth={self.depth})>"
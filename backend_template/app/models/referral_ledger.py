@@ -0,0 +1,66 @@
+"""
+Referral Ledger - Append-only double-entry ledger of referral money and the
+per-user balance snapshot it maintains
+"""
+from sqlalchemy import Column, String, Integer, DateTime, Numeric, ForeignKey, Index, UniqueConstraint
+from sqlalchemy.sql import func
+from app.core.database import Base
+
+
+class LedgerEntry(Base):
+    """
+    One leg of a ledger transaction. A transaction (same transaction_key) moves
+    money between accounts and its legs sum to zero; rows are never updated or
+    deleted - a mistake is undone by posting a reversal.
+
+    Every leg belongs to one user: "available" and "held" are the user's own
+    accounts, "commissions" (money earned) and "paid_out" (money withdrawn) are
+    the platform-side counterparts kept per user.
+    """
+    __tablename__ = "referral_ledger_entries"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    transaction_key = Column(String(120), nullable=False)  # e.g. "earning:payment:42" (idempotency key)
+    leg = Column(Integer, nullable=False)
+    entry_type = Column(String(30), nullable=False)  # earning, payout_hold, payout, reversal, opening_balance
+    book = Column(String(20), nullable=False)  # referral (ReferralEarning / ReferralPayout) or affiliate (Commission / Payout)
+    user_id = Column(Integer, ForeignKey('users_profiles.id', ondelete='CASCADE'), nullable=False)
+    account = Column(String(20), nullable=False)  # available, held, commissions, paid_out
+    amount = Column(Numeric(12, 2), nullable=False)  # signed
+
+    reference_type = Column(String(30), nullable=True)  # payment, referral_payout, commission, payout, ...
+    reference_id = Column(Integer, nullable=True)
+    description = Column(String(255), nullable=True)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    # 🔹 Idempotent posting, and statements paged by id per user
+    __table_args__ = (
+        UniqueConstraint('transaction_key', 'leg', name='uq_ledger_transaction_leg'),
+        Index('idx_ledger_user_book_id', 'user_id', 'book', 'id'),
+    )
+
+    def __repr__(self):
+        return f"<LedgerEntry(id={self.id}, {self.transaction_key}#{self.leg}, user={self.user_id}, {self.account} {self.amount})>"
+
+
+class LedgerBalance(Base):
+    """
+    Running per-user, per-book sums of the ledger, updated in the same
+    transaction as every posting: a balance read is one primary-key lookup.
+    """
+    __tablename__ = "referral_ledger_balances"
+
+    user_id = Column(Integer, ForeignKey('users_profiles.id', ondelete='CASCADE'), primary_key=True)
+    book = Column(String(20), primary_key=True)
+
+    available = Column(Numeric(12, 2), nullable=False, default=0)
+    held = Column(Numeric(12, 2), nullable=False, default=0)  # requested payouts not yet paid or rejected
+    total_earned = Column(Numeric(12, 2), nullable=False, default=0)
+    total_paid_out = Column(Numeric(12, 2), nullable=False, default=0)
+    last_entry_id = Column(Integer, nullable=True)
+
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<LedgerBalance(user={self.user_id}, book={self.book}, available={self.available}, held={self.held})>"
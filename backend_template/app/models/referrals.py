@@ -67,7 +67,7 @@
 
 
 
-from sqlalchemy import Column, String, Integer, DateTime, Numeric, ForeignKey, Text, JSON
+from sqlalchemy import Column, String, Integer, DateTime, Numeric, ForeignKey, Text, JSON, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.core.database import Base
@@ -104,6 +104,9 @@ class ReferralPayout(Base):
     # Timestamps
     requested_at = Column(DateTime(timezone=True), server_default=func.now())
     processed_at = Column(DateTime(timezone=True), nullable=True)
+
+    # Payout run that paid it (app/services/payout_batches.py)
+    batch_id = Column(Integer, ForeignKey('payout_batches.id'), nullable=True, index=True)
     
     # Relationship
     user = relationship(
@@ -153,4 +156,9 @@ class ReferralEarning(Base):
         back_populates="referral_earnings"
     )
 
+    # 🔹 Payouts mark a user's pending earnings paid in one UPDATE
+    __table_args__ = (
+        Index('idx_referral_earnings_user_status', 'user_id', 'status'),
+    )
+
 
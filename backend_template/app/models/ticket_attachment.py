@@ -21,6 +21,7 @@ class TicketAttachment(Base):
     # Encrypted storage information
     storage_path = Column(String(500), nullable=False)  # Path to encrypted file
     encryption_key_id = Column(String(100), nullable=False)  # Reference to encryption key
+    blob_id = Column(Integer, ForeignKey("attachment_blobs.id", ondelete="SET NULL"), nullable=True, index=True)  # Shared encrypted blob
     file_hash = Column(String(64), nullable=False)  # SHA-256 hash for integrity
     
     # Security information
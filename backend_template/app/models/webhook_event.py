@@ -0,0 +1,45 @@
+"""
+WebhookEvent - Inbox of gateway webhooks, stored before they are processed
+"""
+from sqlalchemy import Column, String, Integer, DateTime, JSON, Text, Index
+from sqlalchemy.sql import func
+from app.core.database import Base
+
+
+class WebhookEvent(Base):
+    """
+    One delivered webhook, inserted (and acknowledged) as soon as its signature
+    checks out; WebhookConsumer processes it later. Rows are only appended: the
+    payload is never modified and a redelivered event_id is ignored.
+    status: received -> processing -> processed, or back to received for a
+    retry, or dead once max attempts are exhausted (replay with
+    scripts/replay_webhooks.py). Events sharing an order_key are processed
+    strictly in arrival order.
+    """
+    __tablename__ = "webhook_events"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    provider = Column(String(20), nullable=False, default='razorpay')
+    event_id = Column(String(100), nullable=False, unique=True)  # X-Razorpay-Event-Id (dedup key)
+    event_type = Column(String(50), nullable=False)  # payment.captured, payment.failed, ...
+    order_key = Column(String(100), nullable=True)  # razorpay_order_id: per-order ordering
+    payload = Column(JSON, nullable=False)
+
+    status = Column(String(20), nullable=False, default='received')  # received, processing, processed, dead
+    attempts = Column(Integer, nullable=False, default=0)
+    run_after = Column(DateTime(timezone=True), nullable=False)
+    locked_by = Column(String(100), nullable=True)
+    locked_at = Column(DateTime(timezone=True), nullable=True)
+    last_error = Column(Text, nullable=True)
+
+    received_at = Column(DateTime(timezone=True), server_default=func.now())
+    processed_at = Column(DateTime(timezone=True), nullable=True)
+
+    # 🔹 Consumers look for due events, and for earlier pending events of the same order
+    __table_args__ = (
+        Index('idx_webhook_events_status_run_after', 'status', 'run_after'),
+        Index('idx_webhook_events_order_key_id', 'order_key', 'id'),
+    )
+
+    def __repr__(self):
+        return f"<WebhookEvent(id={self.id}, event={self.event_type}, order={self.order_key}, status={self.status})>"
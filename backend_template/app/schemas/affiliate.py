@@ -70,6 +70,12 @@ class TeamMember(BaseModel):
     child_count: int  # Number of referrals under them
 
 
+class TeamMemberPage(BaseModel):
+    """One page of team members; pass next_cursor back to get the following page"""
+    items: List[TeamMember]
+    next_cursor: Optional[str] = None
+
+
 # ==================== Commission Tracking ====================
 
 class CommissionDetail(BaseModel):
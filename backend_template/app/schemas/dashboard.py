@@ -141,22 +141,25 @@ class DashboardResponse(BaseModel):
 
 
 
+# Sections that failed or timed out come back as None and are listed in failed_sections
 class CustomerDashboard(BaseModel):
-    active_servers: int
-    monthly_cost: Decimal
-    open_tickets: int
-    bandwidth_used: float
-    recent_servers: List[Dict[str, Any]]
-    recent_invoices: List[Dict[str, Any]]
+    active_servers: Optional[int] = None
+    monthly_cost: Optional[Decimal] = None
+    open_tickets: Optional[int] = None
+    bandwidth_used: Optional[float] = None
+    recent_servers: Optional[List[Dict[str, Any]]] = None
+    recent_invoices: Optional[List[Dict[str, Any]]] = None
+    failed_sections: List[str] = []
 
 class AdminDashboard(BaseModel):
-    user_stats: Dict[str, Any]
-    server_stats: Dict[str, Any]
-    order_stats: Dict[str, Any]
-    invoice_stats: Dict[str, Any]
-    support_stats: Dict[str, Any]
-    referral_stats: Dict[str, Any]
-    recent_activity: List[Dict[str, Any]]
+    user_stats: Optional[Dict[str, Any]] = None
+    server_stats: Optional[Dict[str, Any]] = None
+    order_stats: Optional[Dict[str, Any]] = None
+    invoice_stats: Optional[Dict[str, Any]] = None
+    support_stats: Optional[Dict[str, Any]] = None
+    referral_stats: Optional[Dict[str, Any]] = None
+    recent_activity: Optional[List[Dict[str, Any]]] = None
+    failed_sections: List[str] = []
 
 class DashboardResponse(BaseModel):
     message: str
@@ -234,8 +234,8 @@
 
 
 
-from pydantic import BaseModel, field_validator, ConfigDict
-from typing import Optional, Dict, Any
+from pydantic import BaseModel, Field, field_validator, ConfigDict
+from typing import Optional, Dict, Any, List
 from datetime import datetime
 from decimal import Decimal
 
@@ -473,4 +473,58 @@ class ReferralEarningCreate(BaseModel):
     def validate_level(cls, v):
         if v not in [1, 2, 3]:
             raise ValueError('Level must be 1, 2, or 3')
-        return v
\ No newline at end of file
+        return v
+
+
+# ----------------------------
+# ✅ Ledger Balance / Statement Schemas
+# ----------------------------
+class LedgerBalance(BaseModel):
+    book: str
+    available: Decimal
+    held: Decimal
+    total_earned: Decimal
+    total_paid_out: Decimal
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class LedgerEntry(BaseModel):
+    id: int
+    entry_type: str
+    account: str
+    amount: Decimal
+    reference_type: Optional[str] = None
+    reference_id: Optional[int] = None
+    description: Optional[str] = None
+    created_at: Optional[datetime] = None
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class LedgerStatementPage(BaseModel):
+    """One page of ledger entries, newest first; pass next_cursor back to get the following page"""
+    items: List[LedgerEntry]
+    next_cursor: Optional[str] = None
+
+
+# ----------------------------
+# ✅ Payout Batch Schemas
+# ----------------------------
+class PayoutBatchCreate(BaseModel):
+    book: str = Field(..., description="referral or affiliate")
+
+
+class PayoutBatch(BaseModel):
+    id: int
+    book: str
+    status: str
+    payouts_claimed: int
+    payouts_settled: int
+    total_amount: Decimal
+    file_rows: Optional[int] = None
+    last_error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    completed_at: Optional[datetime] = None
+
+    model_config = ConfigDict(from_attributes=True)
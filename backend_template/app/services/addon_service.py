@@ -8,6 +8,8 @@ from decimal import Decimal
 
 from app.models.addon import Addon, AddonCategory
 from app.schemas.addon import AddonCreate, AddonUpdate, ServerConfigValidation, PriceBreakdown
+from app.services.pricing_catalog import pricing_catalog
+from app.services.pricing_engine import LineItem, monthly_from_annual, price_cart
 
 
 class AddonService:
@@ -91,7 +93,8 @@ class AddonService:
         quantity: int
     ) -> Decimal:
         """Calculate price for an addon based on quantity"""
-        addon = await self.get_addon_by_slug(db, addon_slug)
+        catalog = await pricing_catalog.get()
+        addon = catalog.active_addon(addon_slug)
         if not addon:
             return Decimal('0')
         
@@ -115,97 +118,64 @@ class AddonService:
         """
         Validate server configuration and calculate total price
         This is the SINGLE SOURCE OF TRUTH for pricing
+        Addon prices come from the in-memory pricing catalog (no queries per quote).
         """
-        addon_costs = {}
-        
+        catalog = await pricing_catalog.get()
+        quantity = Decimal(str(server_config.quantity))
+        lines = [LineItem('plan', 'Base Plan', base_plan_price, quantity)]
+
+        def add(label: str, slug: str, units=1, monthly_price=None):
+            addon = catalog.active_addon(slug)
+            if addon:
+                unit_price = monthly_price(addon.price) if monthly_price else addon.price
+                lines.append(LineItem('addon', label, unit_price * Decimal(str(units)), quantity, ref_id=addon.id))
+
         # Extra Storage (₹2/GB/month)
         if server_config.extra_storage > 0:
-            storage_addon = await self.get_addon_by_slug(db, 'extra-storage')
-            if storage_addon:
-                cost = Decimal(str(storage_addon.price)) * Decimal(str(server_config.extra_storage))
-                addon_costs['Extra Storage'] = float(cost)
-        
+            add('Extra Storage', 'extra-storage', server_config.extra_storage)
+
         # Extra Bandwidth (₹100/TB/month)
         if server_config.extra_bandwidth > 0:
-            bandwidth_addon = await self.get_addon_by_slug(db, 'extra-bandwidth')
-            if bandwidth_addon:
-                cost = Decimal(str(bandwidth_addon.price)) * Decimal(str(server_config.extra_bandwidth))
-                addon_costs['Extra Bandwidth'] = float(cost)
-        
+            add('Extra Bandwidth', 'extra-bandwidth', server_config.extra_bandwidth)
+
         # Additional IPv4
         if server_config.additional_ipv4 > 0:
-            ipv4_addon = await self.get_addon_by_slug(db, 'additional-ipv4')
-            if ipv4_addon:
-                cost = Decimal(str(ipv4_addon.price)) * Decimal(str(server_config.additional_ipv4))
-                addon_costs['Additional IPv4'] = float(cost)
-        
+            add('Additional IPv4', 'additional-ipv4', server_config.additional_ipv4)
+
         # Plesk Control Panel
         if server_config.plesk_addon:
-            plesk_slug = f'plesk-{server_config.plesk_addon}'
-            plesk_addon = await self.get_addon_by_slug(db, plesk_slug)
-            if plesk_addon:
-                addon_costs[f'Plesk {server_config.plesk_addon.title()}'] = float(plesk_addon.price)
-        
+            add(f'Plesk {server_config.plesk_addon.title()}', f'plesk-{server_config.plesk_addon}')
+
         # Backup Storage
         if server_config.backup_storage:
-            backup_slug = f'backup-{server_config.backup_storage}'
-            backup_addon = await self.get_addon_by_slug(db, backup_slug)
-            if backup_addon:
-                addon_costs[f'Backup Storage {server_config.backup_storage.upper()}'] = float(backup_addon.price)
-        
-        # SSL Certificate
+            add(f'Backup Storage {server_config.backup_storage.upper()}', f'backup-{server_config.backup_storage}')
+
+        # SSL Certificate (annual, converted to monthly the same way as /pricing/quote)
         if server_config.ssl_certificate:
-            ssl_slug = f'ssl-{server_config.ssl_certificate}'
-            ssl_addon = await self.get_addon_by_slug(db, ssl_slug)
-            if ssl_addon:
-                # SSL is annual, convert to monthly
-                monthly_cost = Decimal(str(ssl_addon.price)) / Decimal('12')
-                addon_costs[f'SSL {server_config.ssl_certificate.replace("-", " ").title()}'] = float(monthly_cost)
-        
+            add(f'SSL {server_config.ssl_certificate.replace("-", " ").title()}',
+                f'ssl-{server_config.ssl_certificate}', monthly_price=monthly_from_annual)
+
         # Support Package
         if server_config.support_package:
-            support_slug = f'support-{server_config.support_package}'
-            support_addon = await self.get_addon_by_slug(db, support_slug)
-            if support_addon:
-                addon_costs[f'Support {server_config.support_package.title()}'] = float(support_addon.price)
-        
+            add(f'Support {server_config.support_package.title()}', f'support-{server_config.support_package}')
+
         # Managed Service
         if server_config.managed_service and server_config.managed_service != 'self':
-            managed_slug = f'managed-{server_config.managed_service}'
-            managed_addon = await self.get_addon_by_slug(db, managed_slug)
-            if managed_addon:
-                addon_costs[f'Managed {server_config.managed_service.title()}'] = float(managed_addon.price)
-        
+            add(f'Managed {server_config.managed_service.title()}', f'managed-{server_config.managed_service}')
+
         # DDoS Protection
         if server_config.ddos_protection and server_config.ddos_protection != 'basic':
-            ddos_slug = f'ddos-{server_config.ddos_protection}'
-            ddos_addon = await self.get_addon_by_slug(db, ddos_slug)
-            if ddos_addon:
-                addon_costs[f'DDoS {server_config.ddos_protection.title()}'] = float(ddos_addon.price)
-        
-        # Calculate totals
-        addon_total = Decimal(str(sum(addon_costs.values())))
-        per_server_cost = base_plan_price + addon_total
-        subtotal = per_server_cost * Decimal(str(server_config.quantity))
-        
-        # Apply discount
-        discount_amount = Decimal('0')
-        if user_discount_percent > 0:
-            discount_amount = subtotal * (user_discount_percent / Decimal('100'))
-        
-        taxable_amount = subtotal - discount_amount
-        
-        # Calculate 18% GST
-        tax_amount = taxable_amount * Decimal('0.18')
-        
-        total = taxable_amount + tax_amount
-        
+            add(f'DDoS {server_config.ddos_protection.title()}', f'ddos-{server_config.ddos_protection}')
+
+        # Discount and 18% GST come from the shared pricing engine
+        cart = price_cart(lines, user_discount_percent if user_discount_percent > 0 else Decimal('0'))
+
         return PriceBreakdown(
             base_price=float(base_plan_price),
-            addon_costs=addon_costs,
-            subtotal=float(subtotal),
-            discount=float(discount_amount),
-            tax=float(tax_amount),
-            total=float(total),
+            addon_costs={line.item.name: float(line.item.unit_price) for line in cart.lines_of('addon')},
+            subtotal=float(cart.subtotal),
+            discount=float(cart.discount_amount),
+            tax=float(cart.tax_amount),
+            total=float(cart.total),
             currency='INR'
         )
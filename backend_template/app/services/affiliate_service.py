@@ -7,6 +7,8 @@ from sqlalchemy.orm import selectinload, joinedload
 from typing import Optional, List, Dict, Tuple
 from decimal import Decimal
 from datetime import datetime, timedelta
+import base64
+import json
 import secrets
 import string
 
@@ -22,11 +24,38 @@ from app.schemas.affiliate import (
     PayoutRequest, PayoutResponse, AffiliateStatsResponse,
     CommissionDetail, TeamMember, ServerPurchaseDetail
 )
+from app.services.referral_tree_service import ReferralTreeService
+from app.services.affiliate_stats_service import AffiliateStatsService
+from app.services.referral_ledger import AFFILIATE_BOOK, referral_ledger
+from app.services.payout_batches import payout_batches
+
+
+TEAM_SORT_FIELDS = ("joined", "purchases", "commission")
+
+
+def _encode_team_cursor(sort_value, referral_id: int) -> str:
+    """Opaque page cursor: the last row's sort value and referral id"""
+    payload = json.dumps({"v": None if sort_value is None else str(sort_value), "id": referral_id})
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def _decode_team_cursor(cursor: str, sort_by: str) -> Tuple[Optional[Decimal], int]:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        last_id = int(payload["id"])
+        last_value = None if sort_by == "joined" else Decimal(payload["v"])
+    except Exception:
+        raise ValueError("Invalid cursor")
+    return last_value, last_id
 
 
 class AffiliateService:
     """Service for managing affiliate/referral system"""
 
+    def __init__(self):
+        self.referral_tree = ReferralTreeService()
+        self.stats = AffiliateStatsService()
+
     # ==================== Subscription Management ====================
 
     @staticmethod
@@ -187,25 +216,26 @@ class AffiliateService:
         )
         db.add(referral_l1)
         await db.flush()
+        await self.stats.referral_added(db, referrer_subscription.user_id, level=1)
 
         # Update referred user's profile
         user_result = await db.execute(
             select(UserProfile).where(UserProfile.id == referred_user_id)
         )
         user = user_result.scalar_one_or_none()
+        upline = {}
         if user:
             user.referred_by = referrer_subscription.user_id
 
+            # Extend the closure table and read the full upline in one lookup
+            await self.referral_tree.link_user(db, referred_user_id, referrer_subscription.user_id)
+            upline = await self.referral_tree.get_upline(db, referred_user_id, max_depth=3)
+
         # Track up to Level 2 and Level 3
-        current_referrer_id = referrer_subscription.user_id
         parent_referral_id = referral_l1.id
         
         for level in [2, 3]:
-            # Find next level referrer
-            next_result = await db.execute(
-                select(UserProfile.referred_by).where(UserProfile.id == current_referrer_id)
-            )
-            next_referrer_id = next_result.scalar_one_or_none()
+            next_referrer_id = upline.get(level)
             
             if not next_referrer_id:
                 break
@@ -223,6 +253,7 @@ class AffiliateService:
             )
             db.add(referral)
             await db.flush()
+            await self.stats.referral_added(db, next_referrer_id, level=level)
             
             # Update user's referral levels
             if level == 2 and user:
@@ -231,13 +262,9 @@ class AffiliateService:
                 user.referral_level_3 = next_referrer_id
             
             parent_referral_id = referral.id
-            current_referrer_id = next_referrer_id
 
         await db.commit()
         
-        # Update stats for all affected affiliates
-        await self._update_referral_counts(db, referrer_subscription.user_id)
-        
         return referral_l1
 
     async def mark_referral_converted(
@@ -260,7 +287,7 @@ class AffiliateService:
                 referral.first_purchase_amount = amount
                 
                 # Update stats
-                await self._update_referral_counts(db, referral.referrer_id)
+                await self.stats.referral_converted(db, referral.referrer_id, referral.level)
 
         await db.commit()
 
@@ -317,13 +344,10 @@ class AffiliateService:
                 status=CommissionStatus.PENDING
             )
             db.add(commission)
+            await self.stats.commission_added(db, referral.referrer_id, commission_amount)
 
         await db.commit()
 
-        # Update affiliate stats for all referrers
-        for referral in referrals:
-            await self._update_commission_stats(db, referral.referrer_id)
-
     async def approve_commission(
         self,
         db: AsyncSession,
@@ -340,11 +364,14 @@ class AffiliateService:
             commission.status = CommissionStatus.APPROVED
             commission.approved_at = datetime.utcnow()
             commission.approved_by = approved_by
+            await self.stats.commission_approved(db, commission.affiliate_user_id, commission.commission_amount)
+            await referral_ledger.credit_earnings(
+                db, AFFILIATE_BOOK, f"earning:commission:{commission.id}",
+                [(commission.affiliate_user_id, commission.commission_amount)],
+                reference_type='commission', reference_id=commission.id
+            )
             await db.commit()
             
-            # Update stats
-            await self._update_commission_stats(db, commission.affiliate_user_id)
-            
             return commission
         return None
 
@@ -356,13 +383,7 @@ class AffiliateService:
         user_id: int,
         payout_request: PayoutRequest
     ) -> Payout:
-        """Create payout request"""
-        # Get available balance
-        stats = await self.get_affiliate_stats(db, user_id)
-        
-        if stats.available_balance < payout_request.amount:
-            raise ValueError("Insufficient balance for payout")
-
+        """Create payout request (the amount is held on the ledger; ValueError if the balance is too low)"""
         payout = Payout(
             affiliate_user_id=user_id,
             amount=payout_request.amount,
@@ -373,6 +394,13 @@ class AffiliateService:
             notes=payout_request.notes
         )
         db.add(payout)
+        await db.flush()
+        try:
+            await referral_ledger.hold_payout(db, AFFILIATE_BOOK, user_id, payout_request.amount, 'payout', payout.id)
+        except ValueError:
+            await db.rollback()
+            raise
+        await self.stats.payout_requested(db, user_id, payout_request.amount)
         await db.commit()
         await db.refresh(payout)
 
@@ -396,6 +424,8 @@ class AffiliateService:
         if not payout:
             return None
 
+        was_pending = payout.status in (PayoutStatus.PENDING, PayoutStatus.PROCESSING)
+
         if action == 'approve':
             payout.status = PayoutStatus.PROCESSING
         elif action == 'complete':
@@ -404,9 +434,19 @@ class AffiliateService:
             
             # Mark commissions as paid
             await self._mark_commissions_paid(db, payout.affiliate_user_id, payout.amount, payout_id)
+            if was_pending:
+                await self.stats.payout_closed(db, payout.affiliate_user_id, payout.amount, completed=True)
+                await referral_ledger.settle_payout(
+                    db, AFFILIATE_BOOK, payout.affiliate_user_id, payout.amount, 'payout', payout.id
+                )
         elif action == 'reject':
             payout.status = PayoutStatus.FAILED
             payout.processed_at = datetime.utcnow()
+            if was_pending:
+                await self.stats.payout_closed(db, payout.affiliate_user_id, payout.amount, completed=False)
+                await referral_ledger.release_payout(
+                    db, AFFILIATE_BOOK, payout.affiliate_user_id, payout.amount, 'payout', payout.id
+                )
 
         payout.processed_by = processed_by
         payout.transaction_id = transaction_id
@@ -415,10 +455,6 @@ class AffiliateService:
         await db.commit()
         await db.refresh(payout)
 
-        # Update stats
-        if action == 'complete':
-            await self._update_commission_stats(db, payout.affiliate_user_id)
-
         return payout
 
     # ==================== Stats & Analytics ====================
@@ -445,6 +481,9 @@ class AffiliateService:
         # Get subscription info
         subscription = await self.get_user_subscription(db, user_id)
 
+        # Money that can be paid out comes from the ledger snapshot
+        balance = await referral_ledger.get_balance(db, user_id, AFFILIATE_BOOK)
+
         return AffiliateStatsResponse(
             total_referrals_level1=stats.total_referrals_level1,
             total_referrals_level2=stats.total_referrals_level2,
@@ -458,14 +497,14 @@ class AffiliateService:
             pending_commission=stats.pending_commission,
             approved_commission=stats.approved_commission,
             paid_commission=stats.paid_commission,
-            available_balance=stats.available_balance,
+            available_balance=balance.available,
             total_payouts=stats.total_payouts,
             total_payout_amount=stats.total_payout_amount,
             subscription_type=subscription.subscription_type if subscription else None,
             subscription_status=subscription.status.value if subscription else None,
             referral_code=subscription.referral_code if subscription else None,
             is_active=subscription.is_active if subscription else False,
-            can_request_payout=stats.available_balance >= Decimal('500')
+            can_request_payout=balance.available >= Decimal('500')
         )
 
     async def get_team_members(
@@ -474,85 +513,154 @@ class AffiliateService:
         user_id: int,
         level: Optional[int] = None
     ) -> List[TeamMember]:
-        """Get team members at specific level or all levels"""
-        query = select(Referral).where(Referral.referrer_id == user_id)
-        
-        if level:
-            query = query.where(Referral.level == level)
+        """Get team members at specific level or all levels (newest first)"""
+        members, _ = await self.get_team_page(db, user_id, level=level, limit=None)
+        return members
 
-        query = query.options(selectinload(Referral.commissions))
-        
-        result = await db.execute(query)
-        referrals = result.scalars().all()
+    async def get_team_page(
+        self,
+        db: AsyncSession,
+        user_id: int,
+        level: Optional[int] = None,
+        sort_by: str = "joined",
+        cursor: Optional[str] = None,
+        limit: Optional[int] = 50
+    ) -> Tuple[List[TeamMember], Optional[str]]:
+        """
+        Get one page of team members with purchases, commission, active servers
+        and child counts, all loaded in a single query of grouped subqueries.
 
-        team_members = []
-        for ref in referrals:
-            # Get user details
-            user_result = await db.execute(
-                select(UserProfile).where(UserProfile.id == ref.referred_user_id)
-            )
-            user = user_result.scalar_one_or_none()
-            if not user:
-                continue
+        Sorted descending by sort_by ("joined", "purchases" or "commission").
+        Pass the returned cursor back in to fetch the next page; it is None on
+        the last page. Raises ValueError for an unknown sort_by or bad cursor.
+        """
+        if sort_by not in TEAM_SORT_FIELDS:
+            raise ValueError(f"sort_by must be one of: {', '.join(TEAM_SORT_FIELDS)}")
 
-            # Get total purchases
-            purchases_result = await db.execute(
-                select(func.coalesce(func.sum(Order.total_amount), 0)).where(
-                    and_(
-                        Order.user_id == ref.referred_user_id,
-                        Order.order_status.in_(['completed', 'active'])
-                    )
-                )
+        team_filter = [Referral.referrer_id == user_id]
+        if level:
+            team_filter.append(Referral.level == level)
+        team_user_ids = select(Referral.referred_user_id).where(*team_filter)
+
+        purchases = (
+            select(
+                Order.user_id.label("user_id"),
+                func.sum(Order.total_amount).label("total_purchases")
             )
-            total_purchases = purchases_result.scalar() or Decimal('0')
-
-            # Get total commission from this user
-            commission_result = await db.execute(
-                select(func.coalesce(func.sum(Commission.commission_amount), 0)).where(
-                    and_(
-                        Commission.referral_id == ref.id,
-                        Commission.affiliate_user_id == user_id
-                    )
-                )
+            .where(
+                Order.user_id.in_(team_user_ids),
+                Order.order_status.in_(['completed', 'active'])
             )
-            total_commission = commission_result.scalar() or Decimal('0')
-
-            # Get active servers count
-            servers_result = await db.execute(
-                select(func.count(Server.id)).where(
-                    and_(
-                        Server.user_id == ref.referred_user_id,
-                        Server.server_status.in_(['active', 'running'])
-                    )
-                )
+            .group_by(Order.user_id)
+            .subquery()
+        )
+        commissions = (
+            select(
+                Commission.referral_id.label("referral_id"),
+                func.sum(Commission.commission_amount).label("total_commission")
             )
-            active_servers = servers_result.scalar() or 0
-
-            # Get child count (direct referrals of this member)
-            child_result = await db.execute(
-                select(func.count(Referral.id)).where(
-                    and_(
-                        Referral.referrer_id == ref.referred_user_id,
-                        Referral.level == 1
-                    )
-                )
+            .where(Commission.affiliate_user_id == user_id)
+            .group_by(Commission.referral_id)
+            .subquery()
+        )
+        servers = (
+            select(
+                Server.user_id.label("user_id"),
+                func.count(Server.id).label("active_servers")
             )
-            child_count = child_result.scalar() or 0
-
-            team_members.append(TeamMember(
-                user_id=user.id,
-                email=user.email,
-                full_name=user.full_name,
-                level=ref.level,
-                joined_at=ref.created_at,
-                has_purchased=ref.has_purchased,
-                total_purchases=total_purchases,
-                total_commission=total_commission,
-                active_servers=active_servers,
-                child_count=child_count
-            ))
+            .where(
+                Server.user_id.in_(team_user_ids),
+                Server.server_status.in_(['active', 'running'])
+            )
+            .group_by(Server.user_id)
+            .subquery()
+        )
+        children = (
+            select(
+                Referral.referrer_id.label("user_id"),
+                func.count(Referral.id).label("child_count")
+            )
+            .where(
+                Referral.referrer_id.in_(team_user_ids),
+                Referral.level == 1
+            )
+            .group_by(Referral.referrer_id)
+            .subquery()
+        )
+
+        total_purchases = func.coalesce(purchases.c.total_purchases, 0)
+        total_commission = func.coalesce(commissions.c.total_commission, 0)
+        sort_column = {
+            "joined": None,
+            "purchases": total_purchases,
+            "commission": total_commission,
+        }[sort_by]
+
+        query = (
+            select(
+                Referral,
+                UserProfile,
+                total_purchases.label("total_purchases"),
+                total_commission.label("total_commission"),
+                func.coalesce(servers.c.active_servers, 0).label("active_servers"),
+                func.coalesce(children.c.child_count, 0).label("child_count"),
+            )
+            .join(UserProfile, UserProfile.id == Referral.referred_user_id)
+            .outerjoin(purchases, purchases.c.user_id == Referral.referred_user_id)
+            .outerjoin(commissions, commissions.c.referral_id == Referral.id)
+            .outerjoin(servers, servers.c.user_id == Referral.referred_user_id)
+            .outerjoin(children, children.c.user_id == Referral.referred_user_id)
+            .where(*team_filter)
+        )
 
-        return team_members
+        # Keyset pagination on (sort value, referral id); referral ids grow with join time
+        if cursor:
+            last_value, last_id = _decode_team_cursor(cursor, sort_by)
+            if sort_column is None:
+                query = query.where(Referral.id < last_id)
+            else:
+                query = query.where(or_(
+                    sort_column < last_value,
+                    and_(sort_column == last_value, Referral.id < last_id)
+                ))
+
+        if sort_column is None:
+            query = query.order_by(desc(Referral.id))
+        else:
+            query = query.order_by(desc(sort_column), desc(Referral.id))
+
+        if limit:
+            query = query.limit(limit + 1)
+
+        rows = (await db.execute(query)).all()
+
+        next_cursor = None
+        if limit and len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            last_value = {
+                "joined": None,
+                "purchases": last.total_purchases,
+                "commission": last.total_commission,
+            }[sort_by]
+            next_cursor = _encode_team_cursor(last_value, last.Referral.id)
+
+        team_members = [
+            TeamMember(
+                user_id=row.UserProfile.id,
+                email=row.UserProfile.email,
+                full_name=row.UserProfile.full_name,
+                level=row.Referral.level,
+                joined_at=row.Referral.created_at,
+                has_purchased=row.Referral.has_purchased,
+                total_purchases=Decimal(row.total_purchases or 0),
+                total_commission=Decimal(row.total_commission or 0),
+                active_servers=row.active_servers,
+                child_count=row.child_count
+            )
+            for row in rows
+        ]
+        return team_members, next_cursor
 
     async def get_recent_commissions(
         self,
@@ -613,163 +721,16 @@ class AffiliateService:
     # ==================== Helper Methods ====================
 
     async def _initialize_affiliate_stats(self, db: AsyncSession, user_id: int):
-        """Initialize affiliate stats record"""
-        stats = AffiliateStats(
-            affiliate_user_id=user_id,
-            total_referrals_level1=0,
-            total_referrals_level2=0,
-            total_referrals_level3=0,
-            total_referrals=0,
-            active_referrals_level1=0,
-            active_referrals_level2=0,
-            active_referrals_level3=0,
-            active_referrals=0,
-            total_commission_earned=Decimal('0'),
-            pending_commission=Decimal('0'),
-            approved_commission=Decimal('0'),
-            paid_commission=Decimal('0'),
-            available_balance=Decimal('0'),
-            total_payouts=0,
-            total_payout_amount=Decimal('0')
-        )
-        db.add(stats)
-        await db.commit()
-
-    async def _update_referral_counts(self, db: AsyncSession, user_id: int):
-        """Update referral counts in stats"""
-        stats_result = await db.execute(
-            select(AffiliateStats).where(AffiliateStats.affiliate_user_id == user_id)
-        )
-        stats = stats_result.scalar_one_or_none()
-        if not stats:
-            await self._initialize_affiliate_stats(db, user_id)
-            return
-
-        # Count referrals by level
-        for level in [1, 2, 3]:
-            # Total referrals
-            total_result = await db.execute(
-                select(func.count(Referral.id)).where(
-                    and_(
-                        Referral.referrer_id == user_id,
-                        Referral.level == level
-                    )
-                )
-            )
-            total = total_result.scalar() or 0
-
-            # Active referrals (with purchases)
-            active_result = await db.execute(
-                select(func.count(Referral.id)).where(
-                    and_(
-                        Referral.referrer_id == user_id,
-                        Referral.level == level,
-                        Referral.has_purchased == True
-                    )
-                )
-            )
-            active = active_result.scalar() or 0
-
-            if level == 1:
-                stats.total_referrals_level1 = total
-                stats.active_referrals_level1 = active
-            elif level == 2:
-                stats.total_referrals_level2 = total
-                stats.active_referrals_level2 = active
-            else:
-                stats.total_referrals_level3 = total
-                stats.active_referrals_level3 = active
-
-        stats.total_referrals = stats.total_referrals_level1 + stats.total_referrals_level2 + stats.total_referrals_level3
-        stats.active_referrals = stats.active_referrals_level1 + stats.active_referrals_level2 + stats.active_referrals_level3
-
-        await db.commit()
-
-    async def _update_commission_stats(self, db: AsyncSession, user_id: int):
-        """Update commission stats"""
-        stats_result = await db.execute(
-            select(AffiliateStats).where(AffiliateStats.affiliate_user_id == user_id)
+        """Initialize affiliate stats record, seeded from any existing history"""
+        existing = await db.execute(
+            select(AffiliateStats.id).where(AffiliateStats.affiliate_user_id == user_id)
         )
-        stats = stats_result.scalar_one_or_none()
-        if not stats:
+        if existing.scalar_one_or_none():
             return
 
-        # Total earned
-        total_result = await db.execute(
-            select(func.coalesce(func.sum(Commission.commission_amount), 0)).where(
-                Commission.affiliate_user_id == user_id
-            )
-        )
-        stats.total_commission_earned = total_result.scalar() or Decimal('0')
-
-        # Pending
-        pending_result = await db.execute(
-            select(func.coalesce(func.sum(Commission.commission_amount), 0)).where(
-                and_(
-                    Commission.affiliate_user_id == user_id,
-                    Commission.status == CommissionStatus.PENDING
-                )
-            )
-        )
-        stats.pending_commission = pending_result.scalar() or Decimal('0')
-
-        # Approved
-        approved_result = await db.execute(
-            select(func.coalesce(func.sum(Commission.commission_amount), 0)).where(
-                and_(
-                    Commission.affiliate_user_id == user_id,
-                    Commission.status == CommissionStatus.APPROVED
-                )
-            )
-        )
-        stats.approved_commission = approved_result.scalar() or Decimal('0')
-
-        # Paid
-        paid_result = await db.execute(
-            select(func.coalesce(func.sum(Commission.commission_amount), 0)).where(
-                and_(
-                    Commission.affiliate_user_id == user_id,
-                    Commission.status == CommissionStatus.PAID
-                )
-            )
-        )
-        stats.paid_commission = paid_result.scalar() or Decimal('0')
-
-        # Payouts
-        payout_count_result = await db.execute(
-            select(func.count(Payout.id)).where(
-                and_(
-                    Payout.affiliate_user_id == user_id,
-                    Payout.status == PayoutStatus.COMPLETED
-                )
-            )
-        )
-        stats.total_payouts = payout_count_result.scalar() or 0
-
-        payout_amount_result = await db.execute(
-            select(func.coalesce(func.sum(Payout.amount), 0)).where(
-                and_(
-                    Payout.affiliate_user_id == user_id,
-                    Payout.status == PayoutStatus.COMPLETED
-                )
-            )
-        )
-        stats.total_payout_amount = payout_amount_result.scalar() or Decimal('0')
-
-        # Available balance = approved - paid - pending payouts
-        pending_payouts_result = await db.execute(
-            select(func.coalesce(func.sum(Payout.amount), 0)).where(
-                and_(
-                    Payout.affiliate_user_id == user_id,
-                    Payout.status.in_([PayoutStatus.PENDING, PayoutStatus.PROCESSING])
-                )
-            )
-        )
-        pending_payouts = pending_payouts_result.scalar() or Decimal('0')
-
-        stats.available_balance = stats.approved_commission - stats.paid_commission - pending_payouts
-        stats.last_calculated_at = datetime.utcnow()
-
+        totals = await self.stats.compute(db, [user_id])
+        stats = AffiliateStats(affiliate_user_id=user_id, **totals[user_id])
+        db.add(stats)
         await db.commit()
 
     async def _get_commission_rule(
@@ -810,27 +771,7 @@ class AffiliateService:
         amount: Decimal,
         payout_id: int
     ):
-        """Mark commissions as paid for a payout"""
-        # Get approved commissions up to the payout amount
-        result = await db.execute(
-            select(Commission).where(
-                and_(
-                    Commission.affiliate_user_id == user_id,
-                    Commission.status == CommissionStatus.APPROVED,
-                    Commission.payout_id == None
-                )
-            ).order_by(Commission.created_at).limit(100)  # Safety limit
-        )
-        commissions = result.scalars().all()
-
-        remaining = amount
-        for comm in commissions:
-            if remaining <= 0:
-                break
-            
-            comm.status = CommissionStatus.PAID
-            comm.paid_at = datetime.utcnow()
-            comm.payout_id = payout_id
-            remaining -= comm.commission_amount
-
-        await db.commit()
+        """Mark commissions as paid for a payout (oldest first, up to the payout amount)"""
+        paid = await payout_batches.mark_commissions_paid(db, [payout_id])
+        if paid.get(user_id):
+            await self.stats.commissions_paid(db, user_id, paid[user_id])
@@ -0,0 +1,296 @@
+"""
+Affiliate Stats Service - Keeps AffiliateStats current with atomic deltas.
+
+Every Referral / Commission / Payout state change applies its delta to the
+affected affiliate's row with a single UPDATE ... SET col = col + :delta, in
+the same transaction as the change itself. Nothing is recomputed on the hot
+path; reconcile() recomputes everything offline and repairs drift.
+"""
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update, func, case
+from typing import Dict, List, Optional, Tuple
+from decimal import Decimal
+from datetime import datetime
+
+from app.models.affiliate import (
+    AffiliateStats, Referral, Commission, Payout, CommissionStatus, PayoutStatus
+)
+
+
+REFERRAL_COUNT_FIELDS = (
+    "total_referrals_level1", "total_referrals_level2", "total_referrals_level3", "total_referrals",
+    "active_referrals_level1", "active_referrals_level2", "active_referrals_level3", "active_referrals",
+)
+COMMISSION_FIELDS = (
+    "total_commission_earned", "pending_commission", "approved_commission", "paid_commission",
+    "total_payouts", "total_payout_amount", "available_balance",
+)
+PENDING_PAYOUT_STATUSES = (PayoutStatus.PENDING, PayoutStatus.PROCESSING)
+
+
+def _available_balance(approved, paid, pending_payouts):
+    """Available balance = approved - paid - pending payouts (same rule for deltas and totals)"""
+    return approved - paid - pending_payouts
+
+
+def _commissions_paid_deltas(amount) -> Dict[str, object]:
+    return {
+        "approved_commission": -amount,
+        "paid_commission": amount,
+        "available_balance": _available_balance(-amount, amount, 0),
+    }
+
+
+def _payout_closed_deltas(amount, completed: bool, count: int = 1) -> Dict[str, object]:
+    deltas = {"available_balance": _available_balance(0, 0, -amount)}
+    if completed:
+        deltas["total_payouts"] = count
+        deltas["total_payout_amount"] = amount
+    return deltas
+
+
+class AffiliateStatsService:
+    """Incremental maintenance and offline reconciliation of AffiliateStats"""
+
+    # ==================== Deltas (hot path) ====================
+
+    async def referral_added(self, db: AsyncSession, affiliate_user_id: int, level: int):
+        await self._apply(db, affiliate_user_id, {
+            f"total_referrals_level{level}": 1,
+            "total_referrals": 1,
+        })
+
+    async def referral_converted(self, db: AsyncSession, affiliate_user_id: int, level: int):
+        await self._apply(db, affiliate_user_id, {
+            f"active_referrals_level{level}": 1,
+            "active_referrals": 1,
+        })
+
+    async def commission_added(self, db: AsyncSession, affiliate_user_id: int, amount: Decimal):
+        await self._apply(db, affiliate_user_id, {
+            "total_commission_earned": amount,
+            "pending_commission": amount,
+        })
+
+    async def commission_approved(self, db: AsyncSession, affiliate_user_id: int, amount: Decimal):
+        await self._apply(db, affiliate_user_id, {
+            "pending_commission": -amount,
+            "approved_commission": amount,
+            "available_balance": _available_balance(amount, 0, 0),
+        })
+
+    async def commissions_paid(self, db: AsyncSession, affiliate_user_id: int, amount: Decimal):
+        await self._apply(db, affiliate_user_id, _commissions_paid_deltas(amount))
+
+    async def payout_requested(self, db: AsyncSession, affiliate_user_id: int, amount: Decimal):
+        await self._apply(db, affiliate_user_id, {
+            "available_balance": _available_balance(0, 0, amount),
+        })
+
+    async def payout_closed(
+        self,
+        db: AsyncSession,
+        affiliate_user_id: int,
+        amount: Decimal,
+        completed: bool
+    ):
+        """A pending/processing payout was completed or rejected"""
+        await self._apply(db, affiliate_user_id, _payout_closed_deltas(amount, completed))
+
+    async def payouts_completed(
+        self,
+        db: AsyncSession,
+        commissions_paid: Dict[int, Decimal],
+        payouts: Dict[int, Tuple[int, Decimal]]
+    ):
+        """
+        A chunk of a payout run: commissions_paid() and payout_closed(completed=True)
+        for every affiliate in it, as one UPDATE. payouts maps user -> (count, amount).
+        """
+        deltas: Dict[int, Dict[str, object]] = {}
+        changes = [(user_id, _commissions_paid_deltas(amount)) for user_id, amount in commissions_paid.items()]
+        changes += [(user_id, _payout_closed_deltas(amount, True, count)) for user_id, (count, amount) in payouts.items()]
+        for user_id, change in changes:
+            row = deltas.setdefault(user_id, {})
+            for name, delta in change.items():
+                row[name] = row.get(name, 0) + delta
+        await self._apply_many(db, deltas)
+
+    async def _apply(self, db: AsyncSession, affiliate_user_id: int, deltas: Dict[str, object]):
+        """
+        Atomically add `deltas` to the affiliate's stats row. Caller owns the commit.
+        A missing row is created from a full recompute (which already sees this change).
+        """
+        values = {name: getattr(AffiliateStats, name) + delta for name, delta in deltas.items()}
+        result = await db.execute(
+            update(AffiliateStats)
+            .where(AffiliateStats.affiliate_user_id == affiliate_user_id)
+            .values(**values)
+        )
+        if result.rowcount == 0:
+            await db.flush()
+            totals = await self.compute(db, [affiliate_user_id])
+            db.add(AffiliateStats(
+                affiliate_user_id=affiliate_user_id,
+                last_calculated_at=datetime.utcnow(),
+                **totals[affiliate_user_id]
+            ))
+
+    async def _apply_many(self, db: AsyncSession, deltas: Dict[int, Dict[str, object]]):
+        """_apply() for many affiliates: one UPDATE with a CASE per column"""
+        if not deltas:
+            return
+        user_ids = sorted(deltas)
+        columns = sorted({name for row in deltas.values() for name in row})
+
+        def delta(name):
+            return case(
+                {user_id: deltas[user_id].get(name, 0) for user_id in user_ids},
+                value=AffiliateStats.affiliate_user_id,
+                else_=0
+            )
+
+        result = await db.execute(
+            update(AffiliateStats)
+            .where(AffiliateStats.affiliate_user_id.in_(user_ids))
+            .values(**{name: getattr(AffiliateStats, name) + delta(name) for name in columns})
+            .returning(AffiliateStats.affiliate_user_id)
+            .execution_options(synchronize_session=False)
+        )
+        missing = sorted(set(user_ids) - set(result.scalars().all()))
+        if missing:
+            await db.flush()
+            totals = await self.compute(db, missing)
+            for user_id in missing:
+                db.add(AffiliateStats(
+                    affiliate_user_id=user_id,
+                    last_calculated_at=datetime.utcnow(),
+                    **totals[user_id]
+                ))
+
+    # ==================== Full recompute / reconciliation ====================
+
+    async def compute(self, db: AsyncSession, affiliate_user_ids: Optional[List[int]] = None) -> Dict[int, Dict]:
+        """
+        Recompute stats from source rows - one grouped query per table.
+        Pass None to compute for every affiliate that has a stats row or any activity.
+        """
+        def scoped(query, column):
+            if affiliate_user_ids is not None:
+                query = query.where(column.in_(affiliate_user_ids))
+            return query
+
+        def count_if(condition):
+            return func.coalesce(func.sum(case((condition, 1), else_=0)), 0)
+
+        def sum_if(condition, column):
+            return func.coalesce(func.sum(case((condition, column), else_=0)), 0)
+
+        totals: Dict[int, Dict] = {}
+
+        def row_for(user_id: int) -> Dict:
+            if user_id not in totals:
+                totals[user_id] = {name: 0 for name in REFERRAL_COUNT_FIELDS + COMMISSION_FIELDS}
+            return totals[user_id]
+
+        for user_id in affiliate_user_ids or []:
+            row_for(user_id)
+        if affiliate_user_ids is None:
+            for (user_id,) in (await db.execute(select(AffiliateStats.affiliate_user_id))).all():
+                row_for(user_id)
+
+        referral_rows = await db.execute(scoped(
+            select(
+                Referral.referrer_id,
+                *[count_if(Referral.level == level) for level in (1, 2, 3)],
+                *[count_if((Referral.level == level) & (Referral.has_purchased == True)) for level in (1, 2, 3)],
+            ).group_by(Referral.referrer_id),
+            Referral.referrer_id
+        ))
+        for user_id, t1, t2, t3, a1, a2, a3 in referral_rows.all():
+            row_for(user_id).update({
+                "total_referrals_level1": t1, "total_referrals_level2": t2, "total_referrals_level3": t3,
+                "total_referrals": t1 + t2 + t3,
+                "active_referrals_level1": a1, "active_referrals_level2": a2, "active_referrals_level3": a3,
+                "active_referrals": a1 + a2 + a3,
+            })
+
+        commission_rows = await db.execute(scoped(
+            select(
+                Commission.affiliate_user_id,
+                func.coalesce(func.sum(Commission.commission_amount), 0),
+                sum_if(Commission.status == CommissionStatus.PENDING, Commission.commission_amount),
+                sum_if(Commission.status == CommissionStatus.APPROVED, Commission.commission_amount),
+                sum_if(Commission.status == CommissionStatus.PAID, Commission.commission_amount),
+            ).group_by(Commission.affiliate_user_id),
+            Commission.affiliate_user_id
+        ))
+        for user_id, earned, pending, approved, paid in commission_rows.all():
+            row_for(user_id).update({
+                "total_commission_earned": Decimal(earned),
+                "pending_commission": Decimal(pending),
+                "approved_commission": Decimal(approved),
+                "paid_commission": Decimal(paid),
+            })
+
+        pending_payouts: Dict[int, Decimal] = {}
+        payout_rows = await db.execute(scoped(
+            select(
+                Payout.affiliate_user_id,
+                count_if(Payout.status == PayoutStatus.COMPLETED),
+                sum_if(Payout.status == PayoutStatus.COMPLETED, Payout.amount),
+                sum_if(Payout.status.in_(PENDING_PAYOUT_STATUSES), Payout.amount),
+            ).group_by(Payout.affiliate_user_id),
+            Payout.affiliate_user_id
+        ))
+        for user_id, completed_count, completed_amount, pending_amount in payout_rows.all():
+            row_for(user_id).update({
+                "total_payouts": completed_count,
+                "total_payout_amount": Decimal(completed_amount),
+            })
+            pending_payouts[user_id] = Decimal(pending_amount)
+
+        for user_id, row in totals.items():
+            row["available_balance"] = _available_balance(
+                Decimal(row["approved_commission"]),
+                Decimal(row["paid_commission"]),
+                pending_payouts.get(user_id, Decimal('0'))
+            )
+        return totals
+
+    async def reconcile(self, db: AsyncSession, repair: bool = True) -> Dict[int, Dict[str, tuple]]:
+        """
+        Compare every AffiliateStats row with a fresh recompute.
+        Returns {affiliate_user_id: {field: (stored, expected)}} for rows that drifted;
+        with repair=True the drifted rows are overwritten and committed.
+        """
+        expected = await self.compute(db)
+        stored = {
+            stats.affiliate_user_id: stats
+            for stats in (await db.execute(select(AffiliateStats))).scalars().all()
+        }
+
+        drift: Dict[int, Dict[str, tuple]] = {}
+        for user_id, values in expected.items():
+            stats = stored.get(user_id)
+            if stats is None:
+                drift[user_id] = {name: (None, value) for name, value in values.items()}
+                if repair:
+                    db.add(AffiliateStats(affiliate_user_id=user_id, last_calculated_at=datetime.utcnow(), **values))
+                continue
+
+            diffs = {
+                name: (getattr(stats, name), value)
+                for name, value in values.items()
+                if Decimal(getattr(stats, name) or 0) != Decimal(value)
+            }
+            if diffs:
+                drift[user_id] = diffs
+                if repair:
+                    for name, (_, value) in diffs.items():
+                        setattr(stats, name, value)
+                    stats.last_calculated_at = datetime.utcnow()
+
+        if repair:
+            await db.commit()
+        return drift
@@ -0,0 +1,126 @@
+"""
+Attachment Blob Store - Content-addressed, reference-counted encrypted blobs.
+
+Identical uploads (same plaintext SHA-256) share one AttachmentBlob and one
+encrypted file; every TicketAttachment using it holds a reference:
+  - acquire()  takes a reference on an existing blob (atomic UPDATE ... RETURNING)
+  - add()      registers a newly written blob; if a concurrent identical upload
+               registered first, ours is discarded and theirs is shared
+  - release()  drops a reference when an attachment is soft-deleted
+  - collect_garbage() deletes blobs with no live references once they have been
+    idle for ATTACHMENT_BLOB_GC_GRACE_SECONDS (scripts/gc_attachment_blobs.py)
+
+All reference changes run in the caller's transaction, so they commit or roll
+back together with the attachment row. Blob files live in attachment storage
+(app/services/attachment_storage.py); storage_path is the storage key.
+"""
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import select, update, delete, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.attachment_blob import AttachmentBlob
+from app.models.ticket_attachment import TicketAttachment
+from app.services.attachment_storage import AttachmentStorage, attachment_storage
+
+
+class AttachmentBlobStore:
+    """Reference counting and garbage collection for shared attachment blobs"""
+
+    def __init__(self, storage: AttachmentStorage = attachment_storage):
+        self.storage = storage
+
+    async def acquire(self, db: AsyncSession, content_hash: str) -> Optional[AttachmentBlob]:
+        """Take a reference on the blob holding this content, if one exists"""
+        result = await db.execute(
+            update(AttachmentBlob)
+            .where(AttachmentBlob.content_hash == content_hash)
+            .values(ref_count=AttachmentBlob.ref_count + 1, updated_at=datetime.utcnow())
+            .returning(AttachmentBlob)
+            .execution_options(synchronize_session=False)
+        )
+        return result.scalars().first()
+
+    async def add(
+        self,
+        db: AsyncSession,
+        content_hash: str,
+        size: int,
+        storage_path: str,
+        encryption_key_id: str,
+    ) -> AttachmentBlob:
+        """Register a blob just written to storage_path, holding one reference"""
+        blob = AttachmentBlob(
+            content_hash=content_hash,
+            storage_path=storage_path,
+            encryption_key_id=encryption_key_id,
+            size=size,
+            ref_count=1,
+            updated_at=datetime.utcnow(),
+        )
+        try:
+            async with db.begin_nested():
+                db.add(blob)
+            return blob
+        except IntegrityError:
+            # An identical upload registered the same content first - share theirs
+            existing = await self.acquire(db, content_hash)
+            if existing is None:
+                raise
+            await self.storage.delete(storage_path)
+            return existing
+
+    async def release(self, db: AsyncSession, blob_id: int) -> None:
+        await db.execute(
+            update(AttachmentBlob)
+            .where(AttachmentBlob.id == blob_id, AttachmentBlob.ref_count > 0)
+            .values(ref_count=AttachmentBlob.ref_count - 1, updated_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+
+    async def collect_garbage(
+        self,
+        db: AsyncSession,
+        grace_seconds: int = settings.ATTACHMENT_BLOB_GC_GRACE_SECONDS,
+    ) -> int:
+        """
+        Delete blobs no live attachment references; returns how many were reclaimed.
+        Counts of idle blobs are first recomputed from ticket_attachments, which
+        repairs drift from hard deletes (e.g. a ticket deleted with its attachments).
+        """
+        cutoff = datetime.utcnow() - timedelta(seconds=grace_seconds)
+        live_refs = (
+            select(func.count(TicketAttachment.id))
+            .where(TicketAttachment.blob_id == AttachmentBlob.id, TicketAttachment.is_deleted == False)
+            .scalar_subquery()
+        )
+        await db.execute(
+            update(AttachmentBlob)
+            .where(AttachmentBlob.updated_at < cutoff, AttachmentBlob.ref_count != live_refs)
+            # keep updated_at: a repaired count must not restart the grace period
+            .values(ref_count=live_refs, updated_at=AttachmentBlob.updated_at)
+            .execution_options(synchronize_session=False)
+        )
+        result = await db.execute(
+            delete(AttachmentBlob)
+            .where(AttachmentBlob.ref_count == 0, AttachmentBlob.updated_at < cutoff)
+            .returning(AttachmentBlob.storage_path, AttachmentBlob.preview_key)
+            .execution_options(synchronize_session=False)
+        )
+        reclaimed = result.all()
+        await db.commit()
+
+        # Files go only after the rows are gone, so no committed attachment can point at a missing file
+        for storage_path, preview_key in reclaimed:
+            await self.storage.delete(storage_path)
+            if preview_key:
+                await self.storage.delete(preview_key)
+        if reclaimed:
+            print(f"🧹 Reclaimed {len(reclaimed)} unreferenced attachment blobs")
+        return len(reclaimed)
+
+
+attachment_blob_store = AttachmentBlobStore()
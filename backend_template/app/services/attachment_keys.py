@@ -0,0 +1,137 @@
+"""
+Attachment Keys - Envelope encryption for stored attachments.
+
+Key hierarchy:
+  - master key (KEK): ATTACHMENT_MASTER_KEY if configured, otherwise derived
+    from SECRET_KEY once per process (the only slow KDF, run off the event loop);
+  - data key (DEK): 32 random bytes per file, stored only wrapped by the KEK
+    (AES key wrap, RFC 3394) in TicketAttachment.encryption_key_id as
+    "dek1:<kek id>:<base64 wrapped key>".
+Unwrapped data keys of recently used files are kept in a small LRU, so a hot
+attachment (or a client issuing many Range requests) costs no key work at all.
+
+Bulk crypto work (encrypting upload blocks, the one-time KDF) runs on a bounded
+thread pool, so a large upload never stalls other requests on the event loop.
+"""
+import asyncio
+import base64
+import hashlib
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, Tuple, TypeVar
+
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives.keywrap import InvalidUnwrap, aes_key_unwrap, aes_key_wrap
+
+from app.core.config import settings
+
+
+T = TypeVar("T")
+
+KEY_REF_PREFIX = "dek1"
+KEK_SALT = b"bidua-attachments-kek-v1"
+KEK_ITERATIONS = 600_000
+
+
+class AttachmentKeyring:
+    """Process-wide holder of the master key, the data-key LRU and the crypto pool"""
+
+    def __init__(
+        self,
+        secret: str = settings.SECRET_KEY,
+        master_key: Optional[str] = settings.ATTACHMENT_MASTER_KEY,
+        cache_size: int = settings.ATTACHMENT_KEY_CACHE_SIZE,
+        workers: int = settings.CRYPTO_WORKERS,
+    ):
+        self.secret = secret
+        self.configured_master_key = master_key
+        self.cache_size = cache_size
+        self.workers = workers
+        self._kek: Optional[bytes] = None
+        self._kek_id: Optional[str] = None
+        self._kek_lock: Optional[asyncio.Lock] = None
+        self._keys: "OrderedDict[str, bytes]" = OrderedDict()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    async def run(self, fn: Callable[..., T], *args) -> T:
+        """Run CPU-bound crypto work on the bounded pool"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="crypto")
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def master_key(self) -> Tuple[bytes, str]:
+        """(KEK, KEK id); derived on first use - main.py warms it at startup"""
+        if self._kek is None:
+            if self._kek_lock is None:
+                self._kek_lock = asyncio.Lock()
+            async with self._kek_lock:
+                if self._kek is None:
+                    kek = await self.run(self._derive_master_key)
+                    self._kek_id = hashlib.sha256(kek).hexdigest()[:8]
+                    self._kek = kek
+        return self._kek, self._kek_id
+
+    def _derive_master_key(self) -> bytes:
+        if self.configured_master_key:
+            key = base64.b64decode(self.configured_master_key)
+            if len(key) != 32:
+                raise ValueError("ATTACHMENT_MASTER_KEY must be 32 bytes, base64 encoded")
+            return key
+        return PBKDF2HMAC(
+            algorithm=hashes.SHA256(), length=32, salt=KEK_SALT, iterations=KEK_ITERATIONS
+        ).derive(self.secret.encode())
+
+    async def new_data_key(self) -> Tuple[bytes, str]:
+        """A fresh data key and the reference to store with the file"""
+        kek, kek_id = await self.master_key()
+        data_key = os.urandom(32)
+        wrapped = base64.b64encode(aes_key_wrap(kek, data_key)).decode()
+        key_ref = f"{KEY_REF_PREFIX}:{kek_id}:{wrapped}"
+        self._remember(key_ref, data_key)
+        return data_key, key_ref
+
+    async def data_key(self, key_ref: str, file_id: str, salt: bytes) -> bytes:
+        """
+        Unwrapped data key for a stored file. References that are not "dek1:..."
+        belong to files written before envelope encryption, whose key was derived
+        from SECRET_KEY with the salt in the file header.
+        """
+        data_key = self._keys.get(key_ref)
+        if data_key is not None:
+            self._keys.move_to_end(key_ref)
+            return data_key
+
+        if key_ref.startswith(f"{KEY_REF_PREFIX}:"):
+            _, kek_id, wrapped = key_ref.split(":", 2)
+            kek, current_kek_id = await self.master_key()
+            if kek_id != current_kek_id:
+                raise ValueError(f"Attachment key was wrapped by unknown master key {kek_id}")
+            try:
+                data_key = aes_key_unwrap(kek, base64.b64decode(wrapped))
+            except InvalidUnwrap:
+                raise ValueError("Attachment key could not be unwrapped")
+        else:
+            data_key = HKDF(
+                algorithm=hashes.SHA256(), length=32, salt=salt,
+                info=b"ticket-attachment:" + file_id.encode(),
+            ).derive(self.secret.encode())
+
+        self._remember(key_ref, data_key)
+        return data_key
+
+    def _remember(self, key_ref: str, data_key: bytes) -> None:
+        self._keys[key_ref] = data_key
+        self._keys.move_to_end(key_ref)
+        while len(self._keys) > self.cache_size:
+            self._keys.popitem(last=False)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+attachment_keyring = AttachmentKeyring()
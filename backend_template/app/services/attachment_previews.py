@@ -0,0 +1,170 @@
+"""
+Attachment Previews - Small encrypted thumbnails for image and PDF attachments.
+
+After an upload, a background job (job_queue) renders a JPEG thumbnail of the
+image, or of the first page of a PDF, in a process pool (preview_renderer.py;
+decoding untrusted images never runs in the API process), encrypts it with the
+blob's own data key and stores it next to the blob ("<blob>.preview.enc").
+The support console then fetches a few KB per attachment from
+GET /attachments/{id}/preview instead of decrypting the whole file.
+
+Previews belong to the blob, so identical uploads share one preview, and the
+blob garbage collector removes it together with the blob.
+"""
+import asyncio
+import multiprocessing
+import secrets
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+from fastapi import HTTPException, status
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.attachment_blob import AttachmentBlob
+from app.models.ticket_attachment import TicketAttachment
+from app.models.users import UserProfile
+from app.services.attachment_keys import attachment_keyring
+from app.services.chunked_encryption import SALT_SIZE, ChunkedEncryptor
+from app.services.file_service import AttachmentDownload, SecureFileService
+from app.services.job_queue import JobQueue, job_handler, notify_job_workers
+from app.services.preview_renderer import render_preview
+
+
+T = TypeVar("T")
+
+GENERATE_PREVIEW = "attachment.generate_preview"
+
+PREVIEW_MIME_TYPE = "image/jpeg"
+PREVIEWABLE_MIME_TYPES = {
+    "image/jpeg", "image/png", "image/gif", "image/webp", "image/bmp", "application/pdf",
+}
+
+
+def preview_key_for(storage_key: str) -> str:
+    return f"{storage_key.removesuffix('.enc')}.preview.enc"
+
+
+class AttachmentPreviewService:
+    """Enqueues, renders and stores attachment previews"""
+
+    def __init__(self, workers: int = settings.PREVIEW_WORKERS):
+        self.workers = workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    async def run(self, fn: Callable[..., T], *args) -> T:
+        """Run CPU-heavy image decoding on the process pool"""
+        if self._executor is None:
+            # spawn, not fork: the API process has running threads and open connections
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def enqueue(self, db: AsyncSession, attachment: TicketAttachment) -> bool:
+        """Queue preview generation for the attachment's blob (caller commits)"""
+        if attachment.blob_id is None or attachment.mime_type not in PREVIEWABLE_MIME_TYPES:
+            return False
+        blob = await db.get(AttachmentBlob, attachment.blob_id)
+        if blob is None or blob.preview_status != 'pending':
+            return False
+        await JobQueue().enqueue(
+            db, GENERATE_PREVIEW,
+            {"blob_id": blob.id, "mime_type": attachment.mime_type},
+            idempotency_key=f"{GENERATE_PREVIEW}:{blob.id}"
+        )
+        return True
+
+    async def generate(self, db: AsyncSession, blob_id: int, mime_type: str, file_service: SecureFileService = None) -> str:
+        """
+        Render and store the preview of one blob; returns the new preview_status.
+        Idempotent: a blob whose preview is no longer pending is left alone.
+        Storage errors propagate so the job is retried; content Pillow or
+        pdfium cannot render marks the preview failed instead.
+        """
+        blob = await db.get(AttachmentBlob, blob_id)
+        if blob is None or blob.preview_status != 'pending':
+            return blob.preview_status if blob else 'missing'
+
+        if mime_type not in PREVIEWABLE_MIME_TYPES:
+            blob.preview_status = 'unsupported'
+            return blob.preview_status
+
+        file_service = file_service or SecureFileService()
+        source = await file_service.open_encrypted(blob.storage_path, blob.encryption_key_id)
+        data = await file_service.storage.run(lambda: b"".join(file_service.decrypted_chunks(source)))
+
+        try:
+            preview = await self.run(
+                render_preview, data, mime_type,
+                settings.PREVIEW_MAX_SIZE, settings.PREVIEW_MAX_PIXELS, settings.PREVIEW_JPEG_QUALITY
+            )
+        except BrokenProcessPool:
+            self._executor = None
+            raise
+        except Exception as e:
+            print(f"⚠️ Preview for blob {blob.id} failed: {type(e).__name__}: {e}")
+            blob.preview_status = 'failed'
+            return blob.preview_status
+
+        # Same data key as the blob, fresh salt and nonce prefix (chunked_encryption.py)
+        preview_key = preview_key_for(blob.storage_path)
+        encryptor = ChunkedEncryptor(source.key, secrets.token_bytes(SALT_SIZE))
+        async with file_service.storage.writer(preview_key) as out:
+            await out.write(encryptor.header.raw)
+            await out.write(await attachment_keyring.run(encryptor.update, preview))
+            await out.write(encryptor.finalize())
+
+        blob.preview_key = preview_key
+        blob.preview_status = 'ready'
+        return blob.preview_status
+
+    async def download(
+        self,
+        db: AsyncSession,
+        attachment_id: int,
+        user: UserProfile,
+        file_service: SecureFileService = None
+    ) -> Optional[AttachmentDownload]:
+        """
+        The attachment's preview image, or None while it is still being generated
+        (a missing job is queued again). Same access rules as the download.
+        """
+        file_service = file_service or SecureFileService()
+        attachment = await file_service.get_attachment_for_user(db, attachment_id, user)
+        blob = await db.get(AttachmentBlob, attachment.blob_id) if attachment.blob_id else None
+        
+        if (
+            blob is None
+            or attachment.mime_type not in PREVIEWABLE_MIME_TYPES
+            or blob.preview_status in ('unsupported', 'failed')
+        ):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="No preview available for this attachment"
+            )
+        
+        if blob.preview_status != 'ready':
+            if await self.enqueue(db, attachment):
+                await db.commit()
+                notify_job_workers()
+            return None
+        
+        preview = await file_service.open_encrypted(blob.preview_key, blob.encryption_key_id)
+        size = preview.plaintext_size
+        filename = f"{attachment.original_filename.rsplit('.', 1)[0]}-preview.jpg"
+        return AttachmentDownload(filename, PREVIEW_MIME_TYPE, size, 0, size - 1, file_service.decrypted_chunks(preview))
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+attachment_previews = AttachmentPreviewService()
+
+
+@job_handler(GENERATE_PREVIEW)
+async def generate_preview(db: AsyncSession, payload: Dict[str, Any]):
+    await attachment_previews.generate(db, payload["blob_id"], payload["mime_type"])
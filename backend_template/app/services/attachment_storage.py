@@ -0,0 +1,334 @@
+"""
+Attachment Storage - Where encrypted attachment blobs live.
+
+SecureFileService only sees this interface, so every API node can serve every
+attachment once blobs are in shared storage:
+  - LocalStorage: a directory on local disk (single node / development)
+  - S3Storage:    any S3-compatible object store (AWS S3, MinIO, ...), selected
+                  with ATTACHMENT_STORAGE_BACKEND="s3"
+
+Objects are written as a stream (S3 multipart upload, never the whole file in
+memory) and read back by byte range, so a Range download only fetches the
+encrypted chunks it needs. Blocking I/O runs on a bounded thread pool.
+
+Stored keys are what TicketAttachment.storage_path holds. Rows written before
+this module hold a full local path ("app/static/uploads/tickets/<id>.enc");
+LocalStorage still resolves those.
+"""
+import asyncio
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import AsyncIterator, BinaryIO, Callable, Optional, TypeVar
+
+from app.core.config import settings
+
+
+T = TypeVar("T")
+
+S3_MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+class AttachmentStorage:
+    """Base class for storage drivers; keys are flat object names"""
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    async def run(self, fn: Callable[..., T], *args) -> T:
+        """Run blocking storage I/O on the driver's pool"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="storage")
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    @asynccontextmanager
+    async def writer(self, key: str) -> AsyncIterator["ObjectWriter"]:
+        """
+        Stream a new object: `async with storage.writer(key) as out: await out.write(...)`.
+        The object only becomes visible once the block exits cleanly; on error
+        the partial upload is discarded.
+        """
+        out = self._new_writer(key)
+        try:
+            yield out
+            await out.complete()
+        except BaseException:
+            await out.abort()
+            raise
+
+    def _new_writer(self, key: str) -> "ObjectWriter":
+        raise NotImplementedError
+
+    async def size(self, key: str) -> Optional[int]:
+        """Object size in bytes, or None when it does not exist"""
+        raise NotImplementedError
+
+    async def read(self, key: str, start: int, length: int) -> bytes:
+        raise NotImplementedError
+
+    def open(self, key: str, size: int) -> BinaryIO:
+        """Seekable reader for the object (blocking; use from a worker thread)"""
+        raise NotImplementedError
+
+    async def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+class ObjectWriter:
+    async def write(self, data: bytes) -> None:
+        raise NotImplementedError
+
+    async def complete(self) -> None:
+        raise NotImplementedError
+
+    async def abort(self) -> None:
+        raise NotImplementedError
+
+
+# ==================== Local disk ====================
+
+class LocalStorage(AttachmentStorage):
+    def __init__(self, root: str = settings.ATTACHMENT_LOCAL_DIR, workers: int = settings.STORAGE_WORKERS):
+        super().__init__(workers)
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def path(self, key: str) -> Path:
+        # Keys containing a "/" are full paths stored by older uploads
+        return Path(key) if "/" in key else self.root / key
+
+    def _new_writer(self, key: str) -> "ObjectWriter":
+        return _LocalWriter(self, self.path(key))
+
+    async def size(self, key: str) -> Optional[int]:
+        try:
+            return os.path.getsize(self.path(key))
+        except FileNotFoundError:
+            return None
+
+    async def read(self, key: str, start: int, length: int) -> bytes:
+        with open(self.path(key), "rb") as f:
+            f.seek(start)
+            return f.read(length)
+
+    def open(self, key: str, size: int) -> BinaryIO:
+        return open(self.path(key), "rb")
+
+    async def delete(self, key: str) -> None:
+        self.path(key).unlink(missing_ok=True)
+
+
+class _LocalWriter(ObjectWriter):
+    """Writes to <key>.part and renames it into place when complete"""
+
+    def __init__(self, storage: LocalStorage, path: Path):
+        self.storage = storage
+        self.path = path
+        self.partial_path = path.with_suffix(".part")
+        self._file = open(self.partial_path, "wb")
+
+    async def write(self, data: bytes) -> None:
+        await self.storage.run(self._file.write, data)
+
+    async def complete(self) -> None:
+        self._file.close()
+        os.replace(self.partial_path, self.path)
+
+    async def abort(self) -> None:
+        self._file.close()
+        self.partial_path.unlink(missing_ok=True)
+
+
+# ==================== S3-compatible object store ====================
+
+class S3Storage(AttachmentStorage):
+    def __init__(
+        self,
+        bucket: str = settings.ATTACHMENT_S3_BUCKET,
+        endpoint_url: Optional[str] = settings.ATTACHMENT_S3_ENDPOINT_URL,
+        region: str = settings.ATTACHMENT_S3_REGION,
+        access_key_id: Optional[str] = settings.ATTACHMENT_S3_ACCESS_KEY_ID,
+        secret_access_key: Optional[str] = settings.ATTACHMENT_S3_SECRET_ACCESS_KEY,
+        prefix: str = settings.ATTACHMENT_S3_PREFIX,
+        part_size: int = settings.ATTACHMENT_S3_PART_SIZE,
+        read_ahead: int = settings.ATTACHMENT_S3_READ_AHEAD,
+        workers: int = settings.STORAGE_WORKERS,
+    ):
+        # boto3 is only needed when this driver is selected
+        import boto3
+        from botocore.config import Config
+
+        if not bucket:
+            raise ValueError("ATTACHMENT_S3_BUCKET is required for the s3 storage backend")
+        super().__init__(workers)
+        self.bucket = bucket
+        self.prefix = prefix
+        self.part_size = max(part_size, S3_MIN_PART_SIZE)
+        self.read_ahead = read_ahead
+        # One pooled connection per worker thread; path-style addressing for MinIO and friends
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url,
+            region_name=region,
+            aws_access_key_id=access_key_id,
+            aws_secret_access_key=secret_access_key,
+            config=Config(
+                max_pool_connections=workers,
+                retries={"max_attempts": 3, "mode": "standard"},
+                s3={"addressing_style": "path"},
+            ),
+        )
+
+    def object_name(self, key: str) -> str:
+        return f"{self.prefix}{key}"
+
+    def _new_writer(self, key: str) -> "ObjectWriter":
+        return _S3Writer(self, self.object_name(key))
+
+    async def size(self, key: str) -> Optional[int]:
+        from botocore.exceptions import ClientError
+
+        try:
+            head = await self.run(lambda: self.client.head_object(Bucket=self.bucket, Key=self.object_name(key)))
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+        return head["ContentLength"]
+
+    def _get_range(self, name: str, start: int, length: int) -> bytes:
+        response = self.client.get_object(Bucket=self.bucket, Key=name, Range=f"bytes={start}-{start + length - 1}")
+        with response["Body"] as body:
+            return body.read()
+
+    async def read(self, key: str, start: int, length: int) -> bytes:
+        return await self.run(self._get_range, self.object_name(key), start, length)
+
+    def open(self, key: str, size: int) -> BinaryIO:
+        return _S3RangeReader(self, self.object_name(key), size)
+
+    async def delete(self, key: str) -> None:
+        await self.run(lambda: self.client.delete_object(Bucket=self.bucket, Key=self.object_name(key)))
+
+
+class _S3Writer(ObjectWriter):
+    """
+    Buffers up to one part, then uploads it; objects smaller than one part are
+    sent with a single PUT. Memory is bounded by part_size per upload.
+    """
+
+    def __init__(self, storage: S3Storage, name: str):
+        self.storage = storage
+        self.name = name
+        self._buffer = bytearray()
+        self._upload_id: Optional[str] = None
+        self._parts = []
+
+    async def write(self, data: bytes) -> None:
+        self._buffer += data
+        if len(self._buffer) >= self.storage.part_size:
+            await self._flush_part()
+
+    async def _flush_part(self) -> None:
+        client, bucket = self.storage.client, self.storage.bucket
+        if self._upload_id is None:
+            created = await self.storage.run(
+                lambda: client.create_multipart_upload(Bucket=bucket, Key=self.name)
+            )
+            self._upload_id = created["UploadId"]
+        number = len(self._parts) + 1
+        body = bytes(self._buffer)
+        self._buffer.clear()
+        uploaded = await self.storage.run(lambda: client.upload_part(
+            Bucket=bucket, Key=self.name, UploadId=self._upload_id, PartNumber=number, Body=body
+        ))
+        self._parts.append({"PartNumber": number, "ETag": uploaded["ETag"]})
+
+    async def complete(self) -> None:
+        client, bucket = self.storage.client, self.storage.bucket
+        if self._upload_id is None:
+            body = bytes(self._buffer)
+            await self.storage.run(lambda: client.put_object(Bucket=bucket, Key=self.name, Body=body))
+            return
+        if self._buffer:
+            await self._flush_part()
+        await self.storage.run(lambda: client.complete_multipart_upload(
+            Bucket=bucket, Key=self.name, UploadId=self._upload_id, MultipartUpload={"Parts": self._parts}
+        ))
+
+    async def abort(self) -> None:
+        self._buffer.clear()
+        if self._upload_id is not None:
+            client, bucket = self.storage.client, self.storage.bucket
+            await self.storage.run(lambda: client.abort_multipart_upload(
+                Bucket=bucket, Key=self.name, UploadId=self._upload_id
+            ))
+
+
+class _S3RangeReader(io.RawIOBase):
+    """
+    Seekable file over ranged GETs. Reads are served from a read-ahead window,
+    so decrypting consecutive 64 KiB chunks costs one request per window.
+    """
+
+    def __init__(self, storage: S3Storage, name: str, size: int):
+        self.storage = storage
+        self.name = name
+        self.size = size
+        self._pos = 0
+        self._window_start = 0
+        self._window = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: self.size}[whence]
+        self._pos = max(base + offset, 0)
+        return self._pos
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = self.size - self._pos
+        size = min(size, self.size - self._pos)
+        if size <= 0:
+            return b""
+        offset = self._pos - self._window_start
+        if offset < 0 or offset + size > len(self._window):
+            length = min(max(size, self.storage.read_ahead), self.size - self._pos)
+            self._window = self.storage._get_range(self.name, self._pos, length)
+            self._window_start, offset = self._pos, 0
+        data = self._window[offset:offset + size]
+        self._pos += len(data)
+        return data
+
+    def readinto(self, buffer) -> int:
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def get_attachment_storage() -> AttachmentStorage:
+    backend = settings.ATTACHMENT_STORAGE_BACKEND.lower()
+    if backend == "s3":
+        return S3Storage()
+    if backend == "local":
+        return LocalStorage()
+    raise ValueError(f"Unknown ATTACHMENT_STORAGE_BACKEND: {settings.ATTACHMENT_STORAGE_BACKEND}")
+
+
+attachment_storage = get_attachment_storage()
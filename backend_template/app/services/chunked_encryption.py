@@ -0,0 +1,127 @@
+"""
+Chunked authenticated encryption for stored files (format "BCE1").
+
+A file is split into fixed-size plaintext chunks, each sealed with AES-256-GCM
+(STREAM construction): the nonce is a per-file random prefix + the chunk index
++ a "last chunk" flag, and the file header is bound in as associated data. So:
+  - encryption runs as bytes arrive, holding at most one chunk in memory;
+  - any chunk can be located and decrypted on its own, which is what makes
+    HTTP Range downloads possible without touching the rest of the file;
+  - reordered, swapped, modified or truncated chunks fail authentication.
+
+Layout:
+    header  = b"BCE1" | chunk_size (uint32 BE) | salt (16) | nonce prefix (7)
+    chunk i = AES-GCM(plaintext[i*chunk_size:(i+1)*chunk_size]) + 16-byte tag
+
+The salt is opaque here; callers derive the per-file key from it.
+"""
+import os
+import struct
+from typing import BinaryIO, Iterator, NamedTuple
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+
+MAGIC = b"BCE1"
+DEFAULT_CHUNK_SIZE = 64 * 1024
+SALT_SIZE = 16
+NONCE_PREFIX_SIZE = 7
+TAG_SIZE = 16
+HEADER_SIZE = len(MAGIC) + 4 + SALT_SIZE + NONCE_PREFIX_SIZE
+
+
+class DecryptionError(Exception):
+    """Ciphertext is not in BCE1 format or failed authentication"""
+
+
+class StreamHeader(NamedTuple):
+    raw: bytes
+    chunk_size: int
+    salt: bytes
+    nonce_prefix: bytes
+
+    @classmethod
+    def new(cls, salt: bytes, chunk_size: int = DEFAULT_CHUNK_SIZE) -> "StreamHeader":
+        prefix = os.urandom(NONCE_PREFIX_SIZE)
+        return cls(MAGIC + struct.pack(">I", chunk_size) + salt + prefix, chunk_size, salt, prefix)
+
+    @classmethod
+    def parse(cls, raw: bytes) -> "StreamHeader":
+        if len(raw) != HEADER_SIZE or not raw.startswith(MAGIC):
+            raise DecryptionError("Not a BCE1 encrypted file")
+        (chunk_size,) = struct.unpack(">I", raw[4:8])
+        return cls(raw, chunk_size, raw[8:8 + SALT_SIZE], raw[8 + SALT_SIZE:])
+
+    def nonce(self, index: int, last: bool) -> bytes:
+        return self.nonce_prefix + struct.pack(">I?", index, last)
+
+    def chunk_count(self, encrypted_size: int) -> int:
+        body = encrypted_size - HEADER_SIZE
+        return max(1, -(-body // (self.chunk_size + TAG_SIZE)))
+
+    def plaintext_size(self, encrypted_size: int) -> int:
+        return encrypted_size - HEADER_SIZE - self.chunk_count(encrypted_size) * TAG_SIZE
+
+
+class ChunkedEncryptor:
+    """Incremental encryptor: feed bytes with update(), then call finalize() once"""
+
+    def __init__(self, key: bytes, salt: bytes, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self.header = StreamHeader.new(salt, chunk_size)
+        self._aead = AESGCM(key)
+        self._pending = bytearray()
+        self._index = 0
+
+    def update(self, data: bytes) -> bytes:
+        self._pending += data
+        sealed = []
+        # A full chunk is only sealed once more data follows: the last chunk carries the final flag
+        while len(self._pending) > self.header.chunk_size:
+            sealed.append(self._seal(bytes(self._pending[:self.header.chunk_size]), last=False))
+            del self._pending[:self.header.chunk_size]
+        return b"".join(sealed)
+
+    def finalize(self) -> bytes:
+        sealed = self._seal(bytes(self._pending), last=True)
+        self._pending.clear()
+        return sealed
+
+    def _seal(self, chunk: bytes, last: bool) -> bytes:
+        sealed = self._aead.encrypt(self.header.nonce(self._index, last), chunk, self.header.raw)
+        self._index += 1
+        return sealed
+
+
+def read_header(fileobj: BinaryIO) -> StreamHeader:
+    fileobj.seek(0)
+    return StreamHeader.parse(fileobj.read(HEADER_SIZE))
+
+
+def iter_decrypted(
+    fileobj: BinaryIO,
+    header: StreamHeader,
+    key: bytes,
+    encrypted_size: int,
+    start: int = 0,
+    end: int = None,
+) -> Iterator[bytes]:
+    """
+    Plaintext bytes start..end (inclusive) of an encrypted file, one chunk at a
+    time. Only the chunks overlapping the range are read and authenticated.
+    """
+    aead = AESGCM(key)
+    chunk_size = header.chunk_size
+    last_index = header.chunk_count(encrypted_size) - 1
+    if end is None:
+        end = header.plaintext_size(encrypted_size) - 1
+
+    for index in range(start // chunk_size, end // chunk_size + 1):
+        fileobj.seek(HEADER_SIZE + index * (chunk_size + TAG_SIZE))
+        sealed = fileobj.read(chunk_size + TAG_SIZE)
+        try:
+            chunk = aead.decrypt(header.nonce(index, index == last_index), sealed, header.raw)
+        except InvalidTag:
+            raise DecryptionError(f"Chunk {index} failed authentication")
+        offset = index * chunk_size
+        yield chunk[max(start - offset, 0):end - offset + 1]
@@ -1,24 +1,51 @@
+"""
+Commission Service - Credits referral commissions for a payment.
+
+Crediting is set-based: one multi-row INSERT of ReferralEarning, one ledger
+posting for all uplines (app/services/referral_ledger.py, balances are added
+in the database) and one UPDATE ... SET lN_referrals = lN_referrals + x, so no
+upline row is read into Python and concurrent payments to the same affiliate
+never lose an update. The payment row is claimed with a conditional UPDATE
+first, so a payment is credited once even when its job runs twice.
+
+Commission rates are cached per worker process (they change rarely) and
+dropped as soon as this process commits a write to referral_commission_rates.
+"""
 from decimal import Decimal
-from typing import List, Dict, Any, Optional
+from types import MappingProxyType
+from typing import List, Dict, Mapping, Optional
 from datetime import datetime
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_
+from sqlalchemy import select, update, insert, case, func, and_
 from fastapi import HTTPException
 
+from app.core.cache import TTLCache, invalidate_on_commit
+from app.core.config import settings
 from app.models.payment import PaymentTransaction, ReferralCommissionRate, PaymentType
 from app.models.referrals import ReferralEarning
 from app.models.users import UserProfile
 from app.models.order import Order
+from app.services.referral_ledger import REFERRAL_BOOK, referral_ledger
+
+
+MAX_COMMISSION_LEVEL = 3
+
+DEFAULT_COMMISSION_RATES = {
+    PaymentType.SUBSCRIPTION: {1: Decimal('10.00'), 2: Decimal('5.00'), 3: Decimal('2.00')},
+    PaymentType.SERVER: {1: Decimal('8.00'), 2: Decimal('4.00'), 3: Decimal('2.00')},
+}
+
+commission_rate_cache = TTLCache(ttl_seconds=settings.COMMISSION_RATE_CACHE_TTL_SECONDS, maxsize=16)
 
 
 class CommissionService:
     """
     Handles referral commission distribution logic:
     - Fetches referral chain (L1, L2, L3)
-    - Gets commission rates from configuration
+    - Gets commission rates from configuration (cached)
     - Calculates and distributes commissions
-    - Updates user balances
-    - Creates ReferralEarning records
+    - Credits user balances (one ledger posting for all uplines)
+    - Creates ReferralEarning records (one multi-row INSERT)
     """
 
     async def distribute_commission(
@@ -58,23 +85,15 @@ class CommissionService:
         enable_commission = payment_transaction.payment_metadata and \
                           payment_transaction.payment_metadata.get('enable_commission', False)
         
+        # Claim the payment (idempotency): only one transaction flips commission_distributed
+        if not await self._claim_payment(db, payment_transaction):
+            return await self._existing_earnings(db, payment_transaction.order_id)
+
         if not enable_commission:
             # Mark as distributed but don't create earnings
-            payment_transaction.commission_distributed = True
-            payment_transaction.commission_distributed_at = datetime.utcnow()
             await db.commit()
             return []
 
-        # Check if already distributed (idempotency)
-        if payment_transaction.commission_distributed:
-            # Return existing earnings
-            result = await db.execute(
-                select(ReferralEarning).where(
-                    ReferralEarning.order_id == payment_transaction.order_id
-                )
-            )
-            return result.scalars().all()
-
         # Get the user who made the payment
         result = await db.execute(
             select(UserProfile).where(UserProfile.id == payment_transaction.user_id)
@@ -83,8 +102,6 @@ class CommissionService:
 
         if not user or not user.referred_by:
             # No referrer, mark as distributed anyway
-            payment_transaction.commission_distributed = True
-            payment_transaction.commission_distributed_at = datetime.utcnow()
             await db.commit()
             return []
 
@@ -100,32 +117,49 @@ class CommissionService:
             payment_transaction.payment_type
         )
 
-        # Distribute to each level
-        earnings = []
-        for level, referrer_id in referral_chain.items():
-            if referrer_id and level <= 3:  # Max 3 levels
-                rate = commission_rates.get(level, Decimal('0.00'))
-                if rate > 0:
-                    earning = await self._create_earning(
-                        db=db,
-                        referrer_id=referrer_id,
-                        referred_user_id=user.id,
-                        order_id=payment_transaction.order_id,
-                        level=level,
-                        commission_rate=rate,
-                        order_amount=eligible_amount,
-                        payment_transaction=payment_transaction
-                    )
-                    earnings.append(earning)
-
-        # Mark commission as distributed
-        payment_transaction.commission_distributed = True
-        payment_transaction.commission_distributed_at = datetime.utcnow()
-        
+        rows = self._earning_rows(
+            referral_chain=referral_chain,
+            commission_rates=commission_rates,
+            referred_user_id=user.id,
+            order_id=payment_transaction.order_id,
+            order_amount=eligible_amount
+        )
+
+        earnings = await self._create_earnings(db, rows)
+        await referral_ledger.credit_earnings(
+            db, REFERRAL_BOOK, f"earning:payment:{payment_transaction.id}",
+            [(row['user_id'], row['commission_amount']) for row in rows],
+            reference_type='payment', reference_id=payment_transaction.id
+        )
+        await self._count_referrals(db, rows)
+
         await db.commit()
 
         return earnings
 
+    async def _claim_payment(self, db: AsyncSession, payment_transaction: PaymentTransaction) -> bool:
+        """
+        Set commission_distributed with a compare-and-set. A concurrent run of the
+        same payment waits on the row lock, then matches no row and backs off.
+        """
+        result = await db.execute(
+            update(PaymentTransaction)
+            .where(
+                PaymentTransaction.id == payment_transaction.id,
+                PaymentTransaction.commission_distributed == False
+            )
+            .values(commission_distributed=True, commission_distributed_at=datetime.utcnow())
+        )
+        return result.rowcount == 1
+
+    async def _existing_earnings(self, db: AsyncSession, order_id: Optional[int]) -> List[ReferralEarning]:
+        result = await db.execute(
+            select(ReferralEarning).where(
+                ReferralEarning.order_id == order_id
+            )
+        )
+        return list(result.scalars().all())
+
     async def _get_referral_chain(
         self,
         db: AsyncSession,
@@ -147,101 +181,104 @@ class CommissionService:
         self,
         db: AsyncSession,
         payment_type: PaymentType
-    ) -> Dict[int, Decimal]:
+    ) -> Mapping[int, Decimal]:
         """
-        Get active commission rates for a payment type
+        Get active commission rates for a payment type (cached per process)
         
         Returns:
-            Dict mapping level to commission percentage
+            Read-only mapping of level to commission percentage
         """
+        return await commission_rate_cache.get_or_load(
+            payment_type,
+            lambda: self._load_commission_rates(db, payment_type),
+            tags=[ReferralCommissionRate.__tablename__]
+        )
+
+    async def _load_commission_rates(
+        self,
+        db: AsyncSession,
+        payment_type: PaymentType
+    ) -> Mapping[int, Decimal]:
         result = await db.execute(
-            select(ReferralCommissionRate).where(
+            select(ReferralCommissionRate.level, ReferralCommissionRate.commission_percent).where(
                 and_(
                     ReferralCommissionRate.payment_type == payment_type,
                     ReferralCommissionRate.is_active == True
                 )
             ).order_by(ReferralCommissionRate.level)
         )
-        rates = result.scalars().all()
-
-        # Convert to dictionary
-        rate_dict = {}
-        for rate in rates:
-            rate_dict[rate.level] = rate.commission_percent
+        rate_dict = {level: percent for level, percent in result.all()}
 
         # Default rates if not configured
         if not rate_dict:
-            if payment_type == PaymentType.SUBSCRIPTION:
-                rate_dict = {1: Decimal('10.00'), 2: Decimal('5.00'), 3: Decimal('2.00')}
-            else:  # SERVER
-                rate_dict = {1: Decimal('8.00'), 2: Decimal('4.00'), 3: Decimal('2.00')}
+            rate_dict = dict(DEFAULT_COMMISSION_RATES.get(payment_type, DEFAULT_COMMISSION_RATES[PaymentType.SERVER]))
 
-        return rate_dict
+        return MappingProxyType(rate_dict)
 
-    async def _create_earning(
+    def _earning_rows(
         self,
-        db: AsyncSession,
-        referrer_id: int,
+        referral_chain: Dict[int, Optional[int]],
+        commission_rates: Mapping[int, Decimal],
         referred_user_id: int,
         order_id: Optional[int],
-        level: int,
-        commission_rate: Decimal,
-        order_amount: Decimal,
-        payment_transaction: PaymentTransaction
-    ) -> ReferralEarning:
+        order_amount: Decimal
+    ) -> List[dict]:
+        """ReferralEarning values for every level that earns something"""
+        earned_at = datetime.utcnow()
+        rows = []
+        for level, referrer_id in referral_chain.items():
+            if referrer_id and level <= MAX_COMMISSION_LEVEL:
+                rate = commission_rates.get(level, Decimal('0.00'))
+                if rate > 0:
+                    rows.append({
+                        'user_id': referrer_id,
+                        'referred_user_id': referred_user_id,
+                        'order_id': order_id,
+                        'level': level,
+                        'commission_rate': rate,
+                        'order_amount': order_amount,
+                        'commission_amount': (order_amount * rate / Decimal('100')).quantize(Decimal('0.01')),
+                        'status': 'approved',  # Automatically approve
+                        'earned_at': earned_at,
+                    })
+        return rows
+
+    async def _create_earnings(self, db: AsyncSession, rows: List[dict]) -> List[ReferralEarning]:
+        """Insert every level's earning in one statement"""
+        if not rows:
+            return []
+        result = await db.scalars(insert(ReferralEarning).returning(ReferralEarning), rows)
+        return list(result.all())
+
+    async def _count_referrals(self, db: AsyncSession, rows: List[dict]) -> None:
         """
-        Create a referral earning record and update user balance
-        
-        Args:
-            db: Database session
-            referrer_id: User receiving the commission
-            referred_user_id: User who made the purchase
-            order_id: Associated order ID
-            level: Referral level (1, 2, or 3)
-            commission_rate: Commission percentage
-            order_amount: Order amount for commission calculation
-            payment_transaction: Payment transaction
-        
-        Returns:
-            Created ReferralEarning
+        Bump each referrer's lN_referrals counter, for all referrers in one
+        UPDATE. The increments are computed by the database on the current row values.
         """
-        # Calculate commission amount
-        commission_amount = (order_amount * commission_rate / Decimal('100')).quantize(Decimal('0.01'))
-
-        # Create earning record
-        earning = ReferralEarning(
-            user_id=referrer_id,
-            referred_user_id=referred_user_id,
-            order_id=order_id,
-            level=level,
-            commission_rate=commission_rate,
-            order_amount=order_amount,
-            commission_amount=commission_amount,
-            status='approved',  # Automatically approve
-            earned_at=datetime.utcnow()
-        )
-
-        db.add(earning)
-
-        # Update referrer's balance
-        result = await db.execute(
-            select(UserProfile).where(UserProfile.id == referrer_id)
+        if not rows:
+            return
+
+        level_counts: Dict[int, Dict[int, int]] = {level: {} for level in range(1, MAX_COMMISSION_LEVEL + 1)}
+        for row in rows:
+            counts = level_counts[row['level']]
+            counts[row['user_id']] = counts.get(row['user_id'], 0) + 1
+
+        def increment(column, by_referrer):
+            if not by_referrer:
+                return column
+            return func.coalesce(column, 0) + case(by_referrer, value=UserProfile.id, else_=0)
+
+        referrer_ids = sorted({row['user_id'] for row in rows})
+        await db.execute(
+            update(UserProfile)
+            .where(UserProfile.id.in_(referrer_ids))
+            .values(
+                l1_referrals=increment(UserProfile.l1_referrals, level_counts[1]),
+                l2_referrals=increment(UserProfile.l2_referrals, level_counts[2]),
+                l3_referrals=increment(UserProfile.l3_referrals, level_counts[3]),
+            )
+            .execution_options(synchronize_session=False, user_ids=referrer_ids)
         )
-        referrer = result.scalars().first()
-
-        if referrer:
-            referrer.total_earnings = (referrer.total_earnings or Decimal('0.00')) + commission_amount
-            referrer.available_balance = (referrer.available_balance or Decimal('0.00')) + commission_amount
-            
-            # Update referral statistics
-            if level == 1:
-                referrer.l1_referrals = (referrer.l1_referrals or 0) + 1
-            elif level == 2:
-                referrer.l2_referrals = (referrer.l2_referrals or 0) + 1
-            elif level == 3:
-                referrer.l3_referrals = (referrer.l3_referrals or 0) + 1
-
-        return earning
 
     async def seed_default_commission_rates(self, db: AsyncSession):
         """
@@ -305,3 +342,8 @@ class CommissionService:
             db.add(rate)
 
         await db.commit()
+
+
+# ==================== Rate cache invalidation ====================
+
+invalidate_on_commit({ReferralCommissionRate.__tablename__}, commission_rate_cache.invalidate)
@@ -0,0 +1,67 @@
+"""
+Dashboard Service - Runs independent dashboard sections concurrently.
+
+Each section gets its own session from AsyncSessionLocal (an AsyncSession
+cannot be shared between concurrent tasks) and its own timeout, so one slow
+or failing section yields a partial dashboard instead of a 500.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+
+
+SectionLoader = Callable[[AsyncSession], Awaitable[Any]]
+
+
+class DashboardAssembler:
+    """Fan out section loaders, each on a pooled session, and collect what finishes in time"""
+
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        timeout_seconds: float = settings.DASHBOARD_SECTION_TIMEOUT_SECONDS
+    ):
+        self.session_factory = session_factory
+        self.timeout_seconds = timeout_seconds
+
+    async def assemble(self, sections: Dict[str, SectionLoader]) -> Tuple[Dict[str, Any], List[str]]:
+        """
+        Run every loader concurrently.
+
+        Returns:
+            (results, failed_sections) - failed or timed-out sections map to None
+        """
+        names = list(sections)
+        outcomes = await asyncio.gather(
+            *(self._run_section(name, sections[name]) for name in names)
+        )
+
+        results: Dict[str, Any] = {}
+        failed: List[str] = []
+        for name, (ok, value) in zip(names, outcomes):
+            results[name] = value
+            if not ok:
+                failed.append(name)
+        return results, failed
+
+    async def _run_section(self, name: str, loader: SectionLoader) -> Tuple[bool, Any]:
+        try:
+            async with self.session_factory() as db:
+                value = await asyncio.wait_for(loader(db), timeout=self.timeout_seconds)
+            return True, _plain(value)
+        except asyncio.TimeoutError:
+            print(f"⚠️ Dashboard section '{name}' timed out after {self.timeout_seconds}s")
+        except Exception as e:
+            print(f"⚠️ Dashboard section '{name}' failed: {e}")
+        return False, None
+
+
+def _plain(value: Any) -> Any:
+    """Pydantic models -> dicts so sections drop straight into Dict[str, Any] fields"""
+    if hasattr(value, "model_dump"):
+        return value.model_dump()
+    return value
@@ -1,15 +1,11 @@
-import os
+import re
+import asyncio
 import hashlib
 import secrets
 import mimetypes
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Iterator, NamedTuple, Optional, Tuple
 from datetime import datetime
-from cryptography.fernet import Fernet
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-from cryptography.hazmat.backends import default_backend
-import base64
 
 from fastapi import UploadFile, HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -24,46 +20,77 @@ from app.models.ticket_attachment import (
 )
 from app.models.support import SupportTicket
 from app.models.users import UserProfile
-from app.core.config import settings
+from app.services.attachment_blob_store import AttachmentBlobStore
+from app.services.attachment_keys import attachment_keyring
+from app.services.attachment_storage import AttachmentStorage, attachment_storage
+from app.services.chunked_encryption import (
+    ChunkedEncryptor, DecryptionError, HEADER_SIZE, SALT_SIZE, StreamHeader, iter_decrypted,
+)
+from app.services.malware_scanner import MalwareScanner, ScanResult, malware_scanner
+
+
+UPLOAD_READ_SIZE = 256 * 1024
+SCAN_HEAD_SIZE = 1024
+
+
+class AttachmentDownload(NamedTuple):
+    filename: str
+    mime_type: str
+    size: int                 # plaintext size of the whole file
+    start: int                # first byte served (inclusive)
+    end: int                  # last byte served (inclusive)
+    chunks: Iterator[bytes]   # decrypted lazily while the response streams
+
+    @property
+    def partial(self) -> bool:
+        return self.start > 0 or self.end < self.size - 1
+
+
+class EncryptedObject(NamedTuple):
+    storage_key: str
+    encrypted_size: int
+    header: StreamHeader
+    key: bytes                # unwrapped data key
+
+    @property
+    def plaintext_size(self) -> int:
+        return self.header.plaintext_size(self.encrypted_size)
+
+
+def parse_byte_range(range_header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    (start, end) for a single `Range: bytes=...` header, or None to serve the
+    whole file (no header, or a multi-range request). Unsatisfiable ranges raise 416.
+    """
+    if not range_header:
+        return None
+    match = re.fullmatch(r"\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*", range_header)
+    if not match:
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    elif last:
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        return None
+    if start >= size or start > end:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"}
+        )
+    return start, end
 
 
 class SecureFileService:
     """Service for handling secure file uploads with encryption"""
     
-    def __init__(self):
-        self.upload_dir = Path("app/static/uploads/tickets")
-        self.upload_dir.mkdir(parents=True, exist_ok=True)
-        
-        # Encryption key derivation
-        self.master_key = settings.SECRET_KEY.encode()
-    
-    def _generate_encryption_key(self, file_id: str) -> Tuple[bytes, str]:
-        """Generate a unique encryption key for each file"""
-        salt = secrets.token_bytes(32)
-        kdf = PBKDF2HMAC(
-            algorithm=hashes.SHA256(),
-            length=32,
-            salt=salt,
-            iterations=100000,
-            backend=default_backend()
-        )
-        key = base64.urlsafe_b64encode(kdf.derive(self.master_key + file_id.encode()))
-        key_id = hashlib.sha256(salt).hexdigest()
-        return key, key_id
-    
-    def _encrypt_file(self, file_data: bytes, encryption_key: bytes) -> bytes:
-        """Encrypt file data using Fernet symmetric encryption"""
-        fernet = Fernet(encryption_key)
-        return fernet.encrypt(file_data)
-    
-    def _decrypt_file(self, encrypted_data: bytes, encryption_key: bytes) -> bytes:
-        """Decrypt file data"""
-        fernet = Fernet(encryption_key)
-        return fernet.decrypt(encrypted_data)
-    
-    def _calculate_file_hash(self, file_data: bytes) -> str:
-        """Calculate SHA-256 hash of file for integrity verification"""
-        return hashlib.sha256(file_data).hexdigest()
+    def __init__(self, storage: Optional[AttachmentStorage] = None, scanner: Optional[MalwareScanner] = None):
+        self.storage = storage or attachment_storage
+        self.scanner = scanner or malware_scanner
+        self.blob_store = AttachmentBlobStore(self.storage)
     
     def _validate_file_extension(self, filename: str) -> Tuple[bool, str]:
         """Validate file extension against whitelist"""
@@ -81,29 +108,19 @@ class SecureFileService:
         """Validate MIME type against whitelist"""
         return mime_type in ALLOWED_MIME_TYPES
     
-    def _scan_file_content(self, file_data: bytes) -> Tuple[str, str]:
+    def _scan_file_content(self, scan: ScanResult, head: bytes, file_size: int) -> Tuple[str, str]:
         """
-        Basic security scan for malicious content
-        In production, integrate with ClamAV or VirusTotal API
+        Combine the streaming malware scan of the whole file (signatures, and
+        ClamAV when configured - see malware_scanner.py) with upload-level checks
         """
-        # Check for executable signatures
-        dangerous_signatures = [
-            b'MZ',  # PE executable
-            b'\x7fELF',  # ELF executable
-            b'#!',  # Script shebang
-            b'<?php',  # PHP script
-            b'<script',  # JavaScript in files
-        ]
-        
-        for signature in dangerous_signatures:
-            if signature in file_data[:1024]:  # Check first 1KB
-                return 'infected', f'Dangerous signature detected: {signature}'
+        if scan.status != 'clean':
+            return scan.status, scan.detail
         
         # Check file size for zip bombs (compressed ratio)
-        if len(file_data) < 100 and file_data.startswith(b'PK'):  # ZIP signature
+        if file_size < 100 and head.startswith(b'PK'):  # ZIP signature
             return 'infected', 'Potential zip bomb detected'
         
-        return 'clean', 'File passed basic security checks'
+        return 'clean', scan.detail
     
     async def validate_ticket_attachment_limit(
         self, 
@@ -164,23 +181,7 @@ class SecureFileService:
                 detail=f"File type .{extension} not allowed"
             )
         
-        # 4. Read and validate file
-        file_data = await file.read()
-        file_size = len(file_data)
-        
-        if file_size == 0:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Empty file not allowed"
-            )
-        
-        if file_size > MAX_FILE_SIZE:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"File size exceeds maximum {MAX_FILE_SIZE / (1024*1024)}MB"
-            )
-        
-        # 5. Validate MIME type
+        # 4. Validate MIME type
         mime_type = file.content_type or mimetypes.guess_type(file.filename)[0] or 'application/octet-stream'
         
         if not self._validate_mime_type(mime_type):
@@ -189,8 +190,34 @@ class SecureFileService:
                 detail=f"MIME type {mime_type} not allowed"
             )
         
-        # 6. Security scan
-        scan_status, scan_result = self._scan_file_content(file_data)
+        # 5. Hash and scan the upload as it streams in, both on the worker pool
+        #    (memory stays at one read block)
+        digest = hashlib.sha256()
+        file_size = 0
+        head = b""
+        scan = await self.scanner.open()
+        try:
+            while chunk := await file.read(UPLOAD_READ_SIZE):
+                file_size += len(chunk)
+                if file_size > MAX_FILE_SIZE:
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail=f"File size exceeds maximum {MAX_FILE_SIZE / (1024*1024)}MB"
+                    )
+                if len(head) < SCAN_HEAD_SIZE:
+                    head += chunk[:SCAN_HEAD_SIZE - len(head)]
+                await asyncio.gather(attachment_keyring.run(digest.update, chunk), scan.feed(chunk))
+            
+            if file_size == 0:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Empty file not allowed"
+                )
+            
+            # 6. Security scan verdict
+            scan_status, scan_result = self._scan_file_content(await scan.finish(), head, file_size)
+        finally:
+            await scan.close()
         
         if scan_status == 'infected':
             raise HTTPException(
@@ -198,24 +225,26 @@ class SecureFileService:
                 detail=f"File rejected: {scan_result}"
             )
         
-        # 7. Calculate file hash
-        file_hash = self._calculate_file_hash(file_data)
-        
-        # 8. Generate unique file ID and encryption key
-        file_id = secrets.token_urlsafe(16)
-        encryption_key, key_id = self._generate_encryption_key(file_id)
-        
-        # 9. Encrypt file
-        encrypted_data = self._encrypt_file(file_data, encryption_key)
-        
-        # 10. Save encrypted file
-        encrypted_filename = f"{file_id}.enc"
-        file_path = self.upload_dir / encrypted_filename
-        
-        with open(file_path, 'wb') as f:
-            f.write(encrypted_data)
-        
-        # 11. Create database record
+        file_hash = digest.hexdigest()
+        
+        # 7. Reuse the stored blob for identical content; otherwise encrypt a new one
+        #    under a random name and data key (the object only appears once complete)
+        blob = await self.blob_store.acquire(db, file_hash)
+        if blob is None:
+            storage_key = f"{secrets.token_urlsafe(16)}.enc"
+            data_key, key_id = await attachment_keyring.new_data_key()
+            encryptor = ChunkedEncryptor(data_key, secrets.token_bytes(SALT_SIZE))
+            
+            await file.seek(0)
+            async with self.storage.writer(storage_key) as out:
+                await out.write(encryptor.header.raw)
+                while chunk := await file.read(UPLOAD_READ_SIZE):
+                    await out.write(await attachment_keyring.run(encryptor.update, chunk))
+                await out.write(encryptor.finalize())
+            
+            blob = await self.blob_store.add(db, file_hash, file_size, storage_key, key_id)
+        
+        # 8. Create database record
         attachment = TicketAttachment(
             ticket_id=ticket_id,
             message_id=message_id,
@@ -224,8 +253,9 @@ class SecureFileService:
             file_extension=extension,
             mime_type=mime_type,
             file_size=file_size,
-            storage_path=str(file_path),
-            encryption_key_id=key_id,
+            storage_path=blob.storage_path,
+            encryption_key_id=blob.encryption_key_id,
+            blob_id=blob.id,
             file_hash=file_hash,
             is_safe=(scan_status == 'clean'),
             scan_status=scan_status,
@@ -238,16 +268,16 @@ class SecureFileService:
         
         return attachment
     
-    async def download_file(
+    async def get_attachment_for_user(
         self,
         db: AsyncSession,
         attachment_id: int,
         user: UserProfile
-    ) -> Tuple[bytes, str, str]:
+    ) -> TicketAttachment:
         """
-        Decrypt and download file securely
-        Admins and support staff can download any attachment
-        Users can only download attachments from their own tickets
+        Live attachment the user may read
+        Admins and support staff can read any attachment
+        Users can only read attachments from their own tickets
         """
         # Get attachment
         stmt = select(TicketAttachment).where(
@@ -284,43 +314,63 @@ class SecureFileService:
                 detail="Access denied"
             )
         
-        # Read encrypted file
-        if not os.path.exists(attachment.storage_path):
+        return attachment
+    
+    async def open_encrypted(self, storage_key: str, key_ref: str) -> EncryptedObject:
+        """Header, size and data key of a stored encrypted object"""
+        encrypted_size = await self.storage.size(storage_key)
+        if encrypted_size is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="File not found on server"
             )
         
-        with open(attachment.storage_path, 'rb') as f:
-            encrypted_data = f.read()
-        
-        # Recreate encryption key
-        file_id = Path(attachment.storage_path).stem.replace('.enc', '')
-        encryption_key, _ = self._generate_encryption_key(file_id)
-        
-        # Decrypt file
         try:
-            decrypted_data = self._decrypt_file(encrypted_data, encryption_key)
-        except Exception as e:
+            header = StreamHeader.parse(await self.storage.read(storage_key, 0, HEADER_SIZE))
+            file_id = Path(storage_key).stem
+            key = await attachment_keyring.data_key(key_ref, file_id, header.salt)
+        except (DecryptionError, ValueError):
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Failed to decrypt file"
             )
         
-        # Verify integrity
-        current_hash = self._calculate_file_hash(decrypted_data)
-        if current_hash != attachment.file_hash:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="File integrity check failed"
-            )
-        
-        # Update download stats
-        attachment.downloaded_count += 1
-        attachment.last_downloaded_at = datetime.utcnow()
-        await db.commit()
-        
-        return decrypted_data, attachment.original_filename, attachment.mime_type
+        return EncryptedObject(storage_key, encrypted_size, header, key)
+    
+    def decrypted_chunks(self, obj: EncryptedObject, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        """
+        Plaintext bytes start..end of an object, decrypted lazily. Blocking: iterate
+        on a worker thread (StreamingResponse uses Starlette's threadpool).
+        """
+        with self.storage.open(obj.storage_key, obj.encrypted_size) as f:
+            yield from iter_decrypted(f, obj.header, obj.key, obj.encrypted_size, start, end)
+    
+    async def download_file(
+        self,
+        db: AsyncSession,
+        attachment_id: int,
+        user: UserProfile,
+        range_header: Optional[str] = None
+    ) -> AttachmentDownload:
+        """
+        Decrypt and stream a file (optionally one byte range of it) securely
+        Chunks are decrypted and authenticated while the response streams.
+        """
+        attachment = await self.get_attachment_for_user(db, attachment_id, user)
+        obj = await self.open_encrypted(attachment.storage_path, attachment.encryption_key_id)
+        size = obj.plaintext_size
+        start, end = parse_byte_range(range_header, size) or (0, size - 1)
+        
+        # Update download stats (a resumed or seeking download is not a new download)
+        if start == 0:
+            attachment.downloaded_count += 1
+            attachment.last_downloaded_at = datetime.utcnow()
+            await db.commit()
+        
+        return AttachmentDownload(
+            attachment.original_filename, attachment.mime_type, size, start, end,
+            self.decrypted_chunks(obj, start, end)
+        )
     
     async def delete_file(
         self,
@@ -353,7 +403,9 @@ class SecureFileService:
                 detail="Access denied"
             )
         
-        # Soft delete
+        # Soft delete (the shared blob is reclaimed once no attachment references it)
+        if not attachment.is_deleted and attachment.blob_id is not None:
+            await self.blob_store.release(db, attachment.blob_id)
         attachment.is_deleted = True
         attachment.deleted_at = datetime.utcnow()
         await db.commit()
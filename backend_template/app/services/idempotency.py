@@ -0,0 +1,277 @@
+"""
+Idempotency - Replay retried POSTs instead of running them again.
+
+Checkout clients send an Idempotency-Key header on POST /orders and
+POST /payments/create-order. The first request with a key claims it in
+idempotency_keys (INSERT ... ON CONFLICT DO NOTHING, committed on its own
+session so every process sees it at once), runs, and stores its serialized
+response. A retry with the same key:
+  - replays the stored response (Idempotent-Replayed: true) once the original
+    has completed;
+  - waits for the original while it is still in flight - woken at once in this
+    process, polled from other processes - and gets 409 after
+    IDEMPOTENCY_WAIT_SECONDS;
+  - gets 422 if the method, path or body differ from the original's.
+
+A request refused with an HTTPException before it committed anything
+releases its key, so the retry runs again. The handler's own transaction
+marks the key 'committed' just before it commits: from then on the order
+exists, so the key is never released or taken over - a retry waits for the
+stored response and gets 409 if it never comes (the request was cancelled
+by a client disconnect, failed after its commit, or could not store its
+response). Only an in-progress key whose worker died before committing is
+taken over, once it is older than IDEMPOTENCY_LOCK_TIMEOUT_SECONDS; keys
+older than IDEMPOTENCY_KEY_TTL_HOURS are taken over whatever their state.
+Requests without the header run as before.
+"""
+import asyncio
+import hashlib
+import json
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from fastapi import HTTPException, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, TypeAdapter
+from sqlalchemy import event, select, update, delete, or_, and_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.idempotency_key import IdempotencyKey
+
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+
+
+def request_fingerprint(request: Request, payload: Any) -> str:
+    """sha256 of method, path and the validated request body"""
+    body = payload.model_dump(mode="json") if isinstance(payload, BaseModel) else jsonable_encoder(payload)
+    canonical = json.dumps(
+        {"method": request.method, "path": request.url.path, "body": body},
+        sort_keys=True,
+        separators=(",", ":")
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class IdempotencyStore:
+    """Claims keys, stores responses and replays them"""
+
+    def __init__(self, session_factory=AsyncSessionLocal):
+        self.session_factory = session_factory
+        # Keys being run by this process: duplicates here wait on the event instead of polling
+        self._in_flight: Dict[Tuple[int, str], asyncio.Event] = {}
+
+    async def run(
+        self,
+        request: Request,
+        key: Optional[str],
+        user_id: int,
+        payload: Any,
+        handler: Callable[[], Awaitable[Any]],
+        response_model: Any = None,
+        db: Optional[AsyncSession] = None
+    ) -> Any:
+        """
+        Run handler() once per (user, key) and return its response; duplicates
+        get the stored response. Without a key handler() just runs.
+        db is the session handler() writes with; its commits mark the key
+        'committed' (see _CommitMarker). Without it, an HTTPException from
+        handler() always releases the key.
+        """
+        if key is None:
+            return await handler()
+        if not key or len(key) > MAX_KEY_LENGTH:
+            raise HTTPException(status_code=400, detail=f"{IDEMPOTENCY_HEADER} must be 1-{MAX_KEY_LENGTH} characters")
+
+        fingerprint = request_fingerprint(request, payload)
+        deadline = asyncio.get_running_loop().time() + settings.IDEMPOTENCY_WAIT_SECONDS
+        while True:
+            record = await self._claim(user_id, key, fingerprint)
+            if record is None:
+                break  # ours: run it
+            if record.request_fingerprint != fingerprint:
+                raise HTTPException(
+                    status_code=422,
+                    detail=f"{IDEMPOTENCY_HEADER} was already used for a different request"
+                )
+            if record.status == 'completed':
+                return self._replay(record)
+
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                if record.status == 'committed':
+                    raise HTTPException(
+                        status_code=409,
+                        detail="A request with this Idempotency-Key was already processed; its response is not available"
+                    )
+                raise HTTPException(
+                    status_code=409,
+                    detail="A request with this Idempotency-Key is still in progress",
+                    headers={"Retry-After": "1"}
+                )
+            await self._wait(user_id, key, min(remaining, settings.IDEMPOTENCY_POLL_SECONDS))
+
+        done = self._in_flight.setdefault((user_id, key), asyncio.Event())
+        marker = _CommitMarker(db, user_id, key, fingerprint)
+        try:
+            try:
+                result = await handler()
+            except HTTPException:
+                await self._release(user_id, key, fingerprint)  # a no-op once the handler committed
+                raise
+            body = self._serialize(result, response_model)
+            await self._complete(user_id, key, fingerprint, 200, body)
+            return JSONResponse(content=body, status_code=200)
+        finally:
+            marker.close()
+            done.set()
+            self._in_flight.pop((user_id, key), None)
+
+    # ==================== Key states ====================
+
+    async def _claim(self, user_id: int, key: str, fingerprint: str) -> Optional[IdempotencyKey]:
+        """
+        Claim the key for this request. Returns None when claimed (run the
+        request), otherwise the existing record.
+        """
+        now = datetime.utcnow()
+        async with self.session_factory() as db:
+            dialect = postgresql if db.bind.dialect.name == 'postgresql' else sqlite
+            inserted = await db.execute(
+                dialect.insert(IdempotencyKey)
+                .values(user_id=user_id, key=key, request_fingerprint=fingerprint, status='in_progress', locked_at=now)
+                .on_conflict_do_nothing(index_elements=['user_id', 'key'])
+                .returning(IdempotencyKey.id)
+            )
+            if inserted.scalar_one_or_none() is not None:
+                await db.commit()
+                return None
+
+            # An expired key, or an in-flight one whose worker died, goes to this request.
+            # The conditions are re-checked by the UPDATE, so only one of several retries takes it over.
+            expired = now - timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS)
+            stale = now - timedelta(seconds=settings.IDEMPOTENCY_LOCK_TIMEOUT_SECONDS)
+            taken = await db.execute(
+                update(IdempotencyKey)
+                .where(
+                    IdempotencyKey.user_id == user_id,
+                    IdempotencyKey.key == key,
+                    or_(
+                        IdempotencyKey.locked_at < expired,
+                        and_(IdempotencyKey.status == 'in_progress', IdempotencyKey.locked_at < stale),
+                    )
+                )
+                .values(
+                    request_fingerprint=fingerprint, status='in_progress', locked_at=now,
+                    response_status=None, response_body=None, completed_at=None
+                )
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+            if taken.rowcount == 1:
+                return None
+
+            record = await db.scalar(
+                select(IdempotencyKey).where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+            )
+            if record is None:
+                return await self._claim(user_id, key, fingerprint)  # released in the meantime: try again
+            return record
+
+    async def _complete(self, user_id: int, key: str, fingerprint: str, status_code: int, body: Any) -> None:
+        async with self.session_factory() as db:
+            await db.execute(
+                update(IdempotencyKey)
+                .where(
+                    IdempotencyKey.user_id == user_id,
+                    IdempotencyKey.key == key,
+                    IdempotencyKey.request_fingerprint == fingerprint
+                )
+                .values(status='completed', response_status=status_code, response_body=body, completed_at=datetime.utcnow())
+            )
+            await db.commit()
+
+    async def _release(self, user_id: int, key: str, fingerprint: str) -> None:
+        """The request was refused before committing: forget the key so a retry runs again (in_progress only)"""
+        async with self.session_factory() as db:
+            await db.execute(
+                delete(IdempotencyKey).where(
+                    IdempotencyKey.user_id == user_id,
+                    IdempotencyKey.key == key,
+                    IdempotencyKey.request_fingerprint == fingerprint,
+                    IdempotencyKey.status == 'in_progress'
+                )
+            )
+            await db.commit()
+
+    async def _wait(self, user_id: int, key: str, timeout: float) -> None:
+        """Until the in-flight original finishes here, or one poll interval for another process"""
+        event = self._in_flight.get((user_id, key))
+        if event is None:
+            await asyncio.sleep(timeout)
+            return
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    # ==================== Responses ====================
+
+    def _serialize(self, result: Any, response_model: Any) -> Any:
+        """JSON body exactly as FastAPI would send it for the route's response_model"""
+        if response_model is not None:
+            adapter = TypeAdapter(response_model)
+            return adapter.dump_python(adapter.validate_python(result, from_attributes=True), mode="json")
+        return jsonable_encoder(result)
+
+    def _replay(self, record: IdempotencyKey) -> JSONResponse:
+        return JSONResponse(
+            content=record.response_body,
+            status_code=record.response_status or 200,
+            headers={REPLAYED_HEADER: "true"}
+        )
+
+    async def purge_expired(self, db: AsyncSession) -> int:
+        """Delete keys older than IDEMPOTENCY_KEY_TTL_HOURS; caller commits"""
+        expired = datetime.utcnow() - timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS)
+        result = await db.execute(delete(IdempotencyKey).where(IdempotencyKey.locked_at < expired))
+        return result.rowcount
+
+
+class _CommitMarker:
+    """
+    Marks the key 'committed' in the handler's own transaction, just before
+    it commits, so the mark exists exactly when the handler's changes do
+    """
+
+    def __init__(self, db: Optional[AsyncSession], user_id: int, key: str, fingerprint: str):
+        self._session = db.sync_session if db is not None else None
+        self._mark = (
+            update(IdempotencyKey)
+            .where(
+                IdempotencyKey.user_id == user_id,
+                IdempotencyKey.key == key,
+                IdempotencyKey.request_fingerprint == fingerprint,
+                IdempotencyKey.status == 'in_progress'
+            )
+            .values(status='committed')
+            .execution_options(synchronize_session=False)
+        )
+        if self._session is not None:
+            event.listen(self._session, "before_commit", self._before_commit)
+
+    def _before_commit(self, session) -> None:
+        session.execute(self._mark)
+
+    def close(self) -> None:
+        if self._session is not None:
+            event.remove(self._session, "before_commit", self._before_commit)
+
+
+idempotency_store = IdempotencyStore()
@@ -247,6 +247,8 @@ from decimal import Decimal
 from app.models.invoice import Invoice
 from app.models.users import UserProfile
 from app.schemas.invoice import InvoiceStats
+from app.services.stats_service import StatsService
+from app.services.number_allocator import number_allocator
 
 
 class InvoiceService:
@@ -333,7 +335,7 @@ class InvoiceService:
     async def create_invoice(
         self, db: AsyncSession, user_id: int, invoice_data: Dict[str, Any]
     ) -> Invoice:
-        invoice_number = await self._generate_invoice_number(db)
+        invoice_number = await number_allocator.invoice_number()
 
         db_invoice = Invoice(
             user_id=user_id,
@@ -442,39 +444,8 @@ class InvoiceService:
         return result.scalar() or Decimal("0.0")
 
     async def get_invoice_stats(self, db: AsyncSession) -> InvoiceStats:
-        total_invoices = (await db.execute(select(func.count(Invoice.id)))).scalar()
-        paid_invoices = (await db.execute(
-            select(func.count(Invoice.id)).where(Invoice.payment_status == "paid")
-        )).scalar()
-        pending_invoices = (await db.execute(
-            select(func.count(Invoice.id)).where(Invoice.payment_status == "pending")
-        )).scalar()
-        overdue_invoices = (await db.execute(
-            select(func.count(Invoice.id)).where(Invoice.payment_status == "overdue")
-        )).scalar()
-
-        total_revenue = (
-            await db.execute(
-                select(func.sum(Invoice.total_amount)).where(Invoice.payment_status == "paid")
-            )
-        ).scalar() or Decimal("0.0")
-
-        pending_amount = (
-            await db.execute(
-                select(func.sum(Invoice.balance_due)).where(
-                    Invoice.payment_status.in_(["pending", "overdue"])
-                )
-            )
-        ).scalar() or Decimal("0.0")
-
-        return InvoiceStats(
-            total_invoices=total_invoices or 0,
-            paid_invoices=paid_invoices or 0,
-            pending_invoices=pending_invoices or 0,
-            overdue_invoices=overdue_invoices or 0,
-            total_revenue=total_revenue,
-            pending_amount=pending_amount,
-        )
+        counts = await StatsService().invoice_counts(db)
+        return InvoiceStats(**counts)
 
     async def get_user_recent_invoices(
         self, db: AsyncSession, user_id: int, limit: int = 5
@@ -512,31 +483,3 @@ class InvoiceService:
             )
         )
         return result.scalar() or 0
-
-
-
-
-    # ---------------------
-    # Internal Helpers
-    # ---------------------
-
-    async def _generate_invoice_number(self, db: AsyncSession) -> str:
-        """Generate a unique invoice number"""
-        year = datetime.now().year
-        base_number = f"INV-{year}-"
-
-        result = await db.execute(
-            select(Invoice.invoice_number)
-            .where(Invoice.invoice_number.like(f"{base_number}%"))
-            .order_by(Invoice.invoice_number.desc())
-            .limit(1)
-        )
-        last_invoice = result.scalar_one_or_none()
-
-        if last_invoice:
-            last_number = int(last_invoice.split("-")[-1])
-            new_number = last_number + 1
-        else:
-            new_number = 1
-
-        return f"{base_number}{new_number:04d}"
@@ -0,0 +1,246 @@
+"""
+Job Queue - Durable background jobs backed by the background_jobs table.
+
+Request handlers enqueue() work inside their own transaction, so a job exists
+if and only if the change that produced it was committed. JobWorker coroutines
+(started with the app) claim due jobs with SELECT ... FOR UPDATE SKIP LOCKED,
+run the registered handler on a fresh session, retry failures with exponential
+backoff and dead-letter a job once max_attempts is exhausted.
+
+Handlers may run more than once (a crash after the handler's own commit but
+before the job is marked done), so every handler must be idempotent.
+"""
+import asyncio
+import os
+import socket
+import traceback
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy import select, update, or_, and_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.background_job import BackgroundJob
+
+
+JobHandler = Callable[[AsyncSession, Dict[str, Any]], Awaitable[None]]
+
+JOB_HANDLERS: Dict[str, JobHandler] = {}
+
+
+def job_handler(job_type: str):
+    """Register an async handler(db, payload) for job_type"""
+    def register(handler: JobHandler) -> JobHandler:
+        JOB_HANDLERS[job_type] = handler
+        return handler
+    return register
+
+
+class JobQueue:
+    """Enqueue and administer background jobs"""
+
+    async def enqueue(
+        self,
+        db: AsyncSession,
+        job_type: str,
+        payload: Dict[str, Any],
+        idempotency_key: str,
+        max_attempts: Optional[int] = None,
+        delay_seconds: int = 0
+    ) -> bool:
+        """
+        Add a job to the caller's transaction (caller commits).
+        Returns False if idempotency_key was already enqueued (nothing is
+        written). INSERT ... ON CONFLICT DO NOTHING, so two transactions
+        enqueueing the same key at once never fail on the unique key.
+        """
+        dialect = postgresql if db.bind.dialect.name == 'postgresql' else sqlite
+        result = await db.execute(
+            dialect.insert(BackgroundJob)
+            .values(
+                job_type=job_type,
+                idempotency_key=idempotency_key,
+                payload=payload,
+                status='queued',
+                attempts=0,
+                max_attempts=max_attempts or settings.JOB_MAX_ATTEMPTS,
+                run_after=datetime.utcnow() + timedelta(seconds=delay_seconds)
+            )
+            .on_conflict_do_nothing(index_elements=['idempotency_key'])
+            .returning(BackgroundJob.id)
+        )
+        return result.scalar_one_or_none() is not None
+
+    async def get_dead_jobs(self, db: AsyncSession, limit: int = 100) -> List[BackgroundJob]:
+        result = await db.execute(
+            select(BackgroundJob)
+            .where(BackgroundJob.status == 'dead')
+            .order_by(BackgroundJob.id)
+            .limit(limit)
+        )
+        return list(result.scalars().all())
+
+    async def requeue(self, db: AsyncSession, job_id: int) -> bool:
+        """Give a dead job a fresh set of attempts"""
+        result = await db.execute(
+            update(BackgroundJob)
+            .where(BackgroundJob.id == job_id, BackgroundJob.status == 'dead')
+            .values(status='queued', attempts=0, run_after=datetime.utcnow(), locked_by=None, locked_at=None)
+        )
+        await db.commit()
+        return result.rowcount > 0
+
+
+class JobWorker:
+    """Pool of polling coroutines that execute due jobs"""
+
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        concurrency: int = settings.JOB_WORKER_CONCURRENCY,
+        poll_interval: float = settings.JOB_POLL_INTERVAL_SECONDS
+    ):
+        self.session_factory = session_factory
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._tasks: List[asyncio.Task] = []
+        self._stopping = asyncio.Event()
+        self._wakeup = asyncio.Event()
+
+    def start(self) -> None:
+        self._stopping.clear()
+        self._tasks = [
+            asyncio.create_task(self._run_loop(n), name=f"job-worker-{n}")
+            for n in range(self.concurrency)
+        ]
+        print(f"🧵 Job workers started: {self.concurrency} x {self.worker_id}")
+
+    async def stop(self) -> None:
+        self._stopping.set()
+        self._wakeup.set()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self) -> None:
+        """Skip the poll delay - new jobs were just committed"""
+        self._wakeup.set()
+
+    async def _run_loop(self, n: int) -> None:
+        while not self._stopping.is_set():
+            try:
+                job_id = await self.run_once()
+            except Exception as e:
+                print(f"❌ Job worker {n} poll failed: {e}")
+                job_id = None
+
+            if job_id is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+
+    async def run_once(self) -> Optional[int]:
+        """Claim and execute one due job. Returns its id, or None if nothing was due."""
+        job_id = await self._claim()
+        if job_id is not None:
+            await self._execute(job_id)
+        return job_id
+
+    async def _claim(self) -> Optional[int]:
+        now = datetime.utcnow()
+        lock_expired = now - timedelta(seconds=settings.JOB_LOCK_TIMEOUT_SECONDS)
+
+        async with self.session_factory() as db:
+            result = await db.execute(
+                select(BackgroundJob)
+                .where(or_(
+                    and_(BackgroundJob.status == 'queued', BackgroundJob.run_after <= now),
+                    # A worker died mid-job: take it over once the lock is stale
+                    and_(BackgroundJob.status == 'running', BackgroundJob.locked_at < lock_expired),
+                ))
+                .order_by(BackgroundJob.run_after, BackgroundJob.id)
+                .limit(1)
+                .with_for_update(skip_locked=True)
+            )
+            job = result.scalar_one_or_none()
+            if not job:
+                return None
+
+            # Compare-and-set on (status, attempts) so the claim is safe even where SKIP LOCKED is unsupported
+            claimed = await db.execute(
+                update(BackgroundJob)
+                .where(
+                    BackgroundJob.id == job.id,
+                    BackgroundJob.status == job.status,
+                    BackgroundJob.attempts == job.attempts
+                )
+                .values(status='running', attempts=job.attempts + 1, locked_by=self.worker_id, locked_at=now)
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+            return job.id if claimed.rowcount == 1 else None
+
+    async def _execute(self, job_id: int) -> None:
+        async with self.session_factory() as db:
+            job = await db.get(BackgroundJob, job_id)
+            handler = JOB_HANDLERS.get(job.job_type)
+            try:
+                if handler is None:
+                    raise LookupError(f"No handler registered for job type '{job.job_type}'")
+                await handler(db, dict(job.payload or {}))
+                await db.commit()
+                error = None
+            except Exception as e:
+                await db.rollback()
+                error = f"{type(e).__name__}: {e}\n{traceback.format_exc(limit=5)}"
+
+        async with self.session_factory() as db:
+            job = await db.get(BackgroundJob, job_id)
+            job.locked_by = None
+            job.locked_at = None
+
+            if error is None:
+                job.status = 'succeeded'
+                job.completed_at = datetime.utcnow()
+                job.last_error = None
+            elif job.attempts >= job.max_attempts:
+                job.status = 'dead'
+                job.last_error = error
+                print(f"☠️ Job {job.id} ({job.job_type}) dead after {job.attempts} attempts: {error.splitlines()[0]}")
+            else:
+                backoff = settings.JOB_RETRY_BASE_SECONDS * (2 ** (job.attempts - 1))
+                job.status = 'queued'
+                job.run_after = datetime.utcnow() + timedelta(seconds=backoff)
+                job.last_error = error
+                print(f"⚠️ Job {job.id} ({job.job_type}) attempt {job.attempts} failed, retrying in {backoff}s")
+
+            await db.commit()
+
+
+job_worker: Optional[JobWorker] = None
+
+
+async def start_job_workers() -> None:
+    global job_worker
+    if not settings.JOB_WORKERS_ENABLED or job_worker is not None:
+        return
+    job_worker = JobWorker()
+    job_worker.start()
+
+
+async def stop_job_workers() -> None:
+    global job_worker
+    if job_worker is not None:
+        await job_worker.stop()
+        job_worker = None
+
+
+def notify_job_workers() -> None:
+    """Wake this process's workers after committing new jobs (no-op if workers are off)"""
+    if job_worker is not None:
+        job_worker.notify()
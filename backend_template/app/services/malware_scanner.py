@@ -0,0 +1,292 @@
+"""
+Malware Scanner - Scans every upload in full, as it streams in.
+
+Engines share one small interface (open a session, feed() chunks, finish()),
+so SecureFileService can run them alongside hashing without ever holding the
+whole file:
+  - SignatureScanner: a configurable byte-signature set matched in one pass by
+    an Aho-Corasick automaton. Matches spanning chunk boundaries are found,
+    and the cost is linear in the file size whatever the number of signatures.
+  - ClamAVScanner: streams the same bytes to a local clamd (INSTREAM command)
+    when CLAMAV_HOST or CLAMAV_SOCKET is configured.
+
+Signature matching runs on the crypto thread pool (app/services/attachment_keys.py).
+"""
+import asyncio
+import json
+import re
+import struct
+from collections import deque
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+from app.core.config import settings
+from app.services.attachment_keys import attachment_keyring
+
+
+class Signature(NamedTuple):
+    name: str
+    pattern: bytes
+    max_offset: Optional[int] = None  # only matches starting in the first max_offset bytes count; None = anywhere
+
+
+HEAD_WINDOW = 1024
+
+DEFAULT_SIGNATURES = [
+    # Executables and scripts disguised as documents (file headers, so only near the start)
+    Signature("PE executable", b"MZ", HEAD_WINDOW),
+    Signature("ELF executable", b"\x7fELF", HEAD_WINDOW),
+    Signature("Script shebang", b"#!", HEAD_WINDOW),
+    # Active content anywhere in the file
+    Signature("PHP script", b"<?php"),
+    Signature("JavaScript", b"<script"),
+    Signature("EICAR test file", b"X5O!P%@AP[4\\PZX54(P^)7CC)7}$EICAR-STANDARD-ANTIVIRUS-TEST-FILE!"),
+]
+
+
+class ScanResult(NamedTuple):
+    status: str  # clean, infected, error (TicketAttachment.scan_status values)
+    detail: str
+
+
+class ScanSession:
+    async def feed(self, data: bytes) -> None:
+        raise NotImplementedError
+
+    async def finish(self) -> ScanResult:
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+
+class ScanEngine:
+    name = "engine"
+
+    async def open(self) -> ScanSession:
+        raise NotImplementedError
+
+
+# ==================== Signature matching ====================
+
+class SignatureAutomaton:
+    """Aho-Corasick automaton over a fixed signature set (built once, shared by all scans)"""
+
+    def __init__(self, signatures: Sequence[Signature]):
+        self.signatures = list(signatures)
+        self.goto: List[Dict[int, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.out: List[List[int]] = [[]]
+
+        for index, signature in enumerate(self.signatures):
+            if not signature.pattern:
+                raise ValueError(f"Signature {signature.name!r} has an empty pattern")
+            state = 0
+            for byte in signature.pattern:
+                if byte not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append([])
+                    self.goto[state][byte] = len(self.goto) - 1
+                state = self.goto[state][byte]
+            self.out[state].append(index)
+
+        # Breadth-first fail links; each state also reports the matches of its fail state
+        queue = deque(self.goto[0].values())  # depth-1 states fail to the root
+        while queue:
+            state = queue.popleft()
+            for byte, child in self.goto[state].items():
+                queue.append(child)
+                fallback = self.fail[state]
+                while fallback and byte not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(byte, 0)
+                self.out[child] = self.out[child] + self.out[self.fail[child]]
+
+        # From the root, jump (at C speed) to the next position where the first two
+        # bytes of some signature occur: ordinary data never enters the Python loop
+        prefixes = sorted({signature.pattern[:2] for signature in self.signatures}, key=len, reverse=True)
+        self.next_start = re.compile(b"|".join(re.escape(prefix) for prefix in prefixes)) if prefixes else None
+
+
+class SignatureSession(ScanSession):
+    def __init__(self, automaton: SignatureAutomaton):
+        self.automaton = automaton
+        self.state = 0
+        self.offset = 0
+        self.match: Optional[Signature] = None
+
+    def scan(self, data: bytes) -> None:
+        """Advance over one chunk (blocking; runs on the crypto pool)"""
+        automaton = self.automaton
+        if self.match is not None or automaton.next_start is None:
+            self.offset += len(data)
+            return
+        goto, fail, out = automaton.goto, automaton.fail, automaton.out
+        state, i, n = self.state, 0, len(data)
+        while i < n:
+            if state == 0:
+                found = automaton.next_start.search(data, i)
+                if found is not None:
+                    i = found.start()
+                elif data[n - 1] in goto[0]:
+                    i = n - 1  # a prefix may continue in the next chunk
+                else:
+                    break
+            byte = data[i]
+            while state and byte not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(byte, 0)
+            for index in out[state]:
+                signature = automaton.signatures[index]
+                start = self.offset + i + 1 - len(signature.pattern)
+                if signature.max_offset is None or start < signature.max_offset:
+                    self.match = signature
+                    self.offset += n
+                    return
+            i += 1
+        self.state = state
+        self.offset += n
+
+    async def feed(self, data: bytes) -> None:
+        await attachment_keyring.run(self.scan, data)
+
+    async def finish(self) -> ScanResult:
+        if self.match is not None:
+            return ScanResult("infected", f"Dangerous signature detected: {self.match.name}")
+        return ScanResult("clean", "No known signatures")
+
+
+class SignatureScanner(ScanEngine):
+    name = "signatures"
+
+    def __init__(self, signatures: Sequence[Signature] = DEFAULT_SIGNATURES):
+        self.automaton = SignatureAutomaton(signatures)
+
+    async def open(self) -> ScanSession:
+        return SignatureSession(self.automaton)
+
+
+def load_signatures(path: Optional[str] = settings.MALWARE_SIGNATURES_FILE) -> List[Signature]:
+    """Built-in signatures plus any listed in MALWARE_SIGNATURES_FILE
+    (JSON: [{"name": ..., "hex": ..., "max_offset": null}, ...])"""
+    signatures = list(DEFAULT_SIGNATURES)
+    if path:
+        with open(path) as f:
+            for entry in json.load(f):
+                signatures.append(Signature(entry["name"], bytes.fromhex(entry["hex"]), entry.get("max_offset")))
+    return signatures
+
+
+# ==================== ClamAV ====================
+
+class ClamAVSession(ScanSession):
+    def __init__(self, scanner: "ClamAVScanner"):
+        self.scanner = scanner
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.error: Optional[str] = None
+
+    async def connect(self) -> None:
+        try:
+            if self.scanner.socket_path:
+                connection = asyncio.open_unix_connection(self.scanner.socket_path)
+            else:
+                connection = asyncio.open_connection(self.scanner.host, self.scanner.port)
+            self.reader, self.writer = await asyncio.wait_for(connection, self.scanner.timeout_seconds)
+            self.writer.write(b"zINSTREAM\0")
+        except (OSError, asyncio.TimeoutError) as e:
+            self.error = f"ClamAV unreachable: {e}"
+
+    async def feed(self, data: bytes) -> None:
+        if self.error or not data:
+            return
+        try:
+            self.writer.write(struct.pack(">I", len(data)) + data)
+            await asyncio.wait_for(self.writer.drain(), self.scanner.timeout_seconds)
+        except (OSError, asyncio.TimeoutError) as e:
+            self.error = f"ClamAV stream failed: {e}"
+
+    async def finish(self) -> ScanResult:
+        if self.error:
+            return ScanResult("error", self.error)
+        try:
+            self.writer.write(struct.pack(">I", 0))
+            await self.writer.drain()
+            reply = await asyncio.wait_for(self.reader.readuntil(b"\0"), self.scanner.timeout_seconds)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+            return ScanResult("error", f"ClamAV did not answer: {e}")
+
+        # "stream: OK" / "stream: Eicar-Signature FOUND" / "INSTREAM size limit exceeded. ERROR"
+        reply = reply.rstrip(b"\0").decode(errors="replace").strip()
+        if reply.endswith("FOUND"):
+            return ScanResult("infected", f"ClamAV: {reply.split(':', 1)[-1].strip()}")
+        if reply.endswith("OK"):
+            return ScanResult("clean", "ClamAV: OK")
+        return ScanResult("error", f"ClamAV: {reply}")
+
+    async def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+
+
+class ClamAVScanner(ScanEngine):
+    name = "clamav"
+
+    def __init__(
+        self,
+        host: Optional[str] = settings.CLAMAV_HOST,
+        port: int = settings.CLAMAV_PORT,
+        socket_path: Optional[str] = settings.CLAMAV_SOCKET,
+        timeout_seconds: float = settings.CLAMAV_TIMEOUT_SECONDS,
+    ):
+        self.host = host
+        self.port = port
+        self.socket_path = socket_path
+        self.timeout_seconds = timeout_seconds
+
+    async def open(self) -> ScanSession:
+        session = ClamAVSession(self)
+        await session.connect()
+        return session
+
+
+# ==================== All engines ====================
+
+class MultiScanSession(ScanSession):
+    def __init__(self, sessions: List[ScanSession]):
+        self.sessions = sessions
+
+    async def feed(self, data: bytes) -> None:
+        await asyncio.gather(*(session.feed(data) for session in self.sessions))
+
+    async def finish(self) -> ScanResult:
+        results = await asyncio.gather(*(session.finish() for session in self.sessions))
+        for status in ("infected", "error"):
+            flagged = [result.detail for result in results if result.status == status]
+            if flagged:
+                return ScanResult(status, "; ".join(flagged))
+        return ScanResult("clean", "File passed security checks")
+
+    async def close(self) -> None:
+        for session in self.sessions:
+            await session.close()
+
+
+class MalwareScanner:
+    """Runs every configured engine over the same stream"""
+
+    def __init__(self, engines: Sequence[ScanEngine]):
+        self.engines = list(engines)
+
+    async def open(self) -> ScanSession:
+        return MultiScanSession([await engine.open() for engine in self.engines])
+
+
+def get_malware_scanner() -> MalwareScanner:
+    engines: List[ScanEngine] = [SignatureScanner(load_signatures())]
+    if settings.CLAMAV_HOST or settings.CLAMAV_SOCKET:
+        engines.append(ClamAVScanner())
+    return MalwareScanner(engines)
+
+
+malware_scanner = get_malware_scanner()
@@ -0,0 +1,118 @@
+"""
+Number Allocator - Order, invoice and ticket numbers from block-allocated counters.
+
+Each process reserves a block of NUMBER_BLOCK_SIZE numbers with one atomic
+UPDATE number_sequences SET next_value = next_value + :block ... RETURNING,
+then hands them out from memory. Creating an order or ticket therefore costs
+no extra round-trip (one per block), and numbers stay unique across workers
+and hosts because every block is carved out of the same counter row.
+
+Numbers are unique and increasing within a process, not gapless: whatever is
+left of a block when a process exits is never issued.
+"""
+import asyncio
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from sqlalchemy import select, update, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.invoice import Invoice
+from app.models.number_sequence import NumberSequence
+from app.models.order import Order
+from app.models.support import SupportTicket
+
+
+Seed = Callable[[AsyncSession], Awaitable[int]]
+
+
+def _last_issued(column, prefix: str) -> Seed:
+    """Seed for a new counter row: highest numeric suffix already issued under prefix"""
+    async def seed(db: AsyncSession) -> int:
+        result = await db.execute(
+            select(column)
+            .where(column.like(f"{prefix}%"))
+            .order_by(func.length(column).desc(), column.desc())
+            .limit(1)
+        )
+        last = result.scalar_one_or_none()
+        try:
+            return int(last[len(prefix):]) if last else 0
+        except ValueError:
+            return 0
+    return seed
+
+
+class NumberAllocator:
+    """Hands out sequence values from per-process blocks"""
+
+    def __init__(self, session_factory=AsyncSessionLocal, block_size: int = settings.NUMBER_BLOCK_SIZE):
+        self.session_factory = session_factory
+        self.block_size = block_size
+        self._blocks: Dict[str, Tuple[int, int]] = {}  # name -> (next value, end of block)
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    async def next_value(self, name: str, seed: Optional[Seed] = None) -> int:
+        """
+        Next value of sequence `name`. `seed` returns the last value already used
+        and is only consulted when the counter row does not exist yet.
+        """
+        lock = self._locks.setdefault(name, asyncio.Lock())
+        async with lock:
+            value, end = self._blocks.get(name, (0, 0))
+            if value >= end:
+                value, end = await self._reserve_block(name, seed)
+            self._blocks[name] = (value + 1, end)
+            return value
+
+    async def _reserve_block(self, name: str, seed: Optional[Seed]) -> Tuple[int, int]:
+        # Own short transaction: the counter row is never held locked for the caller's request
+        for _ in range(3):
+            async with self.session_factory() as db:
+                result = await db.execute(
+                    update(NumberSequence)
+                    .where(NumberSequence.name == name)
+                    .values(next_value=NumberSequence.next_value + self.block_size)
+                    .returning(NumberSequence.next_value)
+                    .execution_options(synchronize_session=False)
+                )
+                end = result.scalar_one_or_none()
+                if end is not None:
+                    await db.commit()
+                    return end - self.block_size, end
+
+                start = (await seed(db) if seed else 0) + 1
+                db.add(NumberSequence(name=name, next_value=start + self.block_size))
+                try:
+                    await db.commit()
+                    return start, start + self.block_size
+                except IntegrityError:
+                    # Another process created the row first - take a block from it instead
+                    await db.rollback()
+        raise RuntimeError(f"Could not reserve a block for number sequence '{name}'")
+
+    # ==================== Business numbers ====================
+
+    async def order_number(self) -> str:
+        year = datetime.now().year
+        prefix = f"ORD-{year}-"
+        value = await self.next_value(f"order:{year}", _last_issued(Order.order_number, prefix))
+        return f"{prefix}{value:06d}"
+
+    async def invoice_number(self) -> str:
+        year = datetime.now().year
+        prefix = f"INV-{year}-"
+        value = await self.next_value(f"invoice:{year}", _last_issued(Invoice.invoice_number, prefix))
+        return f"{prefix}{value:04d}"
+
+    async def ticket_number(self) -> str:
+        year = datetime.now().year
+        prefix = f"TICK-{year}-"
+        value = await self.next_value(f"ticket:{year}", _last_issued(SupportTicket.ticket_number, prefix))
+        return f"{prefix}{value:04d}"
+
+
+number_allocator = NumberAllocator()
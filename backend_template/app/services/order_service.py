@@ -3,20 +3,21 @@ from sqlalchemy import select, func
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timedelta
 from decimal import Decimal
-import secrets
-import string
 
 from app.models.order import Order
 from app.models.plan import HostingPlan
 from app.models.users import UserProfile
 from app.models.invoice import Invoice
-from app.models.addon import Addon
-from app.models.service import Service
 from app.models.order_addon import OrderAddon
 from app.models.order_service import OrderService as OrderServiceModel
 from app.schemas.order import OrderCreate, OrderUpdate, OrderSummary, InvoiceResponse
 from app.models.referrals import ReferralEarning
 from app.services.referral_service import ReferralService
+from app.services.referral_tree_service import ReferralTreeService
+from app.services.stats_service import StatsService
+from app.services.number_allocator import number_allocator
+from app.services.pricing_catalog import pricing_catalog
+from app.services.pricing_engine import LineItem, cycle_discount_percent, price_cart
 
 
 class OrderService:
@@ -119,152 +120,57 @@ class OrderService:
         return result.scalar_one_or_none()
 
     async def create_order(
-        self, db: AsyncSession, user_id: int, order_data
+        self, db: AsyncSession, user_id: int, order_data, commit: bool = True
     ) -> Dict[str, Any]:
+        """
+        Create the order with its addons, services and invoice.
+        commit=False only flushes, so the caller can commit the order together
+        with its own changes (payment verification).
+        """
         try:
-            # ✅ 1️⃣ Fetch hosting plan
-            result = await db.execute(select(HostingPlan).where(HostingPlan.id == order_data.plan_id))
-            plan = result.scalar_one_or_none()
+            # ✅ 1️⃣ Fetch hosting plan (plans, addons and services come from the in-memory catalog)
+            catalog = await pricing_catalog.get()
+            plan = catalog.plans.get(order_data.plan_id)
             if not plan:
                 raise ValueError("Hosting plan not found")
 
             # ✅ 2️⃣ Generate unique order number
-            order_number = await self._generate_order_number(db)
-
-            # ✅ 3️⃣ Billing cycle → discount %
-            discount_map = {
-                "monthly": Decimal("5.00"),
-                "quarterly": Decimal("10.00"),
-                "semi-annually": Decimal("15.00"),
-                "annually": Decimal("20.00"),
-                "biennially": Decimal("25.00"),
-                "triennially": Decimal("35.00"),
-            }
-            discount_percent = discount_map.get(order_data.billing_cycle.lower(), Decimal("0.00"))
-
-            # ✅ 4️⃣ Calculate base totals from hosting plan
-            plan_subtotal = Decimal(order_data.total_amount)
-            plan_discount_amount = (plan_subtotal * discount_percent) / Decimal("100.00")
-            plan_discounted_total = plan_subtotal - plan_discount_amount
-
-            # ✅ 5️⃣ Process Addons
-            addon_total = Decimal("0.00")
-            addon_records = []
-            invoice_addon_items = []
-            
-            if order_data.addon_ids:
-                addon_result = await db.execute(
-                    select(Addon).where(Addon.id.in_(order_data.addon_ids), Addon.is_active == True)
-                )
-                addons = addon_result.scalars().all()
-                
-                for addon in addons:
-                    unit_price = Decimal(str(addon.price))
-                    quantity = Decimal("1")  # Default quantity, can be extended later
-                    subtotal = unit_price * quantity
-                    
-                    # Apply same discount as plan
-                    addon_discount = (subtotal * discount_percent) / Decimal("100.00")
-                    addon_discounted = subtotal - addon_discount
-                    addon_tax = (addon_discounted * Decimal("18.00")) / Decimal("100.00")
-                    addon_item_total = addon_discounted + addon_tax
-                    
-                    addon_total += addon_item_total
-                    
-                    # Store for OrderAddon creation later
-                    addon_records.append({
-                        "addon_id": addon.id,
-                        "unit_price": unit_price,
-                        "quantity": quantity,
-                        "subtotal": subtotal,
-                        "discount_amount": addon_discount,
-                        "tax_amount": addon_tax,
-                        "total_amount": addon_item_total,
-                        "billing_type": addon.billing_type,
-                    })
-                    
-                    # Invoice line item
-                    invoice_addon_items.append({
-                        "description": f"{addon.name} - {addon.category.value}",
-                        "quantity": int(quantity),
-                        "unit_price": float(unit_price),
-                        "discount_percent": float(discount_percent),
-                        "discount_amount": float(addon_discount),
-                        "subtotal_after_discount": float(addon_discounted),
-                        "gst_percent": 18.0,
-                        "gst_amount": float(addon_tax),
-                        "total_amount": float(addon_item_total)
-                    })
-
-            # ✅ 6️⃣ Process Services
-            service_total = Decimal("0.00")
-            service_records = []
-            invoice_service_items = []
-            
-            if order_data.service_ids:
-                service_result = await db.execute(
-                    select(Service).where(Service.id.in_(order_data.service_ids), Service.is_active == True)
-                )
-                services = service_result.scalars().all()
-                
-                for service in services:
-                    unit_price = Decimal(str(service.base_price))
-                    quantity = Decimal("1")
-                    subtotal = unit_price * quantity
-                    
-                    # Apply same discount as plan
-                    service_discount = (subtotal * discount_percent) / Decimal("100.00")
-                    service_discounted = subtotal - service_discount
-                    service_tax = (service_discounted * Decimal("18.00")) / Decimal("100.00")
-                    service_item_total = service_discounted + service_tax
-                    
-                    service_total += service_item_total
-                    
-                    # Store for OrderService creation later
-                    service_records.append({
-                        "service_id": service.id,
-                        "unit_price": unit_price,
-                        "quantity": quantity,
-                        "subtotal": subtotal,
-                        "discount_amount": service_discount,
-                        "tax_amount": service_tax,
-                        "total_amount": service_item_total,
-                        "service_status": "pending",
-                    })
-                    
-                    # Invoice line item
-                    invoice_service_items.append({
-                        "description": f"{service.name} - {service.category.value}",
-                        "quantity": int(quantity),
-                        "unit_price": float(unit_price),
-                        "discount_percent": float(discount_percent),
-                        "discount_amount": float(service_discount),
-                        "subtotal_after_discount": float(service_discounted),
-                        "gst_percent": 18.0,
-                        "gst_amount": float(service_tax),
-                        "total_amount": float(service_item_total)
-                    })
-
-            # ✅ 7️⃣ Calculate final totals (Plan + Addons + Services)
-            total_discount_amount = plan_discount_amount + sum(a["discount_amount"] for a in addon_records) + sum(s["discount_amount"] for s in service_records)
-            total_discounted = plan_discounted_total + sum(a["subtotal"] - a["discount_amount"] for a in addon_records) + sum(s["subtotal"] - s["discount_amount"] for s in service_records)
-            
-            # GST calculation (18% on total discounted amount)
-            gst_amount = (total_discounted * Decimal("18.00")) / Decimal("100.00")
-            
-            # Grand total for customer invoice
-            grand_total = total_discounted + gst_amount
-
-            # ✅ 8️⃣ Create Order
+            order_number = await number_allocator.order_number()
+
+            # ✅ 3️⃣ Billing cycle → discount % (shared table in the pricing engine)
+            discount_percent = cycle_discount_percent(order_data.billing_cycle)
+
+            # ✅ 4️⃣ One cart: plan + addons + services, priced in a single pass
+            cart_items = [LineItem(
+                'plan', plan.name, Decimal(str(order_data.total_amount)), ref_id=plan.id,
+                description=f"{plan.name} - {order_data.billing_cycle.title()} Plan",
+            )]
+            for addon in catalog.active_addons(order_data.addon_ids):
+                cart_items.append(LineItem(
+                    'addon', addon.name, addon.price, ref_id=addon.id,
+                    description=f"{addon.name} - {addon.category.value}",
+                    category=addon.category.value, billing_type=addon.billing_type.value,
+                ))
+            for service in catalog.active_services(order_data.service_ids):
+                cart_items.append(LineItem(
+                    'service', service.name, service.price, ref_id=service.id,
+                    description=f"{service.name} - {service.category.value}",
+                    category=service.category.value, billing_type=service.billing_type,
+                ))
+            cart = price_cart(cart_items, discount_percent)
+            addon_lines = cart.lines_of('addon')
+            service_lines = cart.lines_of('service')
+
+            # ✅ 5️⃣ Create Order
             new_order = Order(
                 user_id=user_id,
                 plan_id=order_data.plan_id,
                 order_number=order_number,
                 billing_cycle=order_data.billing_cycle,
-                total_amount=plan_subtotal + sum(a["subtotal"] for a in addon_records) + sum(s["subtotal"] for s in service_records),
-                discount_amount=total_discount_amount,
-                tax_amount=gst_amount,
-                grand_total=grand_total,
+                total_amount=cart.subtotal,
+                discount_amount=cart.discount_amount,
+                tax_amount=cart.tax_amount,
+                grand_total=cart.total,
                 server_details=order_data.server_details,  # Kept for backward compatibility
                 order_status="pending",
                 payment_status="pending",
@@ -276,86 +182,66 @@ class OrderService:
             db.add(new_order)
             await db.flush()  # Get new_order.id
 
-            # ✅ 9️⃣ Create OrderAddon records
-            for addon_data in addon_records:
-                order_addon = OrderAddon(
+            # ✅ 6️⃣ Create OrderAddon records
+            for line in addon_lines:
+                db.add(OrderAddon(
                     order_id=new_order.id,
-                    addon_id=addon_data["addon_id"],
-                    unit_price=addon_data["unit_price"],
-                    quantity=addon_data["quantity"],
-                    subtotal=addon_data["subtotal"],
-                    discount_amount=addon_data["discount_amount"],
-                    tax_amount=addon_data["tax_amount"],
-                    total_amount=addon_data["total_amount"],
-                    billing_type=addon_data["billing_type"],
+                    addon_id=line.item.ref_id,
+                    addon_name=line.item.name,
+                    addon_category=line.item.category,
+                    billing_type=line.item.billing_type,
                     is_active=True,
-                )
-                db.add(order_addon)
+                    **line.order_values(cart.discount_percent, cart.tax_percent),
+                ))
 
-            # ✅ 🔟 Create OrderService records
-            for service_data in service_records:
-                order_service = OrderServiceModel(
+            # ✅ 7️⃣ Create OrderService records
+            for line in service_lines:
+                db.add(OrderServiceModel(
                     order_id=new_order.id,
-                    service_id=service_data["service_id"],
-                    unit_price=service_data["unit_price"],
-                    quantity=service_data["quantity"],
-                    subtotal=service_data["subtotal"],
-                    discount_amount=service_data["discount_amount"],
-                    tax_amount=service_data["tax_amount"],
-                    total_amount=service_data["total_amount"],
-                    service_status=service_data["service_status"],
-                )
-                db.add(order_service)
-
-            # ✅ 1️⃣1️⃣ Create Invoice with all line items
-            invoice_number = await self._generate_invoice_number(db)
-            
-            # Build complete invoice items array: plan + addons + services
-            plan_item = {
-                "description": f"{plan.name} - {order_data.billing_cycle.title()} Plan",
-                "quantity": 1,
-                "amount": float(grand_total),
-                "unit_price": float(plan_subtotal),
-                "discount_percent": float(discount_percent),
-                "discount_amount": float(plan_discount_amount),
-                "subtotal_after_discount": float(plan_discounted_total),
-                "gst_percent": 18.0,
-                "gst_amount": float((plan_discounted_total * Decimal("18.00")) / Decimal("100.00")),
-                "total_amount": float(plan_discounted_total + (plan_discounted_total * Decimal("18.00")) / Decimal("100.00"))
-            }
-            
-            invoice_items = [plan_item] + invoice_addon_items + invoice_service_items
-            
+                    service_id=line.item.ref_id,
+                    service_name=line.item.name,
+                    service_category=line.item.category,
+                    billing_type=line.item.billing_type,
+                    service_status="pending",
+                    **line.order_values(cart.discount_percent, cart.tax_percent),
+                ))
+
+            # ✅ 8️⃣ Create Invoice with all line items (plan + addons + services)
+            invoice_number = await number_allocator.invoice_number()
+
             new_invoice = Invoice(
                 user_id=user_id,
                 order_id=new_order.id,
                 invoice_number=invoice_number,
                 invoice_date=datetime.utcnow(),
                 due_date=datetime.utcnow() + timedelta(days=7),
-                subtotal=total_discounted,
-                tax_amount=gst_amount,
-                total_amount=grand_total,
+                subtotal=cart.taxable_amount,
+                tax_amount=cart.tax_amount,
+                total_amount=cart.total,
                 amount_paid=Decimal("0.00"),
-                balance_due=grand_total,
+                balance_due=cart.total,
                 status="unpaid",
                 payment_status="pending",
                 currency="INR",
-                tax_rate=Decimal("18.00"),
+                tax_rate=cart.tax_percent,
                 late_fee=Decimal("0.00"),
                 days_overdue=0,
-                items=invoice_items,
+                items=cart.invoice_items(),
                 created_at=datetime.utcnow(),
                 updated_at=datetime.utcnow(),
             )
 
             db.add(new_invoice)
 
-            # ✅ 1️⃣2️⃣ Commit all changes
-            await db.commit()
+            # ✅ 9️⃣ Commit all changes (or leave them to the caller's transaction)
+            if commit:
+                await db.commit()
+            else:
+                await db.flush()
             await db.refresh(new_order)
             await db.refresh(new_invoice)
 
-            # ✅ 1️⃣3️⃣ Auto Commission (optional)
+            # ✅ 🔟 Auto Commission (optional)
             # If payment_status == "completed" → auto distribute commission
             if new_order.order_status == "completed":
                 referral_service = ReferralService()
@@ -367,7 +253,7 @@ class OrderService:
                     plan_type="recurring" if order_data.billing_cycle.lower() == "monthly" else "longterm",
                 )
 
-            # ✅ 1️⃣4️⃣ Return combined response with addons and services
+            # ✅ 1️⃣1️⃣ Return combined response with addons and services
             return {
                 "order": {
                     "id": new_order.id,
@@ -385,21 +271,21 @@ class OrderService:
                     "server_details": new_order.server_details,
                     "addons": [
                         {
-                            "addon_id": a["addon_id"],
-                            "unit_price": float(a["unit_price"]),
-                            "quantity": float(a["quantity"]),
-                            "total": float(a["total_amount"])
+                            "addon_id": line.item.ref_id,
+                            "unit_price": float(line.item.unit_price),
+                            "quantity": float(line.item.quantity),
+                            "total": float(line.total)
                         }
-                        for a in addon_records
+                        for line in addon_lines
                     ],
                     "services": [
                         {
-                            "service_id": s["service_id"],
-                            "unit_price": float(s["unit_price"]),
-                            "quantity": float(s["quantity"]),
-                            "total": float(s["total_amount"])
+                            "service_id": line.item.ref_id,
+                            "unit_price": float(line.item.unit_price),
+                            "quantity": float(line.item.quantity),
+                            "total": float(line.total)
                         }
-                        for s in service_records
+                        for line in service_lines
                     ],
                     "created_at": new_order.created_at,
                     "updated_at": new_order.updated_at,
@@ -510,25 +396,20 @@ class OrderService:
             3: 2.0,
         }
 
-        # 5️⃣ Detect referral direction and traverse up
-        current_user = buyer
-        current_level = 1
+        # 5️⃣ Resolve the whole upline from the referral closure in one lookup
         order_amount = float(order.grand_total or 0)
+        upline = await ReferralTreeService().get_upline(
+            db, buyer.id, max_depth=len(commission_structure)
+        )
 
-        while current_user.referred_by and current_level <= len(commission_structure):
-            # find the referrer (upline)
-            result = await db.execute(select(UserProfile).filter(UserProfile.id == current_user.referred_by))
-            referrer = result.scalars().first()
-            if not referrer:
-                break
-
+        for current_level, referrer_id in upline.items():
             commission_rate = commission_structure[current_level]
             commission_amount = round(order_amount * (commission_rate / 100), 2)
 
             # Create referral earning record
             earning = ReferralEarning(
                 user_id=buyer.id,
-                referred_user_id=referrer.id,
+                referred_user_id=referrer_id,
                 order_id=order.id,
                 level=current_level,
                 commission_rate=commission_rate,
@@ -539,10 +420,6 @@ class OrderService:
             )
             db.add(earning)
 
-            # Move up the chain
-            current_user = referrer
-            current_level += 1
-
         await db.commit()
         await db.refresh(order)
         return True
@@ -560,61 +437,16 @@ class OrderService:
         return result.scalars().all()
 
     async def get_order_stats(self, db: AsyncSession) -> OrderSummary:
-        total_orders = await self.get_total_orders(db)
-
-        pending = await db.execute(
-            select(func.count(Order.id)).where(Order.order_status == "pending")
-        )
-        completed = await db.execute(
-            select(func.count(Order.id)).where(Order.order_status == "completed")
-        )
-        cancelled = await db.execute(
-            select(func.count(Order.id)).where(Order.order_status == "cancelled")
-        )
-
-        total_revenue_result = await db.execute(
-            select(func.sum(Order.total_amount)).where(Order.payment_status == "paid")
-        )
-        total_revenue = total_revenue_result.scalar() or Decimal("0.0")
-
-        start_of_month = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        monthly_revenue_result = await db.execute(
-            select(func.sum(Order.total_amount)).where(
-                Order.payment_status == "paid", Order.created_at >= start_of_month
-            )
-        )
-        monthly_revenue = monthly_revenue_result.scalar() or Decimal("0.0")
-
+        counts = await StatsService().order_counts(db)
         return OrderSummary(
-            total_orders=total_orders,
-            pending_orders=pending.scalar() or 0,
-            completed_orders=completed.scalar() or 0,
-            cancelled_orders=cancelled.scalar() or 0,
-            total_revenue=total_revenue,
-            monthly_revenue=monthly_revenue,
+            total_orders=counts["total_orders"],
+            pending_orders=counts["pending_orders"],
+            completed_orders=counts["completed_orders"],
+            cancelled_orders=counts["cancelled_orders"],
+            total_revenue=counts["total_revenue"],
+            monthly_revenue=counts["monthly_revenue"],
         )
 
-    # -----------------------------
-    # 🔹 PRIVATE HELPERS
-    # -----------------------------
-    async def _generate_order_number(self, db: AsyncSession, length: int = 10) -> str:
-        chars = string.ascii_uppercase + string.digits
-        while True:
-            number = "ORD-" + "".join(secrets.choice(chars) for _ in range(length))
-            result = await db.execute(select(Order).where(Order.order_number == number))
-            if not result.scalar_one_or_none():
-                return number
-
-    async def _generate_invoice_number(self, db: AsyncSession, length: int = 6) -> str:
-        chars = string.digits
-        while True:
-            number = "INV-" + "".join(secrets.choice(chars) for _ in range(length))
-            result = await db.execute(
-                select(Invoice).where(Invoice.invoice_number == number)
-            )
-            if not result.scalar_one_or_none():
-                return number
-
    # ====================== Razorpay Integration Helpers ====================== #
 
     async def complete_order_by_gateway(
@@ -0,0 +1,187 @@
+"""
+Payment Fulfillment - Background job handlers for post-payment side effects.
+
+verify_payment commits the payment (and the order / invoice status) and
+enqueues these jobs; JobWorker runs them. Every handler is idempotent, so a
+retry after a partial failure never creates a second server, subscription or
+commission payout.
+"""
+from datetime import datetime
+from typing import Any, Dict, List
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from app.models.order import Order
+from app.models.payment import PaymentTransaction
+from app.models.plan import HostingPlan
+from app.models.server import Server
+from app.models.users import UserProfile
+from app.schemas.affiliate import AffiliateSubscriptionCreate
+from app.schemas.server import ServerCreate
+from app.services.affiliate_service import AffiliateService
+from app.services.commission_service import CommissionService
+from app.services.job_queue import JobQueue, job_handler
+from app.services.server_service import ServerService
+
+
+DISTRIBUTE_COMMISSION = "payment.distribute_commission"
+PROVISION_SERVER = "payment.provision_server"
+PROVISION_INVOICE_SERVER = "payment.provision_invoice_server"
+ACTIVATE_AFFILIATE = "payment.activate_affiliate"
+ACTIVATE_SUBSCRIPTION = "payment.activate_subscription"
+
+
+def server_hostname(user_id: int, order_id: int, metadata: Dict[str, Any] = None) -> str:
+    """Hostname for a server bought through checkout - also the provisioning dedup key"""
+    return (metadata or {}).get('hostname') or f"server-{user_id}-{order_id}.bidua.com"
+
+
+def invoice_server_hostname(user_id: int, order_id: int) -> str:
+    return f"server-{user_id}-{order_id}"
+
+
+async def enqueue_fulfillment(
+    db: AsyncSession,
+    job_types: List[str],
+    payload: Dict[str, Any]
+) -> List[str]:
+    """
+    Enqueue one job per type for a payment (caller commits).
+    Keys are derived from the payment transaction, so a repeated verify is a no-op.
+    """
+    queue = JobQueue()
+    for job_type in job_types:
+        await queue.enqueue(
+            db, job_type, payload,
+            idempotency_key=f"{job_type}:{payload['payment_transaction_id']}"
+        )
+    return job_types
+
+
+async def _existing_server(db: AsyncSession, user_id: int, hostname: str):
+    result = await db.execute(
+        select(Server).where(Server.user_id == user_id, Server.hostname == hostname).limit(1)
+    )
+    return result.scalar_one_or_none()
+
+
+async def _get_payment(db: AsyncSession, payment_transaction_id: int) -> PaymentTransaction:
+    payment = await db.get(PaymentTransaction, payment_transaction_id)
+    if not payment:
+        raise LookupError(f"Payment transaction {payment_transaction_id} not found")
+    return payment
+
+
+@job_handler(DISTRIBUTE_COMMISSION)
+async def distribute_commission(db: AsyncSession, payload: Dict[str, Any]):
+    # Guarded by PaymentTransaction.commission_distributed
+    await CommissionService().distribute_commission(
+        db=db,
+        payment_transaction_id=payload['payment_transaction_id']
+    )
+
+
+@job_handler(PROVISION_SERVER)
+async def provision_server(db: AsyncSession, payload: Dict[str, Any]):
+    user_id = payload['user_id']
+    order_id = payload['order_id']
+    payment = await _get_payment(db, payload['payment_transaction_id'])
+    server_metadata = payment.payment_metadata or {}
+
+    hostname = server_hostname(user_id, order_id, server_metadata)
+    if await _existing_server(db, user_id, hostname):
+        return
+
+    plan = await db.get(HostingPlan, payload['plan_id'])
+    if not plan:
+        raise LookupError(f"Hosting plan {payload['plan_id']} not found")
+
+    server_data = ServerCreate(
+        server_name=server_metadata.get('server_name', f'{plan.name} Server'),
+        hostname=hostname,
+        server_type='VPS',
+        operating_system=server_metadata.get('os', 'Ubuntu 22.04 LTS'),
+        vcpu=plan.cpu_cores,
+        ram_gb=plan.ram_gb,
+        storage_gb=plan.storage_gb,
+        bandwidth_gb=plan.bandwidth_gb or 1000,
+        plan_id=plan.id,
+        monthly_cost=plan.base_price
+    )
+    server = await ServerService().create_user_server(db, user_id, server_data)
+    print(f"✅ Server {server.id} created for user {user_id}")
+
+
+@job_handler(PROVISION_INVOICE_SERVER)
+async def provision_invoice_server(db: AsyncSession, payload: Dict[str, Any]):
+    user_id = payload['user_id']
+    hostname = invoice_server_hostname(user_id, payload['order_id'])
+    if await _existing_server(db, user_id, hostname):
+        return
+
+    result = await db.execute(
+        select(Order)
+        .options(selectinload(Order.order_addons), selectinload(Order.order_services))
+        .where(Order.id == payload['order_id'])
+    )
+    order = result.scalar_one_or_none()
+    if not order or not order.plan_id:
+        return
+
+    plan = await db.get(HostingPlan, order.plan_id)
+    if not plan:
+        raise LookupError(f"Hosting plan {order.plan_id} not found")
+
+    server_data = ServerCreate(
+        plan_id=plan.id,
+        server_name=f"{plan.name} Server",
+        hostname=hostname,
+        server_type=plan.plan_type,
+        operating_system="Ubuntu 22.04 LTS",
+        vcpu=plan.cpu_cores,
+        ram_gb=plan.ram_gb,
+        storage_gb=plan.storage_gb,
+        bandwidth_gb=plan.bandwidth_gb,
+        monthly_cost=plan.monthly_price,
+        billing_cycle=order.billing_cycle or "monthly",
+        addons=[addon.to_dict() for addon in order.order_addons],
+        services=[service.to_dict() for service in order.order_services]
+    )
+    server = await ServerService().create_user_server(db=db, user_id=user_id, server_data=server_data)
+    print(f"✅ Server {server.id} created for invoice order {order.id}")
+
+
+@job_handler(ACTIVATE_AFFILIATE)
+async def activate_affiliate(db: AsyncSession, payload: Dict[str, Any]):
+    # Free affiliate subscription with a server purchase; returns the existing one on retry
+    affiliate_sub = await AffiliateService().check_and_activate_from_server_purchase(db, payload['user_id'])
+    if affiliate_sub is not None:
+        print(f"✅ Affiliate subscription activated for user {payload['user_id']}")
+
+
+@job_handler(ACTIVATE_SUBSCRIPTION)
+async def activate_subscription(db: AsyncSession, payload: Dict[str, Any]):
+    user_id = payload['user_id']
+    payment = await _get_payment(db, payload['payment_transaction_id'])
+
+    subscription_data = AffiliateSubscriptionCreate(
+        subscription_type='premium',
+        payment_method='razorpay',
+        payment_id=payment.razorpay_payment_id,
+        transaction_id=str(payment.id),
+        amount_paid=float(payment.total_amount)
+    )
+    # Returns the existing subscription if one was already created
+    affiliate_sub = await AffiliateService().create_affiliate_subscription(
+        db=db,
+        user_id=user_id,
+        subscription_data=subscription_data
+    )
+
+    user = await db.get(UserProfile, user_id)
+    if user and user.subscription_status != 'active':
+        user.subscription_status = 'active'
+        user.subscription_start = datetime.utcnow()
+    print(f"✅ Affiliate subscription created: {affiliate_sub.id}")
@@ -118,7 +118,8 @@ class PaymentService:
         db: AsyncSession,
         razorpay_order_id: str,
         razorpay_payment_id: str,
-        razorpay_signature: str
+        razorpay_signature: str,
+        commit: bool = True
     ) -> PaymentTransaction:
         """
         Verify Razorpay payment and mark transaction as paid
@@ -128,6 +129,8 @@ class PaymentService:
             razorpay_order_id: Razorpay order ID
             razorpay_payment_id: Razorpay payment ID
             razorpay_signature: Razorpay signature for verification
+            commit: False to only flush, so the caller commits PAID together
+                with the order and fulfillment jobs
         
         Returns:
             Updated PaymentTransaction
@@ -145,13 +148,16 @@ class PaymentService:
                 detail="Invalid payment signature"
             )
 
-        # Find payment transaction
-        result = await db.execute(
-            select(PaymentTransaction).where(
-                PaymentTransaction.razorpay_order_id == razorpay_order_id
-            )
+        # Fetch payment details from Razorpay (before taking the row lock)
+        payment_details = await self.razorpay_service.fetch_payment_details(
+            razorpay_payment_id
+        )
+
+        # Find payment transaction, locked until the caller commits so the
+        # payment.captured webhook consumer cannot settle it at the same time
+        payment_transaction = await self.get_payment_by_razorpay_order_id(
+            db, razorpay_order_id, for_update=True
         )
-        payment_transaction = result.scalars().first()
 
         if not payment_transaction:
             raise HTTPException(
@@ -159,17 +165,13 @@ class PaymentService:
                 detail="Payment transaction not found"
             )
 
-        # Fetch payment details from Razorpay
-        payment_details = await self.razorpay_service.fetch_payment_details(
-            razorpay_payment_id
-        )
-
-        # Update payment transaction
+        # Update payment transaction (the webhook may have marked it paid already)
+        if payment_transaction.payment_status != PaymentStatus.PAID:
+            payment_transaction.paid_at = datetime.utcnow()
         payment_transaction.razorpay_payment_id = razorpay_payment_id
         payment_transaction.razorpay_signature = razorpay_signature
         payment_transaction.payment_status = PaymentStatus.PAID
         payment_transaction.payment_method = payment_details.get('method', 'unknown')
-        payment_transaction.paid_at = datetime.utcnow()
         
         # Store additional Razorpay metadata
         if payment_details:
@@ -178,8 +180,11 @@ class PaymentService:
                 'razorpay_details': payment_details
             }
 
-        await db.commit()
-        await db.refresh(payment_transaction)
+        if commit:
+            await db.commit()
+            await db.refresh(payment_transaction)
+        else:
+            await db.flush()
 
         return payment_transaction
 
@@ -187,7 +192,8 @@ class PaymentService:
         self,
         db: AsyncSession,
         payment_transaction_id: int,
-        order_id: int
+        order_id: int,
+        commit: bool = True
     ):
         """
         Link a payment transaction to an order after order creation
@@ -196,6 +202,7 @@ class PaymentService:
             db: Database session
             payment_transaction_id: PaymentTransaction ID
             order_id: Order ID
+            commit: False to only flush (the caller commits)
         """
         result = await db.execute(
             select(PaymentTransaction).where(
@@ -206,7 +213,10 @@ class PaymentService:
 
         if payment_transaction:
             payment_transaction.order_id = order_id
-            await db.commit()
+            if commit:
+                await db.commit()
+            else:
+                await db.flush()
 
     def _calculate_discount(self, amount: Decimal, discount_percent: Decimal) -> Decimal:
         """Calculate discount amount based on percentage"""
@@ -221,14 +231,16 @@ class PaymentService:
     async def get_payment_by_razorpay_order_id(
         self,
         db: AsyncSession,
-        razorpay_order_id: str
+        razorpay_order_id: str,
+        for_update: bool = False
     ) -> Optional[PaymentTransaction]:
-        """Get payment transaction by Razorpay order ID"""
-        result = await db.execute(
-            select(PaymentTransaction).where(
-                PaymentTransaction.razorpay_order_id == razorpay_order_id
-            )
+        """Get payment transaction by Razorpay order ID (for_update: lock the row until commit)"""
+        stmt = select(PaymentTransaction).where(
+            PaymentTransaction.razorpay_order_id == razorpay_order_id
         )
+        if for_update:
+            stmt = stmt.with_for_update()
+        result = await db.execute(stmt)
         return result.scalars().first()
 
     async def mark_payment_failed(
@@ -0,0 +1,434 @@
+"""
+Payout Batches - Monthly payout runs, settled with set-based statements.
+
+Finance pays every approved payout of a book (see referral_ledger) in one run:
+
+  create()  claims all approved payouts of the book with one
+            UPDATE ... SET batch_id and enqueues the run (job payout.run_batch).
+  run()     settles the claimed payouts in id-ordered chunks of
+            PAYOUT_BATCH_CHUNK_SIZE. A chunk costs the same handful of
+            statements whatever its size - payouts marked completed, the
+            earnings / commissions they pay marked paid, and for the affiliate
+            book the ledger and AffiliateStats updated - and commits together
+            with the batch checkpoint (last_payout_id). Once everything is
+            settled, the bank-upload CSV is streamed to payout file storage one
+            page of payouts at a time.
+
+A crashed run is resumed by running it again (the job is retried, or
+scripts/run_payout_batch.py --resume): chunks up to the checkpoint are
+committed, and every statement only touches payouts that are still approved,
+so nothing is paid twice. The file is rebuilt from the database, so a crash
+while writing it just means writing it again.
+
+The single-payout admin actions (ReferralService.complete_payout,
+AffiliateService.process_payout) use the same set-based helpers.
+"""
+import csv
+import io
+import json
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import select, update, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.affiliate import Commission, CommissionStatus, Payout, PayoutStatus
+from app.models.payout_batch import PayoutBatch
+from app.models.referrals import ReferralEarning, ReferralPayout
+from app.models.users import UserProfile
+from app.services.affiliate_stats_service import AffiliateStatsService
+from app.services.attachment_storage import AttachmentStorage, LocalStorage, S3Storage
+from app.services.job_queue import JobQueue, job_handler, notify_job_workers
+from app.services.referral_ledger import AFFILIATE_BOOK, BOOKS, REFERRAL_BOOK, referral_ledger
+
+
+RUN_PAYOUT_BATCH = "payout.run_batch"
+
+PAYOUT_MODELS = {REFERRAL_BOOK: ReferralPayout, AFFILIATE_BOOK: Payout}
+# Status of a payout that is approved but not yet transferred, per book
+APPROVED_STATUS = {REFERRAL_BOOK: "approved", AFFILIATE_BOOK: PayoutStatus.PROCESSING}
+COMPLETED_STATUS = {REFERRAL_BOOK: "completed", AFFILIATE_BOOK: PayoutStatus.COMPLETED}
+
+BANK_FILE_COLUMNS = (
+    "payout_reference", "beneficiary_name", "account_number", "ifsc_code", "bank_name",
+    "upi_id", "payment_method", "amount", "currency", "narration",
+)
+
+
+def get_payout_file_storage() -> AttachmentStorage:
+    """Bank files use the attachment storage backend, in their own directory / prefix"""
+    if settings.ATTACHMENT_STORAGE_BACKEND.lower() == "s3":
+        return S3Storage(prefix=settings.PAYOUT_FILES_S3_PREFIX)
+    return LocalStorage(settings.PAYOUT_FILES_LOCAL_DIR)
+
+
+def _account_details(details: Any) -> Dict[str, Any]:
+    """Bank details as a dict (affiliate payouts keep them as a JSON string)"""
+    if isinstance(details, str):
+        try:
+            details = json.loads(details)
+        except ValueError:
+            return {}
+    return details if isinstance(details, dict) else {}
+
+
+def _first(details: Dict[str, Any], *names: str) -> str:
+    for name in names:
+        if details.get(name):
+            return str(details[name])
+    return ""
+
+
+def _csv_lines(rows: Iterable[Sequence[Any]]) -> bytes:
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="\n").writerows(rows)
+    return buffer.getvalue().encode("utf-8")
+
+
+class PayoutBatchService:
+    """Creates and runs payout batches; set-based settlement of payouts"""
+
+    def __init__(self):
+        self.stats = AffiliateStatsService()
+        self._storage: Optional[AttachmentStorage] = None
+
+    @property
+    def storage(self) -> AttachmentStorage:
+        if self._storage is None:
+            self._storage = get_payout_file_storage()
+        return self._storage
+
+    # ==================== Runs ====================
+
+    async def create(
+        self,
+        db: AsyncSession,
+        book: str,
+        created_by: Optional[int] = None,
+        enqueue: bool = True
+    ) -> PayoutBatch:
+        """
+        Claim every approved payout of the book for a new batch and commit.
+        With enqueue, a background job runs it; otherwise call run().
+        """
+        if book not in BOOKS:
+            raise ValueError(f"Unknown ledger book: {book}")
+
+        open_batch = await db.scalar(
+            select(PayoutBatch.id)
+            .where(PayoutBatch.book == book, PayoutBatch.status != 'completed')
+            .limit(1)
+        )
+        if open_batch is not None:
+            raise ValueError(f"Payout batch {open_batch} of the {book} book is not completed yet; resume it first")
+
+        batch = PayoutBatch(
+            book=book,
+            status='running',
+            payouts_claimed=0,
+            payouts_settled=0,
+            total_amount=Decimal('0.00'),
+            last_payout_id=0,
+            created_by=created_by
+        )
+        db.add(batch)
+        await db.flush()
+
+        model = PAYOUT_MODELS[book]
+        claimed = await db.execute(
+            update(model)
+            .where(model.status == APPROVED_STATUS[book], model.batch_id.is_(None))
+            .values(batch_id=batch.id)
+            .execution_options(synchronize_session=False)
+        )
+        if claimed.rowcount == 0:
+            await db.rollback()
+            raise ValueError("No approved payouts to pay")
+        batch.payouts_claimed = claimed.rowcount
+
+        if enqueue:
+            await JobQueue().enqueue(db, RUN_PAYOUT_BATCH, {"batch_id": batch.id}, f"payout_batch:{batch.id}")
+        await db.commit()
+        if enqueue:
+            notify_job_workers()
+
+        print(f"🧾 Payout batch {batch.id} ({book}) created: {batch.payouts_claimed} payouts")
+        return batch
+
+    async def run(
+        self,
+        db: AsyncSession,
+        batch_id: int,
+        chunk_size: int = settings.PAYOUT_BATCH_CHUNK_SIZE
+    ) -> PayoutBatch:
+        """Settle the batch chunk by chunk, then write its bank file (resumes a failed or interrupted run)"""
+        batch = await db.get(PayoutBatch, batch_id)
+        if batch is None:
+            raise ValueError(f"Payout batch {batch_id} not found")
+        if batch.status == 'completed':
+            return batch
+
+        batch.status = 'running'
+        batch.last_error = None
+        await db.commit()
+
+        try:
+            while await self._settle_next_chunk(db, batch_id, chunk_size):
+                pass
+
+            batch = await db.get(PayoutBatch, batch_id)
+            if batch.file_key is None:
+                batch.file_key, batch.file_rows = await self._write_bank_file(db, batch, chunk_size)
+            batch.status = 'completed'
+            batch.completed_at = datetime.utcnow()
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            await db.execute(
+                update(PayoutBatch)
+                .where(PayoutBatch.id == batch_id)
+                .values(status='failed', last_error=f"{type(e).__name__}: {e}")
+            )
+            await db.commit()
+            print(f"❌ Payout batch {batch_id} failed: {e}")
+            raise
+
+        print(f"✅ Payout batch {batch.id} ({batch.book}) completed: {batch.payouts_settled} payouts, ₹{batch.total_amount}")
+        return batch
+
+    async def _settle_next_chunk(self, db: AsyncSession, batch_id: int, chunk_size: int) -> bool:
+        """Settle the next chunk after the checkpoint and commit; False when nothing is left"""
+        # The batch row lock keeps a second runner of the same batch (job retry, script) out of this chunk
+        result = await db.execute(
+            select(PayoutBatch)
+            .where(PayoutBatch.id == batch_id)
+            .with_for_update()
+            .execution_options(populate_existing=True)
+        )
+        batch = result.scalar_one()
+        model = PAYOUT_MODELS[batch.book]
+
+        ids = (await db.execute(
+            select(model.id)
+            .where(
+                model.batch_id == batch.id,
+                model.status == APPROVED_STATUS[batch.book],
+                model.id > batch.last_payout_id
+            )
+            .order_by(model.id)
+            .limit(chunk_size)
+        )).scalars().all()
+        if not ids:
+            await db.commit()
+            return False
+
+        if batch.book == REFERRAL_BOOK:
+            settled, amount = await self.complete_referral_payouts(db, ids)
+        else:
+            settled, amount = await self.complete_affiliate_payouts(db, ids, processed_by=batch.created_by)
+
+        batch.last_payout_id = ids[-1]
+        batch.payouts_settled += settled
+        batch.total_amount += amount
+        await db.commit()
+
+        print(f"💸 Payout batch {batch.id}: {batch.payouts_settled}/{batch.payouts_claimed} payouts settled")
+        return True
+
+    # ==================== Set-based settlement ====================
+
+    async def complete_referral_payouts(self, db: AsyncSession, payout_ids: List[int]) -> Tuple[int, Decimal]:
+        """
+        Approved referral payouts were transferred: mark them completed and their
+        users' pending earnings paid. Returns (payouts completed, net amount).
+        The ledger already moved these payouts to paid_out when they were approved.
+        """
+        result = await db.execute(
+            update(ReferralPayout)
+            .where(ReferralPayout.id.in_(payout_ids), ReferralPayout.status == "approved")
+            .values(status="completed")
+            .returning(ReferralPayout.user_id, ReferralPayout.net_amount)
+            .execution_options(synchronize_session=False)
+        )
+        rows = result.all()
+        if not rows:
+            return 0, Decimal('0.00')
+
+        await db.execute(
+            update(ReferralEarning)
+            .where(
+                ReferralEarning.user_id.in_(sorted({row.user_id for row in rows})),
+                ReferralEarning.status == "pending"
+            )
+            .values(status="paid", paid_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        return len(rows), sum((row.net_amount for row in rows), Decimal('0.00'))
+
+    async def complete_affiliate_payouts(
+        self,
+        db: AsyncSession,
+        payout_ids: List[int],
+        processed_by: Optional[int] = None
+    ) -> Tuple[int, Decimal]:
+        """
+        Approved (processing) affiliate payouts were transferred: mark them
+        completed, pay out their commissions, settle them on the ledger and
+        update AffiliateStats. Returns (payouts completed, amount).
+        """
+        result = await db.execute(
+            update(Payout)
+            .where(Payout.id.in_(payout_ids), Payout.status == PayoutStatus.PROCESSING)
+            .values(status=PayoutStatus.COMPLETED, processed_at=datetime.utcnow(), processed_by=processed_by)
+            .returning(Payout.id, Payout.affiliate_user_id, Payout.amount)
+            .execution_options(synchronize_session=False)
+        )
+        rows = result.all()
+        if not rows:
+            return 0, Decimal('0.00')
+
+        commissions_paid = await self.mark_commissions_paid(db, [row.id for row in rows])
+
+        payouts: Dict[int, Tuple[int, Decimal]] = {}
+        for row in rows:
+            count, amount = payouts.get(row.affiliate_user_id, (0, Decimal('0.00')))
+            payouts[row.affiliate_user_id] = (count + 1, amount + row.amount)
+        await self.stats.payouts_completed(db, commissions_paid, payouts)
+
+        await referral_ledger.settle_payouts(
+            db, AFFILIATE_BOOK, [(row.affiliate_user_id, row.amount, 'payout', row.id) for row in rows]
+        )
+        return len(rows), sum((row.amount for row in rows), Decimal('0.00'))
+
+    async def mark_commissions_paid(self, db: AsyncSession, payout_ids: List[int]) -> Dict[int, Decimal]:
+        """
+        Attach each affiliate's oldest approved, unpaid commissions to their
+        payout until the payout amount is covered, in one UPDATE: a commission
+        is paid when the commissions before it (running sum per affiliate)
+        total less than the payout. Returns the amount marked paid per
+        affiliate; AffiliateStats is the caller's.
+        """
+        # One row per affiliate, in case a chunk holds two payouts of the same affiliate
+        payouts = (
+            select(
+                Payout.affiliate_user_id.label("user_id"),
+                func.min(Payout.id).label("payout_id"),
+                func.sum(Payout.amount).label("amount"),
+            )
+            .where(Payout.id.in_(payout_ids))
+            .group_by(Payout.affiliate_user_id)
+            .subquery()
+        )
+        paid_before = func.sum(Commission.commission_amount).over(
+            partition_by=Commission.affiliate_user_id,
+            order_by=(Commission.created_at, Commission.id)
+        ) - Commission.commission_amount
+        ranked = (
+            select(Commission.id, payouts.c.payout_id, payouts.c.amount, paid_before.label("paid_before"))
+            .join(payouts, payouts.c.user_id == Commission.affiliate_user_id)
+            .where(Commission.status == CommissionStatus.APPROVED, Commission.payout_id.is_(None))
+            .subquery()
+        )
+
+        result = await db.execute(
+            update(Commission)
+            .where(Commission.id == ranked.c.id, ranked.c.paid_before < ranked.c.amount)
+            .values(status=CommissionStatus.PAID, paid_at=datetime.utcnow(), payout_id=ranked.c.payout_id)
+            .returning(Commission.affiliate_user_id, Commission.commission_amount)
+            .execution_options(synchronize_session=False)
+        )
+        paid: Dict[int, Decimal] = {}
+        for user_id, amount in result.all():
+            paid[user_id] = paid.get(user_id, Decimal('0.00')) + amount
+        return paid
+
+    # ==================== Bank file ====================
+
+    async def _write_bank_file(self, db: AsyncSession, batch: PayoutBatch, page_size: int) -> Tuple[str, int]:
+        """Stream the batch's completed payouts to storage as CSV; returns (key, rows)"""
+        key = f"payout-batch-{batch.id}-{batch.book}.csv"
+        rows = 0
+        async with self.storage.writer(key) as out:
+            await out.write(_csv_lines([BANK_FILE_COLUMNS]))
+            after = 0
+            while True:
+                page = await self._bank_file_page(db, batch, after, page_size)
+                if not page:
+                    break
+                await out.write(_csv_lines(line for _, line in page))
+                rows += len(page)
+                after = page[-1][0]
+
+        print(f"🏦 Payout batch {batch.id}: bank file {key} ({rows} rows)")
+        return key, rows
+
+    async def _bank_file_page(
+        self,
+        db: AsyncSession,
+        batch: PayoutBatch,
+        after: int,
+        limit: int
+    ) -> List[Tuple[int, Tuple]]:
+        """(payout id, CSV row) for the next page of the batch's completed payouts"""
+        model = PAYOUT_MODELS[batch.book]
+        user_id = ReferralPayout.user_id if batch.book == REFERRAL_BOOK else Payout.affiliate_user_id
+        result = await db.execute(
+            select(model, UserProfile.full_name)
+            .join(UserProfile, UserProfile.id == user_id)
+            .where(model.batch_id == batch.id, model.status == COMPLETED_STATUS[batch.book], model.id > after)
+            .order_by(model.id)
+            .limit(limit)
+        )
+
+        page = []
+        for payout, full_name in result.all():
+            if batch.book == REFERRAL_BOOK:
+                details = _account_details(payout.bank_account_details)
+                reference, amount, currency = payout.payout_number, payout.net_amount, "INR"
+            else:
+                details = _account_details(payout.payment_details)
+                reference, amount, currency = f"AFF-PAYOUT-{payout.id}", payout.amount, payout.currency or "INR"
+            page.append((payout.id, (
+                reference,
+                _first(details, "account_holder", "account_holder_name", "name") or full_name,
+                _first(details, "account_number"),
+                _first(details, "ifsc_code", "ifsc"),
+                _first(details, "bank_name"),
+                _first(details, "upi_id", "upi"),
+                payout.payment_method,
+                f"{amount:.2f}",
+                currency,
+                f"{settings.PROJECT_NAME} payout {reference}",
+            )))
+        return page
+
+    async def open_bank_file(self, db: AsyncSession, batch_id: int) -> Tuple[PayoutBatch, int]:
+        """(batch, file size) for a completed batch's bank file"""
+        batch = await db.get(PayoutBatch, batch_id)
+        if batch is None or batch.file_key is None:
+            raise ValueError("Bank file not available")
+        size = await self.storage.size(batch.file_key)
+        if size is None:
+            raise ValueError("Bank file not available")
+        return batch, size
+
+    async def bank_file_chunks(self, key: str, size: int, chunk_size: int = 64 * 1024):
+        """Bank file bytes, read from storage one range at a time"""
+        for start in range(0, size, chunk_size):
+            yield await self.storage.read(key, start, min(chunk_size, size - start))
+
+    async def list_batches(self, db: AsyncSession, book: Optional[str] = None, limit: int = 50) -> List[PayoutBatch]:
+        query = select(PayoutBatch).order_by(PayoutBatch.id.desc()).limit(limit)
+        if book:
+            query = query.where(PayoutBatch.book == book)
+        return list((await db.execute(query)).scalars().all())
+
+
+payout_batches = PayoutBatchService()
+
+
+@job_handler(RUN_PAYOUT_BATCH)
+async def run_payout_batch(db: AsyncSession, payload: Dict[str, Any]):
+    await payout_batches.run(db, payload["batch_id"])
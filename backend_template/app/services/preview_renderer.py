@@ -0,0 +1,36 @@
+"""
+Preview Renderer - Thumbnail rendering for attachment previews.
+
+Runs in the preview worker processes (attachment_previews.py), which are
+spawned fresh, so this module deliberately imports nothing from the app.
+"""
+import io
+
+import pypdfium2
+from PIL import Image
+
+
+def render_preview(data: bytes, mime_type: str, max_size: int, max_pixels: int, quality: int) -> bytes:
+    """JPEG thumbnail (at most max_size px per side) of an image or of a PDF's first page"""
+    Image.MAX_IMAGE_PIXELS = max_pixels  # decompression bombs raise instead of exhausting memory
+    if mime_type == "application/pdf":
+        pdf = pypdfium2.PdfDocument(data)
+        try:
+            page = pdf[0]
+            width, height = page.get_size()
+            image = page.render(scale=max_size / max(width, height, 1)).to_pil()
+        finally:
+            pdf.close()
+    else:
+        image = Image.open(io.BytesIO(data))
+        image.draft("RGB", (max_size, max_size))  # JPEGs decode straight at a reduced scale
+
+    image.thumbnail((max_size, max_size))
+    if image.mode in ("RGBA", "LA", "P"):
+        image = image.convert("RGBA")
+        flattened = Image.new("RGB", image.size, "white")
+        flattened.paste(image, mask=image.getchannel("A"))
+        image = flattened
+    out = io.BytesIO()
+    image.convert("RGB").save(out, "JPEG", quality=quality, optimize=True)
+    return out.getvalue()
@@ -0,0 +1,209 @@
+"""
+Pricing Catalog - Process-local snapshot of hosting plans, addons and services.
+
+Quotes and checkout read prices from an immutable in-memory snapshot indexed
+by id and slug instead of querying HostingPlan / Addon / Service per request.
+
+Freshness is driven by a version counter (the "catalog:pricing" row in
+number_sequences). Any transaction that writes one of the catalog tables bumps
+it before committing (see invalidate_on_commit below), and:
+  - this process marks its snapshot stale on commit and reloads on next use;
+  - other processes compare the counter every PRICING_CATALOG_CHECK_SECONDS
+    (one primary-key SELECT) and reload when it moved.
+A reload builds a complete new snapshot and swaps a single reference, so readers
+never see a half-loaded catalog.
+"""
+import asyncio
+import time
+from decimal import Decimal
+from types import MappingProxyType
+from typing import Mapping, NamedTuple, Optional
+
+from sqlalchemy import select, update, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.cache import invalidate_on_commit
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.addon import Addon, AddonCategory, BillingType
+from app.models.number_sequence import NumberSequence
+from app.models.plan import HostingPlan
+from app.models.service import Service, ServiceCategory
+
+
+CATALOG_VERSION_KEY = "catalog:pricing"
+CATALOG_MODELS = (HostingPlan, Addon, Service)
+CATALOG_TABLES = {model.__tablename__ for model in CATALOG_MODELS}
+
+
+class PlanRecord(NamedTuple):
+    id: int
+    name: str
+    plan_type: str
+    cpu_cores: int
+    ram_gb: int
+    storage_gb: int
+    bandwidth_gb: int
+    base_price: Decimal
+    monthly_price: Decimal
+    quarterly_price: Decimal
+    annual_price: Decimal
+    biennial_price: Decimal
+    triennial_price: Decimal
+    is_active: bool
+
+
+class AddonRecord(NamedTuple):
+    id: int
+    name: str
+    slug: str
+    category: AddonCategory
+    price: Decimal
+    billing_type: BillingType
+    min_quantity: int
+    max_quantity: Optional[int]
+    is_active: bool
+
+
+class ServiceRecord(NamedTuple):
+    id: int
+    name: str
+    slug: str
+    category: ServiceCategory
+    price: Decimal
+    billing_type: str
+    is_active: bool
+
+
+class CatalogSnapshot(NamedTuple):
+    """One consistent, read-only view of the catalog"""
+    version: int
+    plans: Mapping[int, PlanRecord]
+    addons: Mapping[int, AddonRecord]
+    addons_by_slug: Mapping[str, AddonRecord]
+    services: Mapping[int, ServiceRecord]
+    services_by_slug: Mapping[str, ServiceRecord]
+
+    def active_addon(self, slug: str) -> Optional[AddonRecord]:
+        addon = self.addons_by_slug.get(slug)
+        return addon if addon and addon.is_active else None
+
+    def active_addons(self, addon_ids) -> list:
+        """Active addons for the given ids, each once, in request order"""
+        return [
+            self.addons[addon_id] for addon_id in dict.fromkeys(addon_ids or [])
+            if addon_id in self.addons and self.addons[addon_id].is_active
+        ]
+
+    def active_services(self, service_ids) -> list:
+        return [
+            self.services[service_id] for service_id in dict.fromkeys(service_ids or [])
+            if service_id in self.services and self.services[service_id].is_active
+        ]
+
+
+def _price(value) -> Decimal:
+    return Decimal(str(value)) if value is not None else Decimal('0')
+
+
+class PricingCatalog:
+    """Holds the current snapshot and reloads it when the version counter moves"""
+
+    def __init__(self, session_factory=AsyncSessionLocal, check_interval: float = settings.PRICING_CATALOG_CHECK_SECONDS):
+        self.session_factory = session_factory
+        self.check_interval = check_interval
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._next_check = 0.0
+        self._stale = False
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def get(self) -> CatalogSnapshot:
+        snapshot = self._snapshot
+        if snapshot is not None and not self._stale and time.monotonic() < self._next_check:
+            return snapshot
+
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            snapshot = self._snapshot
+            if snapshot is not None and not self._stale and time.monotonic() < self._next_check:
+                return snapshot
+
+            async with self.session_factory() as db:
+                version = await self._read_version(db)
+                if snapshot is None or self._stale or version != snapshot.version:
+                    self._stale = False
+                    snapshot = await self._load(db, version)
+                    self._snapshot = snapshot
+                    print(f"📚 Pricing catalog v{version} loaded: {len(snapshot.plans)} plans, "
+                          f"{len(snapshot.addons)} addons, {len(snapshot.services)} services")
+            self._next_check = time.monotonic() + self.check_interval
+            return snapshot
+
+    def mark_stale(self) -> None:
+        """Reload on next use (a local commit changed the catalog)"""
+        self._stale = True
+
+    @staticmethod
+    async def _read_version(db: AsyncSession) -> int:
+        result = await db.execute(
+            select(NumberSequence.next_value).where(NumberSequence.name == CATALOG_VERSION_KEY)
+        )
+        return result.scalar_one_or_none() or 0
+
+    @staticmethod
+    async def _load(db: AsyncSession, version: int) -> CatalogSnapshot:
+        plans = {
+            p.id: PlanRecord(
+                p.id, p.name, p.plan_type, p.cpu_cores, p.ram_gb, p.storage_gb, p.bandwidth_gb,
+                _price(p.base_price), _price(p.monthly_price), _price(p.quarterly_price),
+                _price(p.annual_price), _price(p.biennial_price), _price(p.triennial_price),
+                bool(p.is_active),
+            )
+            for p in (await db.execute(select(HostingPlan))).scalars()
+        }
+        addons = {
+            a.id: AddonRecord(
+                a.id, a.name, a.slug, a.category, _price(a.price), a.billing_type,
+                a.min_quantity or 0, a.max_quantity, bool(a.is_active),
+            )
+            for a in (await db.execute(select(Addon))).scalars()
+        }
+        services = {
+            s.id: ServiceRecord(
+                s.id, s.name, s.slug, s.category, _price(s.price), s.billing_type, bool(s.is_active),
+            )
+            for s in (await db.execute(select(Service))).scalars()
+        }
+        return CatalogSnapshot(
+            version=version,
+            plans=MappingProxyType(plans),
+            addons=MappingProxyType(addons),
+            addons_by_slug=MappingProxyType({a.slug: a for a in addons.values()}),
+            services=MappingProxyType(services),
+            services_by_slug=MappingProxyType({s.slug: s for s in services.values()}),
+        )
+
+
+pricing_catalog = PricingCatalog()
+
+
+# ==================== Version bump / invalidation ====================
+
+def _bump_catalog_version(session):
+    """Move the shared version inside the same transaction as the catalog edit"""
+    result = session.execute(
+        update(NumberSequence)
+        .where(NumberSequence.name == CATALOG_VERSION_KEY)
+        .values(next_value=NumberSequence.next_value + 1)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        session.execute(insert(NumberSequence).values(name=CATALOG_VERSION_KEY, next_value=1))
+
+
+invalidate_on_commit(
+    CATALOG_TABLES,
+    lambda tables: pricing_catalog.mark_stale(),
+    before_commit=_bump_catalog_version,
+)
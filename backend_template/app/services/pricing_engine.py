@@ -0,0 +1,193 @@
+"""
+Pricing Engine - One Decimal pricing pass shared by quotes, orders and invoices.
+
+A cart is a list of LineItems (plan, addons, services). price_cart() prices the
+whole cart at once:
+  - every line amount is unit_price x quantity x months, rounded to the paisa;
+  - the cycle / user discount and 18% GST are computed once on the cart total
+    (ROUND_HALF_UP to the paisa), exactly as the customer sees them on the quote;
+  - the cart discount and tax are then split across lines by largest remainder,
+    so order lines and invoice items always add up to the order / invoice totals.
+
+The quote response, OrderAddon / OrderService rows and invoice items are all
+read from the same PricedCart, so the three can no longer disagree.
+"""
+import heapq
+from decimal import Decimal, ROUND_DOWN, ROUND_HALF_UP
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+
+CENT = Decimal('0.01')
+HUNDRED = Decimal('100')
+GST_PERCENT = Decimal('18.00')
+
+# Billing cycle -> (months, label, discount %)
+BILLING_TERMS: Dict[str, Tuple[int, str, Decimal]] = {
+    'monthly': (1, 'Monthly', Decimal('5')),
+    'quarterly': (3, 'Quarterly', Decimal('10')),
+    'semiannually': (6, 'Semiannually', Decimal('15')),
+    'annually': (12, 'Annually', Decimal('20')),
+    'biennially': (24, 'Biennially', Decimal('25')),
+    'triennially': (36, 'Triennially', Decimal('35')),
+}
+
+# Spellings used by older clients and by OrderService before the tables were merged
+_CYCLE_ALIASES = {
+    'semi-annually': 'semiannually',
+    'semi_annually': 'semiannually',
+    'annual': 'annually',
+}
+
+
+def billing_terms(cycle: Optional[str]) -> Optional[Tuple[int, str, Decimal]]:
+    """(months, label, discount %) for a billing cycle, or None if unknown"""
+    key = (cycle or '').strip().lower()
+    return BILLING_TERMS.get(_CYCLE_ALIASES.get(key, key))
+
+
+def cycle_discount_percent(cycle: Optional[str]) -> Decimal:
+    terms = billing_terms(cycle)
+    return terms[2] if terms else Decimal('0')
+
+
+def monthly_from_annual(annual_price: Decimal) -> Decimal:
+    """Monthly equivalent of an annually billed addon (SSL), in whole rupees"""
+    return (Decimal(annual_price) / Decimal('12')).quantize(Decimal('1'), rounding=ROUND_HALF_UP)
+
+
+def money(value) -> Decimal:
+    return Decimal(value).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+class LineItem(NamedTuple):
+    kind: str                      # plan | addon | service
+    name: str
+    unit_price: Decimal            # per unit per month (plans may carry the whole term price)
+    quantity: Decimal = Decimal('1')
+    months: int = 1
+    ref_id: Optional[int] = None   # HostingPlan / Addon / Service id
+    description: Optional[str] = None
+    category: Optional[str] = None
+    billing_type: Optional[str] = None
+
+
+class PricedLine(NamedTuple):
+    item: LineItem
+    subtotal: Decimal
+    discount_amount: Decimal
+    taxable_amount: Decimal
+    tax_amount: Decimal
+    total: Decimal
+
+    def order_values(self, discount_percent: Decimal, tax_percent: Decimal) -> Dict[str, Any]:
+        """Column values for an OrderAddon / OrderService row"""
+        return {
+            'unit_price': money(self.item.unit_price),
+            'quantity': int(self.item.quantity),
+            'subtotal': self.subtotal,
+            'discount_percent': discount_percent,
+            'discount_amount': self.discount_amount,
+            'tax_percent': tax_percent,
+            'tax_amount': self.tax_amount,
+            'total_amount': self.total,
+        }
+
+
+class PricedCart(NamedTuple):
+    lines: Tuple[PricedLine, ...]
+    discount_percent: Decimal
+    tax_percent: Decimal
+    subtotal: Decimal
+    discount_amount: Decimal
+    taxable_amount: Decimal
+    tax_amount: Decimal
+    total: Decimal
+
+    def lines_of(self, kind: str) -> List[PricedLine]:
+        return [line for line in self.lines if line.item.kind == kind]
+
+    def quote_totals(self) -> Dict[str, Decimal]:
+        return {
+            'subtotal_before_discount': self.subtotal,
+            'discount_amount': self.discount_amount,
+            'subtotal_after_discount': self.taxable_amount,
+            'tax_amount': self.tax_amount,
+            'total': self.total,
+        }
+
+    def invoice_items(self) -> List[Dict[str, Any]]:
+        """Invoice.items JSON; every amount is already rounded to the paisa"""
+        items = []
+        for line in self.lines:
+            item = {
+                'description': line.item.description or line.item.name,
+                'quantity': int(line.item.quantity),
+                'unit_price': float(money(line.item.unit_price)),
+                'discount_percent': float(self.discount_percent),
+                'discount_amount': float(line.discount_amount),
+                'subtotal_after_discount': float(line.taxable_amount),
+                'gst_percent': float(self.tax_percent),
+                'gst_amount': float(line.tax_amount),
+                'total_amount': float(line.total),
+            }
+            if line.item.kind == 'plan':
+                # Older invoice views read the invoice grand total from the plan row
+                item['amount'] = float(self.total)
+            items.append(item)
+        return items
+
+
+def _allocate(total: Decimal, shares: List[Decimal]) -> List[Decimal]:
+    """Split a rounded total over exact shares: floor each, hand leftover paise to the largest remainders"""
+    parts = [share.quantize(CENT, rounding=ROUND_DOWN) for share in shares]
+    leftover = int((total - sum(parts)) / CENT)
+    if leftover > 0:
+        for index in heapq.nlargest(leftover, range(len(parts)), key=lambda i: shares[i] - parts[i]):
+            parts[index] += CENT
+    return parts
+
+
+def price_cart(
+    items: Iterable[LineItem],
+    discount_percent: Decimal = Decimal('0'),
+    tax_percent: Decimal = GST_PERCENT,
+) -> PricedCart:
+    """Price every line of a cart with exact Decimal arithmetic"""
+    items = list(items)
+    discount_rate = Decimal(discount_percent) / HUNDRED
+    tax_rate = Decimal(tax_percent) / HUNDRED
+
+    subtotals = []
+    for item in items:
+        amount = money(Decimal(item.unit_price) * Decimal(item.quantity) * item.months)
+        if amount < 0:
+            raise ValueError(f"Line item '{item.name}' has a negative amount")
+        subtotals.append(amount)
+    subtotal = sum(subtotals, Decimal('0.00'))
+
+    if discount_rate > 0:
+        discount_amount = money(subtotal * discount_rate)
+        discounts = _allocate(discount_amount, [amount * discount_rate for amount in subtotals])
+    else:
+        discount_amount = Decimal('0.00')
+        discounts = [Decimal('0.00')] * len(items)
+
+    taxables = [amount - discount for amount, discount in zip(subtotals, discounts)]
+    taxable_amount = subtotal - discount_amount
+    tax_amount = money(taxable_amount * tax_rate)
+    taxes = _allocate(tax_amount, [amount * tax_rate for amount in taxables])
+
+    lines = tuple(
+        PricedLine(item, amount, discount, taxable, tax, taxable + tax)
+        for item, amount, discount, taxable, tax in zip(items, subtotals, discounts, taxables, taxes)
+    )
+    return PricedCart(
+        lines=lines,
+        discount_percent=Decimal(discount_percent),
+        tax_percent=Decimal(tax_percent),
+        subtotal=subtotal,
+        discount_amount=discount_amount,
+        taxable_amount=taxable_amount,
+        tax_amount=tax_amount,
+        total=taxable_amount + tax_amount,
+    )
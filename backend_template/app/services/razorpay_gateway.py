@@ -0,0 +1,190 @@
+"""
+Razorpay Gateway - Non-blocking adapter for the Razorpay REST API.
+
+The official razorpay.Client is synchronous; calling it from an async handler
+stalls the event loop for the whole gateway round-trip. This adapter keeps one
+process-wide pooled HTTP session, runs each call on a bounded worker pool,
+applies a per-request timeout and retries transient failures with backoff
+(awaiting between attempts, never sleeping a thread). Signature checks are
+HMAC-SHA256 computed off the loop.
+
+Only failures where Razorpay cannot have acted on the request are retried for
+POST (creating an order is not idempotent): the connection was never
+established, or the request was rate limited (429). A read timeout or a 5xx
+after the request went out may already have created the order, so it is
+raised to the caller instead of being sent twice. GETs retry every transient
+failure.
+"""
+import asyncio
+import hashlib
+import hmac
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Dict, Optional, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+from app.core.config import settings
+
+
+logger = logging.getLogger(__name__)
+
+# Rate limited / upstream unavailable - safe to retry for idempotent calls
+RETRYABLE_STATUS_CODES = {429, 502, 503, 504}
+# Rate limited - Razorpay did not process the request, so even a POST is retried
+NOT_PROCESSED_STATUS_CODES = {429}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+
+class RazorpayGatewayError(Exception):
+    """Razorpay returned an error response or could not be reached"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, code: Optional[str] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.code = code
+
+
+class RazorpayGateway:
+    """Async Razorpay API client with connection pooling, timeouts and retries"""
+
+    def __init__(
+        self,
+        key_id: str,
+        key_secret: str,
+        base_url: str = "https://api.razorpay.com/v1",
+        timeout_seconds: float = 10.0,
+        max_retries: int = 2,
+        backoff_seconds: float = 0.25,
+        pool_size: int = 20
+    ):
+        self.key_secret = key_secret
+        self.base_url = base_url.rstrip("/")
+        self.timeout_seconds = timeout_seconds
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+
+        self._session = requests.Session()
+        self._session.auth = (key_id, key_secret)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+
+        # One worker per pooled connection, so a slow gateway can never exhaust the default executor
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="razorpay")
+
+    # ==================== API calls ====================
+
+    async def create_order(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        return await self._request("POST", "/orders", json=payload)
+
+    async def fetch_order(self, order_id: str) -> Dict[str, Any]:
+        return await self._request("GET", f"/orders/{order_id}")
+
+    async def fetch_payment(self, payment_id: str) -> Dict[str, Any]:
+        return await self._request("GET", f"/payments/{payment_id}")
+
+    async def _request(self, method: str, path: str, json: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Send one API call, retrying transient failures up to max_retries times
+        with exponential backoff. Non-idempotent calls (POST) are only retried
+        when the request cannot have reached Razorpay.
+        """
+        loop = asyncio.get_running_loop()
+        url = f"{self.base_url}{path}"
+        send = partial(self._session.request, method, url, json=json, timeout=self.timeout_seconds)
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        retryable_statuses = RETRYABLE_STATUS_CODES if idempotent else NOT_PROCESSED_STATUS_CODES
+
+        attempt = 0
+        while True:
+            try:
+                response = await loop.run_in_executor(self._executor, send)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= self.max_retries or not (idempotent or _never_sent(e)):
+                    raise RazorpayGatewayError(f"Razorpay unreachable after {attempt + 1} attempts: {e}")
+            else:
+                if response.status_code < 400:
+                    return response.json()
+                if response.status_code not in retryable_statuses or attempt >= self.max_retries:
+                    raise self._error_from(response)
+
+            await asyncio.sleep(self.backoff_seconds * (2 ** attempt))
+            attempt += 1
+            logger.warning("Razorpay %s %s retry %d/%d", method, path, attempt, self.max_retries)
+
+    @staticmethod
+    def _error_from(response: requests.Response) -> RazorpayGatewayError:
+        try:
+            error = response.json().get("error", {})
+        except ValueError:
+            error = {}
+        return RazorpayGatewayError(
+            error.get("description") or f"Razorpay returned HTTP {response.status_code}",
+            status_code=response.status_code,
+            code=error.get("code")
+        )
+
+    # ==================== Signatures ====================
+
+    async def verify_payment_signature(self, order_id: str, payment_id: str, signature: str) -> bool:
+        """Checkout signature: HMAC-SHA256(order_id|payment_id, key_secret)"""
+        message = f"{order_id}|{payment_id}"
+        return await asyncio.get_running_loop().run_in_executor(
+            None, _signature_matches, message, signature, self.key_secret
+        )
+
+    async def verify_webhook_signature(self, body: Union[bytes, str], signature: str, secret: str) -> bool:
+        """Webhook signature: HMAC-SHA256(raw request body, webhook secret)"""
+        return await asyncio.get_running_loop().run_in_executor(
+            None, _signature_matches, body, signature, secret
+        )
+
+    def close(self) -> None:
+        self._session.close()
+        self._executor.shutdown(wait=False)
+
+
+def _never_sent(error: requests.RequestException) -> bool:
+    """True when the connection was never established (connect timeout / refused), so Razorpay saw nothing"""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = error.args[0] if error.args else None
+    return isinstance(getattr(reason, "reason", reason), NewConnectionError)
+
+
+def _signature_matches(message: Union[bytes, str], signature: Optional[str], secret: str) -> bool:
+    if not signature or not secret:
+        return False
+    if not isinstance(message, bytes):
+        message = str(message).encode("utf-8")
+    expected = hmac.new(secret.encode("utf-8"), message, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+_gateway: Optional[RazorpayGateway] = None
+
+
+def get_razorpay_gateway() -> RazorpayGateway:
+    """Process-wide gateway so every request shares one connection pool"""
+    global _gateway
+    if _gateway is None:
+        _gateway = RazorpayGateway(
+            key_id=settings.RAZORPAY_KEY_ID,
+            key_secret=settings.RAZORPAY_KEY_SECRET,
+            base_url=settings.RAZORPAY_API_BASE_URL,
+            timeout_seconds=settings.RAZORPAY_TIMEOUT_SECONDS,
+            max_retries=settings.RAZORPAY_MAX_RETRIES,
+            pool_size=settings.RAZORPAY_POOL_SIZE
+        )
+    return _gateway
+
+
+def close_razorpay_gateway() -> None:
+    global _gateway
+    if _gateway is not None:
+        _gateway.close()
+        _gateway = None
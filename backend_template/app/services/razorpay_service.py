@@ -1,5 +1,4 @@
 
-import razorpay
 from decimal import Decimal
 from typing import Dict, Any, Optional
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -8,15 +7,14 @@ from sqlalchemy import select
 from app.core.config import settings
 from app.models.order import Order
 from app.models.users import UserProfile
+from app.services.razorpay_gateway import get_razorpay_gateway
 
 
 class RazorpayService:
-    """Handle Razorpay payment operations"""
+    """Handle Razorpay payment operations (all gateway I/O is non-blocking)"""
 
     def __init__(self):
-        self.client = razorpay.Client(
-            auth=(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET)
-        )
+        self.gateway = get_razorpay_gateway()
 
     async def create_order(
         self,
@@ -39,7 +37,7 @@ class RazorpayService:
             referrer_id = await self._verify_referral_code(db, referral_code)
 
         # Create Razorpay order
-        razorpay_order = self.client.order.create({
+        razorpay_order = await self.gateway.create_order({
             'amount': amount_paisa,
             'currency': 'INR',
             'payment_capture': 1,
@@ -83,16 +81,11 @@ class RazorpayService:
         """
         Verify Razorpay payment signature
         """
-        try:
-            params_dict = {
-                'razorpay_order_id': razorpay_order_id,
-                'razorpay_payment_id': razorpay_payment_id,
-                'razorpay_signature': razorpay_signature
-            }
-            self.client.utility.verify_payment_signature(params_dict)
-            return True
-        except razorpay.errors.SignatureVerificationError:
-            return False
+        return await self.gateway.verify_payment_signature(
+            razorpay_order_id,
+            razorpay_payment_id,
+            razorpay_signature
+        )
 
     async def create_razorpay_order(
         self,
@@ -117,7 +110,7 @@ class RazorpayService:
         amount_paisa = int(amount * 100)
 
         # Create Razorpay order
-        razorpay_order = self.client.order.create({
+        razorpay_order = await self.gateway.create_order({
             'amount': amount_paisa,
             'currency': 'INR',
             'payment_capture': 1,
@@ -157,21 +150,18 @@ class RazorpayService:
         Fetch payment details from Razorpay
         """
         try:
-            payment = self.client.payment.fetch(payment_id)
+            payment = await self.gateway.fetch_payment(payment_id)
             return payment
         except Exception as e:
             return {'error': str(e)}
 
-    async def process_webhook(self, payload: Dict[str, Any], signature: str) -> bool:
+    async def process_webhook(self, body: bytes, signature: str) -> bool:
         """
-        Process Razorpay webhook
+        Verify a Razorpay webhook: the signature covers the raw request body
+        exactly as received (re-serialized JSON would not match)
         """
-        try:
-            self.client.utility.verify_webhook_signature(
-                payload,
-                signature,
-                settings.RAZORPAY_KEY_SECRET
-            )
-            return True
-        except razorpay.errors.SignatureVerificationError:
-            return False
+        return await self.gateway.verify_webhook_signature(
+            body,
+            signature,
+            settings.RAZORPAY_WEBHOOK_SECRET or settings.RAZORPAY_KEY_SECRET
+        )
@@ -0,0 +1,59 @@
+"""
+Razorpay Webhooks - Inbox handlers for Razorpay events.
+
+razorpay_webhook stores each event in the webhook inbox and acknowledges it;
+WebhookConsumer runs these handlers afterwards, in order per razorpay_order_id.
+Each handler is idempotent: a replayed or redelivered event changes nothing
+twice (commission uses the same job key as verify-payment, so it runs once).
+"""
+from datetime import datetime
+from typing import Any, Dict
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.payment import PaymentStatus
+from app.services.payment_fulfillment import enqueue_fulfillment, DISTRIBUTE_COMMISSION
+from app.services.payment_service import PaymentService
+from app.services.webhook_inbox import webhook_handler
+
+
+def _payment_entity(payload: Dict[str, Any]) -> Dict[str, Any]:
+    return payload.get('payload', {}).get('payment', {}).get('entity', {})
+
+
+@webhook_handler('payment.captured')
+async def payment_captured(db: AsyncSession, payload: Dict[str, Any]):
+    # Payment was successful; the row lock serializes this with verify-payment
+    payment_entity = _payment_entity(payload)
+    payment_transaction = await PaymentService().get_payment_by_razorpay_order_id(
+        db=db,
+        razorpay_order_id=payment_entity.get('order_id'),
+        for_update=True
+    )
+
+    if payment_transaction and payment_transaction.payment_status == PaymentStatus.INITIATED:
+        payment_transaction.razorpay_payment_id = payment_entity.get('id')
+        payment_transaction.payment_status = PaymentStatus.PAID
+        payment_transaction.paid_at = datetime.utcnow()
+
+        # Queue commission distribution if needed (same key as verify-payment, so it runs once)
+        if payment_transaction.requires_commission():
+            await enqueue_fulfillment(db, [DISTRIBUTE_COMMISSION], {
+                "payment_transaction_id": payment_transaction.id,
+                "user_id": payment_transaction.user_id
+            })
+
+
+@webhook_handler('payment.failed')
+async def payment_failed(db: AsyncSession, payload: Dict[str, Any]):
+    payment_entity = _payment_entity(payload)
+    payment_transaction = await PaymentService().get_payment_by_razorpay_order_id(
+        db=db,
+        razorpay_order_id=payment_entity.get('order_id'),
+        for_update=True
+    )
+
+    # A failed attempt never overrides a later successful one on the same order
+    if payment_transaction and payment_transaction.payment_status in (PaymentStatus.INITIATED, PaymentStatus.PENDING):
+        payment_transaction.payment_status = PaymentStatus.FAILED
+        payment_transaction.failure_reason = payment_entity.get('error_description', 'Payment failed')
@@ -0,0 +1,368 @@
+"""
+Referral Ledger - Every movement of referral / affiliate money, posted once.
+
+Earnings, payout holds, payouts and reversals are appended to
+referral_ledger_entries as balanced transactions (the legs sum to zero) and,
+in the same statement batch, added to the user's LedgerBalance snapshot with
+INSERT ... ON CONFLICT DO UPDATE SET col = col + excluded.col. Reading a
+balance is one primary-key lookup; a statement is the user's entries paged by
+id.
+
+Postings are idempotent: the transaction_key is unique per leg, so posting the
+same earning or payout twice changes nothing (post() returns False).
+post_many() appends many transactions with the same two statements (payout
+runs settle a whole chunk at once).
+
+Two books are kept apart, one per payout flow:
+  - referral:  ReferralEarning / ReferralPayout (CommissionService, ReferralService).
+               The snapshot is copied to UserProfile.available_balance /
+               total_earnings / total_withdrawn for the profile payloads.
+  - affiliate: Commission / Payout (AffiliateService)
+"""
+import base64
+import json
+from decimal import Decimal
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import select, update, case, func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.referral_ledger import LedgerEntry, LedgerBalance
+from app.models.users import UserProfile
+
+
+REFERRAL_BOOK = "referral"
+AFFILIATE_BOOK = "affiliate"
+BOOKS = (REFERRAL_BOOK, AFFILIATE_BOOK)
+
+# The user's accounts...
+AVAILABLE = "available"
+HELD = "held"
+# ...and their platform-side counterparts
+COMMISSIONS = "commissions"
+PAID_OUT = "paid_out"
+
+# Snapshot column fed by each account, and the sign applied (money earned leaves "commissions")
+SNAPSHOT_COLUMNS = {
+    AVAILABLE: ("available", 1),
+    HELD: ("held", 1),
+    COMMISSIONS: ("total_earned", -1),
+    PAID_OUT: ("total_paid_out", 1),
+}
+BALANCE_COLUMNS = ("available", "held", "total_earned", "total_paid_out")
+
+# Accounts shown on a user's statement
+STATEMENT_ACCOUNTS = (AVAILABLE, HELD)
+
+
+class Leg(NamedTuple):
+    user_id: int
+    account: str
+    amount: Decimal
+
+
+class Posting(NamedTuple):
+    """One transaction for post_many()"""
+    transaction_key: str
+    legs: List[Leg]
+    reference_type: Optional[str] = None
+    reference_id: Optional[int] = None
+    description: Optional[str] = None
+
+
+class InsufficientBalanceError(ValueError):
+    """A hold would take the available balance below zero"""
+
+
+def hold_key(reference_type: str, reference_id: int) -> str:
+    return f"payout_hold:{reference_type}:{reference_id}"
+
+
+def _encode_statement_cursor(entry_id: int) -> str:
+    """Opaque page cursor: the last entry id of the page"""
+    return base64.urlsafe_b64encode(json.dumps({"id": entry_id}).encode()).decode()
+
+
+def _decode_statement_cursor(cursor: str) -> int:
+    try:
+        return int(json.loads(base64.urlsafe_b64decode(cursor.encode()))["id"])
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+class ReferralLedger:
+    """Posts balanced transactions and reads balances / statements"""
+
+    # ==================== Posting ====================
+
+    async def post(
+        self,
+        db: AsyncSession,
+        transaction_key: str,
+        entry_type: str,
+        book: str,
+        legs: List[Leg],
+        reference_type: Optional[str] = None,
+        reference_id: Optional[int] = None,
+        description: Optional[str] = None,
+        check_funds: bool = True
+    ) -> bool:
+        """
+        Append one transaction and update the affected snapshots (caller commits).
+        Returns False when the transaction_key was already posted.
+        With check_funds, a leg that takes an available or held balance below
+        zero raises InsufficientBalanceError; the caller must roll back.
+        """
+        if not legs:
+            return False
+        posting = Posting(transaction_key, legs, reference_type, reference_id, description)
+        posted = await self.post_many(db, entry_type, book, [posting], check_funds)
+        return bool(posted)
+
+    async def post_many(
+        self,
+        db: AsyncSession,
+        entry_type: str,
+        book: str,
+        postings: List["Posting"],
+        check_funds: bool = True
+    ) -> List[str]:
+        """
+        post() for many transactions at once: one INSERT for every leg and one
+        snapshot upsert. Returns the transaction keys that were new.
+        """
+        postings = [posting for posting in postings if posting.legs]
+        if not postings:
+            return []
+        if book not in BOOKS:
+            raise ValueError(f"Unknown ledger book: {book}")
+        for posting in postings:
+            if sum(leg.amount for leg in posting.legs) != 0:
+                raise ValueError(f"Ledger transaction {posting.transaction_key} does not balance")
+
+        dialect = postgresql if db.bind.dialect.name == 'postgresql' else sqlite
+        inserted = await db.execute(
+            dialect.insert(LedgerEntry)
+            .values([
+                {
+                    "transaction_key": posting.transaction_key,
+                    "leg": number,
+                    "entry_type": entry_type,
+                    "book": book,
+                    "user_id": leg.user_id,
+                    "account": leg.account,
+                    "amount": leg.amount,
+                    "reference_type": posting.reference_type,
+                    "reference_id": posting.reference_id,
+                    "description": posting.description,
+                }
+                for posting in postings
+                for number, leg in enumerate(posting.legs, start=1)
+            ])
+            .on_conflict_do_nothing(index_elements=['transaction_key', 'leg'])
+            .returning(LedgerEntry.id, LedgerEntry.transaction_key)
+        )
+        rows = inserted.all()
+        if not rows:
+            return []
+
+        new_keys = {row.transaction_key for row in rows}
+        legs = [leg for posting in postings if posting.transaction_key in new_keys for leg in posting.legs]
+        balances = await self._apply(db, dialect, book, legs, max(row.id for row in rows))
+
+        if check_funds:
+            for leg in legs:
+                if leg.account in STATEMENT_ACCOUNTS and leg.amount < 0:
+                    if balances[leg.user_id][SNAPSHOT_COLUMNS[leg.account][0]] < 0:
+                        raise InsufficientBalanceError("Insufficient balance for payout")
+
+        if book == REFERRAL_BOOK:
+            await self._copy_to_profiles(db, balances)
+        return [posting.transaction_key for posting in postings if posting.transaction_key in new_keys]
+
+    async def _apply(self, db: AsyncSession, dialect, book: str, legs: List[Leg], last_entry_id: int) -> Dict[int, Dict]:
+        """Add the legs to the snapshots in one upsert; returns the new snapshot values per user"""
+        deltas: Dict[int, Dict[str, Decimal]] = {}
+        for leg in legs:
+            column, sign = SNAPSHOT_COLUMNS[leg.account]
+            row = deltas.setdefault(leg.user_id, {name: Decimal('0.00') for name in BALANCE_COLUMNS})
+            row[column] += sign * leg.amount
+
+        # Sorted by user so concurrent postings lock snapshot rows in the same order
+        stmt = dialect.insert(LedgerBalance).values([
+            {"user_id": user_id, "book": book, "last_entry_id": last_entry_id, **row}
+            for user_id, row in sorted(deltas.items())
+        ])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['user_id', 'book'],
+            set_={
+                **{name: getattr(LedgerBalance, name) + getattr(stmt.excluded, name) for name in BALANCE_COLUMNS},
+                "last_entry_id": stmt.excluded.last_entry_id,
+                "updated_at": func.now(),
+            }
+        ).returning(LedgerBalance.user_id, *[getattr(LedgerBalance, name) for name in BALANCE_COLUMNS])
+
+        result = await db.execute(stmt)
+        return {row[0]: dict(zip(BALANCE_COLUMNS, row[1:])) for row in result.all()}
+
+    async def _copy_to_profiles(self, db: AsyncSession, balances: Dict[int, Dict]) -> None:
+        """Keep the UserProfile balance columns equal to the referral snapshot"""
+        user_ids = sorted(balances)
+
+        def value(name):
+            return case({user_id: balances[user_id][name] for user_id in user_ids}, value=UserProfile.id)
+
+        await db.execute(
+            update(UserProfile)
+            .where(UserProfile.id.in_(user_ids))
+            .values(
+                available_balance=value("available"),
+                total_earnings=value("total_earned"),
+                total_withdrawn=value("total_paid_out"),
+            )
+            .execution_options(synchronize_session=False, user_ids=user_ids)
+        )
+
+    # ==================== Postings by type ====================
+
+    async def credit_earnings(
+        self,
+        db: AsyncSession,
+        book: str,
+        transaction_key: str,
+        credits: Iterable[Tuple[int, Decimal]],
+        reference_type: str,
+        reference_id: int
+    ) -> bool:
+        """Earned commission becomes available: (user_id, amount) for every earner of one sale"""
+        legs = []
+        for user_id, amount in credits:
+            if amount:
+                legs += [Leg(user_id, AVAILABLE, amount), Leg(user_id, COMMISSIONS, -amount)]
+        return await self.post(db, transaction_key, "earning", book, legs, reference_type, reference_id)
+
+    async def hold_payout(
+        self,
+        db: AsyncSession,
+        book: str,
+        user_id: int,
+        amount: Decimal,
+        reference_type: str,
+        reference_id: int
+    ) -> bool:
+        """Move a requested payout from available to held; raises InsufficientBalanceError"""
+        legs = [Leg(user_id, AVAILABLE, -amount), Leg(user_id, HELD, amount)]
+        return await self.post(
+            db, hold_key(reference_type, reference_id), "payout_hold", book, legs, reference_type, reference_id
+        )
+
+    async def settle_payout(
+        self,
+        db: AsyncSession,
+        book: str,
+        user_id: int,
+        amount: Decimal,
+        reference_type: str,
+        reference_id: int
+    ) -> bool:
+        """A held payout was paid"""
+        settled = await self.settle_payouts(db, book, [(user_id, amount, reference_type, reference_id)])
+        return bool(settled)
+
+    async def settle_payouts(
+        self,
+        db: AsyncSession,
+        book: str,
+        payouts: Iterable[Tuple[int, Decimal, str, int]]
+    ) -> List[str]:
+        """settle_payout() for a whole chunk of (user_id, amount, reference_type, reference_id)"""
+        return await self.post_many(db, "payout", book, [
+            Posting(
+                f"payout:{reference_type}:{reference_id}",
+                [Leg(user_id, HELD, -amount), Leg(user_id, PAID_OUT, amount)],
+                reference_type,
+                reference_id
+            )
+            for user_id, amount, reference_type, reference_id in payouts
+        ])
+
+    async def release_payout(
+        self,
+        db: AsyncSession,
+        book: str,
+        user_id: int,
+        amount: Decimal,
+        reference_type: str,
+        reference_id: int
+    ) -> bool:
+        """
+        A held payout was rejected: its hold is reversed. A payout requested
+        before the ledger existed has no hold transaction (its amount is in the
+        opening balance's held leg), so the same reversal is posted from the
+        payout's own amount - under the same key, so it still happens once.
+        """
+        key = hold_key(reference_type, reference_id)
+        if await self.reverse(db, key, "Payout rejected"):
+            return True
+        legs = [Leg(user_id, AVAILABLE, amount), Leg(user_id, HELD, -amount)]
+        return await self.post(
+            db, f"reversal:{key}", "reversal", book, legs, reference_type, reference_id, "Payout rejected",
+            check_funds=False
+        )
+
+    async def reverse(self, db: AsyncSession, transaction_key: str, description: Optional[str] = None) -> bool:
+        """Post the exact opposite of an earlier transaction (once)"""
+        result = await db.execute(
+            select(LedgerEntry)
+            .where(LedgerEntry.transaction_key == transaction_key)
+            .order_by(LedgerEntry.leg)
+        )
+        original = result.scalars().all()
+        if not original:
+            return False
+        legs = [Leg(entry.user_id, entry.account, -entry.amount) for entry in original]
+        return await self.post(
+            db, f"reversal:{transaction_key}", "reversal", original[0].book, legs,
+            original[0].reference_type, original[0].reference_id, description, check_funds=False
+        )
+
+    # ==================== Reads ====================
+
+    async def get_balance(self, db: AsyncSession, user_id: int, book: str = REFERRAL_BOOK) -> LedgerBalance:
+        """The user's snapshot (a zero balance when nothing was ever posted)"""
+        balance = await db.get(LedgerBalance, (user_id, book))
+        if balance is None:
+            zero = Decimal('0.00')
+            balance = LedgerBalance(
+                user_id=user_id, book=book, available=zero, held=zero, total_earned=zero, total_paid_out=zero
+            )
+        return balance
+
+    async def get_statement(
+        self,
+        db: AsyncSession,
+        user_id: int,
+        book: str = REFERRAL_BOOK,
+        cursor: Optional[str] = None,
+        limit: int = 50
+    ) -> Tuple[List[LedgerEntry], Optional[str]]:
+        """The user's available / held entries, newest first, one page at a time"""
+        query = select(LedgerEntry).where(
+            LedgerEntry.user_id == user_id,
+            LedgerEntry.book == book,
+            LedgerEntry.account.in_(STATEMENT_ACCOUNTS)
+        )
+        if cursor:
+            query = query.where(LedgerEntry.id < _decode_statement_cursor(cursor))
+        result = await db.execute(query.order_by(LedgerEntry.id.desc()).limit(limit + 1))
+        entries = list(result.scalars().all())
+
+        next_cursor = None
+        if len(entries) > limit:
+            entries = entries[:limit]
+            next_cursor = _encode_statement_cursor(entries[-1].id)
+        return entries, next_cursor
+
+
+referral_ledger = ReferralLedger()
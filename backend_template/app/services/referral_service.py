@@ -1418,7 +1418,7 @@
 
 
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
+from sqlalchemy import select
 from datetime import datetime
 from decimal import Decimal
 from typing import List, Dict, Any
@@ -1426,6 +1426,10 @@ from typing import List, Dict, Any
 from app.models.referrals import ReferralEarning, ReferralPayout
 from app.models.users import UserProfile
 from app.schemas.referrals import ReferralPayoutCreate, ReferralStats
+from app.services.referral_ledger import REFERRAL_BOOK, referral_ledger
+from app.services.referral_tree_service import ReferralTreeService
+from app.services.stats_service import StatsService
+from app.services.payout_batches import payout_batches
 
 
 class ReferralService:
@@ -1437,6 +1441,9 @@ class ReferralService:
     RECURRING_COMMISSIONS = {1: Decimal("0.05"), 2: Decimal("0.01"), 3: Decimal("0.01")}
     LONGTERM_COMMISSIONS = {1: Decimal("0.15"), 2: Decimal("0.03"), 3: Decimal("0.02")}
 
+    def __init__(self):
+        self.referral_tree = ReferralTreeService()
+
     # --------------------------------------------------------
     # ✅ Record commissions when an order completes
     # --------------------------------------------------------
@@ -1453,23 +1460,20 @@ class ReferralService:
         Automatically tracks commissions for up to 3 upline users.
         If user has no referrer, commission goes to L1 referrer only.
         """
-        result = await db.execute(select(UserProfile).where(UserProfile.id == user_id))
-        user = result.scalar_one_or_none()
-        if not user:
-            return  # ❌ User not found
-        
-        if not user.referred_by:
-            print(f"ℹ️ User {user_id} has no referrer, skipping commission")
-            return  # No referrer chain
-
         structure = (
             self.RECURRING_COMMISSIONS if plan_type == "recurring"
             else self.LONGTERM_COMMISSIONS
         )
 
-        current_referrer_id = user.referred_by
+        # Whole upline (L1..L3) in one indexed closure lookup
+        upline = await self.referral_tree.get_upline(db, user_id, max_depth=len(structure))
+        if not upline:
+            print(f"ℹ️ User {user_id} has no referrer, skipping commission")
+            return  # No referrer chain
 
+        credits = []
         for level, percent in structure.items():
+            current_referrer_id = upline.get(level)
             if not current_referrer_id:
                 break
 
@@ -1490,14 +1494,11 @@ class ReferralService:
             )
 
             db.add(earning)
-            await db.flush()
-
-            # Find next-level referrer
-            next_ref = await db.execute(
-                select(UserProfile.referred_by).where(UserProfile.id == current_referrer_id)
-            )
-            current_referrer_id = next_ref.scalar_one_or_none()
+            credits.append((current_referrer_id, commission_amount.quantize(Decimal("0.01"))))
 
+        await referral_ledger.credit_earnings(
+            db, REFERRAL_BOOK, f"earning:order:{order_id}", credits, reference_type="order", reference_id=order_id
+        )
         await db.commit()
 
     # --------------------------------------------------------
@@ -1506,67 +1507,28 @@ class ReferralService:
     async def get_user_referral_stats(self, db: AsyncSession, user_id: int) -> ReferralStats:
         """Return detailed stats for user's referrals and earnings."""
 
-        # --- Level 1 ---
-        l1_result = await db.execute(select(func.count(UserProfile.id)).where(UserProfile.referred_by == user_id))
-        l1_referrals = l1_result.scalar() or 0
-
-        # --- Level 2 ---
-        l2_result = await db.execute(
-            select(func.count(UserProfile.id)).where(
-                UserProfile.referred_by.in_(
-                    select(UserProfile.id).where(UserProfile.referred_by == user_id)
-                )
-            )
-        )
-        l2_referrals = l2_result.scalar() or 0
-
-        # --- Level 3 ---
-        l3_result = await db.execute(
-            select(func.count(UserProfile.id)).where(
-                UserProfile.referred_by.in_(
-                    select(UserProfile.id).where(
-                        UserProfile.referred_by.in_(
-                            select(UserProfile.id).where(UserProfile.referred_by == user_id)
-                        )
-                    )
-                )
-            )
-        )
-        l3_referrals = l3_result.scalar() or 0
+        # --- Levels 1-3 from the closure table (single grouped query) ---
+        level_counts = await self.referral_tree.get_downline_counts(db, user_id, max_depth=3)
+        l1_referrals = level_counts[1]
+        l2_referrals = level_counts[2]
+        l3_referrals = level_counts[3]
 
         total_referrals = l1_referrals + l2_referrals + l3_referrals
 
-        total_earnings_result = await db.execute(
-            select(func.coalesce(func.sum(ReferralEarning.commission_amount), 0))
-            .where(ReferralEarning.user_id == user_id)
-        )
-        total_earnings = Decimal(total_earnings_result.scalar() or 0)
-
-        pending_payouts_result = await db.execute(
-            select(func.coalesce(func.sum(ReferralPayout.net_amount), 0))
-            .where(ReferralPayout.user_id == user_id, ReferralPayout.status == "requested")
-        )
-        pending_payouts = Decimal(pending_payouts_result.scalar() or 0)
-
-        completed_payouts_result = await db.execute(
-            select(func.coalesce(func.sum(ReferralPayout.net_amount), 0))
-            .where(ReferralPayout.user_id == user_id, ReferralPayout.status == "approved")
-        )
-        completed_payouts = Decimal(completed_payouts_result.scalar() or 0)
-
-        available_balance = total_earnings - (pending_payouts + completed_payouts)
+        # --- Money from the ledger snapshot (one row) ---
+        balance = await referral_ledger.get_balance(db, user_id, REFERRAL_BOOK)
 
         return ReferralStats(
             total_referrals=total_referrals,
             l1_referrals=l1_referrals,
             l2_referrals=l2_referrals,
             l3_referrals=l3_referrals,
-            total_earnings=total_earnings,
-            pending_payouts=pending_payouts,
-            completed_payouts=completed_payouts,
-            available_balance=available_balance,
-            total_withdrawn=completed_payouts,
-            can_request_payout=available_balance >= Decimal("500"),
+            total_earnings=balance.total_earned,
+            pending_payouts=balance.held,
+            completed_payouts=balance.total_paid_out,
+            available_balance=balance.available,
+            total_withdrawn=balance.total_paid_out,
+            can_request_payout=balance.available >= Decimal("500"),
             referral_code=f"REF{user_id:04d}",
         )
 
@@ -1587,8 +1549,9 @@ class ReferralService:
     # --------------------------------------------------------
     async def request_payout(self, db: AsyncSession, user_id: int, data: ReferralPayoutCreate) -> ReferralPayout:
         """
-        Create a payout request entry.
+        Create a payout request entry and hold the gross amount on the ledger.
         Auto-calculates tax, service charge, and net payable amount.
+        Raises InsufficientBalanceError (a ValueError) when the balance is too low.
         """
         gross = Decimal(data.gross_amount)
         tds = gross * Decimal("0.10")       # 10% TDS
@@ -1609,8 +1572,14 @@ class ReferralService:
             requested_at=datetime.now(),
         )
 
-        async with db.begin():
-            db.add(payout)
+        db.add(payout)
+        await db.flush()
+        try:
+            await referral_ledger.hold_payout(db, REFERRAL_BOOK, user_id, gross, "referral_payout", payout.id)
+        except ValueError:
+            await db.rollback()
+            raise
+        await db.commit()
         await db.refresh(payout)
         return payout
 
@@ -1628,8 +1597,10 @@ class ReferralService:
         payout.payment_reference = payment_ref
         payout.processed_at = datetime.now()
 
-        async with db.begin():
-            db.add(payout)
+        await referral_ledger.settle_payout(
+            db, REFERRAL_BOOK, payout.user_id, payout.gross_amount, "referral_payout", payout.id
+        )
+        await db.commit()
         return True
 
     async def reject_payout(self, db: AsyncSession, payout_id: int, reason: str) -> bool:
@@ -1643,38 +1614,18 @@ class ReferralService:
         payout.rejected_reason = reason
         payout.processed_at = datetime.now()
 
-        async with db.begin():
-            db.add(payout)
+        await referral_ledger.release_payout(
+            db, REFERRAL_BOOK, payout.user_id, payout.gross_amount, "referral_payout", payout.id
+        )
+        await db.commit()
         return True
 
     async def complete_payout(self, db: AsyncSession, payout_id: int) -> bool:
-        """Mark payout as completed after bank transfer"""
-        result = await db.execute(select(ReferralPayout).where(ReferralPayout.id == payout_id))
-        payout = result.scalar_one_or_none()
-        if not payout or payout.status != "approved":
+        """Mark payout as completed after bank transfer (monthly runs use payout_batches)"""
+        completed, _ = await payout_batches.complete_referral_payouts(db, [payout_id])
+        if not completed:
             return False
-
-        payout.status = "completed"
-        
-        # Mark all related earnings as paid
-        await db.execute(
-            select(ReferralEarning)
-            .where(ReferralEarning.user_id == payout.user_id, ReferralEarning.status == "pending")
-        )
-        earnings_result = await db.execute(
-            select(ReferralEarning).where(
-                ReferralEarning.user_id == payout.user_id,
-                ReferralEarning.status == "pending"
-            )
-        )
-        earnings = earnings_result.scalars().all()
-        
-        for earning in earnings:
-            earning.status = "paid"
-            earning.paid_at = datetime.now()
-
-        async with db.begin():
-            db.add(payout)
+        await db.commit()
         return True
 
     async def get_user_payouts(self, db: AsyncSession, user_id: int) -> List[ReferralPayout]:
@@ -1707,23 +1658,13 @@ class ReferralService:
     # --------------------------------------------------------
     async def get_admin_referral_stats(self, db: AsyncSession) -> Dict[str, Any]:
         """Get overall system-wide referral stats for admin dashboard."""
-        total_payouts = (await db.execute(select(func.count(ReferralPayout.id)))).scalar() or 0
-        approved_payouts = (
-            await db.execute(select(func.count(ReferralPayout.id)).where(ReferralPayout.status == "approved"))
-        ).scalar() or 0
-        rejected_payouts = (
-            await db.execute(select(func.count(ReferralPayout.id)).where(ReferralPayout.status == "rejected"))
-        ).scalar() or 0
-        pending_payouts = (
-            await db.execute(select(func.count(ReferralPayout.id)).where(ReferralPayout.status == "requested"))
-        ).scalar() or 0
-
-        total_earnings = (
-            await db.execute(select(func.sum(ReferralEarning.commission_amount)))
-        ).scalar() or 0
-        total_withdrawn = (
-            await db.execute(select(func.sum(ReferralPayout.net_amount)))
-        ).scalar() or 0
+        counts = await StatsService().referral_payout_counts(db)
+        total_payouts = counts["total_payouts"]
+        approved_payouts = counts["approved_payouts"]
+        rejected_payouts = counts["rejected_payouts"]
+        pending_payouts = counts["pending_payouts"]
+        total_earnings = counts["total_earnings"]
+        total_withdrawn = counts["total_withdrawn"]
 
         return {
             "total_payouts": total_payouts,
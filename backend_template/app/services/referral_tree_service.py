@@ -0,0 +1,101 @@
+"""
+Referral Tree Service - Upline/downline lookups backed by the referral_closure table
+"""
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, func, insert, delete, literal, union_all, text
+from typing import Dict, List
+
+from app.models.referral_closure import ReferralClosure
+
+
+# Rebuilds every closure row from users_profiles.referred_by in one statement.
+# The depth guard stops a corrupt referred_by cycle from recursing forever.
+REBUILD_CLOSURE_SQL = """
+    INSERT INTO referral_closure (ancestor_id, descendant_id, depth)
+    WITH RECURSIVE chain(ancestor_id, descendant_id, depth) AS (
+        SELECT referred_by, id, 1
+        FROM users_profiles
+        WHERE referred_by IS NOT NULL
+        UNION ALL
+        SELECT u.referred_by, c.descendant_id, c.depth + 1
+        FROM chain c
+        JOIN users_profiles u ON u.id = c.ancestor_id
+        WHERE u.referred_by IS NOT NULL AND c.depth < 64
+    )
+    SELECT ancestor_id, descendant_id, MIN(depth)
+    FROM chain
+    GROUP BY ancestor_id, descendant_id
+"""
+
+
+class ReferralTreeService:
+    """Maintains the referral closure table and answers upline/downline queries"""
+
+    async def link_user(self, db: AsyncSession, user_id: int, referrer_id: int) -> None:
+        """
+        Attach a newly referred user under referrer_id.
+        Copies the referrer's own uplines one level deeper and adds the direct
+        edge, all in a single INSERT ... SELECT. Caller owns the commit.
+        """
+        rows = union_all(
+            select(
+                literal(referrer_id).label("ancestor_id"),
+                literal(user_id).label("descendant_id"),
+                literal(1).label("depth"),
+            ),
+            select(
+                ReferralClosure.ancestor_id,
+                literal(user_id),
+                ReferralClosure.depth + 1,
+            ).where(ReferralClosure.descendant_id == referrer_id),
+        )
+        await db.execute(
+            insert(ReferralClosure).from_select(
+                ["ancestor_id", "descendant_id", "depth"], rows
+            )
+        )
+
+    async def get_upline(self, db: AsyncSession, user_id: int, max_depth: int = 3) -> Dict[int, int]:
+        """Return {level: ancestor_user_id} for the user's uplines up to max_depth"""
+        result = await db.execute(
+            select(ReferralClosure.depth, ReferralClosure.ancestor_id)
+            .where(
+                ReferralClosure.descendant_id == user_id,
+                ReferralClosure.depth <= max_depth,
+            )
+            .order_by(ReferralClosure.depth)
+        )
+        return {depth: ancestor_id for depth, ancestor_id in result.all()}
+
+    async def get_downline_counts(self, db: AsyncSession, user_id: int, max_depth: int = 3) -> Dict[int, int]:
+        """Return {level: member_count} for the user's downline, zero-filled up to max_depth"""
+        result = await db.execute(
+            select(ReferralClosure.depth, func.count())
+            .where(
+                ReferralClosure.ancestor_id == user_id,
+                ReferralClosure.depth <= max_depth,
+            )
+            .group_by(ReferralClosure.depth)
+        )
+        counts = {level: 0 for level in range(1, max_depth + 1)}
+        counts.update({depth: count for depth, count in result.all()})
+        return counts
+
+    async def get_downline_ids(self, db: AsyncSession, user_id: int, level: int) -> List[int]:
+        """Return ids of every downline user exactly `level` steps below user_id"""
+        result = await db.execute(
+            select(ReferralClosure.descendant_id).where(
+                ReferralClosure.ancestor_id == user_id,
+                ReferralClosure.depth == level,
+            )
+        )
+        return list(result.scalars().all())
+
+    async def rebuild(self, db: AsyncSession) -> int:
+        """Recompute the whole closure from UserProfile.referred_by (backfill/repair)"""
+        await db.execute(delete(ReferralClosure))
+        await db.execute(text(REBUILD_CLOSURE_SQL))
+        await db.commit()
+
+        result = await db.execute(select(func.count()).select_from(ReferralClosure))
+        return result.scalar() or 0
@@ -523,6 +523,7 @@ from app.models.server import Server
 from app.models.plan import HostingPlan
 from app.models.order import Order
 from app.schemas.server import ServerCreate, ServerUpdate, ServerStats
+from app.services.stats_service import StatsService
 
 
 class ServerService:
@@ -804,38 +805,19 @@ class ServerService:
         ]
 
     async def get_server_stats(self, db: AsyncSession) -> ServerStats:
-        total_servers = (
-            await db.execute(select(func.count(Server.id)))
-        ).scalar() or 0
-
-        active_servers = await self.get_active_servers_count(db)
-
-        stopped_servers = (
-            await db.execute(
-                select(func.count(Server.id)).where(Server.server_status == "stopped")
-            )
-        ).scalar() or 0
-
-        provisioning_servers = (
-            await db.execute(
-                select(func.count(Server.id)).where(Server.server_status == "provisioning")
-            )
-        ).scalar() or 0
+        counts = await StatsService().server_counts(db)
+        active_servers = counts["active_servers"]
 
         # Calculate total bandwidth (mocked)
         total_bandwidth_used = Decimal(active_servers) * Decimal("2.4")
 
-        avg_cost_result = await db.execute(select(func.avg(Server.monthly_cost)))
-        avg_cost = avg_cost_result.scalar()
-        average_monthly_cost = Decimal(avg_cost) if avg_cost else Decimal("0.0")
-
         return ServerStats(
-            total_servers=total_servers,
+            total_servers=counts["total_servers"],
             active_servers=active_servers,
-            stopped_servers=stopped_servers,
-            provisioning_servers=provisioning_servers,
+            stopped_servers=counts["stopped_servers"],
+            provisioning_servers=counts["provisioning_servers"],
             total_bandwidth_used=total_bandwidth_used,
-            average_monthly_cost=average_monthly_cost,
+            average_monthly_cost=counts["average_monthly_cost"],
         )
 
     # --------------------------------------------------------
@@ -0,0 +1,226 @@
+"""
+Stats Service - Dashboard aggregates computed with one conditional-aggregate
+SELECT per table (COUNT ... FILTER / SUM CASE) and cached for a short TTL.
+
+Cached entries are tagged with the table they read and dropped as soon as a
+session commits a write to that table (registered with invalidate_on_commit below).
+"""
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, func, case
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Any, Dict
+
+from app.core.cache import TTLCache, invalidate_on_commit
+from app.core.config import settings
+from app.models.users import UserProfile
+from app.models.server import Server
+from app.models.order import Order
+from app.models.invoice import Invoice
+from app.models.support import SupportTicket
+from app.models.affiliate import Referral
+from app.models.referrals import ReferralEarning, ReferralPayout
+
+
+stats_cache = TTLCache(ttl_seconds=settings.STATS_CACHE_TTL_SECONDS)
+
+# Tables whose writes invalidate cached aggregates
+TRACKED_TABLES = {
+    UserProfile.__tablename__,
+    Server.__tablename__,
+    Order.__tablename__,
+    Invoice.__tablename__,
+    SupportTicket.__tablename__,
+    Referral.__tablename__,
+    ReferralEarning.__tablename__,
+    ReferralPayout.__tablename__,
+}
+
+
+def _sum_if(condition, column):
+    """SUM(CASE WHEN condition THEN column ELSE 0 END), never NULL"""
+    return func.coalesce(func.sum(case((condition, column), else_=0)), 0)
+
+
+def _month_start() -> datetime:
+    return datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+class StatsService:
+    """Shared aggregation layer for the admin dashboard and stats endpoints"""
+
+    async def user_counts(self, db: AsyncSession) -> Dict[str, Any]:
+        return await stats_cache.get_or_load(
+            "users", lambda: self._load_user_counts(db), tags=[UserProfile.__tablename__]
+        )
+
+    async def server_counts(self, db: AsyncSession) -> Dict[str, Any]:
+        return await stats_cache.get_or_load(
+            "servers", lambda: self._load_server_counts(db), tags=[Server.__tablename__]
+        )
+
+    async def order_counts(self, db: AsyncSession) -> Dict[str, Any]:
+        return await stats_cache.get_or_load(
+            "orders", lambda: self._load_order_counts(db), tags=[Order.__tablename__]
+        )
+
+    async def invoice_counts(self, db: AsyncSession) -> Dict[str, Any]:
+        return await stats_cache.get_or_load(
+            "invoices", lambda: self._load_invoice_counts(db), tags=[Invoice.__tablename__]
+        )
+
+    async def ticket_counts(self, db: AsyncSession) -> Dict[str, Any]:
+        return await stats_cache.get_or_load(
+            "tickets", lambda: self._load_ticket_counts(db), tags=[SupportTicket.__tablename__]
+        )
+
+    async def affiliate_referral_counts(self, db: AsyncSession) -> Dict[str, Any]:
+        return await stats_cache.get_or_load(
+            "affiliate_referrals", lambda: self._load_affiliate_referral_counts(db),
+            tags=[Referral.__tablename__]
+        )
+
+    async def referral_payout_counts(self, db: AsyncSession) -> Dict[str, Any]:
+        return await stats_cache.get_or_load(
+            "referral_payouts", lambda: self._load_referral_payout_counts(db),
+            tags=[ReferralPayout.__tablename__, ReferralEarning.__tablename__]
+        )
+
+    async def get_admin_stats(self, db: AsyncSession) -> Dict[str, Any]:
+        """Payload for GET /admin/stats - one query per table on a cold cache, none when warm"""
+        users = await self.user_counts(db)
+        servers = await self.server_counts(db)
+        orders = await self.order_counts(db)
+        tickets = await self.ticket_counts(db)
+        referrals = await self.affiliate_referral_counts(db)
+
+        active_referrals = referrals["active_referrals"]
+        return {
+            "total_users": users["total_users"],
+            "users_this_month": users["new_users_this_month"],
+            "active_servers": servers["active_servers"],
+            "total_servers": servers["total_servers"],
+            "total_orders": orders["total_orders"],
+            "monthly_revenue": float(orders["monthly_completed_revenue"]),
+            "open_tickets": tickets["open_tickets"] + tickets["in_progress_tickets"],
+            "active_referrals": active_referrals,
+            "referral_status": "Active" if active_referrals > 0 else "Inactive"
+        }
+
+    # ==================== Loaders (one round-trip each) ====================
+
+    async def _load_user_counts(self, db: AsyncSession) -> Dict[str, Any]:
+        today = datetime.now().date()
+        start_of_week = today - timedelta(days=today.weekday())
+        created_on = func.date(UserProfile.created_at)
+
+        row = (await db.execute(
+            select(
+                func.count(UserProfile.id).label("total_users"),
+                func.count(UserProfile.id).filter(UserProfile.account_status == "active").label("active_users"),
+                func.count(UserProfile.id).filter(UserProfile.account_status == "suspended").label("suspended_users"),
+                func.count(UserProfile.id).filter(created_on == today).label("new_users_today"),
+                func.count(UserProfile.id).filter(created_on >= start_of_week).label("new_users_this_week"),
+                func.count(UserProfile.id).filter(UserProfile.created_at >= _month_start()).label("new_users_this_month"),
+            )
+        )).one()
+        return dict(row._mapping)
+
+    async def _load_server_counts(self, db: AsyncSession) -> Dict[str, Any]:
+        row = (await db.execute(
+            select(
+                func.count(Server.id).label("total_servers"),
+                func.count(Server.id).filter(Server.server_status == "active").label("active_servers"),
+                func.count(Server.id).filter(Server.server_status == "stopped").label("stopped_servers"),
+                func.count(Server.id).filter(Server.server_status == "provisioning").label("provisioning_servers"),
+                func.avg(Server.monthly_cost).label("average_monthly_cost"),
+            )
+        )).one()
+        counts = dict(row._mapping)
+        counts["average_monthly_cost"] = Decimal(counts["average_monthly_cost"] or 0)
+        return counts
+
+    async def _load_order_counts(self, db: AsyncSession) -> Dict[str, Any]:
+        month_start = _month_start()
+        paid = Order.payment_status == "paid"
+        completed = Order.order_status == "completed"
+
+        row = (await db.execute(
+            select(
+                func.count(Order.id).label("total_orders"),
+                func.count(Order.id).filter(Order.order_status == "pending").label("pending_orders"),
+                func.count(Order.id).filter(completed).label("completed_orders"),
+                func.count(Order.id).filter(Order.order_status == "cancelled").label("cancelled_orders"),
+                _sum_if(paid, Order.total_amount).label("total_revenue"),
+                _sum_if(paid & (Order.created_at >= month_start), Order.total_amount).label("monthly_revenue"),
+                _sum_if(completed & (Order.created_at >= month_start), Order.total_amount).label("monthly_completed_revenue"),
+            )
+        )).one()
+        counts = dict(row._mapping)
+        for key in ("total_revenue", "monthly_revenue", "monthly_completed_revenue"):
+            counts[key] = Decimal(counts[key] or 0)
+        return counts
+
+    async def _load_invoice_counts(self, db: AsyncSession) -> Dict[str, Any]:
+        paid = Invoice.payment_status == "paid"
+        outstanding = Invoice.payment_status.in_(["pending", "overdue"])
+
+        row = (await db.execute(
+            select(
+                func.count(Invoice.id).label("total_invoices"),
+                func.count(Invoice.id).filter(paid).label("paid_invoices"),
+                func.count(Invoice.id).filter(Invoice.payment_status == "pending").label("pending_invoices"),
+                func.count(Invoice.id).filter(Invoice.payment_status == "overdue").label("overdue_invoices"),
+                _sum_if(paid, Invoice.total_amount).label("total_revenue"),
+                _sum_if(outstanding, Invoice.balance_due).label("pending_amount"),
+            )
+        )).one()
+        counts = dict(row._mapping)
+        counts["total_revenue"] = Decimal(counts["total_revenue"] or 0)
+        counts["pending_amount"] = Decimal(counts["pending_amount"] or 0)
+        return counts
+
+    async def _load_ticket_counts(self, db: AsyncSession) -> Dict[str, Any]:
+        row = (await db.execute(
+            select(
+                func.count(SupportTicket.id).label("total_tickets"),
+                func.count(SupportTicket.id).filter(SupportTicket.status == "open").label("open_tickets"),
+                func.count(SupportTicket.id).filter(SupportTicket.status == "in_progress").label("in_progress_tickets"),
+                func.count(SupportTicket.id).filter(SupportTicket.status == "resolved").label("resolved_tickets"),
+                func.count(SupportTicket.id).filter(SupportTicket.status == "closed").label("closed_tickets"),
+            )
+        )).one()
+        return dict(row._mapping)
+
+    async def _load_affiliate_referral_counts(self, db: AsyncSession) -> Dict[str, Any]:
+        row = (await db.execute(
+            select(
+                func.count(Referral.id).label("total_referrals"),
+                func.count(Referral.id).filter(Referral.is_active == True).label("active_referrals"),
+            )
+        )).one()
+        return dict(row._mapping)
+
+    async def _load_referral_payout_counts(self, db: AsyncSession) -> Dict[str, Any]:
+        row = (await db.execute(
+            select(
+                func.count(ReferralPayout.id).label("total_payouts"),
+                func.count(ReferralPayout.id).filter(ReferralPayout.status == "approved").label("approved_payouts"),
+                func.count(ReferralPayout.id).filter(ReferralPayout.status == "rejected").label("rejected_payouts"),
+                func.count(ReferralPayout.id).filter(ReferralPayout.status == "requested").label("pending_payouts"),
+                func.coalesce(func.sum(ReferralPayout.net_amount), 0).label("total_withdrawn"),
+            )
+        )).one()
+        counts = dict(row._mapping)
+
+        total_earnings = (await db.execute(
+            select(func.coalesce(func.sum(ReferralEarning.commission_amount), 0))
+        )).scalar()
+        counts["total_earnings"] = Decimal(total_earnings or 0)
+        counts["total_withdrawn"] = Decimal(counts["total_withdrawn"] or 0)
+        return counts
+
+
+# ==================== Cache invalidation ====================
+
+invalidate_on_commit(TRACKED_TABLES, stats_cache.invalidate)
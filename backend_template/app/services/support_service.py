@@ -8,6 +8,8 @@ import string
 from app.models.support import SupportTicket
 from app.models.users import UserProfile
 from app.schemas.support import SupportTicketCreate, SupportTicketUpdate, SupportStats
+from app.services.stats_service import StatsService
+from app.services.number_allocator import number_allocator
 
 class SupportService:
     async def get_user_tickets(self, db: AsyncSession, user_id: int, skip: int = 0, limit: int = 100, 
@@ -75,7 +77,7 @@ class SupportService:
         return result.scalar_one_or_none()
     
     async def create_ticket(self, db: AsyncSession, user_id: int, ticket_data: SupportTicketCreate) -> SupportTicket:
-        ticket_number = await self._generate_ticket_number(db)
+        ticket_number = await number_allocator.ticket_number()
         
         db_ticket = SupportTicket(
             user_id=user_id,
@@ -175,57 +177,9 @@ class SupportService:
         return result.scalar()
     
     async def get_support_stats(self, db: AsyncSession) -> SupportStats:
-        total_tickets_result = await db.execute(select(func.count(SupportTicket.id)))
-        total_tickets = total_tickets_result.scalar()
-        
-        open_tickets_result = await db.execute(
-            select(func.count(SupportTicket.id)).where(SupportTicket.status == 'open')
-        )
-        open_tickets = open_tickets_result.scalar()
-        
-        in_progress_tickets_result = await db.execute(
-            select(func.count(SupportTicket.id)).where(SupportTicket.status == 'in_progress')
-        )
-        in_progress_tickets = in_progress_tickets_result.scalar()
-        
-        resolved_tickets_result = await db.execute(
-            select(func.count(SupportTicket.id)).where(SupportTicket.status == 'resolved')
-        )
-        resolved_tickets = resolved_tickets_result.scalar()
-        
-        closed_tickets_result = await db.execute(
-            select(func.count(SupportTicket.id)).where(SupportTicket.status == 'closed')
-        )
-        closed_tickets = closed_tickets_result.scalar()
+        counts = await StatsService().ticket_counts(db)
         
         # Calculate average response time (mock data)
         average_response_time = 2.5  # hours
         
-        return SupportStats(
-            total_tickets=total_tickets,
-            open_tickets=open_tickets,
-            in_progress_tickets=in_progress_tickets,
-            resolved_tickets=resolved_tickets,
-            closed_tickets=closed_tickets,
-            average_response_time=average_response_time
-        )
-    
-    async def _generate_ticket_number(self, db: AsyncSession) -> str:
-        """Generate a unique ticket number"""
-        year = datetime.now().year
-        base_number = f"TICK-{year}-"
-        
-        result = await db.execute(
-            select(SupportTicket.ticket_number).where(
-                SupportTicket.ticket_number.like(f"{base_number}%")
-            ).order_by(SupportTicket.ticket_number.desc()).limit(1)
-        )
-        last_ticket = result.scalar_one_or_none()
-        
-        if last_ticket:
-            last_number = int(last_ticket.split('-')[-1])
-            new_number = last_number + 1
-        else:
-            new_number = 1
-        
-        return f"{base_number}{new_number:03d}"
\ No newline at end of file
+        return SupportStats(**counts, average_response_time=average_response_time)
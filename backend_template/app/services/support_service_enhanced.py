@@ -1,5 +1,6 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import func, select, and_, or_
+from sqlalchemy.orm import aliased
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 import secrets
@@ -10,58 +11,64 @@ from app.models.ticket_message import TicketMessage
 from app.models.users import UserProfile
 from app.schemas.support import SupportTicketCreate, SupportTicketUpdate, SupportStats
 from app.schemas.ticket_message import TicketMessageCreate
+from app.services.stats_service import StatsService
+from app.services.number_allocator import number_allocator
+
+def _message_count(public_only: bool = False):
+    """Correlated COUNT of a ticket's messages, evaluated inside the listing query"""
+    query = select(func.count(TicketMessage.id)).where(TicketMessage.ticket_id == SupportTicket.id)
+    if public_only:
+        query = query.where(TicketMessage.is_internal_note == False)
+    return query.correlate(SupportTicket).scalar_subquery().label("message_count")
+
+
+def _ticket_row(ticket: SupportTicket, message_count: int) -> Dict[str, Any]:
+    return {
+        "id": ticket.id,
+        "user_id": ticket.user_id,
+        "ticket_number": ticket.ticket_number,
+        "subject": ticket.subject,
+        "description": ticket.description,
+        "status": ticket.status,
+        "priority": ticket.priority,
+        "department": ticket.department,
+        "assigned_to": ticket.assigned_to,
+        "created_at": ticket.created_at,
+        "updated_at": ticket.updated_at,
+        "closed_at": ticket.closed_at,
+        "message_count": message_count or 0
+    }
+
 
 class SupportService:
     """Enhanced support service with ticket assignment and messaging"""
     
     async def get_user_tickets(self, db: AsyncSession, user_id: int, skip: int = 0, limit: int = 100, 
                               status: Optional[str] = None) -> List[Dict[str, Any]]:
-        """Get tickets created by a specific user"""
-        query = select(SupportTicket).where(SupportTicket.user_id == user_id)
+        """Get tickets created by a specific user (one query, message counts included)"""
+        query = select(SupportTicket, _message_count(public_only=True)).where(
+            SupportTicket.user_id == user_id
+        )
         
         if status and status != "all":
             query = query.where(SupportTicket.status == status)
             
         query = query.order_by(SupportTicket.created_at.desc()).offset(skip).limit(limit)
         result = await db.execute(query)
-        tickets = result.scalars().all()
-        
-        # Enrich with message count
-        tickets_list = []
-        for ticket in tickets:
-            msg_count_result = await db.execute(
-                select(func.count(TicketMessage.id)).where(
-                    TicketMessage.ticket_id == ticket.id,
-                    TicketMessage.is_internal_note == False
-                )
-            )
-            message_count = msg_count_result.scalar() or 0
-            
-            ticket_dict = {
-                "id": ticket.id,
-                "user_id": ticket.user_id,
-                "ticket_number": ticket.ticket_number,
-                "subject": ticket.subject,
-                "description": ticket.description,
-                "status": ticket.status,
-                "priority": ticket.priority,
-                "department": ticket.department,
-                "assigned_to": ticket.assigned_to,
-                "created_at": ticket.created_at,
-                "updated_at": ticket.updated_at,
-                "closed_at": ticket.closed_at,
-                "message_count": message_count
-            }
-            tickets_list.append(ticket_dict)
         
-        return tickets_list
+        return [_ticket_row(ticket, message_count) for ticket, message_count in result.all()]
     
     async def get_all_tickets(self, db: AsyncSession, skip: int = 0, limit: int = 100, 
                              status: Optional[str] = None, priority: Optional[str] = None,
                              assigned_to: Optional[int] = None, department: Optional[str] = None) -> List[Dict[str, Any]]:
-        """Get all tickets with filters (Admin/Employee view)"""
-        query = select(SupportTicket, UserProfile).join(
+        """Get all tickets with filters (Admin/Employee view) - one query regardless of page size"""
+        Assignee = aliased(UserProfile)
+        query = select(
+            SupportTicket, UserProfile, Assignee.full_name.label("assigned_to_name"), _message_count()
+        ).join(
             UserProfile, SupportTicket.user_id == UserProfile.id
+        ).outerjoin(
+            Assignee, SupportTicket.assigned_to == Assignee.id
         )
         
         if status and status != "all":
@@ -78,44 +85,15 @@ class SupportService:
             
         query = query.order_by(SupportTicket.created_at.desc()).offset(skip).limit(limit)
         result = await db.execute(query)
-        tickets_with_users = result.all()
         
         tickets_list = []
-        for ticket, user in tickets_with_users:
-            # Get assigned employee info if exists
-            assigned_name = None
-            if ticket.assigned_to:
-                assigned_result = await db.execute(
-                    select(UserProfile).where(UserProfile.id == ticket.assigned_to)
-                )
-                assigned_user = assigned_result.scalar_one_or_none()
-                if assigned_user:
-                    assigned_name = assigned_user.full_name
-            
-            # Get message count
-            msg_count_result = await db.execute(
-                select(func.count(TicketMessage.id)).where(TicketMessage.ticket_id == ticket.id)
-            )
-            message_count = msg_count_result.scalar() or 0
-            
-            ticket_dict = {
-                "id": ticket.id,
-                "user_id": ticket.user_id,
-                "ticket_number": ticket.ticket_number,
-                "subject": ticket.subject,
-                "description": ticket.description,
-                "status": ticket.status,
-                "priority": ticket.priority,
-                "department": ticket.department,
-                "assigned_to": ticket.assigned_to,
+        for ticket, user, assigned_name, message_count in result.all():
+            ticket_dict = _ticket_row(ticket, message_count)
+            ticket_dict.update({
                 "assigned_to_name": assigned_name,
-                "created_at": ticket.created_at,
-                "updated_at": ticket.updated_at,
-                "closed_at": ticket.closed_at,
                 "user_name": user.full_name,
-                "user_email": user.email,
-                "message_count": message_count
-            }
+                "user_email": user.email
+            })
             tickets_list.append(ticket_dict)
         
         return tickets_list
@@ -123,7 +101,7 @@ class SupportService:
     async def get_assigned_tickets(self, db: AsyncSession, employee_id: int, skip: int = 0, 
                                    limit: int = 100, status: Optional[str] = None) -> List[Dict[str, Any]]:
         """Get tickets assigned to a specific employee"""
-        query = select(SupportTicket, UserProfile).join(
+        query = select(SupportTicket, UserProfile, _message_count()).join(
             UserProfile, SupportTicket.user_id == UserProfile.id
         ).where(SupportTicket.assigned_to == employee_id)
         
@@ -132,32 +110,14 @@ class SupportService:
             
         query = query.order_by(SupportTicket.created_at.desc()).offset(skip).limit(limit)
         result = await db.execute(query)
-        tickets_with_users = result.all()
         
         tickets_list = []
-        for ticket, user in tickets_with_users:
-            msg_count_result = await db.execute(
-                select(func.count(TicketMessage.id)).where(TicketMessage.ticket_id == ticket.id)
-            )
-            message_count = msg_count_result.scalar() or 0
-            
-            ticket_dict = {
-                "id": ticket.id,
-                "user_id": ticket.user_id,
-                "ticket_number": ticket.ticket_number,
-                "subject": ticket.subject,
-                "description": ticket.description,
-                "status": ticket.status,
-                "priority": ticket.priority,
-                "department": ticket.department,
-                "assigned_to": ticket.assigned_to,
-                "created_at": ticket.created_at,
-                "updated_at": ticket.updated_at,
-                "closed_at": ticket.closed_at,
+        for ticket, user, message_count in result.all():
+            ticket_dict = _ticket_row(ticket, message_count)
+            ticket_dict.update({
                 "user_name": user.full_name,
-                "user_email": user.email,
-                "message_count": message_count
-            }
+                "user_email": user.email
+            })
             tickets_list.append(ticket_dict)
         
         return tickets_list
@@ -171,9 +131,12 @@ class SupportService:
     
     async def get_ticket_with_details(self, db: AsyncSession, ticket_id: int) -> Optional[Dict[str, Any]]:
         """Get ticket with user and assigned employee details"""
+        Assignee = aliased(UserProfile)
         result = await db.execute(
-            select(SupportTicket, UserProfile).join(
+            select(SupportTicket, UserProfile, Assignee.full_name, Assignee.email).join(
                 UserProfile, SupportTicket.user_id == UserProfile.id
+            ).outerjoin(
+                Assignee, SupportTicket.assigned_to == Assignee.id
             ).where(SupportTicket.id == ticket_id)
         )
         ticket_user = result.first()
@@ -181,19 +144,7 @@ class SupportService:
         if not ticket_user:
             return None
         
-        ticket, user = ticket_user
-        
-        # Get assigned employee if exists
-        assigned_name = None
-        assigned_email = None
-        if ticket.assigned_to:
-            assigned_result = await db.execute(
-                select(UserProfile).where(UserProfile.id == ticket.assigned_to)
-            )
-            assigned_user = assigned_result.scalar_one_or_none()
-            if assigned_user:
-                assigned_name = assigned_user.full_name
-                assigned_email = assigned_user.email
+        ticket, user, assigned_name, assigned_email = ticket_user
         
         return {
             "id": ticket.id,
@@ -226,7 +177,7 @@ class SupportService:
     
     async def create_ticket(self, db: AsyncSession, user_id: int, ticket_data: SupportTicketCreate) -> SupportTicket:
         """Create a new support ticket"""
-        ticket_number = await self._generate_ticket_number(db)
+        ticket_number = await number_allocator.ticket_number()
         
         db_ticket = SupportTicket(
             user_id=user_id,
@@ -358,42 +309,22 @@ class SupportService:
     
     async def get_support_stats(self, db: AsyncSession) -> SupportStats:
         """Get support ticket statistics"""
-        total_tickets_result = await db.execute(select(func.count(SupportTicket.id)))
-        total_tickets = total_tickets_result.scalar()
-        
-        open_tickets_result = await db.execute(
-            select(func.count(SupportTicket.id)).where(SupportTicket.status == 'open')
-        )
-        open_tickets = open_tickets_result.scalar()
-        
-        in_progress_tickets_result = await db.execute(
-            select(func.count(SupportTicket.id)).where(SupportTicket.status == 'in_progress')
-        )
-        in_progress_tickets = in_progress_tickets_result.scalar()
-        
-        resolved_tickets_result = await db.execute(
-            select(func.count(SupportTicket.id)).where(SupportTicket.status == 'resolved')
-        )
-        resolved_tickets = resolved_tickets_result.scalar()
-        
-        closed_tickets_result = await db.execute(
-            select(func.count(SupportTicket.id)).where(SupportTicket.status == 'closed')
-        )
-        closed_tickets = closed_tickets_result.scalar()
-        
-        return SupportStats(
-            total_tickets=total_tickets,
-            open_tickets=open_tickets,
-            in_progress_tickets=in_progress_tickets,
-            resolved_tickets=resolved_tickets,
-            closed_tickets=closed_tickets,
-            average_response_time=2.5
-        )
+        counts = await StatsService().ticket_counts(db)
+        return SupportStats(**counts, average_response_time=2.5)
     
     async def get_support_employees(self, db: AsyncSession) -> List[Dict[str, Any]]:
-        """Get list of users who can be assigned to tickets (support staff)"""
+        """Get list of users who can be assigned to tickets (support staff), with active ticket counts"""
+        active_counts = select(
+            SupportTicket.assigned_to.label("employee_id"),
+            func.count(SupportTicket.id).label("active_tickets")
+        ).where(
+            SupportTicket.status.in_(['open', 'in_progress'])
+        ).group_by(SupportTicket.assigned_to).subquery()
+        
         result = await db.execute(
-            select(UserProfile).where(
+            select(UserProfile, func.coalesce(active_counts.c.active_tickets, 0)).outerjoin(
+                active_counts, active_counts.c.employee_id == UserProfile.id
+            ).where(
                 or_(
                     UserProfile.role == 'admin',
                     UserProfile.role == 'support',
@@ -401,19 +332,9 @@ class SupportService:
                 )
             ).order_by(UserProfile.full_name)
         )
-        employees = result.scalars().all()
         
         employees_list = []
-        for emp in employees:
-            # Count assigned tickets
-            assigned_count_result = await db.execute(
-                select(func.count(SupportTicket.id)).where(
-                    SupportTicket.assigned_to == emp.id,
-                    SupportTicket.status.in_(['open', 'in_progress'])
-                )
-            )
-            assigned_count = assigned_count_result.scalar() or 0
-            
+        for emp, assigned_count in result.all():
             employees_list.append({
                 "id": emp.id,
                 "full_name": emp.full_name,
@@ -424,22 +345,3 @@ class SupportService:
         
         return employees_list
     
-    async def _generate_ticket_number(self, db: AsyncSession) -> str:
-        """Generate a unique ticket number"""
-        year = datetime.now().year
-        base_number = f"TICK-{year}-"
-        
-        result = await db.execute(
-            select(SupportTicket.ticket_number).where(
-                SupportTicket.ticket_number.like(f"{base_number}%")
-            ).order_by(SupportTicket.ticket_number.desc()).limit(1)
-        )
-        last_ticket = result.scalar_one_or_none()
-        
-        if last_ticket:
-            last_number = int(last_ticket.split('-')[-1])
-            new_number = last_number + 1
-        else:
-            new_number = 1
-        
-        return f"{base_number}{new_number:04d}"
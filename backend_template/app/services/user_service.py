@@ -277,6 +277,7 @@ from decimal import Decimal
 from app.models.users import UserProfile
 from app.schemas.users import UserCreate, UserUpdate, UserStats
 from app.utils.security_utils import get_password_hash, verify_password
+from app.services.stats_service import StatsService
 from fastapi import HTTPException, status
 from sqlalchemy import update
 
@@ -459,41 +460,8 @@ class UserService:
         return result.scalar() or 0
 
     async def get_user_stats(self, db: AsyncSession) -> UserStats:
-        total_users = await self.get_total_users(db)
-        active_users = await self.get_active_users_count(db)
-
-        suspended_result = await db.execute(
-            select(func.count(UserProfile.id)).where(UserProfile.account_status == "suspended")
-        )
-        suspended_users = suspended_result.scalar() or 0
-
-        today = datetime.now().date()
-        start_of_week = today - timedelta(days=today.weekday())
-        start_of_month = today.replace(day=1)
-
-        new_today_result = await db.execute(
-            select(func.count(UserProfile.id)).where(func.date(UserProfile.created_at) == today)
-        )
-        new_users_today = new_today_result.scalar() or 0
-
-        new_week_result = await db.execute(
-            select(func.count(UserProfile.id)).where(func.date(UserProfile.created_at) >= start_of_week)
-        )
-        new_users_this_week = new_week_result.scalar() or 0
-
-        new_month_result = await db.execute(
-            select(func.count(UserProfile.id)).where(func.date(UserProfile.created_at) >= start_of_month)
-        )
-        new_users_this_month = new_month_result.scalar() or 0
-
-        return UserStats(
-            total_users=total_users,
-            active_users=active_users,
-            suspended_users=suspended_users,
-            new_users_today=new_users_today,
-            new_users_this_week=new_users_this_week,
-            new_users_this_month=new_users_this_month,
-        )
+        counts = await StatsService().user_counts(db)
+        return UserStats(**counts)
 
     # ✅ Recent activity
     async def get_recent_users(self, db: AsyncSession, limit: int = 5) -> List[UserProfile]:
@@ -0,0 +1,244 @@
+"""
+Webhook Inbox - Durable, ordered processing of gateway webhooks.
+
+The webhook endpoint only verifies the signature and appends the event to
+webhook_events with one INSERT ... ON CONFLICT (event_id) DO NOTHING, then
+acknowledges. A redelivered event hits the unique event_id and is ignored.
+
+WebhookConsumer coroutines (started with the app, same polling / wake-up model
+as JobWorker) claim received events and run the handler registered for the
+event type. Events with the same order_key (razorpay_order_id) are processed
+strictly in arrival order: an event is only claimable once every earlier event
+of its order is processed or dead. Failures are retried with exponential
+backoff; after WEBHOOK_MAX_ATTEMPTS the event is dead and
+scripts/replay_webhooks.py puts it back.
+
+Handlers may run more than once (a crash after the handler's work but before
+the event is marked processed), so every handler must be idempotent.
+"""
+import asyncio
+import traceback
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy import select, update, exists, or_, and_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.webhook_event import WebhookEvent
+from app.services.job_queue import JobWorker, notify_job_workers
+
+
+WebhookHandler = Callable[[AsyncSession, Dict[str, Any]], Awaitable[None]]
+
+WEBHOOK_HANDLERS: Dict[str, WebhookHandler] = {}
+
+PENDING_STATUSES = ('received', 'processing')
+
+
+def webhook_handler(event_type: str):
+    """Register an async handler(db, payload) for a webhook event type"""
+    def register(handler: WebhookHandler) -> WebhookHandler:
+        WEBHOOK_HANDLERS[event_type] = handler
+        return handler
+    return register
+
+
+def razorpay_order_key(payload: Dict[str, Any]) -> Optional[str]:
+    """razorpay_order_id an event belongs to (payment.* and order.* events)"""
+    entities = payload.get('payload') or {}
+    payment = (entities.get('payment') or {}).get('entity') or {}
+    order = (entities.get('order') or {}).get('entity') or {}
+    return payment.get('order_id') or order.get('id')
+
+
+class WebhookInbox:
+    """Append and administer inbox events"""
+
+    async def append(
+        self,
+        db: AsyncSession,
+        event_id: str,
+        event_type: str,
+        payload: Dict[str, Any],
+        order_key: Optional[str] = None,
+        provider: str = 'razorpay'
+    ) -> bool:
+        """
+        Store an event and commit. Returns False for a redelivery of an event
+        already in the inbox (nothing is written).
+        """
+        dialect = postgresql if db.bind.dialect.name == 'postgresql' else sqlite
+        result = await db.execute(
+            dialect.insert(WebhookEvent)
+            .values(
+                provider=provider,
+                event_id=event_id,
+                event_type=event_type,
+                order_key=order_key,
+                payload=payload,
+                status='received',
+                attempts=0,
+                run_after=datetime.utcnow()
+            )
+            .on_conflict_do_nothing(index_elements=['event_id'])
+            .returning(WebhookEvent.id)
+        )
+        inserted = result.scalar_one_or_none() is not None
+        await db.commit()
+        return inserted
+
+    async def get_events(
+        self,
+        db: AsyncSession,
+        statuses: List[str],
+        order_key: Optional[str] = None,
+        limit: int = 100
+    ) -> List[WebhookEvent]:
+        stmt = select(WebhookEvent).where(WebhookEvent.status.in_(statuses))
+        if order_key:
+            stmt = stmt.where(WebhookEvent.order_key == order_key)
+        result = await db.execute(stmt.order_by(WebhookEvent.id).limit(limit))
+        return list(result.scalars().all())
+
+    async def replay(self, db: AsyncSession, event_id: int) -> bool:
+        """Process an event again (a dead one, or a processed one after a fix)"""
+        result = await db.execute(
+            update(WebhookEvent)
+            .where(WebhookEvent.id == event_id, WebhookEvent.status.in_(('dead', 'processed')))
+            .values(status='received', attempts=0, run_after=datetime.utcnow(), locked_by=None, locked_at=None)
+        )
+        await db.commit()
+        return result.rowcount > 0
+
+
+class WebhookConsumer(JobWorker):
+    """Pool of polling coroutines that process inbox events"""
+
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        concurrency: int = settings.WEBHOOK_CONSUMER_CONCURRENCY,
+        poll_interval: float = settings.JOB_POLL_INTERVAL_SECONDS,
+        max_attempts: int = settings.WEBHOOK_MAX_ATTEMPTS
+    ):
+        super().__init__(session_factory, concurrency, poll_interval)
+        self.max_attempts = max_attempts
+
+    def start(self) -> None:
+        self._stopping.clear()
+        self._tasks = [
+            asyncio.create_task(self._run_loop(n), name=f"webhook-consumer-{n}")
+            for n in range(self.concurrency)
+        ]
+        print(f"📥 Webhook consumers started: {self.concurrency} x {self.worker_id}")
+
+    async def _claim(self) -> Optional[int]:
+        now = datetime.utcnow()
+        lock_expired = now - timedelta(seconds=settings.JOB_LOCK_TIMEOUT_SECONDS)
+        earlier = aliased(WebhookEvent)
+
+        async with self.session_factory() as db:
+            result = await db.execute(
+                select(WebhookEvent)
+                .where(
+                    or_(
+                        and_(WebhookEvent.status == 'received', WebhookEvent.run_after <= now),
+                        # A consumer died mid-event: take it over once the lock is stale
+                        and_(WebhookEvent.status == 'processing', WebhookEvent.locked_at < lock_expired),
+                    ),
+                    # Per-order ordering: nothing earlier for the same order is still pending
+                    ~exists().where(
+                        earlier.order_key == WebhookEvent.order_key,
+                        earlier.id < WebhookEvent.id,
+                        earlier.status.in_(PENDING_STATUSES)
+                    )
+                )
+                .order_by(WebhookEvent.id)
+                .limit(1)
+                .with_for_update(skip_locked=True)
+            )
+            event = result.scalar_one_or_none()
+            if not event:
+                return None
+
+            # Compare-and-set on (status, attempts) so the claim is safe even where SKIP LOCKED is unsupported
+            claimed = await db.execute(
+                update(WebhookEvent)
+                .where(
+                    WebhookEvent.id == event.id,
+                    WebhookEvent.status == event.status,
+                    WebhookEvent.attempts == event.attempts
+                )
+                .values(status='processing', attempts=event.attempts + 1, locked_by=self.worker_id, locked_at=now)
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+            return event.id if claimed.rowcount == 1 else None
+
+    async def _execute(self, event_id: int) -> None:
+        async with self.session_factory() as db:
+            event = await db.get(WebhookEvent, event_id)
+            # Event types without a handler are acknowledged and recorded, nothing more
+            handler = WEBHOOK_HANDLERS.get(event.event_type)
+            try:
+                if handler is not None:
+                    await handler(db, dict(event.payload or {}))
+                await db.commit()
+                error = None
+            except Exception as e:
+                await db.rollback()
+                error = f"{type(e).__name__}: {e}\n{traceback.format_exc(limit=5)}"
+
+        async with self.session_factory() as db:
+            event = await db.get(WebhookEvent, event_id)
+            event.locked_by = None
+            event.locked_at = None
+
+            if error is None:
+                event.status = 'processed'
+                event.processed_at = datetime.utcnow()
+                event.last_error = None
+            elif event.attempts >= self.max_attempts:
+                event.status = 'dead'
+                event.last_error = error
+                print(f"☠️ Webhook {event.event_id} ({event.event_type}) dead after {event.attempts} attempts: {error.splitlines()[0]}")
+            else:
+                backoff = settings.WEBHOOK_RETRY_BASE_SECONDS * (2 ** (event.attempts - 1))
+                event.status = 'received'
+                event.run_after = datetime.utcnow() + timedelta(seconds=backoff)
+                event.last_error = error
+                print(f"⚠️ Webhook {event.event_id} ({event.event_type}) attempt {event.attempts} failed, retrying in {backoff}s")
+
+            await db.commit()
+
+        # Handlers enqueue jobs (e.g. commission payout); run them now rather than at the next poll
+        if error is None:
+            notify_job_workers()
+
+
+webhook_consumer: Optional[WebhookConsumer] = None
+
+
+async def start_webhook_consumers() -> None:
+    global webhook_consumer
+    if not settings.WEBHOOK_CONSUMERS_ENABLED or webhook_consumer is not None:
+        return
+    webhook_consumer = WebhookConsumer()
+    webhook_consumer.start()
+
+
+async def stop_webhook_consumers() -> None:
+    global webhook_consumer
+    if webhook_consumer is not None:
+        await webhook_consumer.stop()
+        webhook_consumer = None
+
+
+def notify_webhook_consumers() -> None:
+    """Wake this process's consumers after appending events (no-op if consumers are off)"""
+    if webhook_consumer is not None:
+        webhook_consumer.notify()
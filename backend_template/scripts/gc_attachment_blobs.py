@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""
+Delete attachment blobs that no live ticket attachment references any more.
+Run from cron; blobs stay for ATTACHMENT_BLOB_GC_GRACE_SECONDS after their last use.
+
+    python scripts/gc_attachment_blobs.py
+    python scripts/gc_attachment_blobs.py --grace-seconds 0    # reclaim immediately
+"""
+
+import argparse
+import asyncio
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.base import Base  # noqa: F401  (registers all mappers)
+from app.services.attachment_blob_store import attachment_blob_store
+
+
+async def run(grace_seconds: int):
+    async with AsyncSessionLocal() as db:
+        reclaimed = await attachment_blob_store.collect_garbage(db, grace_seconds)
+    if not reclaimed:
+        print("✅ No unreferenced attachment blobs")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--grace-seconds", type=int, default=settings.ATTACHMENT_BLOB_GC_GRACE_SECONDS,
+        help="only reclaim blobs unused for at least this long",
+    )
+    args = parser.parse_args()
+    asyncio.run(run(args.grace_seconds))
@@ -0,0 +1,24 @@
+#!/usr/bin/env python3
+"""
+Delete Idempotency-Key records older than IDEMPOTENCY_KEY_TTL_HOURS (run daily, e.g. from cron).
+
+    python scripts/purge_idempotency_keys.py
+"""
+
+import asyncio
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.base import Base  # noqa: F401  (registers all mappers)
+from app.services.idempotency import idempotency_store
+
+
+async def run():
+    async with AsyncSessionLocal() as db:
+        deleted = await idempotency_store.purge_expired(db)
+        await db.commit()
+    print(f"🧹 {deleted} idempotency keys older than {settings.IDEMPOTENCY_KEY_TTL_HOURS}h deleted")
+
+
+if __name__ == "__main__":
+    asyncio.run(run())
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Razorpay REST API, for offline load tests of RazorpayGateway.
+
+    # Serve a fake gateway (point RAZORPAY_API_BASE_URL at http://127.0.0.1:9100/v1)
+    python -m scripts.razorpay_stub_gateway serve --latency 0.8 --error-rate 0.05
+
+    # Fire concurrent create_order calls through the real adapter and report
+    # throughput plus the worst event-loop stall seen while they were in flight
+    python -m scripts.razorpay_stub_gateway bench --requests 200 --concurrency 50 --latency 0.5
+
+Implements POST /v1/orders, GET /v1/orders/<id> and GET /v1/payments/<id>.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import secrets
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from app.services.razorpay_gateway import RazorpayGateway, RazorpayGatewayError
+
+
+def make_handler(latency: float, error_rate: float):
+    class StubRazorpayHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, so connection pooling is exercised
+
+        def log_message(self, format, *args):
+            pass
+
+        def _reply(self, status: int, body: dict):
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _simulate_gateway(self) -> bool:
+            time.sleep(latency)
+            if random.random() < error_rate:
+                self._reply(503, {"error": {"code": "SERVER_ERROR", "description": "stub: upstream unavailable"}})
+                return False
+            return True
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if self.path.rstrip("/") != "/v1/orders":
+                return self._reply(404, {"error": {"code": "BAD_REQUEST_ERROR", "description": "not found"}})
+            if not self._simulate_gateway():
+                return
+            self._reply(200, {
+                "id": f"order_stub{secrets.token_hex(7)}",
+                "entity": "order",
+                "amount": body.get("amount"),
+                "amount_paid": 0,
+                "amount_due": body.get("amount"),
+                "currency": body.get("currency", "INR"),
+                "receipt": body.get("receipt"),
+                "status": "created",
+                "attempts": 0,
+                "notes": body.get("notes", {}),
+                "created_at": int(time.time()),
+            })
+
+        def do_GET(self):
+            parts = self.path.strip("/").split("/")
+            if len(parts) != 3 or parts[0] != "v1" or parts[1] not in ("orders", "payments"):
+                return self._reply(404, {"error": {"code": "BAD_REQUEST_ERROR", "description": "not found"}})
+            if not self._simulate_gateway():
+                return
+            entity = parts[1][:-1]
+            self._reply(200, {
+                "id": parts[2],
+                "entity": entity,
+                "status": "captured" if entity == "payment" else "paid",
+                "currency": "INR",
+                "created_at": int(time.time()),
+            })
+
+    return StubRazorpayHandler
+
+
+def start_stub(host: str, port: int, latency: float, error_rate: float) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), make_handler(latency, error_rate))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def bench(base_url: str, total: int, concurrency: int, pool_size: int, timeout: float):
+    gateway = RazorpayGateway(
+        key_id="rzp_test_stub", key_secret="stub_secret", base_url=base_url,
+        timeout_seconds=timeout, pool_size=pool_size
+    )
+    semaphore = asyncio.Semaphore(concurrency)
+    failures = 0
+    worst_lag = 0.0
+    done = asyncio.Event()
+
+    async def watch_loop():
+        # A blocked event loop shows up as a late wake-up here
+        nonlocal worst_lag
+        while not done.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(0.01)
+            worst_lag = max(worst_lag, time.perf_counter() - started - 0.01)
+
+    async def one(i: int):
+        nonlocal failures
+        async with semaphore:
+            try:
+                await gateway.create_order({"amount": 49900, "currency": "INR", "receipt": f"bench-{i}"})
+            except RazorpayGatewayError:
+                failures += 1
+
+    watcher = asyncio.create_task(watch_loop())
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    elapsed = time.perf_counter() - started
+    done.set()
+    await watcher
+    gateway.close()
+
+    print(f"✅ {total} orders in {elapsed:.2f}s -> {total / elapsed:.1f} req/s "
+          f"(concurrency={concurrency}, pool={pool_size}, failures={failures})")
+    print(f"⏱️  worst event-loop stall: {worst_lag * 1000:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline Razorpay stub gateway")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name in ("serve", "bench"):
+        cmd = sub.add_parser(name)
+        cmd.add_argument("--host", default="127.0.0.1")
+        cmd.add_argument("--port", type=int, default=9100)
+        cmd.add_argument("--latency", type=float, default=0.3, help="seconds per stubbed call")
+        cmd.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls answered with 503")
+        if name == "bench":
+            cmd.add_argument("--requests", type=int, default=200)
+            cmd.add_argument("--concurrency", type=int, default=50)
+            cmd.add_argument("--pool-size", type=int, default=20)
+            cmd.add_argument("--timeout", type=float, default=10.0)
+    args = parser.parse_args()
+
+    server = start_stub(args.host, args.port, args.latency, args.error_rate)
+    base_url = f"http://{args.host}:{server.server_port}/v1"
+
+    if args.command == "serve":
+        print(f"🧪 Razorpay stub listening on {base_url} (latency={args.latency}s, error_rate={args.error_rate})")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+    else:
+        asyncio.run(bench(base_url, args.requests, args.concurrency, args.pool_size, args.timeout))
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Local Razorpay webhook emitter, for load tests of the webhook inbox.
+
+Sends signed payment events to a running API the way Razorpay does: the events
+of one order in sequence (an optional failed attempt, then payment.captured),
+many orders at once, with a share of events redelivered (same event id).
+Reports acknowledgement latency and throughput.
+
+    # API started with RAZORPAY_WEBHOOK_SECRET=whsec_local
+    python -m scripts.razorpay_webhook_emitter --secret whsec_local --orders 500 --concurrency 100
+
+Orders are random ids, so the API finds no PaymentTransaction and the events
+are processed as no-ops; pass --order-id to target real orders.
+"""
+
+import argparse
+import hashlib
+import hmac
+import json
+import random
+import secrets
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+def payment_event(event: str, order_id: str) -> dict:
+    entity = {
+        "id": f"pay_emit{secrets.token_hex(7)}",
+        "entity": "payment",
+        "amount": 49900,
+        "currency": "INR",
+        "order_id": order_id,
+        "status": "captured" if event == "payment.captured" else "failed",
+    }
+    if event == "payment.failed":
+        entity["error_description"] = "emitter: card declined"
+    return {
+        "entity": "event",
+        "event": event,
+        "contains": ["payment"],
+        "payload": {"payment": {"entity": entity}},
+        "created_at": int(time.time()),
+    }
+
+
+class Emitter:
+    def __init__(self, url: str, secret: str, concurrency: int, redeliver: float, failed_first: float, timeout: float):
+        self.url = url
+        self.secret = secret.encode()
+        self.redeliver = redeliver
+        self.failed_first = failed_first
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.latencies = []
+        self.statuses = {}
+        self._lock = threading.Lock()
+
+    def send(self, body: bytes, event_id: str) -> None:
+        headers = {
+            "Content-Type": "application/json",
+            "X-Razorpay-Event-Id": event_id,
+            "X-Razorpay-Signature": hmac.new(self.secret, body, hashlib.sha256).hexdigest(),
+        }
+        started = time.perf_counter()
+        try:
+            status = self.session.post(self.url, data=body, headers=headers, timeout=self.timeout).status_code
+        except requests.RequestException:
+            status = "error"
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.latencies.append(elapsed)
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+
+    def order(self, order_id: str) -> None:
+        events = ["payment.captured"]
+        if random.random() < self.failed_first:
+            events.insert(0, "payment.failed")
+        for event in events:
+            body = json.dumps(payment_event(event, order_id)).encode()
+            event_id = f"evt_emit{secrets.token_hex(7)}"
+            self.send(body, event_id)
+            if random.random() < self.redeliver:
+                self.send(body, event_id)  # Razorpay retries when it saw no timely 2xx
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Razorpay webhook emitter")
+    parser.add_argument("--url", default="http://127.0.0.1:8000/api/v1/payments/razorpay-webhook")
+    parser.add_argument("--secret", required=True, help="RAZORPAY_WEBHOOK_SECRET of the API under test")
+    parser.add_argument("--orders", type=int, default=200)
+    parser.add_argument("--order-id", action="append", default=[], help="real razorpay_order_id to target (repeatable)")
+    parser.add_argument("--concurrency", type=int, default=50, help="orders in flight at once")
+    parser.add_argument("--redeliver", type=float, default=0.2, help="fraction of events sent twice")
+    parser.add_argument("--failed-first", type=float, default=0.1, help="fraction of orders with a failed attempt first")
+    parser.add_argument("--timeout", type=float, default=10.0)
+    args = parser.parse_args()
+
+    emitter = Emitter(args.url, args.secret, args.concurrency, args.redeliver, args.failed_first, args.timeout)
+    order_ids = args.order_id or [f"order_emit{secrets.token_hex(7)}" for _ in range(args.orders)]
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(emitter.order, order_ids))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(emitter.latencies)
+    percentile = lambda p: latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000
+    print(f"✅ {len(latencies)} deliveries for {len(order_ids)} orders in {elapsed:.2f}s "
+          f"-> {len(latencies) / elapsed:.1f} req/s (concurrency={args.concurrency})")
+    print(f"⏱️  ack latency p50={percentile(0.5):.1f} ms p95={percentile(0.95):.1f} ms "
+          f"p99={percentile(0.99):.1f} ms mean={statistics.mean(latencies) * 1000:.1f} ms")
+    print(f"📊 responses: {emitter.statuses}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+#!/usr/bin/env python3
+"""
+Rebuild the referral_closure table from users_profiles.referred_by.
+Run once after deploying on a database created via create_all (no Alembic backfill),
+or any time upline/downline counts look out of sync.
+"""
+
+import asyncio
+
+from app.core.database import AsyncSessionLocal
+from app.models.base import Base  # noqa: F401  (registers all mappers)
+from app.services.referral_tree_service import ReferralTreeService
+
+
+async def rebuild():
+    async with AsyncSessionLocal() as db:
+        rows = await ReferralTreeService().rebuild(db)
+        print(f"✅ referral_closure rebuilt: {rows} ancestor/descendant rows")
+
+
+if __name__ == "__main__":
+    asyncio.run(rebuild())
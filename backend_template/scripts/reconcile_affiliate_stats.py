@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+Verify affiliate_stats against referrals, commissions and payouts, and repair drift.
+AffiliateStats is maintained by deltas on the hot path; run this nightly (cron)
+or after any manual data fix.
+
+    python scripts/reconcile_affiliate_stats.py            # report and repair
+    python scripts/reconcile_affiliate_stats.py --dry-run  # report only
+"""
+
+import argparse
+import asyncio
+
+from app.core.database import AsyncSessionLocal
+from app.models.base import Base  # noqa: F401  (registers all mappers)
+from app.services.affiliate_stats_service import AffiliateStatsService
+
+
+async def reconcile(repair: bool):
+    async with AsyncSessionLocal() as db:
+        drift = await AffiliateStatsService().reconcile(db, repair=repair)
+
+    if not drift:
+        print("✅ affiliate_stats is consistent")
+        return
+
+    for user_id, fields in drift.items():
+        changes = ", ".join(f"{name}: {stored} -> {expected}" for name, (stored, expected) in fields.items())
+        print(f"⚠️ affiliate {user_id}: {changes}")
+    action = "repaired" if repair else "found (dry run, nothing written)"
+    print(f"{'✅' if repair else 'ℹ️'} {len(drift)} drifted affiliate_stats rows {action}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--dry-run", action="store_true", help="report drift without writing")
+    args = parser.parse_args()
+    asyncio.run(reconcile(repair=not args.dry_run))
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+List dead-lettered webhook events and put them back in the inbox.
+An event is dead once it has failed WEBHOOK_MAX_ATTEMPTS times; fix the cause first.
+
+    python scripts/replay_webhooks.py                         # list dead events
+    python scripts/replay_webhooks.py --all                   # replay every dead event
+    python scripts/replay_webhooks.py --id 12 --id 15         # replay specific events (dead or processed)
+    python scripts/replay_webhooks.py --order order_Nx1 --all # only events of one Razorpay order
+"""
+
+import argparse
+import asyncio
+
+from app.core.database import AsyncSessionLocal
+from app.models.base import Base  # noqa: F401  (registers all mappers)
+from app.services.webhook_inbox import WebhookInbox
+
+
+async def run(event_ids, replay_all: bool, order_key: str):
+    inbox = WebhookInbox()
+    async with AsyncSessionLocal() as db:
+        dead = await inbox.get_events(db, ['dead'], order_key=order_key, limit=1000)
+        if not dead and not event_ids:
+            print("✅ No dead webhook events")
+            return
+
+        for event in dead:
+            error = event.last_error.splitlines()[0] if event.last_error else "-"
+            print(f"☠️ event {event.id} {event.event_type} order={event.order_key} "
+                  f"id={event.event_id} attempts={event.attempts}: {error}")
+
+        targets = [event.id for event in dead] if replay_all else event_ids
+        for event_id in targets:
+            if await inbox.replay(db, event_id):
+                print(f"🔁 event {event_id} replayed")
+            else:
+                print(f"⚠️ event {event_id} is still pending, skipped")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--id", dest="event_ids", type=int, action="append", default=[], help="inbox event id to replay")
+    parser.add_argument("--all", action="store_true", help="replay every dead event")
+    parser.add_argument("--order", dest="order_key", help="only events of this razorpay_order_id")
+    args = parser.parse_args()
+    asyncio.run(run(args.event_ids, args.all, args.order_key))
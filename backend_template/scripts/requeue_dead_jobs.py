@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+List dead-lettered background jobs and put them back on the queue.
+A job is dead once it has failed JOB_MAX_ATTEMPTS times; fix the cause first.
+
+    python scripts/requeue_dead_jobs.py              # list dead jobs
+    python scripts/requeue_dead_jobs.py --all        # requeue every dead job
+    python scripts/requeue_dead_jobs.py --id 12 --id 15
+"""
+
+import argparse
+import asyncio
+
+from app.core.database import AsyncSessionLocal
+from app.models.base import Base  # noqa: F401  (registers all mappers)
+from app.services.job_queue import JobQueue
+
+
+async def run(job_ids, requeue_all: bool):
+    queue = JobQueue()
+    async with AsyncSessionLocal() as db:
+        dead = await queue.get_dead_jobs(db, limit=1000)
+        if not dead:
+            print("✅ No dead jobs")
+            return
+
+        for job in dead:
+            error = (job.last_error or "").splitlines()[0] if job.last_error else "-"
+            print(f"☠️ job {job.id} {job.job_type} key={job.idempotency_key} attempts={job.attempts}: {error}")
+
+        targets = [job.id for job in dead] if requeue_all else job_ids
+        for job_id in targets:
+            if await queue.requeue(db, job_id):
+                print(f"🔁 job {job_id} requeued")
+            else:
+                print(f"⚠️ job {job_id} is not dead, skipped")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--id", dest="job_ids", type=int, action="append", default=[], help="dead job id to requeue")
+    parser.add_argument("--all", action="store_true", help="requeue every dead job")
+    args = parser.parse_args()
+    asyncio.run(run(args.job_ids, args.all))
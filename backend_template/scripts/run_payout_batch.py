@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Run a monthly payout batch in this process: settle every approved payout of a book and write its bank-upload file.
+Safe to interrupt - run it again with --resume and it continues after the last settled chunk.
+
+    python scripts/run_payout_batch.py --book affiliate        # claim approved affiliate payouts and pay them
+    python scripts/run_payout_batch.py --book referral --chunk-size 1000
+    python scripts/run_payout_batch.py --resume 7              # finish a failed / interrupted batch
+    python scripts/run_payout_batch.py --list
+"""
+
+import argparse
+import asyncio
+import time
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.base import Base  # noqa: F401  (registers all mappers)
+from app.services.payout_batches import payout_batches
+from app.services.referral_ledger import BOOKS
+
+
+async def run(book, resume_id, chunk_size: int, list_only: bool):
+    async with AsyncSessionLocal() as db:
+        if list_only:
+            for batch in await payout_batches.list_batches(db):
+                print(
+                    f"🧾 batch {batch.id} {batch.book} {batch.status}: "
+                    f"{batch.payouts_settled}/{batch.payouts_claimed} payouts, ₹{batch.total_amount}"
+                    + (f", file {batch.file_key}" if batch.file_key else "")
+                )
+            return
+
+        if resume_id is None:
+            try:
+                batch = await payout_batches.create(db, book, enqueue=False)
+            except ValueError as e:
+                print(f"⚠️ {e}")
+                return
+            resume_id = batch.id
+
+        started = time.perf_counter()
+        batch = await payout_batches.run(db, resume_id, chunk_size=chunk_size)
+        print(f"⏱️ {time.perf_counter() - started:.1f}s - bank file: {batch.file_key} ({batch.file_rows} rows)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--book", choices=BOOKS, help="start a new batch for this book")
+    group.add_argument("--resume", dest="resume_id", type=int, help="batch id to resume")
+    group.add_argument("--list", action="store_true", help="list recent batches")
+    parser.add_argument("--chunk-size", type=int, default=settings.PAYOUT_BATCH_CHUNK_SIZE, help="payouts settled per commit")
+    args = parser.parse_args()
+    asyncio.run(run(args.book, args.resume_id, args.chunk_size, args.list))
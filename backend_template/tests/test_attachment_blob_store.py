@@ -0,0 +1,63 @@
+"""
+Identical uploads share one encrypted blob, and the blob is reclaimed only after
+every attachment using it has been soft-deleted.
+Runs the real upload / delete path against a SQLite file database.
+"""
+import asyncio
+import io
+import os
+
+from sqlalchemy import select
+from starlette.datastructures import Headers, UploadFile
+
+from app.models.attachment_blob import AttachmentBlob
+from app.models.support import SupportTicket
+from app.models.users import UserProfile
+from app.services.attachment_storage import LocalStorage
+from app.services.file_service import SecureFileService
+
+
+def _upload(data: bytes, filename: str = "log.txt") -> UploadFile:
+    return UploadFile(file=io.BytesIO(data), filename=filename, headers=Headers({"content-type": "text/plain"}))
+
+
+def test_identical_uploads_share_one_blob_until_all_are_deleted(session_factory, tmp_path):
+    async def run():
+        service = SecureFileService(LocalStorage(str(tmp_path), workers=1))
+        async with session_factory() as db:
+            user = UserProfile(email="user@example.com", full_name="User", hashed_password="x", role="user")
+            db.add(user)
+            await db.flush()
+            tickets = [
+                SupportTicket(user_id=user.id, ticket_number=f"T-{i}", subject="s", description="d")
+                for i in range(2)
+            ]
+            db.add_all(tickets)
+            await db.commit()
+
+            data = b"2026-10-18 12:00:00 worker ok\n" * 12000
+            first = await service.upload_file(db, _upload(data), tickets[0].id, user.id)
+            second = await service.upload_file(db, _upload(data, "copy.txt"), tickets[1].id, user.id)
+            other = await service.upload_file(db, _upload(b"something else"), tickets[1].id, user.id)
+
+            assert first.blob_id == second.blob_id != other.blob_id
+            assert first.storage_path == second.storage_path
+            assert len(list(tmp_path.glob("*.enc"))) == 2
+            blob = await db.get(AttachmentBlob, first.blob_id)
+            await db.refresh(blob)
+            assert blob.ref_count == 2
+            download = await service.download_file(db, second.id, user)
+            assert b"".join(download.chunks) == data
+
+            await service.delete_file(db, first.id, user)
+            assert await service.blob_store.collect_garbage(db, grace_seconds=0) == 0
+            assert os.path.exists(service.storage.path(first.storage_path))
+
+            await service.delete_file(db, second.id, user)
+            await service.delete_file(db, second.id, user)  # deleting twice releases once
+            assert await service.blob_store.collect_garbage(db, grace_seconds=0) == 1
+            assert not os.path.exists(service.storage.path(first.storage_path))
+            remaining = (await db.execute(select(AttachmentBlob.id))).scalars().all()
+            assert remaining == [other.blob_id]
+
+    asyncio.run(run())
@@ -0,0 +1,45 @@
+"""
+AttachmentKeyring: data keys survive a wrap / unwrap round trip through the
+stored reference, hot keys come from the LRU, and keys wrapped by another
+master key are refused.
+"""
+import asyncio
+import base64
+
+import pytest
+
+from app.services.attachment_keys import AttachmentKeyring
+
+
+def _keyring(master: bytes = b"m" * 32, cache_size: int = 2) -> AttachmentKeyring:
+    return AttachmentKeyring(secret="s", master_key=base64.b64encode(master).decode(), cache_size=cache_size, workers=1)
+
+
+def test_wrapped_data_key_round_trip_and_lru():
+    async def run():
+        writer = _keyring()
+        data_key, key_ref = await writer.new_data_key()
+        assert key_ref.startswith("dek1:") and len(key_ref) <= 100  # fits encryption_key_id
+        assert data_key.hex() not in key_ref
+
+        # Another worker process (empty cache) unwraps the same key
+        reader = _keyring()
+        assert await reader.data_key(key_ref, "file", b"") == data_key
+        assert list(reader._keys) == [key_ref]
+
+        for _ in range(3):
+            await reader.new_data_key()
+        assert len(reader._keys) == 2 and key_ref not in reader._keys
+        writer.shutdown()
+        reader.shutdown()
+
+    asyncio.run(run())
+
+
+def test_key_from_another_master_key_is_refused():
+    async def run():
+        _, key_ref = await _keyring(b"a" * 32).new_data_key()
+        with pytest.raises(ValueError):
+            await _keyring(b"b" * 32).data_key(key_ref, "file", b"")
+
+    asyncio.run(run())
@@ -0,0 +1,91 @@
+"""
+Attachment previews: an image and a PDF get a small encrypted JPEG preview via
+the background job, the endpoint answers "pending" until then, unreadable
+files are marked failed, and the blob collector removes the preview too.
+"""
+import asyncio
+import io
+import os
+
+import pypdfium2
+from PIL import Image
+from sqlalchemy import select
+from starlette.datastructures import Headers, UploadFile
+
+from app.models.attachment_blob import AttachmentBlob
+from app.models.background_job import BackgroundJob
+from app.models.support import SupportTicket
+from app.models.users import UserProfile
+from app.services.attachment_previews import AttachmentPreviewService, GENERATE_PREVIEW
+from app.services.attachment_storage import LocalStorage
+from app.services.file_service import SecureFileService
+
+
+def _png() -> bytes:
+    out = io.BytesIO()
+    Image.new("RGBA", (1600, 900), (30, 120, 200, 255)).save(out, "PNG")
+    return out.getvalue()
+
+
+def _pdf() -> bytes:
+    pdf = pypdfium2.PdfDocument.new()
+    pdf.new_page(595, 842)
+    out = io.BytesIO()
+    pdf.save(out)
+    pdf.close()
+    return out.getvalue()
+
+
+def test_previews_are_generated_served_and_collected(session_factory, tmp_path):
+    async def run():
+        files = SecureFileService(LocalStorage(str(tmp_path), workers=1))
+        previews = AttachmentPreviewService(workers=1)
+        try:
+            async with session_factory() as db:
+                user = UserProfile(email="user@example.com", full_name="User", hashed_password="x", role="user")
+                db.add(user)
+                await db.flush()
+                ticket = SupportTicket(user_id=user.id, ticket_number="T-1", subject="s", description="d")
+                db.add(ticket)
+                await db.commit()
+
+                uploads = [("shot.png", "image/png", _png()), ("invoice.pdf", "application/pdf", _pdf()),
+                           ("broken.jpg", "image/jpeg", b"\xff\xd8 not really a jpeg")]
+                attachments = []
+                for filename, mime_type, data in uploads:
+                    upload = UploadFile(file=io.BytesIO(data), filename=filename, headers=Headers({"content-type": mime_type}))
+                    attachment = await files.upload_file(db, upload, ticket.id, user.id)
+                    assert await previews.enqueue(db, attachment)
+                    attachments.append(attachment)
+                await db.commit()
+
+                assert await previews.download(db, attachments[0].id, user, files) is None
+                jobs = (await db.execute(select(BackgroundJob).where(BackgroundJob.job_type == GENERATE_PREVIEW))).scalars().all()
+                assert len(jobs) == 3
+
+                statuses = []
+                for job in jobs:
+                    statuses.append(await previews.generate(db, job.payload["blob_id"], job.payload["mime_type"], files))
+                    await db.commit()
+                assert statuses == ["ready", "ready", "failed"]
+                # Idempotent: a retried job leaves the preview alone
+                assert await previews.generate(db, jobs[0].payload["blob_id"], "image/png", files) == "ready"
+
+                for attachment in attachments[:2]:
+                    preview = await previews.download(db, attachment.id, user, files)
+                    image = Image.open(io.BytesIO(b"".join(preview.chunks)))
+                    assert image.format == "JPEG" and max(image.size) <= 320
+                    assert preview.size < 20_000
+
+                blob = await db.get(AttachmentBlob, attachments[0].blob_id)
+                preview_path = files.storage.path(blob.preview_key)
+                assert os.path.exists(preview_path)
+                assert b"JFIF" not in open(preview_path, "rb").read()  # stored encrypted
+
+                await files.delete_file(db, attachments[0].id, user)
+                assert await files.blob_store.collect_garbage(db, grace_seconds=0) == 1
+                assert not os.path.exists(preview_path)
+        finally:
+            previews.shutdown()
+
+    asyncio.run(run())
@@ -0,0 +1,84 @@
+"""
+Auth user cache: a committed role, account_status or password change drops the
+cached principal - through an ORM flush or a bulk update(), with or without
+execution_options(user_ids=[...]) - while a rolled-back change keeps it.
+Runs get_current_user against a SQLite file database.
+"""
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+from sqlalchemy import update
+
+from app.core.security import auth_user_cache, create_access_token, get_current_user
+from app.models.users import UserProfile
+
+
+def _token(user_id):
+    return HTTPAuthorizationCredentials(scheme="Bearer", credentials=create_access_token(user_id))
+
+
+async def _login(session_factory, user_id):
+    async with session_factory() as db:
+        return await get_current_user(db=db, token=_token(user_id))
+
+
+def test_committed_user_writes_drop_the_cached_principal(session_factory):
+    async def run():
+        auth_user_cache.clear()
+        async with session_factory() as db:
+            users = [
+                UserProfile(email=f"user{n}@example.com", full_name="User", hashed_password="old")
+                for n in range(2)
+            ]
+            db.add_all(users)
+            await db.commit()
+            alice, bob = (user.id for user in users)
+
+        for user_id in (alice, bob):
+            await _login(session_factory, user_id)
+            assert auth_user_cache.get(user_id) is not None
+
+        # Role change through the ORM: cached until the commit, then reloaded
+        async with session_factory() as db:
+            user = await db.get(UserProfile, alice)
+            user.role = "admin"
+            await db.flush()
+            assert auth_user_cache.get(alice) is not None
+            await db.commit()
+        assert auth_user_cache.get(alice) is None and auth_user_cache.get(bob) is not None
+        assert (await _login(session_factory, alice)).role == "admin"
+
+        # A rolled-back change keeps the entry
+        async with session_factory() as db:
+            user = await db.get(UserProfile, alice)
+            user.account_status = "suspended"
+            await db.flush()
+            await db.rollback()
+        assert auth_user_cache.get(alice).account_status == "active"
+
+        # Bulk password update naming its rows drops only those users
+        async with session_factory() as db:
+            await db.execute(
+                update(UserProfile).where(UserProfile.id == alice).values(hashed_password="new")
+                .execution_options(user_ids=[alice])
+            )
+            await db.commit()
+        assert auth_user_cache.get(alice) is None and auth_user_cache.get(bob) is not None
+        assert (await _login(session_factory, alice)).hashed_password == "new"
+
+        # Bulk status update without user_ids can't name its rows: everything is dropped
+        async with session_factory() as db:
+            await db.execute(update(UserProfile).where(UserProfile.id == bob).values(account_status="suspended"))
+            await db.rollback()
+        assert auth_user_cache.get(bob) is not None
+        async with session_factory() as db:
+            await db.execute(update(UserProfile).where(UserProfile.id == bob).values(account_status="suspended"))
+            await db.commit()
+        assert auth_user_cache.get(alice) is None and auth_user_cache.get(bob) is None
+        with pytest.raises(HTTPException) as refused:
+            await _login(session_factory, bob)
+        assert refused.value.status_code == 403
+
+    asyncio.run(run())
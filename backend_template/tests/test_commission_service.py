@@ -0,0 +1,90 @@
+"""
+Commission crediting: every level is credited with set-based statements, a
+payment is credited only once, and rate edits reach the cached rates.
+Runs the real CommissionService against a SQLite file database.
+"""
+import asyncio
+from decimal import Decimal
+
+from sqlalchemy import select, update
+
+from app.models.payment import (
+    ActivationType, PaymentStatus, PaymentTransaction, PaymentType, ReferralCommissionRate
+)
+from app.models.referrals import ReferralEarning
+from app.models.users import UserProfile
+from app.services.commission_service import CommissionService, commission_rate_cache
+
+
+def _user(name: str, **chain) -> UserProfile:
+    return UserProfile(email=f"{name}@example.com", full_name=name, hashed_password="x", role="user", **chain)
+
+
+def _payment(user_id: int, order_id: int, amount: str) -> PaymentTransaction:
+    return PaymentTransaction(
+        user_id=user_id,
+        order_id=order_id,
+        payment_type=PaymentType.SERVER,
+        activation_type=ActivationType.REFERRAL,
+        subtotal=Decimal(amount),
+        total_amount=Decimal(amount),
+        refunded_amount=Decimal("0.00"),
+        razorpay_order_id=f"order_{order_id}",
+        payment_status=PaymentStatus.PAID,
+        payment_metadata={"enable_commission": True},
+    )
+
+
+def test_commission_is_credited_to_every_level_once_with_cached_rates(session_factory):
+    async def run():
+        commission_rate_cache.clear()
+        service = CommissionService()
+        async with session_factory() as db:
+            await service.seed_default_commission_rates(db)
+            top, middle, direct = _user("top"), _user("middle"), _user("direct")
+            db.add_all([top, middle, direct])
+            await db.flush()
+            buyers = [
+                _user(f"buyer{i}", referred_by=direct.id, referral_level_1=direct.id,
+                      referral_level_2=middle.id, referral_level_3=top.id)
+                for i in range(2)
+            ]
+            db.add_all(buyers)
+            await db.flush()
+            payments = [_payment(buyers[0].id, 1, "1000.00"), _payment(buyers[1].id, 2, "500.00")]
+            db.add_all(payments)
+            await db.commit()
+
+            earnings = await service.distribute_commission(db, payments[0].id)
+            assert [(e.level, e.user_id, e.commission_amount) for e in earnings] == [
+                (1, direct.id, Decimal("80.00")),
+                (2, middle.id, Decimal("40.00")),
+                (3, top.id, Decimal("20.00")),
+            ]
+            # A second run of the same payment credits nothing new
+            assert await service.distribute_commission(db, payments[0].id) == []
+            assert len((await db.execute(select(ReferralEarning.id))).all()) == 3
+
+            # Rate edits committed here invalidate the cached rates
+            await db.execute(
+                update(ReferralCommissionRate)
+                .where(ReferralCommissionRate.payment_type == PaymentType.SERVER, ReferralCommissionRate.level == 1)
+                .values(commission_percent=Decimal("10.00"))
+            )
+            await db.commit()
+            await service.distribute_commission(db, payments[1].id)
+
+            rows = await db.execute(
+                select(UserProfile.id, UserProfile.total_earnings, UserProfile.available_balance,
+                       UserProfile.l1_referrals, UserProfile.l2_referrals, UserProfile.l3_referrals)
+                .where(UserProfile.id.in_([direct.id, middle.id, top.id]))
+                .order_by(UserProfile.id)
+            )
+            assert [tuple(row) for row in rows] == [
+                (top.id, Decimal("30.00"), Decimal("30.00"), 0, 0, 2),
+                (middle.id, Decimal("60.00"), Decimal("60.00"), 0, 2, 0),
+                (direct.id, Decimal("130.00"), Decimal("130.00"), 2, 0, 0),
+            ]
+            assert len((await db.execute(select(ReferralEarning.id))).all()) == 6
+
+    asyncio.run(run())
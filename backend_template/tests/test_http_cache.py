@@ -0,0 +1,77 @@
+"""
+HttpCacheMiddleware: public catalog routes get an ETag and are revalidated with
+304 without running the endpoint again; every other route stays no-store.
+
+Driven as a raw ASGI app (httpx / TestClient are not dependencies here).
+"""
+import asyncio
+
+from fastapi import FastAPI
+
+from app.core.config import settings
+from app.core.http_cache import HttpCacheMiddleware
+
+calls = {"plan-types": 0}
+app = FastAPI()
+app.add_middleware(HttpCacheMiddleware)
+
+
+@app.get(f"{settings.API_V1_STR}/pricing/plan-types")
+async def plan_types():
+    calls["plan-types"] += 1
+    return [{"id": "general_purpose"}]
+
+
+@app.get(f"{settings.API_V1_STR}/orders/")
+async def orders():
+    return []
+
+
+async def _get(path: str, if_none_match: str = None):
+    headers = [(b"host", b"testserver")]
+    if if_none_match:
+        headers.append((b"if-none-match", if_none_match.encode()))
+    scope = {
+        "type": "http", "method": "GET", "path": path, "raw_path": path.encode(), "query_string": b"",
+        "root_path": "", "headers": headers, "scheme": "http", "server": ("testserver", 80),
+        "client": ("127.0.0.1", 1), "http_version": "1.1", "asgi": {"version": "3.0"},
+    }
+    messages, done, received = [], asyncio.Event(), []
+
+    async def receive():
+        if not received:
+            received.append(True)
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        messages.append(message)
+        if message["type"] == "http.response.body" and not message.get("more_body"):
+            done.set()
+
+    await app(scope, receive, send)
+    headers = {k.decode(): v.decode() for k, v in messages[0]["headers"]}
+    return messages[0]["status"], headers, b"".join(m.get("body", b"") for m in messages[1:])
+
+
+def test_catalog_route_is_public_and_revalidates_without_running_endpoint():
+    async def run():
+        path = f"{settings.API_V1_STR}/pricing/plan-types"
+        status, headers, body = await _get(path)
+        assert status == 200 and body
+        assert headers["cache-control"] == f"public, max-age={settings.REFERENCE_CACHE_MAX_AGE_SECONDS}"
+
+        status, revalidated, body = await _get(path, if_none_match=f'W/{headers["etag"]}')
+        assert status == 304 and body == b""
+        assert revalidated["etag"] == headers["etag"]
+        assert calls["plan-types"] == 1
+
+    asyncio.run(run())
+
+
+def test_other_routes_stay_no_store():
+    status, headers, _ = asyncio.run(_get(f"{settings.API_V1_STR}/orders/"))
+    assert status == 200
+    assert headers["cache-control"] == "no-cache, no-store, must-revalidate"
+    assert "etag" not in headers
@@ -0,0 +1,155 @@
+"""
+Idempotency keys: concurrent duplicates wait for the original and replay its
+response, a key reused for a different body is refused, a request refused
+before committing releases its key, and one cancelled or failing after it
+committed keeps it - even past the lock timeout. Runs the real store against
+a SQLite file database.
+"""
+import asyncio
+import json
+
+import pytest
+from fastapi import HTTPException
+from pydantic import BaseModel
+from starlette.requests import Request
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.models.idempotency_key import IdempotencyKey
+from app.models.users import UserProfile
+from app.services.idempotency import REPLAYED_HEADER, IdempotencyStore
+
+
+class OrderIn(BaseModel):
+    plan_id: int
+    quantity: int = 1
+
+
+class OrderOut(BaseModel):
+    order_number: str
+    quantity: int
+
+
+def _request(path="/api/v1/orders/"):
+    return Request({"type": "http", "method": "POST", "path": path, "headers": [], "query_string": b""})
+
+
+def test_duplicates_replay_the_first_response_and_failures_release_the_key(session_factory):
+    async def run():
+        store = IdempotencyStore(session_factory=session_factory)
+        async with session_factory() as db:
+            user = UserProfile(email="buyer@example.com", full_name="Buyer", hashed_password="x", role="user")
+            db.add(user)
+            await db.commit()
+            user_id = user.id
+
+        created = []
+
+        async def create_order():
+            await asyncio.sleep(0.2)
+            created.append(1)
+            return {"order_number": f"ORD-{len(created)}", "quantity": 2, "internal": "dropped by response_model"}
+
+        # A checkout retried three times at once creates one order
+        payload = OrderIn(plan_id=7, quantity=2)
+        responses = await asyncio.gather(*[
+            store.run(_request(), "checkout-1", user_id, payload, create_order, OrderOut) for _ in range(3)
+        ])
+        assert len(created) == 1
+        bodies = [json.loads(response.body) for response in responses]
+        assert bodies == [{"order_number": "ORD-1", "quantity": 2}] * 3
+        assert sorted(response.headers.get(REPLAYED_HEADER, "") for response in responses) == ["", "true", "true"]
+
+        # A later retry replays too; the same key on a different request is refused
+        replay = await store.run(_request(), "checkout-1", user_id, payload, create_order, OrderOut)
+        assert json.loads(replay.body)["order_number"] == "ORD-1" and len(created) == 1
+        with pytest.raises(HTTPException) as refused:
+            await store.run(_request(), "checkout-1", user_id, OrderIn(plan_id=8), create_order, OrderOut)
+        assert refused.value.status_code == 422
+
+        # A failed request releases its key: the retry runs
+        async def gateway_down():
+            raise HTTPException(status_code=500, detail="Failed to create payment order")
+
+        with pytest.raises(HTTPException):
+            await store.run(_request("/api/v1/payments/create-order"), "pay-1", user_id, payload, gateway_down)
+        retried = await store.run(_request("/api/v1/payments/create-order"), "pay-1", user_id, payload, create_order)
+        assert json.loads(retried.body)["order_number"] == "ORD-2"
+
+        # Without the header nothing is stored
+        assert (await store.run(_request(), None, user_id, payload, create_order))["order_number"] == "ORD-3"
+
+    asyncio.run(run())
+
+
+def test_a_request_cancelled_after_creating_the_order_keeps_its_key(session_factory, monkeypatch):
+    async def run():
+        store = IdempotencyStore(session_factory=session_factory)
+        monkeypatch.setattr(settings, "IDEMPOTENCY_WAIT_SECONDS", 0.3)
+        async with session_factory() as db:
+            user = UserProfile(email="buyer@example.com", full_name="Buyer", hashed_password="x", role="user")
+            db.add(user)
+            await db.commit()
+            user_id = user.id
+
+        created = asyncio.Event()
+        orders = []
+
+        async def create_order(db):
+            db.add(UserProfile(email=f"order{len(orders)}@example.com", full_name="Order", hashed_password="x", role="user"))
+            await db.commit()  # the order exists from here on
+            orders.append(1)
+            created.set()
+            await asyncio.sleep(10)  # building the response when the client disconnects
+
+        async def _created():
+            return {"order_number": "ORD-4"}
+
+        payload = OrderIn(plan_id=7)
+
+        # Cancelled after committing: the key is marked committed and the retry does not run again
+        async with session_factory() as db:
+            task = asyncio.create_task(
+                store.run(_request(), "checkout-2", user_id, payload, lambda: create_order(db), db=db)
+            )
+            await created.wait()
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+        async with session_factory() as db:
+            record = await db.scalar(select(IdempotencyKey).where(IdempotencyKey.key == "checkout-2"))
+            assert record.status == "committed"
+        async with session_factory() as db:
+            with pytest.raises(HTTPException) as pending:
+                await store.run(_request(), "checkout-2", user_id, payload, lambda: create_order(db), db=db)
+        assert pending.value.status_code == 409 and len(orders) == 1
+
+        # Not even after the lock timeout: only a key whose request never committed is taken over
+        monkeypatch.setattr(settings, "IDEMPOTENCY_LOCK_TIMEOUT_SECONDS", 0)
+        async with session_factory() as db:
+            with pytest.raises(HTTPException) as pending:
+                await store.run(_request(), "checkout-2", user_id, payload, lambda: create_order(db), db=db)
+        assert pending.value.status_code == 409 and len(orders) == 1
+
+        async def abandoned():
+            raise asyncio.CancelledError()  # cancelled before it wrote anything
+
+        with pytest.raises(asyncio.CancelledError):
+            await store.run(_request(), "checkout-4", user_id, payload, abandoned)
+        retried = await store.run(_request(), "checkout-4", user_id, payload, lambda: _created())
+        assert json.loads(retried.body) == {"order_number": "ORD-4"}
+
+        # An HTTPException raised after a commit keeps the key as well
+        async def fails_after_commit(db):
+            db.add(UserProfile(email="late@example.com", full_name="Late", hashed_password="x", role="user"))
+            await db.commit()
+            raise HTTPException(status_code=500, detail="Error creating order")
+
+        async with session_factory() as db:
+            with pytest.raises(HTTPException):
+                await store.run(_request(), "checkout-3", user_id, payload, lambda: fails_after_commit(db), db=db)
+        async with session_factory() as db:
+            record = await db.scalar(select(IdempotencyKey).where(IdempotencyKey.key == "checkout-3"))
+            assert record.status == "committed"
+
+    asyncio.run(run())
@@ -0,0 +1,97 @@
+"""
+Job queue: enqueueing a key twice - even from two transactions at once - stores
+one job, workers claim due jobs, failures are retried with backoff and a job
+is dead-lettered once its attempts are used up. Runs the real queue / worker
+against a SQLite file database.
+"""
+import asyncio
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update
+
+from app.core.config import settings
+from app.models.background_job import BackgroundJob
+from app.models.users import UserProfile
+from app.services.job_queue import JobQueue, JobWorker, job_handler
+
+calls = []
+
+
+@job_handler("test.ok")
+async def ok(db, payload):
+    calls.append(("ok", payload["n"]))
+
+
+@job_handler("test.flaky")
+async def flaky(db, payload):
+    calls.append(("flaky", payload["n"]))
+    raise RuntimeError("upstream down")
+
+
+async def _jobs(db):
+    result = await db.execute(select(BackgroundJob).order_by(BackgroundJob.id).execution_options(populate_existing=True))
+    return result.scalars().all()
+
+
+def test_concurrent_enqueues_of_one_key_store_one_job_and_both_commit(session_factory):
+    async def run():
+        queue = JobQueue()
+        async with session_factory() as first, session_factory() as second:
+            # The webhook consumer enqueues first and holds its transaction open...
+            assert await queue.enqueue(first, "test.ok", {"n": 1}, "commission:1")
+            # ...while verify-payment enqueues the same key with its own changes
+            second.add(UserProfile(email="buyer@example.com", full_name="Buyer", hashed_password="x", role="user"))
+            racing = asyncio.create_task(queue.enqueue(second, "test.ok", {"n": 1}, "commission:1"))
+            await asyncio.sleep(0.1)
+            await first.commit()
+            assert not await racing
+            await second.commit()  # no unique-key failure: the buyer's changes are kept
+
+        async with session_factory() as db:
+            assert [job.idempotency_key for job in await _jobs(db)] == ["commission:1"]
+            assert await db.scalar(select(UserProfile.email)) == "buyer@example.com"
+            assert not await queue.enqueue(db, "test.ok", {"n": 1}, "commission:1")
+
+    asyncio.run(run())
+
+
+def test_worker_claims_retries_and_dead_letters(session_factory):
+    async def run():
+        calls.clear()
+        queue = JobQueue()
+        worker = JobWorker(session_factory=session_factory, concurrency=1)
+        async with session_factory() as db:
+            await queue.enqueue(db, "test.ok", {"n": 1}, "ok:1")
+            await queue.enqueue(db, "test.flaky", {"n": 2}, "flaky:2", max_attempts=2)
+            await queue.enqueue(db, "test.ok", {"n": 3}, "ok:3", delay_seconds=3600)  # not due yet
+            await db.commit()
+
+            # Due jobs are claimed in order; the delayed one waits
+            assert await worker.run_once() == 1
+            assert await worker.run_once() == 2
+            assert await worker.run_once() is None
+            ok_job, flaky_job, delayed = await _jobs(db)
+            assert (ok_job.status, ok_job.attempts, ok_job.completed_at is not None) == ("succeeded", 1, True)
+            assert delayed.status == "queued" and delayed.attempts == 0
+
+            # The failure is queued again after the backoff, with its error kept
+            assert (flaky_job.status, flaky_job.attempts) == ("queued", 1)
+            assert "upstream down" in flaky_job.last_error
+            backoff = flaky_job.run_after.replace(tzinfo=None) - datetime.utcnow()
+            assert timedelta(seconds=settings.JOB_RETRY_BASE_SECONDS - 5) < backoff
+
+            # Due again: the second failure uses up its attempts and dead-letters it
+            await db.execute(update(BackgroundJob).where(BackgroundJob.id == 2).values(run_after=datetime.utcnow()))
+            await db.commit()
+            assert await worker.run_once() == 2
+            _, flaky_job, _ = await _jobs(db)
+            assert (flaky_job.status, flaky_job.attempts) == ("dead", 2)
+            assert [job.id for job in await queue.get_dead_jobs(db)] == [2]
+
+            # Requeued by an admin, it gets a fresh set of attempts
+            assert await queue.requeue(db, 2)
+            _, flaky_job, _ = await _jobs(db)
+            assert (flaky_job.status, flaky_job.attempts) == ("queued", 0)
+            assert calls == [("ok", 1), ("flaky", 2), ("flaky", 2)]
+
+    asyncio.run(run())
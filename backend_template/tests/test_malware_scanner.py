@@ -0,0 +1,102 @@
+"""
+Streaming malware scan: the signature automaton agrees with a naive search
+however the stream is chunked, honours header-only signatures, and the ClamAV
+engine speaks clamd's INSTREAM protocol (against an in-process fake clamd).
+"""
+import asyncio
+import random
+import struct
+
+from app.services.malware_scanner import (
+    ClamAVScanner, MalwareScanner, Signature, SignatureAutomaton, SignatureScanner, SignatureSession,
+)
+
+
+def _scan(automaton: SignatureAutomaton, data: bytes, piece: int):
+    session = SignatureSession(automaton)
+    for i in range(0, len(data), piece):
+        session.scan(data[i:i + piece])
+    return session.match
+
+
+def _naive(signatures, data: bytes):
+    hits = []
+    for signature in signatures:
+        limit = len(data) if signature.max_offset is None else signature.max_offset + len(signature.pattern) - 1
+        position = data.find(signature.pattern, 0, limit)
+        if position >= 0:
+            hits.append((position + len(signature.pattern), signature))
+    # The first match to complete stops the scan; several can complete on the same byte
+    first_end = min((end for end, _ in hits), default=None)
+    return {signature for end, signature in hits if end == first_end} or {None}
+
+
+def test_automaton_matches_naive_search_across_chunk_boundaries():
+    # Overlapping patterns (prefixes, suffixes, repeats) over a small alphabet
+    signatures = [
+        Signature("ab", b"ab", 8), Signature("bab", b"bab"), Signature("abcab", b"abcab"),
+        Signature("cc", b"cc", 0), Signature("bcb", b"bcb"), Signature("aaaa", b"aaaa"),
+    ]
+    automaton = SignatureAutomaton(signatures)
+    rng = random.Random(19)
+    for _ in range(2000):
+        data = bytes(rng.choice(b"abcx") for _ in range(rng.randint(0, 40)))
+        expected = _naive(signatures, data)
+        for piece in (1, 3, 7, 64):
+            assert _scan(automaton, data, piece) in expected, (data, piece)
+
+
+def test_default_signatures_scan_whole_file():
+    async def run():
+        scanner = MalwareScanner([SignatureScanner()])
+        clean = b"\x00" * 5000 + b"MZ" + b"\x00" * 5000  # "MZ" only counts as a file header
+
+        for data, status in [(clean, "clean"), (b"\x7fELF" + clean, "infected"),
+                             (clean + b"<scr" + b"ipt>alert(1)", "infected")]:
+            session = await scanner.open()
+            for i in range(0, len(data), 4096):
+                await session.feed(data[i:i + 4096])
+            assert (await session.finish()).status == status
+
+    asyncio.run(run())
+
+
+def test_clamav_instream_protocol():
+    async def run():
+        received = []
+
+        async def clamd(reader, writer):
+            assert await reader.readuntil(b"\0") == b"zINSTREAM\0"
+            body = b""
+            while True:
+                (size,) = struct.unpack(">I", await reader.readexactly(4))
+                if size == 0:
+                    break
+                body += await reader.readexactly(size)
+            received.append(body)
+            writer.write(b"stream: Eicar-Signature FOUND\0" if b"EICAR" in body else b"stream: OK\0")
+            await writer.drain()
+            writer.close()
+
+        server = await asyncio.start_server(clamd, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        scanner = MalwareScanner([ClamAVScanner(host="127.0.0.1", port=port, socket_path=None, timeout_seconds=5)])
+        try:
+            for data, status in [(b"hello " * 1000, "clean"), (b"xx EICAR xx", "infected")]:
+                session = await scanner.open()
+                await session.feed(data[:100])
+                await session.feed(data[100:])
+                result = await session.finish()
+                await session.close()
+                assert result.status == status, result
+                assert received[-1] == data
+        finally:
+            server.close()
+            await server.wait_closed()
+
+        # clamd down: the upload is flagged, not silently passed
+        session = await scanner.open()
+        await session.feed(b"data")
+        assert (await session.finish()).status == "error"
+
+    asyncio.run(run())
@@ -0,0 +1,56 @@
+"""
+NumberAllocator must hand out unique numbers when several processes share the
+counter table, and touch the database only once per block.
+
+Two allocator instances stand in for two worker processes; they share one
+SQLite file database.
+"""
+import asyncio
+from datetime import datetime
+
+from sqlalchemy import event
+
+from app.models.support import SupportTicket
+from app.models.users import UserProfile
+from app.services.number_allocator import NumberAllocator
+
+
+def test_parallel_allocators_never_collide(session_factory):
+    queries = {"count": 0}
+
+    @event.listens_for(session_factory.kw["bind"].sync_engine, "before_cursor_execute")
+    def _count(*args, **kwargs):
+        queries["count"] += 1
+
+    async def run():
+        workers = [NumberAllocator(session_factory=session_factory, block_size=10) for _ in range(2)]
+        return await asyncio.gather(*(
+            workers[i % 2].next_value("order:test") for i in range(200)
+        ))
+
+    values = asyncio.run(run())
+    assert len(set(values)) == 200
+    assert min(values) == 1
+    # One UPDATE per 10-number block (plus the one-time row insert), never one per number
+    assert queries["count"] <= 2 * (200 // 10) + 4, queries["count"]
+
+
+def test_new_sequence_continues_after_existing_numbers(session_factory):
+    year_prefix = f"TICK-{datetime.now().year}"
+
+    async def run():
+        async with session_factory() as db:
+            user = UserProfile(email="user@example.com", full_name="User", hashed_password="x")
+            db.add(user)
+            await db.flush()
+            # Numbers issued before the counter row existed, including the old 3-digit format
+            for number in ("099", "0100", "1041"):
+                db.add(SupportTicket(
+                    user_id=user.id, ticket_number=f"{year_prefix}-{number}",
+                    subject="s", description="d"
+                ))
+            await db.commit()
+
+        return await NumberAllocator(session_factory=session_factory, block_size=5).ticket_number()
+
+    assert asyncio.run(run()) == f"{year_prefix}-1042"
@@ -0,0 +1,185 @@
+"""
+Payout batches: a run claims every approved payout, settles commissions /
+earnings with set-based statements, resumes after a crash without paying
+anything twice, and streams a bank-upload file. Runs the real service against
+a SQLite file database.
+"""
+import asyncio
+import csv
+import io
+import json
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import select
+
+from app.models.affiliate import AffiliateStats, Commission, CommissionStatus, Payout, PayoutStatus
+from app.models.referrals import ReferralEarning, ReferralPayout
+from app.models.users import UserProfile
+from app.services.attachment_storage import LocalStorage
+from app.services.payout_batches import PayoutBatchService
+from app.services.referral_ledger import AFFILIATE_BOOK, REFERRAL_BOOK, referral_ledger
+
+
+async def _bank_file_rows(service, key):
+    size = await service.storage.size(key)
+    data = b"".join([chunk async for chunk in service.bank_file_chunks(key, size, chunk_size=7)])
+    return list(csv.DictReader(io.StringIO(data.decode())))
+
+
+def test_affiliate_batch_resumes_after_a_crash_and_pays_once(session_factory, tmp_path):
+    async def run():
+        service = PayoutBatchService()
+        service._storage = LocalStorage(str(tmp_path))
+        try:
+            async with session_factory() as db:
+                alice = UserProfile(email="alice@example.com", full_name="Alice", hashed_password="x", role="user")
+                carol = UserProfile(email="carol@example.com", full_name="Carol", hashed_password="x", role="user")
+                db.add_all([alice, carol])
+                await db.commit()
+                alice_id, carol_id = alice.id, carol.id
+
+                def commission(user_id, amount):
+                    return Commission(
+                        affiliate_user_id=user_id, level=1, order_amount=amount, commission_rate=Decimal("10"),
+                        commission_amount=amount, status=CommissionStatus.APPROVED
+                    )
+
+                db.add_all([commission(alice_id, Decimal("300.00")) for _ in range(3)])
+                db.add_all([commission(carol_id, Decimal("500.00")) for _ in range(2)])
+                details = json.dumps({"account_holder": "Alice A", "account_number": "123456789", "ifsc_code": "HDFC0001234"})
+                payouts = [
+                    Payout(affiliate_user_id=alice_id, amount=Decimal("600.00"), payment_method="bank_transfer",
+                           payment_details=details, status=PayoutStatus.PROCESSING),
+                    Payout(affiliate_user_id=carol_id, amount=Decimal("500.00"), payment_method="upi",
+                           payment_details=json.dumps({"upi_id": "carol@upi"}), status=PayoutStatus.PROCESSING),
+                    Payout(affiliate_user_id=carol_id, amount=Decimal("400.00"), payment_method="upi",
+                           payment_details=json.dumps({"upi_id": "carol@upi"}), status=PayoutStatus.PROCESSING),
+                    Payout(affiliate_user_id=carol_id, amount=Decimal("50.00"), payment_method="upi",
+                           status=PayoutStatus.PENDING),  # not approved: stays out of the batch
+                ]
+                db.add_all(payouts)
+                await db.flush()
+                payout_ids = [payout.id for payout in payouts]
+                await referral_ledger.credit_earnings(
+                    db, AFFILIATE_BOOK, "earning:test", [(alice_id, Decimal("900.00")), (carol_id, Decimal("1000.00"))], "test", 1
+                )
+                for payout in payouts[:3]:
+                    await referral_ledger.hold_payout(db, AFFILIATE_BOOK, payout.affiliate_user_id, payout.amount, "payout", payout.id)
+                await db.commit()
+
+                batch = await service.create(db, AFFILIATE_BOOK, enqueue=False)
+                batch_id = batch.id
+                assert batch.payouts_claimed == 3
+                with pytest.raises(ValueError):
+                    await service.create(db, AFFILIATE_BOOK, enqueue=False)
+
+                # Crash while settling the second chunk
+                settle = service.complete_affiliate_payouts
+                calls = []
+
+                async def crash_on_second_chunk(*args, **kwargs):
+                    calls.append(args)
+                    if len(calls) == 2:
+                        raise RuntimeError("worker killed")
+                    return await settle(*args, **kwargs)
+
+                service.complete_affiliate_payouts = crash_on_second_chunk
+                with pytest.raises(RuntimeError):
+                    await service.run(db, batch_id, chunk_size=1)
+                service.complete_affiliate_payouts = settle
+
+                batch = await service.run(db, batch_id, chunk_size=1)
+                assert (batch.status, batch.payouts_settled, batch.total_amount) == ("completed", 3, Decimal("1500.00"))
+
+                statuses = (await db.execute(
+                    select(Payout.status).where(Payout.id.in_(payout_ids)).order_by(Payout.id)
+                )).scalars().all()
+                assert statuses == [PayoutStatus.COMPLETED] * 3 + [PayoutStatus.PENDING]
+
+                # Oldest commissions first, up to each payout amount
+                paid = (await db.execute(
+                    select(Commission.affiliate_user_id, Commission.status, Commission.payout_id).order_by(Commission.id)
+                )).all()
+                assert [(status, payout) for user, status, payout in paid if user == alice_id] == [
+                    (CommissionStatus.PAID, payout_ids[0]), (CommissionStatus.PAID, payout_ids[0]), (CommissionStatus.APPROVED, None)
+                ]
+                assert all(status == CommissionStatus.PAID for user, status, _ in paid if user == carol_id)
+
+                # Ledger settled once, stats follow the payouts
+                balance = await referral_ledger.get_balance(db, carol_id, AFFILIATE_BOOK)
+                await db.refresh(balance)
+                assert (balance.available, balance.held, balance.total_paid_out) == (
+                    Decimal("100.00"), Decimal("0.00"), Decimal("900.00")
+                )
+                stats = await db.scalar(select(AffiliateStats).where(AffiliateStats.affiliate_user_id == alice_id))
+                assert (stats.total_payouts, stats.paid_commission, stats.approved_commission) == (
+                    1, Decimal("600.00"), Decimal("300.00")
+                )
+
+                rows = await _bank_file_rows(service, batch.file_key)
+                assert [(row["beneficiary_name"], row["amount"]) for row in rows] == [
+                    ("Alice A", "600.00"), ("Carol", "500.00"), ("Carol", "400.00")
+                ]
+                assert rows[0]["account_number"] == "123456789" and rows[1]["upi_id"] == "carol@upi"
+
+                # Running a completed batch again changes nothing
+                assert (await service.run(db, batch_id)).payouts_settled == 3
+        finally:
+            service.storage.shutdown()
+
+    asyncio.run(run())
+
+
+def test_referral_payout_completion_marks_earnings_paid_in_one_statement(session_factory, tmp_path):
+    async def run():
+        service = PayoutBatchService()
+        service._storage = LocalStorage(str(tmp_path))
+        try:
+            async with session_factory() as db:
+                users = [
+                    UserProfile(email=f"user{n}@example.com", full_name=f"User {n}", hashed_password="x", role="user")
+                    for n in range(3)
+                ]
+                db.add_all(users)
+                await db.commit()
+                user_ids = [user.id for user in users]
+
+                db.add_all([
+                    ReferralEarning(user_id=user_id, referred_user_id=user_ids[2], order_id=1, level=1,
+                                    commission_rate=Decimal("5"), order_amount=Decimal("1000"),
+                                    commission_amount=Decimal("50"), status="pending")
+                    for user_id in user_ids for _ in range(2)
+                ])
+                db.add_all([
+                    ReferralPayout(user_id=user_id, payout_number=f"PAY-{user_id}", gross_amount=Decimal("500.00"),
+                                   tds_amount=Decimal("50.00"), net_amount=Decimal("450.00"),
+                                   status="approved" if user_id != user_ids[2] else "requested",
+                                   payment_method="bank_transfer", tax_year="2026", tax_quarter="Q3",
+                                   bank_account_details={"account_holder": f"Holder {user_id}", "account_number": "987654321"})
+                    for user_id in user_ids
+                ])
+                await db.commit()
+
+                batch = await service.create(db, REFERRAL_BOOK, enqueue=False)
+                batch = await service.run(db, batch.id, chunk_size=500)
+                assert (batch.payouts_settled, batch.total_amount, batch.file_rows) == (2, Decimal("900.00"), 2)
+
+                earnings = (await db.execute(
+                    select(ReferralEarning.user_id, ReferralEarning.status, ReferralEarning.paid_at)
+                )).all()
+                for user_id, status, paid_at in earnings:
+                    expected = "pending" if user_id == user_ids[2] else "paid"
+                    assert status == expected and (paid_at is not None) == (expected == "paid")
+
+                rows = await _bank_file_rows(service, batch.file_key)
+                assert [(row["payout_reference"], row["amount"]) for row in rows] == [
+                    (f"PAY-{user_ids[0]}", "450.00"), (f"PAY-{user_ids[1]}", "450.00")
+                ]
+                # Nothing approved is left for a second run
+                with pytest.raises(ValueError):
+                    await service.create(db, REFERRAL_BOOK, enqueue=False)
+        finally:
+            service.storage.shutdown()
+
+    asyncio.run(run())
@@ -0,0 +1,108 @@
+"""
+Property checks for the shared pricing engine, plus a check that its work grows linearly with the cart.
+
+Random carts (seeded, so failures reproduce) are priced by price_cart() and
+compared against a straightforward reference: discount and GST computed once on
+the cart total, rounded half-up to the paisa. Order lines and invoice items must
+add up to exactly the same totals the quote reports.
+"""
+import random
+from decimal import Decimal, ROUND_HALF_UP
+
+from app.services import pricing_engine
+from app.services.pricing_engine import (
+    BILLING_TERMS, CENT, GST_PERCENT, LineItem, billing_terms, cycle_discount_percent, price_cart,
+)
+
+
+def _round(value: Decimal) -> Decimal:
+    return value.quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def _random_cart(rng: random.Random, size: int):
+    months, _, discount = BILLING_TERMS[rng.choice(list(BILLING_TERMS))]
+    items = [LineItem('plan', 'Plan', Decimal(rng.randint(100, 5_000_000)) / 100, Decimal(rng.randint(1, 20)), months)]
+    for i in range(size - 1):
+        items.append(LineItem(
+            rng.choice(('addon', 'service')), f'Item {i}',
+            Decimal(rng.randint(0, 2_000_000)) / 100, Decimal(rng.randint(1, 500)), months,
+        ))
+    return items, discount
+
+
+def _reference(items, discount_percent):
+    subtotal = sum(_round(i.unit_price * i.quantity * i.months) for i in items)
+    discount = _round(subtotal * discount_percent / 100)
+    tax = _round((subtotal - discount) * GST_PERCENT / 100)
+    return subtotal, discount, tax, subtotal - discount + tax
+
+
+def test_cart_totals_match_reference_and_lines_add_up():
+    rng = random.Random(13)
+    for _ in range(500):
+        items, discount_percent = _random_cart(rng, rng.randint(1, 40))
+        cart = price_cart(items, discount_percent)
+
+        assert (cart.subtotal, cart.discount_amount, cart.tax_amount, cart.total) == _reference(items, discount_percent)
+        for column in ('subtotal', 'discount_amount', 'taxable_amount', 'tax_amount', 'total'):
+            assert sum(getattr(line, column) for line in cart.lines) == getattr(cart, column), column
+
+        for line in cart.lines:
+            assert line.taxable_amount == line.subtotal - line.discount_amount
+            assert line.total == line.taxable_amount + line.tax_amount
+            # Each line's share is within a paisa of its exact proportional share
+            exact_discount = line.subtotal * discount_percent / 100
+            assert abs(line.discount_amount - exact_discount) < CENT
+            assert abs(line.tax_amount - line.taxable_amount * GST_PERCENT / 100) < CENT
+            for value in line[1:]:
+                assert value == value.quantize(CENT)
+
+
+def test_quote_order_and_invoice_views_agree():
+    rng = random.Random(2024)
+    for _ in range(200):
+        items, discount_percent = _random_cart(rng, rng.randint(1, 15))
+        cart = price_cart(items, discount_percent)
+        shuffled = price_cart(rng.sample(items, len(items)), discount_percent)
+
+        quote = cart.quote_totals()
+        invoice_items = cart.invoice_items()
+        assert quote == shuffled.quote_totals()
+        assert quote['total'] == quote['subtotal_after_discount'] + quote['tax_amount']
+        assert sum(Decimal(str(i['total_amount'])) for i in invoice_items) == quote['total']
+        assert sum(Decimal(str(i['gst_amount'])) for i in invoice_items) == quote['tax_amount']
+        assert sum(line.order_values(cart.discount_percent, cart.tax_percent)['total_amount'] for line in cart.lines) == cart.total
+
+
+def test_billing_cycle_aliases_share_one_discount_table():
+    assert cycle_discount_percent('semi-annually') == cycle_discount_percent('semiannually') == Decimal('15')
+    assert cycle_discount_percent('Annually') == Decimal('20')
+    assert cycle_discount_percent('weekly') == Decimal('0')
+    assert billing_terms('triennially') == (36, 'Triennially', Decimal('35'))
+
+
+def test_pricing_work_is_linear_in_cart_size(monkeypatch):
+    """Each line is rounded once and allocated once per pass, whatever the cart size"""
+    calls = {"money": 0, "allocate": []}
+    real_money, real_allocate = pricing_engine.money, pricing_engine._allocate
+
+    def counting_money(value):
+        calls["money"] += 1
+        return real_money(value)
+
+    def counting_allocate(total, shares):
+        calls["allocate"].append(len(shares))
+        return real_allocate(total, shares)
+
+    monkeypatch.setattr(pricing_engine, "money", counting_money)
+    monkeypatch.setattr(pricing_engine, "_allocate", counting_allocate)
+
+    rng = random.Random(7)
+    for size in (1, 10, 1000):
+        items, _ = _random_cart(rng, size)
+        calls["money"], calls["allocate"] = 0, []
+        price_cart(items, Decimal('10'))
+        # one rounding per line subtotal, plus the cart's discount and tax
+        assert calls["money"] == size + 2
+        # one pass over the lines for discounts and one for taxes
+        assert calls["allocate"] == [size, size]
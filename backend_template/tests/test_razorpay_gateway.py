@@ -0,0 +1,81 @@
+"""
+Razorpay gateway retries: order creation (POST) is only retried when the
+request cannot have reached Razorpay, so a timeout never creates a second
+gateway order; reads retry every transient failure.
+"""
+import asyncio
+
+import pytest
+import requests
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+from app.services.razorpay_gateway import RazorpayGateway, RazorpayGatewayError
+
+
+def _response(status_code, body):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = requests.compat.json.dumps(body).encode()
+    return response
+
+
+def _refused():
+    reason = NewConnectionError(None, "Connection refused")
+    return requests.ConnectionError(MaxRetryError(None, "/orders", reason))
+
+
+def _call(outcomes, method, path):
+    """Run one gateway call against scripted outcomes; returns (result or error, attempts)"""
+    gateway = RazorpayGateway("key", "secret", base_url="http://razorpay.test", max_retries=2, backoff_seconds=0)
+    attempts = []
+
+    def request(*args, **kwargs):
+        outcome = outcomes[len(attempts)]
+        attempts.append(args[0])
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    gateway._session.request = request
+    try:
+        if method == "POST":
+            result = asyncio.run(gateway.create_order({"amount": 49900}))
+        else:
+            result = asyncio.run(gateway.fetch_order("order_1"))
+    except RazorpayGatewayError as e:
+        result = e
+    finally:
+        gateway.close()
+    return result, len(attempts)
+
+
+ORDER = {"id": "order_1", "status": "created"}
+
+
+@pytest.mark.parametrize("outcome", [
+    requests.ReadTimeout("read timed out"),
+    _response(504, {"error": {"description": "Gateway timeout"}}),
+    _response(500, {"error": {"description": "Internal error"}}),
+])
+def test_create_order_is_not_resent_when_it_may_have_been_processed(outcome):
+    result, attempts = _call([outcome, _response(200, ORDER)], "POST", "/orders")
+    assert isinstance(result, RazorpayGatewayError)
+    assert attempts == 1
+
+
+@pytest.mark.parametrize("outcome", [
+    requests.ConnectTimeout("connect timed out"),
+    _refused(),
+    _response(429, {"error": {"description": "Too many requests"}}),
+])
+def test_create_order_retries_when_razorpay_saw_nothing(outcome):
+    result, attempts = _call([outcome, _response(200, ORDER)], "POST", "/orders")
+    assert result == ORDER
+    assert attempts == 2
+
+
+def test_reads_retry_timeouts_and_unavailable_upstream():
+    outcomes = [requests.ReadTimeout("read timed out"), _response(503, {}), _response(200, ORDER)]
+    result, attempts = _call(outcomes, "GET", "/orders/order_1")
+    assert result == ORDER
+    assert attempts == 3
@@ -0,0 +1,123 @@
+"""
+Referral ledger: postings balance and are applied once, holds cannot overdraw,
+rejected holds are reversed (also for payouts opened before the ledger), and
+the snapshot always equals the sum of the entries. Runs the real ledger
+against a SQLite file database.
+"""
+import asyncio
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import select, func
+
+from app.models.referral_ledger import LedgerEntry
+from app.models.referrals import ReferralPayout
+from app.models.users import UserProfile
+from app.services.referral_ledger import (
+    AFFILIATE_BOOK, REFERRAL_BOOK, InsufficientBalanceError, Leg, ReferralLedger, referral_ledger
+)
+from app.services.referral_service import ReferralService
+
+
+def test_postings_keep_the_snapshot_equal_to_the_entries(session_factory):
+    async def run():
+        ledger = ReferralLedger()
+        async with session_factory() as db:
+            alice = UserProfile(email="alice@example.com", full_name="Alice", hashed_password="x", role="user")
+            bob = UserProfile(email="bob@example.com", full_name="Bob", hashed_password="x", role="user")
+            db.add_all([alice, bob])
+            await db.commit()
+            alice_id, bob_id = alice.id, bob.id
+
+            credits = [(alice_id, Decimal("800.00")), (bob_id, Decimal("40.00"))]
+            assert await ledger.credit_earnings(db, REFERRAL_BOOK, "earning:payment:1", credits, "payment", 1)
+            assert not await ledger.credit_earnings(db, REFERRAL_BOOK, "earning:payment:1", credits, "payment", 1)
+            await db.commit()
+
+            # Holds never overdraw; a failed hold is rolled back entirely
+            with pytest.raises(InsufficientBalanceError):
+                await ledger.hold_payout(db, REFERRAL_BOOK, bob_id, Decimal("500.00"), "referral_payout", 7)
+            await db.rollback()
+
+            assert await ledger.hold_payout(db, REFERRAL_BOOK, alice_id, Decimal("500.00"), "referral_payout", 1)
+            assert await ledger.hold_payout(db, REFERRAL_BOOK, alice_id, Decimal("200.00"), "referral_payout", 2)
+            assert await ledger.settle_payout(db, REFERRAL_BOOK, alice_id, Decimal("500.00"), "referral_payout", 1)
+            assert await ledger.release_payout(db, REFERRAL_BOOK, alice_id, Decimal("200.00"), "referral_payout", 2)
+            assert not await ledger.release_payout(db, REFERRAL_BOOK, alice_id, Decimal("200.00"), "referral_payout", 2)
+            await db.commit()
+
+            balance = await ledger.get_balance(db, alice_id)
+            await db.refresh(balance)
+            assert (balance.available, balance.held, balance.total_earned, balance.total_paid_out) == (
+                Decimal("300.00"), Decimal("0.00"), Decimal("800.00"), Decimal("500.00")
+            )
+            # Books are separate, and a user with no postings reads as zero
+            assert (await ledger.get_balance(db, alice_id, AFFILIATE_BOOK)).available == 0
+
+            # Every transaction balances, and the snapshot is the sum of the user's entries
+            unbalanced = await db.execute(
+                select(LedgerEntry.transaction_key)
+                .group_by(LedgerEntry.transaction_key)
+                .having(func.sum(LedgerEntry.amount) != 0)
+            )
+            assert unbalanced.all() == []
+            available = await db.scalar(
+                select(func.sum(LedgerEntry.amount))
+                .where(LedgerEntry.user_id == alice_id, LedgerEntry.account == "available")
+            )
+            assert Decimal(str(available)) == balance.available
+
+            # The profile columns mirror the referral book
+            await db.refresh(alice)
+            assert (alice.available_balance, alice.total_earnings, alice.total_withdrawn) == (
+                Decimal("300.00"), Decimal("800.00"), Decimal("500.00")
+            )
+
+            # Statement pages walk the user's entries newest first
+            first, cursor = await ledger.get_statement(db, alice_id, limit=4)
+            rest, end = await ledger.get_statement(db, alice_id, cursor=cursor, limit=4)
+            assert end is None
+            ids = [entry.id for entry in first + rest]
+            assert ids == sorted(ids, reverse=True) and len(ids) == 8
+
+    asyncio.run(run())
+
+
+def test_rejecting_a_payout_opened_before_the_ledger_releases_its_amount(session_factory):
+    async def run():
+        async with session_factory() as db:
+            alice = UserProfile(email="alice@example.com", full_name="Alice", hashed_password="x", role="user")
+            db.add(alice)
+            await db.commit()
+            alice_id = alice.id
+
+            payout = ReferralPayout(
+                user_id=alice_id, payout_number="PAY-OLD", gross_amount=Decimal("300.00"),
+                tds_amount=Decimal("30.00"), net_amount=Decimal("270.00"), status="requested",
+                payment_method="bank_transfer", tax_year="2026", tax_quarter="Q2"
+            )
+            db.add(payout)
+            await db.flush()
+            payout_id = payout.id
+            # What the migration backfilled: the open payout sits in the opening balance's held leg
+            await referral_ledger.post(db, f"opening:{REFERRAL_BOOK}:{alice_id}", "opening_balance", REFERRAL_BOOK, [
+                Leg(alice_id, "available", Decimal("700.00")),
+                Leg(alice_id, "held", Decimal("300.00")),
+                Leg(alice_id, "commissions", Decimal("-1000.00")),
+            ], description="Opening balance")
+            await db.commit()
+
+            assert await ReferralService().reject_payout(db, payout_id, "Bank details invalid")
+            balance = await referral_ledger.get_balance(db, alice_id)
+            await db.refresh(balance)
+            assert (balance.available, balance.held) == (Decimal("1000.00"), Decimal("0.00"))
+
+            # Released once, even if the rejection is replayed
+            assert not await referral_ledger.release_payout(
+                db, REFERRAL_BOOK, alice_id, Decimal("300.00"), "referral_payout", payout_id
+            )
+            await db.commit()
+            await db.refresh(balance)
+            assert balance.held == Decimal("0.00")
+
+    asyncio.run(run())
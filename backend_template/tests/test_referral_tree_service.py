@@ -0,0 +1,80 @@
+"""
+Referral tree: the closure rows written by link_user and by rebuild match a
+walk up the referred_by chain, and the upline / downline queries read the
+same tree. Runs the real service against a SQLite file database.
+"""
+import asyncio
+
+from sqlalchemy import delete, select, update
+
+from app.models.referral_closure import ReferralClosure
+from app.models.users import UserProfile
+from app.services.referral_tree_service import ReferralTreeService
+
+#        1
+#      /   \
+#     2     3
+#     |     |
+#     4     7
+#     |
+#     5
+#     |
+#     6
+REFERRERS = {1: None, 2: 1, 3: 1, 4: 2, 5: 4, 6: 5, 7: 3}
+
+
+def _walk(referrers):
+    """Expected closure rows: (ancestor, descendant, depth) from following referred_by"""
+    rows = set()
+    for user_id in referrers:
+        depth, ancestor = 1, referrers[user_id]
+        while ancestor is not None:
+            rows.add((ancestor, user_id, depth))
+            depth, ancestor = depth + 1, referrers[ancestor]
+    return rows
+
+
+async def _closure(db):
+    result = await db.execute(select(ReferralClosure.ancestor_id, ReferralClosure.descendant_id, ReferralClosure.depth))
+    return set(result.all())
+
+
+def test_closure_matches_the_referred_by_tree(session_factory):
+    async def run():
+        tree = ReferralTreeService()
+        async with session_factory() as db:
+            # Users sign up in order, each linked under its referrer
+            for user_id, referrer_id in REFERRERS.items():
+                db.add(UserProfile(
+                    id=user_id, email=f"user{user_id}@example.com", full_name="User",
+                    hashed_password="x", referred_by=referrer_id,
+                ))
+                await db.flush()
+                if referrer_id is not None:
+                    await tree.link_user(db, user_id, referrer_id)
+            await db.commit()
+            assert await _closure(db) == _walk(REFERRERS)
+
+            assert await tree.get_upline(db, 6) == {1: 5, 2: 4, 3: 2}
+            assert await tree.get_upline(db, 6, max_depth=10) == {1: 5, 2: 4, 3: 2, 4: 1}
+            assert await tree.get_upline(db, 1) == {}
+            assert await tree.get_downline_counts(db, 1) == {1: 2, 2: 2, 3: 1}
+            assert await tree.get_downline_counts(db, 6) == {1: 0, 2: 0, 3: 0}
+            assert sorted(await tree.get_downline_ids(db, 1, 2)) == [4, 7]
+            assert await tree.get_downline_ids(db, 2, 3) == [6]
+
+            # rebuild repairs a damaged closure and follows a moved user's subtree
+            await db.execute(delete(ReferralClosure).where(ReferralClosure.descendant_id.in_([5, 6])))
+            await db.execute(update(UserProfile).where(UserProfile.id == 4).values(referred_by=7))
+            moved = {**REFERRERS, 4: 7}
+            assert await tree.rebuild(db) == len(_walk(moved))
+            assert await _closure(db) == _walk(moved)
+            assert await tree.get_upline(db, 5, max_depth=5) == {1: 4, 2: 7, 3: 3, 4: 1}
+            assert await tree.get_downline_counts(db, 2) == {1: 0, 2: 0, 3: 0}
+
+            # A corrupt referred_by cycle still terminates
+            await db.execute(update(UserProfile).where(UserProfile.id == 1).values(referred_by=6))
+            assert await tree.rebuild(db) > 0
+            assert (1, 1, 6) in await _closure(db)
+
+    asyncio.run(run())
@@ -0,0 +1,139 @@
+"""
+S3 storage driver against an in-memory stand-in for the boto3 client: uploads
+are split into parts of at least S3_MIN_PART_SIZE, a failed upload is aborted,
+and reads fetch only the byte ranges they need.
+"""
+import asyncio
+import io
+
+import pytest
+
+from app.services.attachment_storage import S3_MIN_PART_SIZE, S3Storage
+
+MiB = 1024 * 1024
+
+
+class FakeS3Client:
+    """The boto3 S3 calls the driver makes, kept in memory and recorded"""
+
+    def __init__(self):
+        self.objects = {}
+        self.uploads = {}
+        self.calls = []
+
+    def put_object(self, Bucket, Key, Body):
+        self.calls.append(("put_object", Key))
+        self.objects[Key] = bytes(Body)
+
+    def create_multipart_upload(self, Bucket, Key):
+        upload_id = f"upload-{len(self.uploads) + 1}"
+        self.uploads[upload_id] = {}
+        self.calls.append(("create_multipart_upload", Key))
+        return {"UploadId": upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.uploads[UploadId][PartNumber] = bytes(Body)
+        self.calls.append(("upload_part", PartNumber, len(Body)))
+        return {"ETag": f'"etag-{PartNumber}"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        parts = self.uploads.pop(UploadId)
+        self.objects[Key] = b"".join(parts[part["PartNumber"]] for part in MultipartUpload["Parts"])
+        self.calls.append(("complete_multipart_upload", Key))
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.uploads.pop(UploadId)
+        self.calls.append(("abort_multipart_upload", Key))
+
+    def head_object(self, Bucket, Key):
+        return {"ContentLength": len(self.objects[Key])}
+
+    def get_object(self, Bucket, Key, Range):
+        start, end = (int(n) for n in Range.removeprefix("bytes=").split("-"))
+        self.calls.append(("get_object", start, end))
+        return {"Body": io.BytesIO(self.objects[Key][start:end + 1])}
+
+
+def _storage(**kwargs):
+    storage = S3Storage(
+        bucket="attachments", access_key_id="test", secret_access_key="test", prefix="t/", workers=2, **kwargs
+    )
+    storage.client = FakeS3Client()
+    return storage
+
+
+def _data(size):
+    return bytes(n % 251 for n in range(size))
+
+
+def test_large_objects_upload_in_parts_of_at_least_the_s3_minimum():
+    async def run():
+        storage = _storage(part_size=1024)  # below the S3 minimum: raised to it
+        try:
+            assert storage.part_size == S3_MIN_PART_SIZE
+            data = _data(12 * MiB + 100)
+            async with storage.writer("big.enc") as out:
+                for start in range(0, len(data), MiB):
+                    await out.write(data[start:start + MiB])
+
+            parts = [call[1:] for call in storage.client.calls if call[0] == "upload_part"]
+            assert parts == [(1, 5 * MiB), (2, 5 * MiB), (3, 2 * MiB + 100)]
+            assert storage.client.objects["t/big.enc"] == data
+            assert await storage.size("big.enc") == len(data)
+
+            # Smaller than one part: a single PUT, no multipart upload
+            async with storage.writer("small.enc") as out:
+                await out.write(b"tiny")
+            assert storage.client.calls[-1] == ("put_object", "t/small.enc")
+        finally:
+            storage.shutdown()
+
+    asyncio.run(run())
+
+
+def test_a_failed_upload_is_aborted_and_never_becomes_visible():
+    async def run():
+        storage = _storage(part_size=S3_MIN_PART_SIZE)
+        try:
+            with pytest.raises(RuntimeError):
+                async with storage.writer("broken.enc") as out:
+                    await out.write(_data(6 * MiB))
+                    raise RuntimeError("client went away")
+
+            names = [call[0] for call in storage.client.calls]
+            assert names == ["create_multipart_upload", "upload_part", "abort_multipart_upload"]
+            assert storage.client.uploads == {} and "t/broken.enc" not in storage.client.objects
+        finally:
+            storage.shutdown()
+
+    asyncio.run(run())
+
+
+def test_reads_fetch_only_the_requested_ranges():
+    async def run():
+        storage = _storage(read_ahead=1000)
+        try:
+            data = _data(5000)
+            storage.client.objects["t/file.enc"] = data
+
+            assert await storage.read("file.enc", 100, 50) == data[100:150]
+            assert storage.client.calls[-1] == ("get_object", 100, 149)
+
+            # The seekable reader serves consecutive reads from one read-ahead window
+            storage.client.calls.clear()
+            reader = storage.open("file.enc", len(data))
+            reader.seek(1200)
+            assert reader.read(300) + reader.read(300) == data[1200:1800]
+            assert storage.client.calls == [("get_object", 1200, 2199)]
+
+            # Seeking back or past the window fetches again; reads stop at the end of the object
+            reader.seek(-100, io.SEEK_END)
+            assert reader.read(500) == data[4900:] and reader.read(10) == b""
+            reader.seek(0)
+            buffer = bytearray(10)
+            assert reader.readinto(buffer) == 10 and bytes(buffer) == data[:10]
+            assert storage.client.calls[1:] == [("get_object", 4900, 4999), ("get_object", 0, 999)]
+        finally:
+            storage.shutdown()
+
+    asyncio.run(run())
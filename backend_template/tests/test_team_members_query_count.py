@@ -0,0 +1,105 @@
+"""
+Benchmark: AffiliateService team listing must cost a constant number of
+queries no matter how large the team is.
+
+Runs against a SQLite file database.
+"""
+import asyncio
+from decimal import Decimal
+
+from sqlalchemy import event
+
+from app.models.affiliate import Referral, Commission
+from app.models.order import Order
+from app.models.users import UserProfile
+from app.services.affiliate_service import AffiliateService
+
+
+async def _add_sponsor(Session) -> int:
+    async with Session() as db:
+        sponsor = UserProfile(email="sponsor@example.com", full_name="Sponsor", hashed_password="x")
+        db.add(sponsor)
+        await db.commit()
+        return sponsor.id
+
+
+async def _add_members(Session, sponsor_id: int, first: int, stop: int) -> None:
+    """Members first..stop-1, each referred by the sponsor with one paid order"""
+    async with Session() as db:
+        for i in range(first, stop):
+            member = UserProfile(email=f"member{i}@example.com", full_name=f"Member {i}", hashed_password="x")
+            db.add(member)
+            await db.flush()
+
+            referral = Referral(
+                referrer_id=sponsor_id, referred_user_id=member.id,
+                level=1, referral_code_used="SPONSOR", has_purchased=True
+            )
+            db.add(referral)
+            await db.flush()
+
+            amount = Decimal(100 + i)
+            db.add(Order(
+                user_id=member.id, plan_id=1, order_number=f"ORD-{i}", order_status="completed",
+                billing_cycle="monthly", total_amount=amount, grand_total=amount
+            ))
+            db.add(Commission(
+                affiliate_user_id=sponsor_id, referral_id=referral.id, level=1,
+                order_amount=amount, commission_rate=Decimal("10"), commission_amount=amount / 10
+            ))
+        await db.commit()
+
+
+async def _measure(Session, sponsor_id: int, **page_kwargs):
+    queries = {"count": 0}
+
+    def count(*args, **kwargs):
+        queries["count"] += 1
+
+    engine = Session.kw["bind"].sync_engine
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        async with Session() as db:
+            members, next_cursor = await AffiliateService().get_team_page(db, sponsor_id, **page_kwargs)
+            return members, next_cursor, queries["count"]
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+
+
+def test_team_query_count_is_constant(session_factory):
+    async def run():
+        sponsor_id = await _add_sponsor(session_factory)
+        results, size = {}, 0
+        for team_size in (5, 50, 250):
+            await _add_members(session_factory, sponsor_id, size, team_size)
+            size = team_size
+            members, _, query_count = await _measure(session_factory, sponsor_id, limit=None)
+            assert len(members) == team_size
+            results[team_size] = query_count
+        return results
+
+    results = asyncio.run(run())
+    assert len(set(results.values())) == 1, results
+    assert results[250] <= 2
+
+
+def test_team_page_sorted_by_purchases_with_cursor(session_factory):
+    async def walk():
+        sponsor_id = await _add_sponsor(session_factory)
+        await _add_members(session_factory, sponsor_id, 0, 7)
+        async with session_factory() as db:
+            service = AffiliateService()
+            seen, cursor = [], None
+            while True:
+                page, cursor = await service.get_team_page(
+                    db, sponsor_id, sort_by="purchases", cursor=cursor, limit=3
+                )
+                seen.extend(page)
+                if cursor is None:
+                    return seen
+
+    members = asyncio.run(walk())
+    purchases = [m.total_purchases for m in members]
+    assert purchases == sorted(purchases, reverse=True)
+    assert len({m.user_id for m in members}) == 7
+    assert all(m.total_commission == m.total_purchases / 10 for m in members)
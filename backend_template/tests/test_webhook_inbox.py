@@ -0,0 +1,99 @@
+"""
+Webhook inbox: redeliveries are stored once, events of one order are processed
+in arrival order, and a failing handler is retried until the event is dead.
+Runs the real inbox / consumer against a SQLite file database.
+"""
+import asyncio
+
+from sqlalchemy import select, update
+
+from app.models.webhook_event import WebhookEvent
+from app.services.webhook_inbox import WebhookConsumer, WebhookInbox, webhook_handler, razorpay_order_key
+
+processed = []
+
+
+@webhook_handler("test.record")
+async def record(db, payload):
+    processed.append(payload["n"])
+
+
+@webhook_handler("test.broken")
+async def broken(db, payload):
+    raise RuntimeError("handler bug")
+
+
+def _event(event_type: str, order_id: str, n: int) -> dict:
+    return {"event": event_type, "n": n, "payload": {"payment": {"entity": {"order_id": order_id}}}}
+
+
+async def _append(db, inbox, event_id, event_type, order_id, n):
+    payload = _event(event_type, order_id, n)
+    return await inbox.append(db, event_id, event_type, payload, razorpay_order_key(payload))
+
+
+def test_redelivery_is_stored_once_and_orders_are_processed_in_sequence(session_factory):
+    async def run():
+        processed.clear()
+        inbox = WebhookInbox()
+        consumer = WebhookConsumer(session_factory, concurrency=1, max_attempts=3)
+        async with session_factory() as db:
+            assert await _append(db, inbox, "evt_1", "test.record", "order_a", 1)
+            assert await _append(db, inbox, "evt_2", "test.record", "order_b", 2)
+            assert await _append(db, inbox, "evt_3", "test.record", "order_a", 3)
+            assert not await _append(db, inbox, "evt_1", "test.record", "order_a", 1)  # redelivery
+            assert (await db.execute(select(WebhookEvent.id))).scalars().all() == [1, 2, 3]
+
+            # order_a's first event is in flight: its second event waits, order_b does not
+            await db.execute(update(WebhookEvent).where(WebhookEvent.id == 1).values(status="processing"))
+            await db.commit()
+            assert await consumer._claim() == 2
+            await consumer._execute(2)
+            assert await consumer._claim() is None
+
+            await db.execute(update(WebhookEvent).where(WebhookEvent.id == 1).values(status="received"))
+            await db.commit()
+            while await consumer.run_once() is not None:
+                pass
+
+            assert processed == [2, 1, 3]
+            statuses = (await db.execute(select(WebhookEvent.status))).scalars().all()
+            assert statuses == ["processed"] * 3
+
+    asyncio.run(run())
+
+
+def test_failing_event_is_retried_then_dead_and_replayable(session_factory):
+    async def run():
+        processed.clear()
+        inbox = WebhookInbox()
+        consumer = WebhookConsumer(session_factory, concurrency=1, max_attempts=2)
+        async with session_factory() as db:
+            await _append(db, inbox, "evt_bad", "test.broken", "order_a", 1)
+            await _append(db, inbox, "evt_next", "test.record", "order_a", 2)
+
+            assert await consumer.run_once() == 1
+            event = await db.get(WebhookEvent, 1)
+            assert (event.status, event.attempts) == ("received", 1)
+            assert "handler bug" in event.last_error
+            # Backing off: nothing is due, and the order's next event waits behind it
+            assert await consumer.run_once() is None
+
+            await db.execute(update(WebhookEvent).values(run_after=event.received_at))
+            await db.commit()
+            assert await consumer.run_once() == 1
+            db.expire_all()
+            event = await db.get(WebhookEvent, 1)
+            assert (event.status, event.attempts) == ("dead", 2)
+
+            # A dead event no longer blocks its order
+            assert await consumer.run_once() == 2
+            assert processed == [2]
+
+            assert [e.id for e in await inbox.get_events(db, ["dead"])] == [1]
+            assert await inbox.replay(db, 1)
+            db.expire_all()
+            event = await db.get(WebhookEvent, 1)
+            assert (event.status, event.attempts) == ("received", 0)
+
+    asyncio.run(run())